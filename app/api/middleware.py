@@ -0,0 +1,210 @@
+import json
+import os
+import tempfile
+import time
+from urllib.parse import parse_qs
+
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+
+from app.core import admission, metrics, profiling
+
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "migrator_http_request_seconds", "HTTP request latency by route", ("method", "route", "status")
+)
+
+
+class MetricsMiddleware:
+    # Plain ASGI middleware: avoids the per-request task and stream overhead of
+    # BaseHTTPMiddleware and labels by route template to keep cardinality bounded.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status["code"]),
+            )
+
+
+class ProfilingMiddleware:
+    # Opt-in per request (X-Profile: 1 header or ?profile=1), sampled via
+    # MIGRATOR_PROFILE_SAMPLE_RATE, or always-on slow tracing when
+    # MIGRATOR_SLOW_REQUEST_MS is set. When none apply the request passes
+    # straight through.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        reason = profiling.should_profile(_profile_requested(scope))
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = profiling.Profile(f"{scope['method']} {scope['path']}", reason)
+        expose = reason != "slow-trace"
+
+        async def receive_wrapper():
+            start = time.perf_counter()
+            message = await receive()
+            profiling.add_timing("read_body", time.perf_counter() - start, bytes=len(message.get("body", b"")))
+            return message
+
+        async def send_wrapper(message):
+            if expose and message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", profile.server_timing().encode()))
+                headers.append((b"x-profile-id", profile.id.encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        with profile:
+            try:
+                await self.app(scope, receive_wrapper, send_wrapper)
+            finally:
+                profile.root.attrs["route"] = getattr(scope.get("route"), "path", "unmatched")
+        profiling.record(profile)
+
+
+def _profile_requested(scope) -> bool:
+    query = scope.get("query_string", b"")
+    if b"profile=" in query:
+        for pair in query.split(b"&"):
+            if pair in (b"profile=1", b"profile=true"):
+                return True
+    for key, value in scope.get("headers", []):
+        if key == b"x-profile":
+            return value in (b"1", b"true")
+    return False
+
+
+async def _send_json(send, status: int, detail: str, headers=()):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        + list(headers),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    # Guards scan ingest: rejects oversized bodies up front, admits a bounded
+    # number of submissions per admission.CONTROLLER and answers the rest with
+    # 429 + Retry-After. Bodies are only read once a request is admitted, so a
+    # herd of agents waits in TCP buffers instead of server memory.
+    # paths: the guarded routes, or {path: body limit} (admission.BODY_LIMITS
+    # by default); max_body_bytes overrides every route's limit. Streamed
+    # routes read their body themselves (see spool_request) instead of
+    # having it buffered here.
+    def __init__(self, app, controller: admission.AdmissionController = None, paths=None,
+                 max_body_bytes: int = None, streamed=admission.STREAMED_PATHS):
+        self.app = app
+        self.controller = controller or admission.CONTROLLER
+        limits = admission.BODY_LIMITS if paths is None else paths
+        if not isinstance(limits, dict):
+            limits = dict.fromkeys(limits, admission.MAX_BODY_BYTES)
+        self.limits = {path: limit if max_body_bytes is None else max_body_bytes for path, limit in limits.items()}
+        self.streamed = set(streamed)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.limits:
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.limits[scope["path"]]
+        too_large = f"Request body exceeds {limit} bytes"
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            admission.REJECTED.inc(reason="body_too_large")
+            await _send_json(send, 413, too_large)
+            return
+        if not self.controller.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        project = (query.get("project") or ["default"])[0]
+        try:
+            await self.controller.acquire(project)
+        except admission.Rejected as e:
+            await _send_json(send, 429, str(e), [(b"retry-after", str(e.retry_after).encode())])
+            return
+
+        start = time.perf_counter()
+        try:
+            if scope["path"] in self.streamed:
+                await self.app(scope, receive, send)
+                return
+            chunks = []
+            size = 0
+            more = True
+            while more:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                chunk = message.get("body", b"")
+                size += len(chunk)
+                if size > limit:
+                    admission.REJECTED.inc(reason="body_too_large")
+                    await _send_json(send, 413, too_large)
+                    return
+                chunks.append(chunk)
+                more = message.get("more_body", False)
+            body = b"".join(chunks)
+            del chunks
+            replayed = False
+
+            async def replay():
+                nonlocal replayed
+                if not replayed:
+                    replayed = True
+                    return {"type": "http.request", "body": body, "more_body": False}
+                return await receive()
+
+            await self.app(scope, replay, send)
+        finally:
+            self.controller.release(time.perf_counter() - start)
+
+
+async def spool_request(request: Request, limit: int, suffix: str = "") -> str:
+    # Streams a request body to a temporary file a chunk at a time, for the
+    # streamed routes above. A body over limit bytes is refused with 413 and
+    # its file removed; otherwise the caller removes it.
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > limit:
+                    admission.REJECTED.inc(reason="body_too_large")
+                    raise HTTPException(status_code=413, detail=f"Request body exceeds {limit} bytes")
+                await run_in_threadpool(f.write, chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
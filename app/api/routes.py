@@ -1,27 +1,31 @@
 from fastapi import APIRouter, HTTPException
 from app.models import SSHConnection, ScanResult, AnalysisResult, BuildConfig, BuildResult, DeployResult
-from app.core import scanner, analyzer, builder, deployer
+from app.core import scanner, analyzer, builder, deployer, jobs
 
 router = APIRouter()
 
 @router.post("/scan", response_model=ScanResult)
 async def scan_infrastructure(connection: SSHConnection):
     try:
-        return scanner.scan_server(connection)
+        return await jobs.RUNNER.io(scanner.scan_server, connection)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/analyze", response_model=AnalysisResult)
 async def analyze_infrastructure(scan_result: ScanResult):
     try:
-        return analyzer.analyze_scan(scan_result)
+        return await jobs.RUNNER.run("analyze", analyzer.analyze_scan, scan_result)
+    except jobs.JobError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/build", response_model=BuildResult)
 async def build_infrastructure(config: BuildConfig):
     try:
-        return builder.generate_terraform(config)
+        return await jobs.RUNNER.run("build", builder.generate_terraform, config)
+    except jobs.JobError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
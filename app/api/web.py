@@ -1,15 +1,54 @@
-from fastapi import APIRouter, Request, BackgroundTasks
+from fastapi import APIRouter, Request, BackgroundTasks, HTTPException, Query
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+import asyncio
 import os
-from app.core import scanner, analyzer, builder, deployer
-from app.models import ScanResult, BuildConfig, Component
+from collections import OrderedDict
+from app.api.middleware import spool_request
+from app.core import admission, scanner, analyzer, builder, bundles, deployer, artifacts, export, history, ingest, inventory, jobs, metrics, profiling, rules
+from app.models import ScanResult, ScanPatch, BuildConfig, Component
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates/web")
 
 PROJECTS = {}
 
+SCAN_UPLOAD_BYTES = metrics.histogram(
+    "migrator_scan_upload_bytes", "Size of agent scan uploads", buckets=metrics.BYTE_BUCKETS
+)
+SCAN_SUBMISSIONS = metrics.counter("migrator_scan_submissions_total", "Scans received from agents")
+SCAN_PATCHES = metrics.counter("migrator_scan_patches_total", "Scan deltas from agent daemons by outcome", ("result",))
+SCAN_PATCH_OPS = metrics.counter("migrator_scan_patch_ops_total", "Operations applied from scan deltas")
+AGENT_THROTTLED_SECONDS = metrics.counter(
+    "migrator_agent_throttled_seconds_total", "Seconds agents slept to respect their read rate limit"
+)
+AGENT_SKIPPED = metrics.counter("migrator_agent_skipped_total", "Sections and files agents skipped", ("kind",))
+PROJECTS_GAUGE = metrics.gauge("migrator_projects", "Projects held in memory")
+PROJECTS_GAUGE.set_function(lambda: len(PROJECTS))
+SCANS_GAUGE = metrics.gauge("migrator_projects_with_scan", "Projects holding a scan result")
+SCANS_GAUGE.set_function(lambda: sum(1 for state in list(PROJECTS.values()) if state.get("scan")))
+
+# Replies to the relay batches imported last; a relay that did not get the
+# reply sends the batch again and gets the same answer back.
+RELAY_REPLIES: "OrderedDict[str, dict]" = OrderedDict()
+RELAY_REPLIES_KEPT = 1000
+
+# The submit endpoint decodes the raw body itself (see ingest.decode_scan), so
+# document the expected payload explicitly.
+SCAN_SUBMIT_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ScanResult"}}},
+    }
+}
+
+
+def render(template_name: str, context: dict):
+    with profiling.span("web.render_template", template=template_name):
+        return templates.TemplateResponse(context["request"], template_name, context)
+
 
 def get_project_name(request: Request) -> str:
     project = request.query_params.get("project")
@@ -73,14 +112,14 @@ async def remove_component(comp: Component, request: Request):
 
 @router.get("/", response_class=HTMLResponse)
 async def read_index(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return render("index.html", {"request": request})
 
 @router.get("/guide/scan", response_class=HTMLResponse)
 async def guide_scan(request: Request):
     project = get_project_name(request)
     state = get_project_state(project)
     host_url = str(request.base_url).rstrip('/')
-    return templates.TemplateResponse("scan.html", {
+    return render("scan.html", {
         "request": request,
         "host_url": host_url,
         "scan_result": state.get("scan"),
@@ -95,10 +134,10 @@ async def guide_analyze(request: Request):
     scan = state.get("scan")
     analysis = state.get("analysis")
     if scan and not analysis:
-        analysis = analyzer.analyze_scan(scan)
+        analysis = await jobs.RUNNER.run("analyze", analyzer.analyze_scan, scan)
         state["analysis"] = analysis
 
-    return templates.TemplateResponse("analyze.html", {
+    return render("analyze.html", {
         "request": request,
         "scan": scan,
         "analysis": analysis,
@@ -121,51 +160,405 @@ async def guide_build(request: Request):
             zone="us-central1-a",
             instance_name=f"migrated-{scan.hostname}" if scan else f"migrated-{project}",
             machine_type=analysis.recommended_gcp_instance,
-            source_image="debian-cloud/debian-11"
+            source_image="debian-cloud/debian-11",
+            disk_size_gb=analysis.recommended_disk_gb,
         )
-        build = builder.generate_terraform(config, scan_result=scan, analysis_result=analysis)
+        build = await jobs.RUNNER.run("build", builder.generate_terraform, config, scan_result=scan, analysis_result=analysis)
         state["build"] = build
 
-    startup_content = ""
+    # The page only indexes startup.sh; its preview and sections are fetched
+    # on demand from /api/build/artifacts/startup.sh.
+    startup = None
     if build:
-        startup_path = os.path.join(os.path.dirname(build.terraform_code_path), 'startup.sh')
-        if os.path.exists(startup_path):
-            with open(startup_path, 'r') as f:
-                startup_content = f.read()
+        try:
+            st = await jobs.RUNNER.io(os.stat, artifacts.artifact_path(build, "startup.sh"))
+        except OSError:
+            st = None
+        if st is not None:
+            startup = {
+                "etag": artifacts.etag(st),
+                "size": st.st_size,
+                "sections": artifacts.section_index(build, st),
+            }
 
-    return templates.TemplateResponse("build.html", {
+    return render("build.html", {
         "request": request,
         "build": build,
         "scan": scan,
-        "startup_script_content": startup_content,
+        "startup": startup,
+        "preview_bytes": artifacts.PREVIEW_BYTES,
         "project": project
     })
 
 
+def _current_build(request: Request):
+    build = get_project_state(get_project_name(request)).get("build")
+    if not build:
+        raise HTTPException(status_code=404, detail="No build for this project")
+    return build
+
+
+@router.get("/api/build/artifacts.zip")
+async def build_artifacts_zip(request: Request):
+    build = _current_build(request)
+    paths = [artifacts.artifact_path(build, name) for name in artifacts.artifact_names(build)]
+    try:
+        with profiling.span("web.zip_artifacts"):
+            tag, data = await jobs.RUNNER.io(artifacts.ZIP_CACHE.get, paths)
+    except OSError:
+        raise HTTPException(status_code=404, detail="Build artifacts are missing")
+    headers = {"ETag": tag, "Cache-Control": "no-cache"}
+    if artifacts.etag_matches(request.headers.get("if-none-match"), tag):
+        artifacts.ARTIFACT_RESPONSES.inc(artifact="zip", status="304")
+        return Response(status_code=304, headers=headers)
+    artifacts.ARTIFACT_RESPONSES.inc(artifact="zip", status="200")
+    artifacts.ARTIFACT_BYTES.inc(len(data), artifact="zip")
+    headers["Content-Disposition"] = f'attachment; filename="{get_project_name(request)}-build.zip"'
+    return Response(content=data, media_type="application/zip", headers=headers)
+
+
+@router.get("/api/build/artifacts/{name}")
+async def build_artifact(name: str, request: Request, download: bool = False):
+    build = _current_build(request)
+    try:
+        path = artifacts.artifact_path(build, name)
+        st = os.stat(path)
+    except (KeyError, OSError):
+        raise HTTPException(status_code=404, detail=f"Artifact {name} not found")
+    tag = artifacts.etag(st)
+    headers = {"ETag": tag, "Cache-Control": "no-cache", "Accept-Ranges": "bytes"}
+    if_match = request.headers.get("if-match")
+    if if_match and not artifacts.etag_matches(if_match, tag, strong=True):
+        # The page's section index is stale: the artifact was rebuilt.
+        artifacts.ARTIFACT_RESPONSES.inc(artifact=name, status="412")
+        return Response(status_code=412, headers=headers)
+    if artifacts.etag_matches(request.headers.get("if-none-match"), tag):
+        artifacts.ARTIFACT_RESPONSES.inc(artifact=name, status="304")
+        return Response(status_code=304, headers=headers)
+
+    start, end, status = 0, st.st_size - 1, 200
+    if_range = request.headers.get("if-range")
+    if not if_range or artifacts.etag_matches(if_range, tag, strong=True):
+        try:
+            requested = artifacts.parse_range(request.headers.get("range"), st.st_size)
+        except artifacts.RangeNotSatisfiable:
+            artifacts.ARTIFACT_RESPONSES.inc(artifact=name, status="416")
+            return Response(status_code=416, headers=dict(headers, **{"Content-Range": f"bytes */{st.st_size}"}))
+        if requested:
+            start, end = requested
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+    if download:
+        headers["Content-Disposition"] = f'attachment; filename="{name}"'
+    headers["Content-Length"] = str(end - start + 1)
+    artifacts.ARTIFACT_RESPONSES.inc(artifact=name, status=str(status))
+    artifacts.ARTIFACT_BYTES.inc(end - start + 1, artifact=name)
+    return StreamingResponse(
+        artifacts.iter_file(path, start, end), status_code=status, media_type=artifacts.MEDIA_TYPES[name], headers=headers,
+    )
+
+
 @router.post("/api/build/trigger")
 async def trigger_build(config: BuildConfig, request: Request):
     project = get_project_name(request)
     state = get_project_state(project)
     scan = state.get("scan")
-    build = builder.generate_terraform(config, scan_result=scan)
+    build = await jobs.RUNNER.run("build", builder.generate_terraform, config, scan_result=scan)
     state["build"] = build
     return build
 
 
+@router.get("/api/jobs")
+async def list_jobs():
+    return [job.to_dict() for job in list(jobs.RUNNER.jobs.values())]
+
+
+@router.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    if not jobs.RUNNER.cancel(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"status": "cancelling", "id": job_id}
+
+
 @router.get("/guide/deploy", response_class=HTMLResponse)
 async def guide_deploy(request: Request):
     project = get_project_name(request)
-    return templates.TemplateResponse("deploy.html", {"request": request, "project": project})
+    return render("deploy.html", {"request": request, "project": project})
 
 
-@router.post("/api/scan/submit")
-async def submit_scan(scan_data: ScanResult, request: Request):
+def record_collection_stats(stats):
+    if not stats:
+        return
+    AGENT_THROTTLED_SECONDS.inc(float(stats.get("throttled_seconds") or 0))
+    AGENT_SKIPPED.inc(len(stats.get("skipped_sections") or ()), kind="section")
+    for reason, count in (stats.get("skipped_files") or {}).items():
+        AGENT_SKIPPED.inc(int(count), kind=f"file_{reason}")
+
+
+@router.post("/api/scan/submit", openapi_extra=SCAN_SUBMIT_OPENAPI)
+async def submit_scan(request: Request):
+    body = await request.body()
+    try:
+        scan_data = ingest.decode_scan(body)
+    except ValidationError as e:
+        errors = [dict(err, loc=("body",) + tuple(err["loc"])) for err in e.errors(include_url=False)]
+        raise RequestValidationError(errors, body=body[:1024])
     project = get_project_name(request)
+    previous = history.HISTORY.get(project, scan_data.hostname)
+    version, changed = record_scan(project, scan_data, previous)
+    SCAN_SUBMISSIONS.inc()
+    SCAN_UPLOAD_BYTES.observe(len(body))
+    record_collection_stats(scan_data.collection_stats)
+    return {
+        "status": "received",
+        "hostname": scan_data.hostname,
+        "project": project,
+        "version": version.version,
+        "changed_sections": changed,
+    }
+
+
+def record_scan(project: str, scan: ScanResult, previous):
     state = get_project_state(project)
-    state["scan"] = scan_data
-    state["analysis"] = None
-    state["build"] = None
-    return {"status": "received", "hostname": scan_data.hostname, "project": project}
+    # Scan history owns scan lifetimes (and releases pooled content on eviction).
+    scan = ingest.store_scan(scan)
+    version = history.HISTORY.record(project, scan)
+    inventory.INDEX.update(project, scan)
+    changed = None
+    if previous is not None:
+        changed = history.diff_scans(previous.scan, scan)["changed_sections"]
+    current = state.get("scan")
+    state["scan"] = scan
+    if changed or current is None or previous is None or current is not previous.scan:
+        # Builds are incremental, so a reset only re-renders changed sections.
+        state["analysis"] = None
+        state["build"] = None
+    return version, changed
+
+
+@router.post("/api/scan/patch")
+async def patch_scan(request: Request):
+    # Deltas from agent daemons, applied to the host's latest scan and kept
+    # as a new version. A patch based on another version than the latest is
+    # refused (409); the agent then re-submits a full scan.
+    body = await request.body()
+    try:
+        patch = ScanPatch.model_validate_json(body)
+    except ValidationError as e:
+        errors = [dict(err, loc=("body",) + tuple(err["loc"])) for err in e.errors(include_url=False)]
+        raise RequestValidationError(errors, body=body[:1024])
+    project = get_project_name(request)
+    previous = history.HISTORY.get(project, patch.hostname)
+    if previous is None or (patch.base_version is not None and patch.base_version != previous.version):
+        SCAN_PATCHES.inc(result="conflict")
+        raise HTTPException(status_code=409, detail="Scan version mismatch, submit a full scan")
+    try:
+        with profiling.span("ingest.patch", ops=len(patch.ops)):
+            scan = ingest.patch_scan(previous.scan, patch.ops)
+    except (ValueError, ValidationError) as e:
+        SCAN_PATCHES.inc(result="invalid")
+        raise HTTPException(status_code=400, detail=str(e))
+    version, changed = record_scan(project, scan, previous)
+    SCAN_PATCHES.inc(result="applied")
+    SCAN_PATCH_OPS.inc(len(patch.ops))
+    SCAN_UPLOAD_BYTES.observe(len(body))
+    return {
+        "status": "patched",
+        "hostname": patch.hostname,
+        "project": project,
+        "version": version.version,
+        "changed_sections": changed,
+    }
+
+
+def import_scan(project: str, scan: ScanResult) -> str:
+    # Re-imported bundles of an unchanged host do not add a version.
+    previous = history.HISTORY.get(project, scan.hostname)
+    if previous is not None and history.fingerprint(previous.scan)["sections"] == history.fingerprint(scan)["sections"]:
+        return "unchanged"
+    record_scan(project, scan, previous)
+    record_collection_stats(scan.collection_stats)
+    return "imported"
+
+
+@router.post("/api/scan/import")
+async def import_scan_bundles(request: Request, path: str = Query("", description="Directory under MIGRATOR_IMPORT_DIR")):
+    # Bulk import of offline bundles dropped into the server's import
+    # directory. Bundles are decoded in parallel on the job workers, then
+    # recorded oldest first; ?project= overrides the project they name.
+    root = os.path.realpath(bundles.IMPORT_DIR)
+    directory = os.path.realpath(os.path.join(root, path))
+    if directory != root and not directory.startswith(root + os.sep):
+        raise HTTPException(status_code=400, detail="Import path must be inside the import directory")
+    if not os.path.isdir(directory):
+        raise HTTPException(status_code=404, detail=f"No import directory '{path}'")
+
+    paths = await jobs.RUNNER.io(bundles.bundle_paths, directory)
+    plan, skipped = await jobs.RUNNER.io(bundles.plan_import, paths)
+    # One job per worker at a time keeps a large import within the job queue.
+    limit = asyncio.Semaphore(max(1, jobs.RUNNER.workers))
+
+    async def load(bundle_path):
+        async with limit:
+            try:
+                return await jobs.RUNNER.run("import", bundles.read_bundle, bundle_path)
+            except bundles.BundleError as e:
+                return e
+
+    loaded = await asyncio.gather(*(load(p) for p, _ in plan))
+    override = request.query_params.get("project")
+    outcomes = {"imported": 0, "unchanged": 0, "duplicate": 0, "failed": 0}
+    failed = {p: reason for p, reason in skipped.items() if reason != "duplicate"}
+    projects = {}
+    for (bundle_path, _), result in zip(plan, loaded):
+        if isinstance(result, Exception):
+            failed[bundle_path] = str(result)
+            continue
+        meta, scan = result
+        project = override or meta.get("project") or "default"
+        outcome = import_scan(project, scan)
+        outcomes[outcome] += 1
+        projects.setdefault(project, set()).add(scan.hostname)
+    outcomes["duplicate"] = sum(1 for reason in skipped.values() if reason == "duplicate")
+    outcomes["failed"] = len(failed)
+    for result, count in outcomes.items():
+        bundles.BUNDLES.inc(count, result=result)
+    return {
+        "status": "imported",
+        "bundles": len(paths),
+        **outcomes,
+        "projects": {project: len(hosts) for project, hosts in sorted(projects.items())},
+        "errors": {os.path.relpath(p, root): reason for p, reason in sorted(failed.items())},
+    }
+
+
+@router.post("/api/scan/relay")
+async def import_relay_batch(request: Request):
+    # Batches of scans from regional relays (app/relay.py), streamed to disk,
+    # decoded on a job worker and recorded in the order the relay received them.
+    path = await spool_request(request, admission.BODY_LIMITS["/api/scan/relay"], bundles.BATCH_EXTENSION)
+    try:
+        size = os.path.getsize(path)
+        batch, scans = await jobs.RUNNER.run("import", bundles.read_batch, path)
+    except bundles.BundleError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        os.remove(path)
+    batch_id = batch.get("id")
+    if batch_id in RELAY_REPLIES:
+        bundles.BUNDLES.inc(len(scans), result="duplicate")
+        return dict(RELAY_REPLIES[batch_id], status="duplicate")
+
+    outcomes = {"imported": 0, "unchanged": 0, "failed": 0}
+    errors, projects = {}, {}
+    for meta, scan in scans:
+        if isinstance(scan, Exception):
+            outcomes["failed"] += 1
+            errors[str(meta.get("hostname"))] = str(scan)
+            continue
+        project = meta.get("project") or "default"
+        outcomes[import_scan(project, scan)] += 1
+        projects.setdefault(project, set()).add(scan.hostname)
+    for result, count in outcomes.items():
+        bundles.BUNDLES.inc(count, result=result)
+    SCAN_UPLOAD_BYTES.observe(size)
+    reply = {
+        "status": "imported",
+        "batch": batch_id,
+        "relay": batch.get("relay") or request.query_params.get("relay"),
+        "scans": len(scans),
+        **outcomes,
+        "projects": {project: len(hosts) for project, hosts in sorted(projects.items())},
+        "errors": errors,
+    }
+    if batch_id:
+        RELAY_REPLIES[batch_id] = reply
+        while len(RELAY_REPLIES) > RELAY_REPLIES_KEPT:
+            RELAY_REPLIES.popitem(last=False)
+    return reply
+
+
+@router.get("/api/scan/history")
+async def scan_history(request: Request, host: str = None):
+    project = get_project_name(request)
+    if host is None:
+        return {"project": project, "hosts": history.HISTORY.hosts(project)}
+    versions = history.HISTORY.versions(project, host)
+    if not versions:
+        raise HTTPException(status_code=404, detail="Unknown host")
+    return {"project": project, "host": host, "versions": [v.summary() for v in versions]}
+
+
+@router.get("/api/scan/diff")
+async def scan_diff(request: Request, host: str, from_version: int = Query(-2, alias="from"), to_version: int = Query(-1, alias="to")):
+    # Versions are absolute numbers or negative offsets from the newest one.
+    project = get_project_name(request)
+    old = history.HISTORY.get(project, host, from_version)
+    new = history.HISTORY.get(project, host, to_version)
+    if old is None or new is None:
+        raise HTTPException(status_code=404, detail="Unknown host or version")
+    with profiling.span("web.scan_diff"):
+        result = history.diff_scans(old.scan, new.scan)
+    return dict(result, project=project, host=host, **{"from": old.version, "to": new.version})
+
+
+@router.get("/api/inventory/search")
+async def inventory_search(q: str = "", limit: int = Query(100, ge=0, le=10000)):
+    # e.g. q=service:postgresql AND package:postgresql-12* AND NOT port:22
+    try:
+        return dict(inventory.INDEX.search(q, limit=limit), query=q)
+    except inventory.QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/api/inventory/terms")
+async def inventory_terms(field: str, prefix: str = "", limit: int = Query(100, ge=1, le=10000)):
+    try:
+        return {"field": field, "terms": inventory.INDEX.terms(field, prefix, limit)}
+    except inventory.QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def rule_summary(engine: rules.RuleEngine, records) -> dict:
+    hosts = {rule.id: [] for rule in engine.rules}
+    count = 0
+    for project, hostname, scan in records:
+        count += 1
+        for finding in engine.evaluate(scan):
+            hosts[finding.rule_id].append({"project": project, "hostname": hostname})
+    return {
+        "hosts": count,
+        "rules": [
+            {"id": rule.id, "severity": rule.severity, "strategy": rule.strategy, "source": rule.source,
+             "matched_hosts": len(hosts[rule.id]), "sample": hosts[rule.id][:10]}
+            for rule in engine.rules
+        ],
+    }
+
+
+@router.get("/api/rules")
+async def rule_findings():
+    # Every loaded rule with the hosts (latest scans) it currently matches.
+    with profiling.span("web.rule_findings"):
+        return await jobs.RUNNER.io(rule_summary, rules.default_engine(), list(history.HISTORY.latest()))
+
+
+def fleet_records():
+    # Latest scan of every host, with the project's analysis where it belongs to that scan.
+    for project, hostname, scan in history.HISTORY.latest():
+        state = PROJECTS.get(project) or {}
+        yield project, scan, state.get("analysis") if state.get("scan") is scan else None
+
+
+@router.get("/api/export/{table}.csv")
+async def export_table(table: str):
+    if table not in export.TABLES:
+        raise HTTPException(status_code=404, detail=f"Unknown table, expected one of: {', '.join(export.TABLES)}")
+    return StreamingResponse(
+        export.stream_csv(table, fleet_records()),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{table}.csv"'},
+    )
 
 
 @router.get("/api/scan/status")
@@ -174,5 +567,5 @@ async def check_scan_status(request: Request):
     state = get_project_state(project)
     scan = state.get("scan")
     if scan:
-        return {"ready": True, "hostname": scan.hostname, "project": project}
+        return {"ready": True, "hostname": scan.hostname, "project": project, "collection_stats": scan.collection_stats}
     return {"ready": False, "project": project}
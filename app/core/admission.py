@@ -0,0 +1,138 @@
+import asyncio
+import collections
+import math
+import os
+import time
+from typing import Deque, Dict, Optional
+
+from app.core import metrics
+
+# Ingest admission control. At most MAX_CONCURRENT submissions are read and
+# parsed at once; up to MAX_QUEUED more wait for a slot, handed out
+# round-robin across projects so one large rollout cannot starve the others.
+# Everything beyond that is rejected with 429 and a Retry-After hint.
+MAX_CONCURRENT = int(os.environ.get("MIGRATOR_INGEST_CONCURRENCY", "4"))
+MAX_QUEUED = int(os.environ.get("MIGRATOR_INGEST_QUEUE", "64"))
+MAX_QUEUED_PER_PROJECT = int(os.environ.get("MIGRATOR_INGEST_PROJECT_QUEUE", "32"))
+QUEUE_TIMEOUT = float(os.environ.get("MIGRATOR_INGEST_QUEUE_TIMEOUT", "15"))
+MAX_BODY_BYTES = int(float(os.environ.get("MIGRATOR_INGEST_MAX_BODY_MB", "64")) * 1024 * 1024)
+MAX_BATCH_BYTES = int(float(os.environ.get("MIGRATOR_INGEST_MAX_BATCH_MB", "256")) * 1024 * 1024)
+# Routes under admission control and the largest body each takes. Relay
+# batches are streamed to disk by their route; bulk imports read bundles
+# from the import directory and take no body.
+BODY_LIMITS = {
+    "/api/scan/submit": MAX_BODY_BYTES,
+    "/api/scan/patch": MAX_BODY_BYTES,
+    "/api/scan/relay": MAX_BATCH_BYTES,
+    "/api/scan/import": 0,
+}
+STREAMED_PATHS = ("/api/scan/relay",)
+
+IN_FLIGHT = metrics.gauge("migrator_ingest_in_flight", "Scan submissions currently being processed")
+QUEUED = metrics.gauge("migrator_ingest_queued", "Scan submissions waiting for an ingest slot")
+REJECTED = metrics.counter("migrator_ingest_rejected_total", "Scan submissions rejected by admission control", ("reason",))
+QUEUE_WAIT = metrics.histogram("migrator_ingest_queue_wait_seconds", "Time scan submissions waited for an ingest slot")
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONCURRENT,
+        max_queued: int = MAX_QUEUED,
+        max_queued_per_project: int = MAX_QUEUED_PER_PROJECT,
+        queue_timeout: float = QUEUE_TIMEOUT,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.max_queued_per_project = max_queued_per_project
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: Dict[str, Deque[asyncio.Future]] = collections.OrderedDict()
+        self._queued = 0
+        # Exponentially weighted service time, used for Retry-After estimates.
+        self._service_seconds = 0.05
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrent > 0
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    def retry_after(self) -> int:
+        # Time to drain what is already admitted or queued, at least a second.
+        backlog = self.in_flight + self._queued
+        return max(1, math.ceil(backlog * self._service_seconds / max(1, self.max_concurrent)))
+
+    async def acquire(self, project: str):
+        if self.in_flight < self.max_concurrent and not self._queued:
+            self.in_flight += 1
+            return
+        waiters = self._waiters.get(project)
+        if self._queued >= self.max_queued:
+            REJECTED.inc(reason="queue_full")
+            raise Rejected("Ingest queue is full", self.retry_after())
+        if waiters is not None and len(waiters) >= self.max_queued_per_project:
+            REJECTED.inc(reason="project_queue_full")
+            raise Rejected(f"Too many queued submissions for project {project}", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(project, collections.deque()).append(future)
+        self._queued += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # Granted a slot at the same moment the wait timed out.
+                QUEUE_WAIT.observe(time.perf_counter() - start)
+                return
+            self._discard(project, future)
+            REJECTED.inc(reason="queue_timeout")
+            raise Rejected("Timed out waiting for an ingest slot", self.retry_after())
+        except BaseException:
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                self._discard(project, future)
+            raise
+        QUEUE_WAIT.observe(time.perf_counter() - start)
+
+    def _discard(self, project: str, future: asyncio.Future):
+        waiters = self._waiters.get(project)
+        if waiters and future in waiters:
+            waiters.remove(future)
+            self._queued -= 1
+            if not waiters:
+                del self._waiters[project]
+        future.cancel()
+
+    def release(self, service_seconds: Optional[float] = None):
+        if service_seconds is not None:
+            self._service_seconds = 0.8 * self._service_seconds + 0.2 * service_seconds
+        # Hand the slot to the next project in round-robin order; the project
+        # goes to the back of the rotation if it still has waiters.
+        while self._waiters:
+            project, waiters = next(iter(self._waiters.items()))
+            future = waiters.popleft()
+            self._queued -= 1
+            del self._waiters[project]
+            if waiters:
+                self._waiters[project] = waiters
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+
+CONTROLLER = AdmissionController()
+IN_FLIGHT.set_function(lambda: CONTROLLER.in_flight)
+QUEUED.set_function(lambda: CONTROLLER.queued)
@@ -1,7 +1,21 @@
-from app.models import ScanResult, AnalysisResult, Component
+from app.models import ScanResult, AnalysisResult, Component, TransferEstimate
+from app.core import metrics, profiling, rules
+import math
+import os
 import uuid
 import re
 
+# Cutover planning knobs: usable link speed to GCP, achievable fraction of it,
+# disk growth headroom and the cutover window a transfer should fit into.
+TRANSFER_MBPS = float(os.environ.get("MIGRATOR_TRANSFER_MBPS", "100"))
+TRANSFER_EFFICIENCY = float(os.environ.get("MIGRATOR_TRANSFER_EFFICIENCY", "0.7"))
+DISK_HEADROOM = float(os.environ.get("MIGRATOR_DISK_HEADROOM", "1.5"))
+CUTOVER_WINDOW_HOURS = float(os.environ.get("MIGRATOR_CUTOVER_WINDOW_HOURS", "4"))
+MIN_DISK_GB = 10
+
+ANALYSIS_SECONDS = metrics.histogram("migrator_analysis_seconds", "Duration of analyze_scan")
+DIAGRAM_SECONDS = metrics.histogram("migrator_diagram_seconds", "Duration of architecture diagram generation")
+
 
 def sanitize_id(value: str) -> str:
     cleaned = re.sub(r"[^0-9A-Za-z_]", "_", value)
@@ -12,6 +26,8 @@ def sanitize_id(value: str) -> str:
     return cleaned
 
 
+@DIAGRAM_SECONDS.time()
+@profiling.traced("analyzer.generate_architecture_diagram")
 def generate_architecture_diagram(scan: ScanResult, analysis: AnalysisResult | None = None) -> str:
     graph = ["graph TD"]
     
@@ -92,7 +108,39 @@ def generate_architecture_diagram(scan: ScanResult, analysis: AnalysisResult | N
 
     return "\n".join(graph)
 
-def analyze_scan(scan: ScanResult) -> AnalysisResult:
+def transfer_seconds(size_bytes: int, bandwidth_mbps: float) -> float:
+    return size_bytes * 8 / (bandwidth_mbps * 1_000_000 * TRANSFER_EFFICIENCY)
+
+
+def estimate_transfer(scan: ScanResult, bandwidth_mbps: float = None):
+    # App, database and system data directories (already de-nested by the
+    # collector); mounts only describe capacity and are not copied as a whole.
+    bandwidth_mbps = bandwidth_mbps or TRANSFER_MBPS
+    estimates = [
+        TransferEstimate(
+            path=v.path, kind=v.kind, bytes=v.bytes,
+            seconds=round(transfer_seconds(v.bytes, bandwidth_mbps), 1), estimated=v.estimated,
+        )
+        for v in scan.data_volumes
+        if v.kind != "mount"
+    ]
+    estimates.sort(key=lambda e: e.bytes, reverse=True)
+    return estimates
+
+
+def recommend_disk_gb(scan: ScanResult) -> int:
+    mounts = [v for v in scan.data_volumes if v.kind == "mount"]
+    if mounts:
+        used_gb = sum(v.bytes for v in mounts) / 1024 ** 3
+    else:
+        # Older scans only know capacity.
+        used_gb = sum(scan.disk_space_gb.values())
+    return max(MIN_DISK_GB, int(math.ceil(used_gb * DISK_HEADROOM / 10.0)) * 10)
+
+
+@ANALYSIS_SECONDS.time()
+@profiling.traced("analyzer.analyze_scan")
+def analyze_scan(scan: ScanResult, bandwidth_mbps: float = None, engine: rules.RuleEngine = None) -> AnalysisResult:
     # 1. Resource Mapping
     # Simple logic: Match CPU/RAM to nearest standard machine type
     machine_type = "e2-medium" # Default
@@ -102,20 +150,11 @@ def analyze_scan(scan: ScanResult) -> AnalysisResult:
         machine_type = "e2-standard-2"
     
     # 2. Strategy Determination
-    strategy = "Rehost"
-    risks = []
-    
-    # Check for databases to suggest Replatform
-    db_services = ["postgresql", "mysql", "oracle", "mongod"]
-    found_dbs = [s for s in scan.running_services if any(db in s for db in db_services)]
-    
-    if found_dbs:
-        strategy = "Replatform"
-        risks.append(f"Database migration required for: {', '.join(found_dbs)}")
-    
-    # Check for older OS
-    if "14.04" in scan.os_info or "16.04" in scan.os_info:
-        risks.append("Legacy OS detected. Consider upgrading or containerizing (Refactor).")
+    # Risk and strategy rules (databases, legacy OS, EOL packages, ...) live
+    # in rule files, see app.core.rules.
+    findings = rules.evaluate(scan, engine)
+    strategy = rules.strategy_for(findings)
+    risks = [f.message for f in findings]
 
     # 3. Cost Estimation (Mocked)
     # e2-standard-4 is roughly $100/mo, e2-medium is $25/mo
@@ -125,6 +164,19 @@ def analyze_scan(scan: ScanResult) -> AnalysisResult:
     elif machine_type == "e2-standard-2":
         cost = 50.0
 
+    # 4. Data volumes: cutover transfer time and disk sizing
+    bandwidth_mbps = bandwidth_mbps or TRANSFER_MBPS
+    estimates = estimate_transfer(scan, bandwidth_mbps)
+    data_bytes = sum(e.bytes for e in estimates)
+    total_seconds = round(transfer_seconds(data_bytes, bandwidth_mbps), 1) if estimates else None
+    if total_seconds and total_seconds > CUTOVER_WINDOW_HOURS * 3600:
+        risks.append(
+            f"Copying {data_bytes / 1024 ** 3:.1f} GB takes about {total_seconds / 3600:.1f}h at {bandwidth_mbps:g} Mbps, "
+            f"longer than a {CUTOVER_WINDOW_HOURS:g}h cutover window. Pre-seed data and sync deltas at cutover."
+        )
+    if any(e.estimated for e in estimates):
+        risks.append("Some data volumes were sampled or cut short by the time budget; sizes are estimates.")
+
     diagram = generate_architecture_diagram(scan, None)
 
     return AnalysisResult(
@@ -133,5 +185,11 @@ def analyze_scan(scan: ScanResult) -> AnalysisResult:
         estimated_cost_monthly=cost,
         migration_strategy=strategy,
         risks=risks,
-        architecture_diagram=diagram
+        architecture_diagram=diagram,
+        data_volume_bytes=data_bytes,
+        transfer_bandwidth_mbps=bandwidth_mbps,
+        transfer_seconds=total_seconds,
+        transfer_estimates=estimates,
+        recommended_disk_gb=recommend_disk_gb(scan),
+        findings=findings,
     )
@@ -0,0 +1,140 @@
+import hashlib
+import io
+import os
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from typing import Iterator, List, Optional, Tuple
+
+from app.core import metrics
+
+# Build artifacts served to the browser. Responses carry a stat-based ETag
+# (builder only rewrites files whose content changed, so mtimes are stable)
+# and support single byte ranges, so the build page can fetch a preview and
+# individual startup script sections instead of inlining the whole script.
+ARTIFACTS = ("main.tf", "startup.sh", "image.pkr.hcl", "boot.sh")
+IMAGE_ARTIFACTS = ("image.pkr.hcl", "boot.sh")  # Only written for baked-image builds
+MEDIA_TYPES = {
+    "main.tf": "text/plain; charset=utf-8",
+    "startup.sh": "text/x-shellscript; charset=utf-8",
+    "image.pkr.hcl": "text/plain; charset=utf-8",
+    "boot.sh": "text/x-shellscript; charset=utf-8",
+}
+STREAM_CHUNK = 64 * 1024
+PREVIEW_BYTES = int(os.environ.get("MIGRATOR_BUILD_PREVIEW_KB", "16")) * 1024
+ZIP_CACHE_SIZE = 8
+
+ARTIFACT_BYTES = metrics.counter("migrator_artifact_bytes_total", "Build artifact bytes served", ("artifact",))
+ARTIFACT_RESPONSES = metrics.counter(
+    "migrator_artifact_responses_total", "Build artifact responses by status", ("artifact", "status")
+)
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def artifact_path(build, name: str) -> str:
+    if name not in artifact_names(build):
+        raise KeyError(name)
+    return os.path.join(os.path.dirname(build.terraform_code_path), name)
+
+
+def artifact_names(build) -> list:
+    return [name for name in ARTIFACTS if build.image_name or name not in IMAGE_ARTIFACTS]
+
+
+def etag(st: os.stat_result) -> str:
+    return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def etag_matches(header: Optional[str], tag: str, strong: bool = False) -> bool:
+    # Weak comparison, as If-None-Match requires; If-Match and If-Range need
+    # strong comparison, where a weak tag never matches.
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = (t.strip() for t in header.split(","))
+    if strong:
+        return tag in tags
+    return tag in (t[2:] if t.startswith("W/") else t for t in tags)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    # One "bytes=" range as an inclusive (start, end); None means the whole
+    # file. Multipart ranges are not supported and are served whole.
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[6:].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            start, end = max(0, size - int(last)), size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+
+def iter_file(path: str, start: int, end: int, chunk: int = STREAM_CHUNK) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = f.read(min(chunk, remaining))
+            if not data:
+                return
+            remaining -= len(data)
+            yield data
+
+
+def section_index(build, st: os.stat_result) -> List[dict]:
+    # The index comes from the build; it only describes the file on disk if
+    # the sizes agree (another build may have rewritten the shared output).
+    sections = [s.model_dump() for s in build.startup_sections]
+    if sections and sections[-1]["offset"] + sections[-1]["length"] != st.st_size:
+        return []
+    return sections
+
+
+def _zip_time(mtime: float) -> tuple:
+    return max(time.localtime(mtime)[:6], (1980, 1, 1, 0, 0, 0))
+
+
+class _ZipCache:
+    # Small LRU of zipped artifact sets keyed by their combined ETag.
+    def __init__(self, size: int):
+        self.size = size
+        self._items: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, paths: List[str]) -> Tuple[str, bytes]:
+        stats = [os.stat(p) for p in paths]
+        key = hashlib.blake2b("".join(etag(st) for st in stats).encode(), digest_size=12).hexdigest()
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+                return f'"{key}"', data
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+            for path, st in zip(paths, stats):
+                info = zipfile.ZipInfo(os.path.basename(path), date_time=_zip_time(st.st_mtime))
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.external_attr = (0o755 if path.endswith(".sh") else 0o644) << 16
+                with open(path, "rb") as f:
+                    zf.writestr(info, f.read())
+        data = buf.getvalue()
+        with self._lock:
+            self._items[key] = data
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+        return f'"{key}"', data
+
+
+ZIP_CACHE = _ZipCache(ZIP_CACHE_SIZE)
@@ -0,0 +1,232 @@
+import csv
+import json
+import os
+import queue
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from app.models import InventoryHost, BuildConfig
+from app.core import metrics
+
+BATCH_HOSTS = metrics.counter("migrator_batch_hosts_total", "Hosts processed by batch runs", ("result",))
+BATCH_QUEUE_WAIT = metrics.histogram(
+    "migrator_batch_queue_wait_seconds", "Time scanned hosts wait for an analyze/build worker"
+)
+
+CHECKPOINT_FILE = "checkpoint.json"
+RESULT_FILE = "result.json"
+
+_STOP = object()
+
+
+def load_inventory(path: str) -> List[InventoryHost]:
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, newline='') as f:
+        if ext == ".json":
+            data = json.load(f)
+        elif ext == ".csv":
+            data = [
+                {k: v for k, v in row.items() if v not in (None, "")}
+                for row in csv.DictReader(f)
+            ]
+        elif ext in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("YAML inventories require PyYAML (pip install pyyaml)")
+            data = yaml.safe_load(f)
+        else:
+            raise ValueError(f"Unsupported inventory format '{ext}' (use .json, .csv, .yaml)")
+
+    if isinstance(data, dict):
+        data = data.get("hosts", [])
+    if not isinstance(data, list):
+        raise ValueError("Inventory must be a list of hosts or a mapping with a 'hosts' list")
+
+    hosts = [InventoryHost(**entry) for entry in data]
+    seen = set()
+    for host in hosts:
+        key = host_key(host)
+        if key in seen:
+            raise ValueError(f"Duplicate inventory entry '{key}' (set a unique 'name')")
+        seen.add(key)
+    return hosts
+
+
+def host_key(host: InventoryHost) -> str:
+    return re.sub(r"[^0-9A-Za-z_.-]", "_", host.name or host.host)
+
+
+class Checkpoint:
+    # Per-host status persisted after every completion so an interrupted run
+    # can resume without redoing finished hosts.
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.hosts: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.hosts = json.load(f).get("hosts", {})
+
+    def is_done(self, key: str) -> bool:
+        return self.hosts.get(key, {}).get("status") == "done"
+
+    def mark(self, key: str, status: str, error: str = None):
+        with self._lock:
+            self.hosts[key] = {"status": status, "error": error, "updated": time.time()}
+            tmp = self.path + ".tmp"
+            with open(tmp, 'w') as f:
+                json.dump({"hosts": self.hosts}, f, indent=2)
+            os.replace(tmp, self.path)
+
+
+def run_batch(
+    hosts: List[InventoryHost],
+    output_dir: str,
+    project_id: str = "my-migration-project",
+    scan_workers: int = 4,
+    build_workers: int = 2,
+    queue_size: int = 8,
+    build: bool = True,
+    bake_image: bool = False,
+    resume: bool = True,
+    on_event: Optional[Callable[[str, str, str, dict], None]] = None,
+    stop_event: Optional[threading.Event] = None,
+) -> Dict[str, dict]:
+    # Two-stage pipeline: scanning (network bound) and analyze/build (CPU and
+    # disk bound) run in separate worker pools joined by a bounded queue, so
+    # analysis of host N overlaps the scan of host N+1 and scanners block
+    # instead of piling up results when the build stage falls behind.
+    from app.core import scanner, analyzer, builder
+
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint = Checkpoint(os.path.join(output_dir, CHECKPOINT_FILE))
+    stop_event = stop_event or threading.Event()
+    summary: Dict[str, dict] = {}
+    summary_lock = threading.Lock()
+
+    def emit(key, stage, status, **detail):
+        if on_event:
+            on_event(key, stage, status, detail)
+
+    def finish(key, result):
+        with summary_lock:
+            summary[key] = result
+        host_dir = os.path.join(output_dir, key)
+        os.makedirs(host_dir, exist_ok=True)
+        with open(os.path.join(host_dir, RESULT_FILE), 'w') as f:
+            json.dump(result, f, indent=2)
+        checkpoint.mark(key, result["status"], result.get("error"))
+        BATCH_HOSTS.inc(result=result["status"])
+        emit(key, "finished", result["status"], error=result.get("error"))
+
+    pending = []
+    for host in hosts:
+        key = host_key(host)
+        if resume and checkpoint.is_done(key):
+            summary[key] = {"host": host.host, "status": "done", "skipped": True}
+            emit(key, "skipped", "done")
+            continue
+        pending.append(host)
+        emit(key, "queued", "pending")
+
+    scan_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    build_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+
+    def scan_worker():
+        while True:
+            host = scan_queue.get()
+            if host is _STOP:
+                return
+            key = host_key(host)
+            if stop_event.is_set():
+                continue
+            emit(key, "scan", "running")
+            start = time.perf_counter()
+            try:
+                scan = scanner.scan_server(host)
+            except Exception as e:
+                finish(key, {"host": host.host, "status": "failed", "stage": "scan", "error": str(e),
+                             "timings": {"scan": time.perf_counter() - start}})
+                continue
+            timings = {"scan": time.perf_counter() - start}
+            emit(key, "scan", "done", seconds=timings["scan"])
+            build_queue.put((host, scan, timings, time.perf_counter()))
+
+    def build_worker():
+        while True:
+            item = build_queue.get()
+            if item is _STOP:
+                return
+            host, scan, timings, queued_at = item
+            key = host_key(host)
+            BATCH_QUEUE_WAIT.observe(time.perf_counter() - queued_at)
+            stage = "analyze"
+            try:
+                emit(key, "analyze", "running")
+                start = time.perf_counter()
+                analysis = analyzer.analyze_scan(scan)
+                timings["analyze"] = time.perf_counter() - start
+                emit(key, "analyze", "done", seconds=timings["analyze"])
+
+                build_result = None
+                if build:
+                    stage = "build"
+                    emit(key, "build", "running")
+                    start = time.perf_counter()
+                    config = BuildConfig(
+                        project_id=host.project_id or project_id,
+                        region="us-central1",
+                        zone="us-central1-a",
+                        instance_name=f"migrated-{scan.hostname}",
+                        machine_type=analysis.recommended_gcp_instance,
+                        source_image="debian-cloud/debian-11",
+                        disk_size_gb=analysis.recommended_disk_gb,
+                        bake_image=bake_image,
+                    )
+                    build_result = builder.generate_terraform(
+                        config, scan_result=scan, analysis_result=analysis,
+                        output_dir=os.path.join(output_dir, key),
+                    )
+                    timings["build"] = time.perf_counter() - start
+                    emit(key, "build", "done", seconds=timings["build"])
+
+                finish(key, {
+                    "host": host.host,
+                    "project": host.project_id or project_id,
+                    "status": "done",
+                    "timings": timings,
+                    "scan": scan.model_dump(),
+                    "analysis": analysis.model_dump(),
+                    "build": build_result.model_dump() if build_result else None,
+                })
+            except Exception as e:
+                finish(key, {"host": host.host, "status": "failed", "stage": stage, "error": str(e),
+                             "timings": timings})
+
+    scanners = [threading.Thread(target=scan_worker, name=f"scan-{i}", daemon=True) for i in range(max(1, scan_workers))]
+    builders = [threading.Thread(target=build_worker, name=f"build-{i}", daemon=True) for i in range(max(1, build_workers))]
+    for t in scanners + builders:
+        t.start()
+
+    try:
+        for host in pending:
+            if stop_event.is_set():
+                break
+            scan_queue.put(host)
+    except KeyboardInterrupt:
+        stop_event.set()
+        raise
+    finally:
+        for _ in scanners:
+            scan_queue.put(_STOP)
+        for t in scanners:
+            t.join()
+        for _ in builders:
+            build_queue.put(_STOP)
+        for t in builders:
+            t.join()
+
+    return summary
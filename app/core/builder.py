@@ -1,158 +1,628 @@
-from app.models import BuildConfig, BuildResult, ScanResult, AnalysisResult
-from jinja2 import Environment, FileSystemLoader
+from app.models import BuildConfig, BuildResult, ScanResult, AnalysisResult, ScriptSection
+from app.core import history, metrics, packages, profiling
+from collections import OrderedDict
+from types import SimpleNamespace
 import os
 import subprocess
 import base64
+import functools
+import hashlib
+import re
+import threading
+import time
 
 TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), '../../templates/gcp')
 GENERATED_DIR = os.path.join(os.path.dirname(__file__), '../../generated')
 
-def generate_terraform(config: BuildConfig, scan_result: ScanResult = None, analysis_result: AnalysisResult = None) -> BuildResult:
-    # Ensure generated directory exists
-    if not os.path.exists(GENERATED_DIR):
-        os.makedirs(GENERATED_DIR)
-        
-    env = Environment(loader=FileSystemLoader(TEMPLATE_DIR))
-    template = env.get_template('main.tf.j2')
-    
-    # Generate startup script if we have config files
-    startup_script = "#!/bin/bash\n"
-    startup_script += "echo 'Starting system migration restoration...'\n\n"
-    
-    if scan_result:
-        # 0. Install Manually Added Components
-        if analysis_result and analysis_result.added_components:
-            startup_script += "# Install Manually Added Components\n"
-            startup_script += "apt-get update\n"
-            for comp in analysis_result.added_components:
-                # Basic assumption: Component name matches package name
-                startup_script += f"apt-get install -y {comp.name.lower()} || echo 'Could not install {comp.name}'\n"
-            startup_script += "\n"
-
-        # 1. Install Packages (Debian/Ubuntu assumption for demo)
-        if scan_result.installed_packages:
-            packages = " ".join(scan_result.installed_packages[:50]) # Limit to top 50 to avoid huge command
-            startup_script += "# Restore Packages (Partial)\n"
-            startup_script += "apt-get update\n"
-            startup_script += f"apt-get install -y {packages} || true\n\n"
-            
-        # 2. Setup Node.js & PM2 (if PM2 processes detected)
-        if scan_result.pm2_processes:
-            startup_script += "# Install Node.js & PM2\n"
-            startup_script += "curl -fsSL https://deb.nodesource.com/setup_lts.x | bash -\n"
-            startup_script += "apt-get install -y nodejs\n"
-            startup_script += "npm install -g pm2\n\n"
-            
-        # 3. Create Users
-        if scan_result.system_users:
-            startup_script += "# Restore Users\n"
-            for user in scan_result.system_users:
-                if user != 'root':
-                    startup_script += f"id -u {user} &>/dev/null || useradd -m {user}\n"
-            startup_script += "\n"
-
-        # 5. Restore Config Files
-        if scan_result.config_files:
-            startup_script += "# Restore Configuration Files\n"
-            for path, content in scan_result.config_files.items():
-                # Encode content to avoid escaping issues
-                b64_content = base64.b64encode(content.encode()).decode()
-                startup_script += f"mkdir -p $(dirname {path})\n"
-                startup_script += f"echo '{b64_content}' | base64 -d > {path}\n"
-            startup_script += "\n"
-
-        # 6. Restore PM2 Apps Configs
-        if scan_result.pm2_processes and scan_result.custom_app_configs:
-            startup_script += "# Restore PM2 Applications Configs\n"
-            for app_name, configs in scan_result.custom_app_configs.items():
-                # Find path for this app from pm2_processes
-                app_path = next((p['path'] for p in scan_result.pm2_processes if p['name'] == app_name), f"/opt/{app_name}")
-                
-                startup_script += f"mkdir -p {app_path}\n"
-                
-                for filename, content in configs.items():
-                    # filename is now a relative path (e.g., "src/config/db.js")
-                    # We need to ensure the directory exists
-                    full_target_path = os.path.join(app_path, filename)
-                    dir_name = os.path.dirname(full_target_path)
-                    
-                    b64_content = base64.b64encode(content.encode()).decode()
-                    
-                    startup_script += f"mkdir -p {dir_name}\n"
-                    startup_script += f"echo '{b64_content}' | base64 -d > {full_target_path}\n"
-                
-                # Try to install dependencies if package.json exists
-                # Check keys for exact match or simple match
-                has_package_json = any(k.endswith('package.json') for k in configs.keys())
-                has_ecosystem = any(k.endswith('ecosystem.config.js') for k in configs.keys())
-                
-                if has_package_json:
-                     startup_script += f"cd {app_path} && npm install || echo 'npm install failed'\n"
-                
-                # Try to restart app
-                if has_ecosystem:
-                    startup_script += f"cd {app_path} && pm2 start ecosystem.config.js || echo 'pm2 start failed'\n"
-                elif has_package_json:
-                     startup_script += f"cd {app_path} && npm start & \n"
-            
-            startup_script += "pm2 save\n\n"
-
-        if scan_result.generic_apps:
-            for app in scan_result.generic_apps:
-                name = app.get("name") or app.get("service_name")
-                app_path = app.get("app_path") or (f"/opt/{name}" if name else None)
-                files = app.get("files") or {}
-                unit_file_path = app.get("unit_file_path")
-                unit_file_content = app.get("unit_file_content")
-
-                if app_path and files:
-                    for filename, content in files.items():
-                        full_target_path = os.path.join(app_path, filename)
-                        dir_name = os.path.dirname(full_target_path)
-                        b64_content = base64.b64encode(content.encode()).decode()
-                        startup_script += f"mkdir -p {dir_name}\n"
-                        startup_script += f"echo '{b64_content}' | base64 -d > {full_target_path}\n"
-
-                if unit_file_path and unit_file_content:
-                    b64_unit = base64.b64encode(unit_file_content.encode()).decode()
-                    unit_dir = os.path.dirname(unit_file_path)
-                    startup_script += f"mkdir -p {unit_dir}\n"
-                    startup_script += f"echo '{b64_unit}' | base64 -d > {unit_file_path}\n"
-                    service_name = app.get("service_name") or (f"{name}.service" if name else None)
-                    if service_name:
-                        startup_script += "systemctl daemon-reload\n"
-                        startup_script += f"systemctl enable {service_name} || true\n"
-                        startup_script += f"systemctl restart {service_name} || true\n"
-
-        if scan_result.crontabs:
-            startup_script += "# Restore Crontabs\n"
-            for user, cron_content in scan_result.crontabs.items():
-                b64_cron = base64.b64encode(cron_content.encode()).decode()
-                startup_script += f"echo '{b64_cron}' | base64 -d | crontab -u {user} -\n"
-            startup_script += "\n"
-            
-    # Save startup script
-    startup_path = os.path.join(GENERATED_DIR, 'startup.sh')
-    with open(startup_path, 'w') as f:
-        f.write(startup_script)
-    
-    # Map config to template variables
-    terraform_content = template.render(
+BUILD_SECONDS = metrics.histogram("migrator_build_seconds", "Duration of Terraform and startup script generation")
+BASE64_BYTES = metrics.counter("migrator_build_base64_bytes_total", "Base64 bytes emitted into startup scripts")
+SECTIONS_RENDERED = metrics.counter(
+    "migrator_build_sections_total", "Startup script sections rendered or served from cache", ("result",)
+)
+STARTUP_SCRIPT_BYTES = metrics.histogram(
+    "migrator_build_startup_script_bytes", "Size of generated startup scripts", buckets=metrics.BYTE_BUCKETS
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _template_env():
+    # Imported on first build so CLI and API startup don't pay for jinja2;
+    # the environment caches compiled templates across builds.
+    from jinja2 import Environment, FileSystemLoader
+
+    return Environment(loader=FileSystemLoader(TEMPLATE_DIR))
+
+
+def _b64(content: str) -> str:
+    if profiling.active():
+        start = time.perf_counter()
+        encoded = base64.b64encode(content.encode()).decode()
+        profiling.add_timing("builder.base64", time.perf_counter() - start, bytes=len(encoded))
+    else:
+        encoded = base64.b64encode(content.encode()).decode()
+    BASE64_BYTES.inc(len(encoded))
+    return encoded
+
+
+STARTUP_HEADER = "#!/bin/bash\necho 'Starting system migration restoration...'\n\n"
+
+
+def _section_added_components(scan_result, analysis_result, config=None) -> str:
+    # 0. Install Manually Added Components
+    if not (analysis_result and analysis_result.added_components):
+        return ""
+    out = ["# Install Manually Added Components\n", "apt-get update\n"]
+    for comp in analysis_result.added_components:
+        # Basic assumption: Component name matches package name
+        out.append(f"apt-get install -y {comp.name.lower()} || echo 'Could not install {comp.name}'\n")
+    out.append("\n")
+    return "".join(out)
+
+
+def _wrap(words, indent: str, width: int = 100) -> list:
+    lines, line = [], []
+    for word in words:
+        if line and len(indent) + sum(len(w) + 1 for w in line) + len(word) > width:
+            lines.append(indent + " ".join(line))
+            line = []
+        line.append(word)
+    if line:
+        lines.append(indent + " ".join(line))
+    return lines
+
+
+def _section_packages(scan_result, analysis_result, config=None) -> str:
+    # 1. Install Packages, resolved to names that exist on the target image
+    if not scan_result.installed_packages:
+        return ""
+    plan = packages.resolve(scan_result.installed_packages, scan_result.os_info, config.source_image if config else "")
+    if plan is None:
+        # No index for this image: install one by one so an unknown name
+        # cannot abort the others.
+        names = list(dict.fromkeys(p.split(":", 1)[0] for p in scan_result.installed_packages))
+        return (
+            "# Restore Packages (no package index for this image, installing names as-is)\n"
+            "apt-get update\n"
+            "for p in \\\n" + " \\\n".join(_wrap(names, "  ")) + "; do\n"
+            "  DEBIAN_FRONTEND=noninteractive apt-get install -y \"$p\" || echo \"Could not install $p\"\n"
+            "done\n\n"
+        )
+    out = [
+        f"# Restore Packages ({plan['source'] or 'unknown source'} -> {plan['target']}, package index {plan['index_version']}): "
+        f"{len(plan['install'])} to install, {len(plan['renamed'])} renamed, {len(plan['base'])} already in the image, "
+        f"{len(plan['dropped'])} dropped, {len(plan['unresolved'])} not available\n"
+    ]
+    for name, names in plan["renamed"].items():
+        out.append(f"#   {name} -> {' '.join(names)}\n")
+    if plan["unresolved"]:
+        out.append(f"# Not available on {plan['target']}:\n")
+        out.extend(line + "\n" for line in _wrap(plan["unresolved"], "#   "))
+    if plan["install"]:
+        out.append("apt-get update\n")
+        out.append("DEBIAN_FRONTEND=noninteractive apt-get install -y \\\n")
+        out.append(" \\\n".join(_wrap(plan["install"], "  ")) + "\n")
+    out.append("\n")
+    return "".join(out)
+
+
+def _section_nodejs(scan_result, analysis_result, config=None) -> str:
+    # 2. Setup Node.js & PM2 (if PM2 processes detected)
+    if not scan_result.pm2_processes:
+        return ""
+    return (
+        "# Install Node.js & PM2\n"
+        "curl -fsSL https://deb.nodesource.com/setup_lts.x | bash -\n"
+        "apt-get install -y nodejs\n"
+        "npm install -g pm2\n\n"
+    )
+
+
+def _section_users(scan_result, analysis_result, config=None) -> str:
+    # 3. Create Users
+    if not scan_result.system_users:
+        return ""
+    out = ["# Restore Users\n"]
+    for user in scan_result.system_users:
+        if user != 'root':
+            out.append(f"id -u {user} &>/dev/null || useradd -m {user}\n")
+    out.append("\n")
+    return "".join(out)
+
+
+def _write_file_lines(out: list, path: str, content: str, mkdir: str):
+    # Encode content to avoid escaping issues
+    out.append(f"mkdir -p {mkdir}\n")
+    out.append(f"echo '{_b64(content)}' | base64 -d > {path}\n")
+
+
+def _section_config_files(scan_result, analysis_result, config=None) -> str:
+    # 5. Restore Config Files
+    if not scan_result.config_files:
+        return ""
+    out = ["# Restore Configuration Files\n"]
+    for path, content in scan_result.config_files.items():
+        _write_file_lines(out, path, content, f"$(dirname {path})")
+    out.append("\n")
+    return "".join(out)
+
+
+def _baking(config) -> bool:
+    return bool(config and config.bake_image)
+
+
+def _pm2_app_path(scan_result, app_name: str) -> str:
+    # Find path for this app from pm2_processes
+    return next((p['path'] for p in scan_result.pm2_processes if p['name'] == app_name), f"/opt/{app_name}")
+
+
+def _section_pm2_apps(scan_result, analysis_result, config=None) -> str:
+    # 6. Restore PM2 Apps Configs
+    if not (scan_result.pm2_processes and scan_result.custom_app_configs):
+        return ""
+    out = ["# Restore PM2 Applications Configs\n"]
+    for app_name, configs in scan_result.custom_app_configs.items():
+        app_path = _pm2_app_path(scan_result, app_name)
+        out.append(f"mkdir -p {app_path}\n")
+
+        for filename, content in configs.items():
+            # filename is a relative path (e.g., "src/config/db.js")
+            full_target_path = os.path.join(app_path, filename)
+            _write_file_lines(out, full_target_path, content, os.path.dirname(full_target_path))
+
+        # Try to install dependencies if package.json exists
+        has_package_json = any(k.endswith('package.json') for k in configs.keys())
+        has_ecosystem = any(k.endswith('ecosystem.config.js') for k in configs.keys())
+
+        if has_package_json:
+            out.append(f"cd {app_path} && npm install || echo 'npm install failed'\n")
+
+        # Try to restart app
+        if has_ecosystem:
+            out.append(f"cd {app_path} && pm2 start ecosystem.config.js || echo 'pm2 start failed'\n")
+        elif has_package_json and not _baking(config):
+            # Baked images start these from boot.sh instead.
+            out.append(f"cd {app_path} && npm start & \n")
+
+    out.append("pm2 save\n")
+    if _baking(config):
+        # Resurrect the saved process list on every boot of the image.
+        out.append("pm2 startup systemd -u root --hp /root || echo 'pm2 startup failed'\n")
+    out.append("\n")
+    return "".join(out)
+
+
+def _section_generic_apps(scan_result, analysis_result, config=None) -> str:
+    out = []
+    for app in scan_result.generic_apps:
+        name = app.get("name") or app.get("service_name")
+        app_path = app.get("app_path") or (f"/opt/{name}" if name else None)
+        files = app.get("files") or {}
+        unit_file_path = app.get("unit_file_path")
+        unit_file_content = app.get("unit_file_content")
+
+        if app_path and files:
+            for filename, content in files.items():
+                full_target_path = os.path.join(app_path, filename)
+                _write_file_lines(out, full_target_path, content, os.path.dirname(full_target_path))
+
+        if unit_file_path and unit_file_content:
+            _write_file_lines(out, unit_file_path, unit_file_content, os.path.dirname(unit_file_path))
+            service_name = app.get("service_name") or (f"{name}.service" if name else None)
+            if service_name:
+                out.append("systemctl daemon-reload\n")
+                out.append(f"systemctl enable {service_name} || true\n")
+                if not _baking(config):
+                    out.append(f"systemctl restart {service_name} || true\n")
+    return "".join(out)
+
+
+def _section_crontabs(scan_result, analysis_result, config=None) -> str:
+    if not scan_result.crontabs:
+        return ""
+    out = ["# Restore Crontabs\n"]
+    for user, cron_content in scan_result.crontabs.items():
+        out.append(f"echo '{_b64(cron_content)}' | base64 -d | crontab -u {user} -\n")
+    out.append("\n")
+    return "".join(out)
+
+
+def _section_image_cleanup(scan_result, analysis_result, config=None) -> str:
+    # Last step of an image bake: keep package caches out of the image.
+    if not _baking(config):
+        return ""
+    return "# Clean up before imaging\napt-get clean\nrm -rf /var/lib/apt/lists/*\n\n"
+
+
+def _ordered(files: dict, prefix: str) -> tuple:
+    # Script output follows insertion order, so cache keys must too.
+    return tuple((k, tuple(v.items())) for k, v in files.items() if k.startswith(prefix))
+
+
+# (name, renderer, cache key). The key names exactly the inputs a section reads
+# (fingerprint hashes from app.core.history), so a rebuild after a new scan
+# version re-renders only sections whose inputs changed.
+STARTUP_SECTIONS = [
+    ("added_components", _section_added_components,
+     lambda fp, scan, analysis, config: tuple(c.name for c in analysis.added_components) if analysis else ()),
+    ("packages", _section_packages,
+     lambda fp, scan, analysis, config: (fp["sections"]["installed_packages"], scan.os_info,
+                                         config.source_image if config else None, packages.index().digest)),
+    ("nodejs", _section_nodejs, lambda fp, scan, analysis, config: bool(scan.pm2_processes)),
+    ("users", _section_users, lambda fp, scan, analysis, config: fp["sections"]["system_users"]),
+    ("config_files", _section_config_files,
+     lambda fp, scan, analysis, config: tuple(fp["files"]["config_files"].items())),
+    ("pm2_apps", _section_pm2_apps,
+     lambda fp, scan, analysis, config: (fp["sections"]["pm2_processes"], _ordered(fp["files"], "custom_app_configs/"),
+                                         _baking(config))),
+    ("generic_apps", _section_generic_apps,
+     lambda fp, scan, analysis, config: (_ordered(fp["files"], "generic_apps/"), _baking(config))),
+    ("crontabs", _section_crontabs, lambda fp, scan, analysis, config: tuple(fp["files"]["crontabs"].items())),
+    ("image_cleanup", _section_image_cleanup, lambda fp, scan, analysis, config: _baking(config)),
+]
+
+
+class _SectionCache:
+    # LRU of rendered sections bounded by total characters.
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self._items: "OrderedDict[tuple, str]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            text = self._items.get(key)
+            if text is not None:
+                self._items.move_to_end(key)
+            return text
+
+    def put(self, key, text: str):
+        if len(text) > self.max_chars:
+            return
+        with self._lock:
+            if key in self._items:
+                return
+            self._items[key] = text
+            self._size += len(text)
+            while self._size > self.max_chars:
+                _, old = self._items.popitem(last=False)
+                self._size -= len(old)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+
+SECTION_CACHE = _SectionCache(int(os.environ.get("MIGRATOR_BUILD_CACHE_MB", "256")) * 1024 * 1024)
+
+
+def render_startup_sections(scan_result: ScanResult = None, analysis_result: AnalysisResult = None, config: BuildConfig = None):
+    # Returns [(name, text, rebuilt)] in script order.
+    if not scan_result:
+        return []
+    fp = history.fingerprint(scan_result)
+    sections = []
+    for name, render, key_fn in STARTUP_SECTIONS:
+        key = (name, key_fn(fp, scan_result, analysis_result, config))
+        text = SECTION_CACHE.get(key)
+        rebuilt = text is None
+        if rebuilt:
+            with profiling.span(f"builder.section.{name}"):
+                text = render(scan_result, analysis_result, config)
+            SECTION_CACHE.put(key, text)
+        SECTIONS_RENDERED.inc(result="rendered" if rebuilt else "cached")
+        sections.append((name, text, rebuilt))
+    return sections
+
+
+def generate_startup_script(scan_result: ScanResult = None, analysis_result: AnalysisResult = None, config: BuildConfig = None) -> str:
+    sections = render_startup_sections(scan_result, analysis_result, config)
+    return STARTUP_HEADER + "".join(text for _, text, _ in sections)
+
+
+def section_index(sections) -> list:
+    # Byte ranges of the rendered sections within the full script.
+    index = []
+    offset = len(STARTUP_HEADER.encode())
+    for name, text, _ in sections:
+        if not text:
+            continue
+        length = len(text.encode())
+        index.append(ScriptSection(name=name, offset=offset, length=length, lines=text.count("\n")))
+        offset += length
+    return index
+
+
+OVERRIDE_HEADER = "#!/bin/bash\necho 'Applying host-specific overrides...'\n\n"
+# Appended to a cluster's shared startup script: runs the member's override
+# script, passed as instance metadata by the cluster's main.tf.
+OVERRIDE_HOOK = (
+    "# Apply host-specific overrides\n"
+    "override=$(curl -sf -H 'Metadata-Flavor: Google' "
+    "http://metadata.google.internal/computeMetadata/v1/instance/attributes/migrator-override) "
+    "&& bash -c \"$override\"\n\n"
+)
+
+
+def _changed(detail: dict) -> list:
+    return detail.get("added", []) + detail.get("modified", [])
+
+
+def _generic_apps(scan: ScanResult) -> dict:
+    apps = {}
+    for app in scan.generic_apps:
+        name = app.get("name") or app.get("service_name") or "app"
+        apps.setdefault(f"generic_apps/{name}", app)
+    return apps
+
+
+def _remove_app_path(out: list, app_path: str):
+    # Never a top-level directory such as /opt itself.
+    if app_path and os.path.normpath(app_path).count("/") >= 2:
+        out.append(f"rm -rf {app_path}\n")
+
+
+def _remove_generic_app(out: list, app: dict):
+    name = app.get("name") or app.get("service_name")
+    service_name = app.get("service_name") or (f"{name}.service" if name else None)
+    if service_name:
+        out.append(f"systemctl disable --now {service_name} || true\n")
+    if app.get("unit_file_path"):
+        out.append(f"rm -f {app['unit_file_path']}\n")
+        out.append("systemctl daemon-reload\n")
+    _remove_app_path(out, app.get("app_path") or (f"/opt/{name}" if name else None))
+
+
+def generate_override_script(base: ScanResult, scan: ScanResult, config: BuildConfig = None) -> str:
+    # What a cluster member needs on top of its cluster's shared startup
+    # script (rendered from base): extra packages and users, the files whose
+    # content differs, and undoing the base's apps, pm2 processes and
+    # crontabs the host does not have. Restarts only what it touched.
+    diff = history.diff_scans(base, scan)["sections"]
+    out = [OVERRIDE_HEADER]
+    added = diff.get("installed_packages", {}).get("added")
+    if added:
+        out.append(_section_packages(SimpleNamespace(installed_packages=added, os_info=scan.os_info), None, config))
+    for user in diff.get("system_users", {}).get("added", []):
+        if user != 'root':
+            out.append(f"id -u {user} &>/dev/null || useradd -m {user}\n")
+
+    config_files = diff.get("config_files", {}).get("config_files", {})
+    for path in _changed(config_files):
+        _write_file_lines(out, path, scan.config_files[path], f"$(dirname {path})")
+    for path in config_files.get("removed", []):
+        out.append(f"rm -f {path}\n")
+    crontabs = diff.get("crontabs", {}).get("crontabs", {})
+    for user in _changed(crontabs):
+        out.append(f"echo '{_b64(scan.crontabs[user])}' | base64 -d | crontab -u {user} -\n")
+    for user in crontabs.get("removed", []):
+        out.append(f"crontab -r -u {user} || true\n")
+
+    pm2_removed = set(diff.get("pm2_processes", {}).get("removed", []))
+    for name in sorted(pm2_removed):
+        out.append(f"pm2 delete {name} || true\n")
+    for group, detail in diff.get("custom_app_configs", {}).items():
+        app_name = group.split("/", 1)[1]
+        if app_name not in scan.custom_app_configs:
+            # Restored from the base only; take it off this host.
+            if app_name not in pm2_removed:
+                pm2_removed.add(app_name)
+                out.append(f"pm2 delete {app_name} || true\n")
+            _remove_app_path(out, _pm2_app_path(base, app_name))
+            continue
+        configs = scan.custom_app_configs.get(app_name, {})
+        app_path = _pm2_app_path(scan, app_name)
+        for filename in _changed(detail):
+            full_target_path = os.path.join(app_path, filename)
+            _write_file_lines(out, full_target_path, configs[filename], os.path.dirname(full_target_path))
+        for filename in detail["removed"]:
+            out.append(f"rm -f {os.path.join(app_path, filename)}\n")
+        if any(k.endswith('ecosystem.config.js') for k in configs):
+            out.append(f"cd {app_path} && pm2 startOrRestart ecosystem.config.js || echo 'pm2 restart failed'\n")
+
+    if pm2_removed:
+        out.append("pm2 save\n")
+
+    apps, base_apps = _generic_apps(scan), _generic_apps(base)
+    for group, detail in diff.get("generic_apps", {}).items():
+        app = apps.get(group)
+        if app is None:
+            if group in base_apps:
+                _remove_generic_app(out, base_apps[group])
+            continue
+        name = app.get("name") or app.get("service_name")
+        app_path = app.get("app_path") or (f"/opt/{name}" if name else None)
+        files = app.get("files") or {}
+        for filename in _changed(detail):
+            if filename == ":unit":
+                if app.get("unit_file_path") and app.get("unit_file_content"):
+                    _write_file_lines(out, app["unit_file_path"], app["unit_file_content"],
+                                      os.path.dirname(app["unit_file_path"]))
+                    out.append("systemctl daemon-reload\n")
+            elif app_path:
+                full_target_path = os.path.join(app_path, filename)
+                _write_file_lines(out, full_target_path, files[filename], os.path.dirname(full_target_path))
+        service_name = app.get("service_name") or (f"{name}.service" if name else None)
+        if service_name and app.get("unit_file_path"):
+            out.append(f"systemctl restart {service_name} || true\n")
+    return "".join(out)
+
+
+def generate_cluster(config: BuildConfig, base: ScanResult, analysis_result: AnalysisResult,
+                     members: list, output_dir: str) -> dict:
+    # One instance template for a cluster of near-identical hosts: a shared
+    # startup script rendered once from the base scan, and per member an
+    # instance from the template carrying its override script.
+    os.makedirs(os.path.join(output_dir, 'overrides'), exist_ok=True)
+    startup_script = generate_startup_script(base, analysis_result, config) + OVERRIDE_HOOK
+    written = []
+    if _write_if_changed(os.path.join(output_dir, 'startup.sh'), startup_script):
+        written.append('startup.sh')
+    hosts = []
+    override_bytes = 0
+    for key, instance_name, scan in members:
+        override = generate_override_script(base, scan, config)
+        override_bytes += len(override.encode())
+        if _write_if_changed(os.path.join(output_dir, 'overrides', f'{key}.sh'), override):
+            written.append(f'overrides/{key}.sh')
+        hosts.append({"key": key, "instance_name": instance_name, "override_path": f"./overrides/{key}.sh"})
+    terraform_content = _template_env().get_template('cluster.tf.j2').render(
         project_id=config.project_id,
         region=config.region,
         zone=config.zone,
-        instance_name=config.instance_name,
+        template_name=config.instance_name,
         machine_type=config.machine_type,
         source_image=config.source_image,
-        startup_script_path="./startup.sh"
+        disk_size_gb=config.disk_size_gb,
+        startup_script_path="./startup.sh",
+        hosts=hosts,
     )
+    if _write_if_changed(os.path.join(output_dir, 'main.tf'), terraform_content):
+        written.append('main.tf')
+    return {
+        "terraform_code_path": os.path.join(output_dir, 'main.tf'),
+        "startup_bytes": len(startup_script.encode()),
+        "override_bytes": override_bytes,
+        "written_files": written,
+    }
+
+
+BOOT_HEADER = "#!/bin/bash\necho 'Starting migrated instance from baked image...'\n\n"
+
+
+def generate_boot_script(scan_result: ScanResult = None) -> str:
+    # Per-instance stage for baked images: everything else is already on the
+    # image. Enabled units and the PM2 process list start on their own; this
+    # only starts apps that have no service of their own.
+    out = [BOOT_HEADER]
+    if scan_result and scan_result.pm2_processes:
+        for app_name, configs in scan_result.custom_app_configs.items():
+            names = configs.keys()
+            if any(k.endswith('package.json') for k in names) and not any(k.endswith('ecosystem.config.js') for k in names):
+                out.append(f"cd {_pm2_app_path(scan_result, app_name)} && npm start & \n")
+    for app in scan_result.generic_apps if scan_result else []:
+        name = app.get("name") or app.get("service_name")
+        service_name = app.get("service_name") or (f"{name}.service" if name else None)
+        if app.get("unit_file_path") and app.get("unit_file_content") and service_name:
+            out.append(f"systemctl start {service_name} || true\n")
+    return "".join(out)
+
+
+def image_name(config: BuildConfig, provision_script: str) -> str:
+    # GCE image names are [a-z][-a-z0-9]{0,62}; the suffix changes whenever
+    # the baked content does, so Terraform never boots a stale image.
+    digest = hashlib.blake2b(
+        f"{config.source_image}\0{config.disk_size_gb}\0{provision_script}".encode(), digest_size=6
+    ).hexdigest()
+    base = re.sub(r"[^a-z0-9-]+", "-", config.instance_name.lower()).strip("-")
+    if not base[:1].isalpha():
+        base = f"image-{base}".rstrip("-")
+    return f"{base[:50].rstrip('-')}-{digest}"
+
+
+def _source_image_family(image: str):
+    # "debian-cloud/debian-11" -> ("debian-cloud", "debian-11"); anything
+    # else is passed to Packer as a plain source_image.
+    project, _, family = image.partition("/")
+    return (project, family) if family and "/" not in family else (None, None)
+
+
+def _write_if_changed(path: str, content: str) -> bool:
+    # Leaves unchanged artifacts (and their mtimes) alone on rebuilds.
+    encoded = content.encode()
+    try:
+        if os.path.getsize(path) == len(encoded):
+            with open(path, 'rb') as f:
+                if f.read() == encoded:
+                    return False
+    except OSError:
+        pass
+    with open(path, 'wb') as f:
+        f.write(encoded)
+    return True
+
+
+@BUILD_SECONDS.time()
+@profiling.traced("builder.generate_terraform")
+def generate_terraform(config: BuildConfig, scan_result: ScanResult = None, analysis_result: AnalysisResult = None, output_dir: str = None) -> BuildResult:
+    output_dir = output_dir or GENERATED_DIR
+    # Ensure generated directory exists
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+        
+    with profiling.span("builder.startup_script"):
+        sections = render_startup_sections(scan_result, analysis_result, config)
+        startup_script = STARTUP_HEADER + "".join(text for _, text, _ in sections)
+
+    # Save startup script
+    startup_path = os.path.join(output_dir, 'startup.sh')
+    written = []
+    with profiling.span("builder.write_startup_script", bytes=len(startup_script)):
+        if _write_if_changed(startup_path, startup_script):
+            written.append('startup.sh')
+    STARTUP_SCRIPT_BYTES.observe(len(startup_script))
+    
+    # With bake_image, startup.sh becomes the Packer provisioning script and
+    # instances boot the baked image with only boot.sh as startup script.
+    baked = image_name(config, startup_script) if config.bake_image else None
+    with profiling.span("builder.image_stage"):
+        for name in ('image.pkr.hcl', 'boot.sh'):
+            if not baked and os.path.exists(os.path.join(output_dir, name)):
+                os.remove(os.path.join(output_dir, name))
+        if baked:
+            project, family = _source_image_family(config.source_image)
+            packer_content = _template_env().get_template('image.pkr.hcl.j2').render(
+                project_id=config.project_id,
+                zone=config.zone,
+                instance_name=config.instance_name,
+                machine_type=config.machine_type,
+                source_image=config.source_image,
+                source_image_project=project,
+                source_image_family=family,
+                disk_size_gb=config.disk_size_gb,
+                image_name=baked,
+                image_family=baked.rsplit("-", 1)[0],
+                provision_script_path="./startup.sh"
+            )
+            if _write_if_changed(os.path.join(output_dir, 'image.pkr.hcl'), packer_content):
+                written.append('image.pkr.hcl')
+            if _write_if_changed(os.path.join(output_dir, 'boot.sh'), generate_boot_script(scan_result)):
+                written.append('boot.sh')
+
+    # Map config to template variables
+    with profiling.span("builder.render_template"):
+        template = _template_env().get_template('main.tf.j2')
+        terraform_content = template.render(
+            project_id=config.project_id,
+            region=config.region,
+            zone=config.zone,
+            instance_name=config.instance_name,
+            machine_type=config.machine_type,
+            source_image=f"projects/{config.project_id}/global/images/{baked}" if baked else config.source_image,
+            disk_size_gb=config.disk_size_gb,
+            startup_script_path="./boot.sh" if baked else "./startup.sh"
+        )
     
-    file_path = os.path.join(GENERATED_DIR, 'main.tf')
-    with open(file_path, 'w') as f:
-        f.write(terraform_content)
+    plan = None
+    if scan_result and scan_result.installed_packages:
+        plan = packages.resolve(scan_result.installed_packages, scan_result.os_info, config.source_image)
+
+    file_path = os.path.join(output_dir, 'main.tf')
+    with profiling.span("builder.write_terraform"):
+        if _write_if_changed(file_path, terraform_content):
+            written.append('main.tf')
         
     return BuildResult(
         terraform_code_path=file_path,
         status="Success",
-        message="Terraform configuration generated successfully. Configuration files restoration script included."
+        message=(
+            f"Terraform configuration generated for baked image {baked}. Run `packer build image.pkr.hcl` before `terraform apply`."
+            if baked else "Terraform configuration generated successfully. Configuration files restoration script included."
+        ),
+        rebuilt_sections=[name for name, text, rebuilt in sections if rebuilt and text],
+        written_files=written,
+        startup_sections=section_index(sections),
+        unavailable_packages=plan["unresolved"] if plan else [],
+        image_name=baked,
     )
@@ -0,0 +1,393 @@
+import contextlib
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from app.core import metrics, profiling
+from app.models import ScanResult
+
+# Offline scan bundles written by agent.py --bundle on hosts that cannot reach
+# the API: zlib frames (one per section, per app and per distinct file body)
+# followed by a JSON index of frame offsets and a fixed footer. Bundles are
+# memory-mapped and inflated one frame at a time, so a large bundle never
+# sits in memory in compressed and decoded form at once. File bodies are
+# content-addressed; a body already inflated for an earlier bundle is reused.
+MAGIC = b"MIGBNDL1"
+FOOTER = struct.Struct("<QI8s")  # index offset, index length, magic
+EXTENSION = ".migb"
+# Relay batches: the frames of many bundles behind one index, shared file
+# bodies stored once.
+BATCH_MAGIC = b"MIGBTCH1"
+BATCH_EXTENSION = ".migr"
+FILE_MAPS = {"crontabs": None, "config_files": None, "custom_app_configs": None, "generic_apps": "files"}
+IMPORT_DIR = os.environ.get("MIGRATOR_IMPORT_DIR", "imports")
+WORKERS = int(os.environ.get("MIGRATOR_IMPORT_WORKERS", str(min(8, os.cpu_count() or 1))))
+BLOB_CACHE_BYTES = int(float(os.environ.get("MIGRATOR_BUNDLE_CACHE_MB", "64")) * 1024 * 1024)
+MARKER_FILE = "bundle.json"
+
+BUNDLES = metrics.counter("migrator_bundles_total", "Offline scan bundles by import outcome", ("result",))
+BUNDLE_BYTES = metrics.counter("migrator_bundle_bytes_total", "Compressed bundle bytes read")
+BLOB_REUSED = metrics.counter("migrator_bundle_blobs_reused_total", "Bundle file bodies reused instead of inflated")
+
+_blobs: Dict[str, str] = {}
+_blob_bytes = 0
+
+
+class BundleError(ValueError):
+    pass
+
+
+@contextlib.contextmanager
+def _mapped(path: str):
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise BundleError(f"{path}: empty file")
+        try:
+            yield mm
+        finally:
+            mm.close()
+
+
+def _frame(mm, offset: int, length: int) -> bytes:
+    if offset < len(MAGIC) or offset + length > len(mm) - FOOTER.size:
+        raise BundleError(f"frame at {offset} is out of range")
+    return mm[offset:offset + length]
+
+
+def _inflate(mm, offset: int, length: int) -> bytes:
+    try:
+        return zlib.decompress(_frame(mm, offset, length))
+    except zlib.error as e:
+        raise BundleError(f"corrupt frame at {offset}: {e}")
+
+
+def _index(mm, expected: bytes = MAGIC) -> dict:
+    if len(mm) < len(expected) + FOOTER.size or mm[:len(expected)] != expected:
+        raise BundleError("not a scan bundle" if expected == MAGIC else "not a relay batch")
+    offset, length, magic = FOOTER.unpack(mm[len(mm) - FOOTER.size:])
+    if magic != expected:
+        raise BundleError("truncated bundle" if expected == MAGIC else "truncated batch")
+    index = json.loads(_inflate(mm, offset, length))
+    if index.get("version") != 1:
+        raise BundleError(f"unsupported bundle version {index.get('version')}")
+    return index
+
+
+def read_index(path: str) -> dict:
+    # Bundle metadata (hostname, project, created, digest) without the frame
+    # tables; only the footer and the index frame are read.
+    try:
+        with _mapped(path) as mm:
+            index = _index(mm)
+    except BundleError as e:
+        raise BundleError(f"{path}: {e}")
+    return {k: v for k, v in index.items() if k not in ("sections", "blobs")}
+
+
+def _blob(mm, blobs: Dict[str, list], ref: dict) -> str:
+    global _blob_bytes
+    digest = ref.get("blob")
+    cached = _blobs.get(digest)
+    if cached is not None:
+        BLOB_REUSED.inc()
+        return cached
+    if digest not in blobs:
+        raise BundleError(f"missing blob {digest}")
+    raw = _inflate(mm, *blobs[digest])
+    # The cache outlives the bundle, so a body must match its digest before
+    # another bundle can be handed it.
+    if hashlib.blake2b(raw, digest_size=16).hexdigest() != digest:
+        raise BundleError(f"blob {digest} does not match its content")
+    content = raw.decode("utf-8", errors="surrogatepass")
+    if _blob_bytes + len(content) > BLOB_CACHE_BYTES:
+        _blobs.clear()
+        _blob_bytes = 0
+    _blobs[digest] = content
+    _blob_bytes += len(content)
+    return content
+
+
+def _resolve(mm, blobs: Dict[str, list], name: str, value):
+    if name not in FILE_MAPS or not isinstance(value, dict):
+        return value
+    inner = FILE_MAPS[name]
+    files = value if inner is None else value.get(inner)
+    if isinstance(files, dict):
+        for path, content in files.items():
+            if isinstance(content, dict):
+                files[path] = _blob(mm, blobs, content)
+    return value
+
+
+def _scan(mm, sections: list, blobs: Dict[str, list]) -> ScanResult:
+    data: Dict[str, object] = {}
+    for name, key, offset, length in sections:
+        value = _resolve(mm, blobs, name, json.loads(_inflate(mm, offset, length)))
+        if key is None:
+            data[name] = value
+        elif isinstance(data.get(name), list):
+            data[name].append(value)
+        else:
+            data.setdefault(name, {})[key] = value
+    return ScanResult.model_validate(data)
+
+
+def read_bundle(path: str) -> Tuple[dict, ScanResult]:
+    with profiling.span("bundles.read"):
+        try:
+            with _mapped(path) as mm:
+                BUNDLE_BYTES.inc(len(mm))
+                index = _index(mm)
+                scan = _scan(mm, index["sections"], index.get("blobs") or {})
+        except (ValueError, KeyError, TypeError) as e:
+            raise BundleError(f"{path}: {e}")
+    meta = {k: v for k, v in index.items() if k not in ("sections", "blobs")}
+    return meta, scan
+
+
+def _copy_frames(out, mm, sections: list, source_blobs: Dict[str, list], wanted, blobs: Dict[str, list]) -> list:
+    copied = []
+    for name, key, offset, length in sections:
+        copied.append([name, key, out.tell(), length])
+        out.write(_frame(mm, offset, length))
+    for digest in wanted:
+        if digest not in blobs:
+            if digest not in source_blobs:
+                raise BundleError(f"missing blob {digest}")
+            offset, length = source_blobs[digest]
+            blobs[digest] = [out.tell(), length]
+            out.write(_frame(mm, offset, length))
+    return copied
+
+
+def _finish_batch(out, tmp: str, target: str, meta: Optional[dict], scans: list, blobs: Dict[str, list]):
+    index = dict(meta or {}, version=1, scans=scans, blobs=blobs)
+    raw = zlib.compress(json.dumps(index).encode("utf-8", "surrogatepass"))
+    offset = out.tell()
+    out.write(raw)
+    out.write(FOOTER.pack(offset, len(raw), BATCH_MAGIC))
+    out.flush()
+    os.fsync(out.fileno())
+    out.close()
+    os.replace(tmp, target)
+
+
+def write_batch(paths: List[str], target: str, meta: Optional[dict] = None) -> List[dict]:
+    # Packs bundles into one relay batch without inflating anything: frames
+    # are copied as they are, and a file body found in several bundles is
+    # copied once. Returns the metadata of the packed scans.
+    blobs: Dict[str, list] = {}
+    scans = []
+    tmp = target + ".tmp"
+    with profiling.span("bundles.batch", bundles=len(paths)), open(tmp, "wb") as out:
+        out.write(BATCH_MAGIC)
+        for path in paths:
+            with _mapped(path) as mm:
+                index = _index(mm)
+                source_blobs = index.get("blobs") or {}
+                sections = _copy_frames(out, mm, index["sections"], source_blobs, source_blobs, blobs)
+            scans.append(dict({k: v for k, v in index.items() if k not in ("sections", "blobs")}, sections=sections))
+        _finish_batch(out, tmp, target, meta, scans, blobs)
+    return [{k: v for k, v in scan.items() if k != "sections"} for scan in scans]
+
+
+def _blob_refs(value, refs: set):
+    if isinstance(value, dict):
+        if isinstance(value.get("blob"), str) and len(value) == 1:
+            refs.add(value["blob"])
+        for item in value.values():
+            _blob_refs(item, refs)
+    elif isinstance(value, list):
+        for item in value:
+            _blob_refs(item, refs)
+
+
+def split_batch(path: str, halves: List[Tuple[str, dict]]) -> List[List[dict]]:
+    # Rewrites a relay batch as two: the first (n + 1) // 2 scans go to
+    # halves[0] and the rest to halves[1], given as (target, batch metadata).
+    # Only section frames are inflated, to find the file bodies each half
+    # uses; everything is copied as it is. Returns each half's scan metadata.
+    with _mapped(path) as mm:
+        index = _index(mm, BATCH_MAGIC)
+        entries = index["scans"]
+        if len(entries) < 2:
+            raise BundleError(f"{path}: a batch of one scan cannot be split")
+        cut = (len(entries) + 1) // 2
+        written = []
+        for (target, meta), part in zip(halves, (entries[:cut], entries[cut:])):
+            blobs: Dict[str, list] = {}
+            scans = []
+            tmp = target + ".tmp"
+            with open(tmp, "wb") as out:
+                out.write(BATCH_MAGIC)
+                for entry in part:
+                    refs: set = set()
+                    for name, _, offset, length in entry["sections"]:
+                        if name in FILE_MAPS:
+                            _blob_refs(json.loads(_inflate(mm, offset, length)), refs)
+                    sections = _copy_frames(out, mm, entry["sections"], index.get("blobs") or {}, sorted(refs), blobs)
+                    scans.append(dict(entry, sections=sections))
+                _finish_batch(out, tmp, target, meta, scans, blobs)
+            written.append([{k: v for k, v in scan.items() if k != "sections"} for scan in scans])
+    return written
+
+
+def read_batch_index(path: str) -> dict:
+    try:
+        with _mapped(path) as mm:
+            index = _index(mm, BATCH_MAGIC)
+    except BundleError as e:
+        raise BundleError(f"{path}: {e}")
+    return {k: v for k, v in index.items() if k not in ("scans", "blobs")}
+
+
+def read_batch(path: str) -> Tuple[dict, List[Tuple[dict, object]]]:
+    # (batch metadata, [(scan metadata, ScanResult or BundleError)]): a
+    # damaged scan does not take the rest of its batch down with it.
+    with profiling.span("bundles.read_batch"):
+        try:
+            with _mapped(path) as mm:
+                BUNDLE_BYTES.inc(len(mm))
+                index = _index(mm, BATCH_MAGIC)
+                blobs = index.get("blobs") or {}
+                scans = []
+                for entry in index["scans"]:
+                    meta = {k: v for k, v in entry.items() if k != "sections"}
+                    try:
+                        scans.append((meta, _scan(mm, entry["sections"], blobs)))
+                    except (ValueError, KeyError, TypeError) as e:
+                        scans.append((meta, BundleError(f"{meta.get('hostname')}: {e}")))
+        except (ValueError, KeyError, TypeError) as e:
+            raise BundleError(f"{path}: {e}")
+    return {k: v for k, v in index.items() if k not in ("scans", "blobs")}, scans
+
+
+def bundle_paths(directory: str) -> List[str]:
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        paths.extend(os.path.join(root, name) for name in sorted(files) if name.endswith(EXTENSION))
+    return paths
+
+
+def plan_import(paths: List[str]) -> Tuple[List[Tuple[str, dict]], Dict[str, str]]:
+    # Reads every index and drops copies of the same scan (equal content
+    # digests), oldest bundle first so hosts get their versions in order.
+    # Returns the bundles to load and {path: reason} for the skipped ones.
+    seen = set()
+    plan, skipped = [], {}
+    indexed = []
+    for path in paths:
+        try:
+            indexed.append((path, read_index(path)))
+        except (OSError, BundleError) as e:
+            skipped[path] = f"failed: {e}"
+    for path, meta in sorted(indexed, key=lambda item: (item[1].get("created") or 0, item[0])):
+        key = (meta.get("hostname"), meta.get("digest"))
+        if key in seen:
+            skipped[path] = "duplicate"
+            continue
+        seen.add(key)
+        plan.append((path, meta))
+    return plan, skipped
+
+
+def _result_key(hostname: str) -> str:
+    return re.sub(r"[^0-9A-Za-z_.-]", "_", hostname)
+
+
+def _write_result(path: str, output_dir: str, project: Optional[str]) -> Tuple[str, str]:
+    # Runs in an import worker: decodes one bundle into a batch-mode
+    # result.json, so export and cluster can read imported hosts.
+    from app.core.batch import RESULT_FILE
+
+    meta, scan = read_bundle(path)
+    host_dir = os.path.join(output_dir, _result_key(scan.hostname))
+    os.makedirs(host_dir, exist_ok=True)
+    result = {
+        "host": scan.hostname,
+        "status": "done",
+        "project": project or meta.get("project"),
+        "scan": scan.model_dump(mode="json"),
+        "analysis": None,
+    }
+    tmp = os.path.join(host_dir, RESULT_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(result, f)
+    os.replace(tmp, os.path.join(host_dir, RESULT_FILE))
+    with open(os.path.join(host_dir, MARKER_FILE), "w") as f:
+        json.dump({"path": path, "digest": meta.get("digest"), "created": meta.get("created")}, f)
+    return scan.hostname, path
+
+
+def _imported_digest(output_dir: str, hostname: str) -> Optional[str]:
+    try:
+        with open(os.path.join(output_dir, _result_key(hostname), MARKER_FILE)) as f:
+            return json.load(f).get("digest")
+    except (OSError, ValueError):
+        return None
+
+
+def import_to_results(directory: str, output_dir: str, project: Optional[str] = None,
+                      workers: int = WORKERS) -> dict:
+    # Offline bulk import into a batch results directory: one result per host
+    # from its newest bundle, decoded across `workers` processes. Hosts whose
+    # newest bundle was already imported are left alone.
+    start = time.perf_counter()
+    paths = bundle_paths(directory)
+    plan, skipped = plan_import(paths)
+    newest: Dict[str, Tuple[str, dict]] = {}
+    for path, meta in plan:
+        previous = newest.get(meta.get("hostname"))
+        if previous is not None:
+            skipped[previous[0]] = "superseded"
+        newest[meta.get("hostname")] = (path, meta)
+
+    pending = []
+    for hostname, (path, meta) in sorted(newest.items(), key=lambda item: str(item[0])):
+        if hostname and _imported_digest(output_dir, hostname) == meta.get("digest"):
+            skipped[path] = "unchanged"
+        else:
+            pending.append(path)
+
+    os.makedirs(output_dir, exist_ok=True)
+    failed = {}
+    if workers > 1 and len(pending) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(path, pool.submit(_write_result, path, output_dir, project)) for path in pending]
+            outcomes = []
+            for path, future in futures:
+                try:
+                    outcomes.append(future.result())
+                except (OSError, BundleError) as e:
+                    failed[path] = str(e)
+    else:
+        outcomes = []
+        for path in pending:
+            try:
+                outcomes.append(_write_result(path, output_dir, project))
+            except (OSError, BundleError) as e:
+                failed[path] = str(e)
+    imported = sorted(hostname for hostname, _ in outcomes)
+
+    summary = {
+        "bundles": len(paths),
+        "imported": imported,
+        "skipped": {path: reason for path, reason in sorted(skipped.items())},
+        "failed": failed,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    BUNDLES.inc(len(imported), result="imported")
+    BUNDLES.inc(len(failed) + sum(1 for r in skipped.values() if r.startswith("failed")), result="failed")
+    for reason in ("duplicate", "superseded", "unchanged"):
+        BUNDLES.inc(sum(1 for r in skipped.values() if r == reason), result=reason)
+    return summary
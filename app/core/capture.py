@@ -0,0 +1,370 @@
+import fnmatch
+import json
+import shlex
+import tarfile
+import time
+from typing import Dict, Iterable, List, Tuple
+
+from app.core import metrics, profiling
+from app.static import agent as agent_rules
+
+# Capture rules are shared with agent.py, which must stay a standalone script.
+IGNORE_DIRS = agent_rules.IGNORE_DIRS
+IGNORE_EXTS = agent_rules.IGNORE_EXTS
+MAX_FILE_SIZE = agent_rules.MAX_FILE_SIZE
+MAX_TOTAL_FILES = agent_rules.MAX_TOTAL_FILES
+SERVICE_CONFIG_PATHS = agent_rules.SERVICE_CONFIG_PATHS
+MAX_CONFIG_BYTES = agent_rules.MAX_CONFIG_BYTES
+MAX_CONFFILES = agent_rules.MAX_CONFFILES
+INFRA_KEYWORDS = agent_rules.INFRA_KEYWORDS
+
+MARKER = "@@migrator@@"
+GZIP_LEVEL = 6
+# A large SSH window keeps the remote side streaming over high-latency links
+# instead of stalling every 2 MiB for a window adjust round trip.
+WINDOW_SIZE = 64 * 1024 * 1024
+MAX_PACKET_SIZE = 32 * 1024
+READ_CHUNK = 256 * 1024
+
+CAPTURE_SECONDS = metrics.histogram("migrator_capture_seconds", "Duration of agentless bulk file capture", ("phase",))
+CAPTURE_BYTES = metrics.counter(
+    "migrator_capture_bytes_total", "Bytes received by agentless capture", ("encoding",)
+)
+CAPTURE_FILES = metrics.counter("migrator_capture_files_total", "Files captured over SSH", ("result",))
+
+METADATA_SCRIPT = r"""
+M='@@migrator@@'
+echo "$M packages"
+dpkg-query -f '${binary:Package}\n' -W 2>/dev/null || rpm -qa --queryformat '%{NAME}\n' 2>/dev/null
+echo "$M conffiles"
+# O: owned by a package, M: differs from the packaged version.
+if command -v dpkg-query >/dev/null 2>&1; then
+  CONF='/^[^ ]/ {ok = ($1 == "installed"); pkg = $2; next}
+    ok && NF >= 2 && $3 != "obsolete" && $3 != "remove-on-upgrade" {print pkg, $2, $1}'
+  C=$(dpkg-query -W -f='${db:Status-Status} ${binary:Package}\n${Conffiles}\n' 2>/dev/null | awk "$CONF")
+  printf '%s\n' "$C" | awk 'NF == 3 {print "O " $3}'
+  # As in agent.py, a file dpkg left as it unpacked it (mtime not after its
+  # package's file list, ctime within the slack of it) is not hashed.
+  I=/var/lib/dpkg/info
+  { printf '%s\n' "$C" | awk -v i="$I" 'NF == 3 {print i "/" $1 ".list"; print $3}' | sort -u |
+      xargs -r -d '\n' stat -c '%Y %Z %n' 2>/dev/null; echo; printf '%s\n' "$C"; } |
+    awk -v i="$I" -v w=@SLACK@ '!s && !NF {s = 1; next} !s {m[$3] = $1; c[$3] = $2; next}
+      NF == 3 {l = i "/" $1 ".list"; d = c[$3] - m[l]
+        if (!(l in m) || !($3 in m) || m[$3] > m[l] || d > w || d < -w) print $2 "  " $3}' |
+    LC_ALL=C md5sum -c 2>/dev/null | sed -n 's/^\(.*\): FAILED$/M \1/p'
+elif command -v rpm >/dev/null 2>&1; then
+  rpm -qac 2>/dev/null | sed -n 's|^/|O /|p'
+  rpm -Va --configfiles --nodeps --noscripts 2>/dev/null | awk '$2 == "c" && ($1 ~ /5/ || $1 ~ /^S/) {print "M " $3}'
+fi
+echo "$M passwd"
+cat /etc/passwd 2>/dev/null
+for u in $(awk -F: '$3 >= 1000 || $3 == 0 {print $1}' /etc/passwd 2>/dev/null); do
+  c=$(crontab -l -u "$u" 2>/dev/null) && [ -n "$c" ] && { echo "$M crontab $u"; printf '%s\n' "$c"; }
+done
+PM2=pm2
+if ! command -v pm2 >/dev/null 2>&1; then
+  for p in /usr/local/bin/pm2 /usr/bin/pm2 /opt/node/bin/pm2; do [ -x "$p" ] && PM2="$p" && break; done
+fi
+echo "$M pm2"
+"$PM2" jlist 2>/dev/null
+echo "$M units"
+systemctl list-units --type=service --state=running --no-legend --no-pager --plain 2>/dev/null | awk '{print $1}' | while read -r u; do
+  case "$u" in *.service) ;; *) continue ;; esac
+  echo "$M unit $u"
+  systemctl show "$u" -p ExecStart -p WorkingDirectory -p FragmentPath 2>/dev/null
+  wd=$(systemctl show "$u" -p WorkingDirectory --value 2>/dev/null)
+  [ -n "$wd" ] && [ -d "$wd" ] && echo "W=$wd"
+  for tok in $(systemctl show "$u" -p ExecStart --value 2>/dev/null); do
+    tok=${tok#\"}; tok=${tok%\"}
+    if [ -d "$tok" ]; then echo "D=$tok"; elif [ -f "$tok" ]; then echo "F=$tok"; fi
+  done
+done
+"""
+METADATA_SCRIPT = METADATA_SCRIPT.replace("@SLACK@", str(agent_rules.CONFFILE_SLACK_SECONDS))
+# Per-service config paths are expanded on the host; only existing files come back.
+METADATA_SCRIPT += 'echo "$M probes"\nfor f in %s; do [ -f "$f" ] && echo "$f"; done\n' % " ".join(
+    p for paths in SERVICE_CONFIG_PATHS.values() for p in paths)
+
+
+def parse_metadata(text: str) -> dict:
+    sections: Dict[Tuple[str, str], List[str]] = {}
+    current = None
+    for line in text.splitlines():
+        if line.startswith(MARKER + " "):
+            parts = line[len(MARKER) + 1:].split(" ", 1)
+            current = (parts[0], parts[1] if len(parts) > 1 else "")
+            sections[current] = []
+        elif current is not None:
+            sections[current].append(line)
+
+    users = []
+    for line in sections.get(("passwd", ""), []):
+        parts = line.split(':')
+        if len(parts) > 2 and parts[2].isdigit():
+            uid = int(parts[2])
+            if uid >= 1000 or uid == 0:
+                users.append(parts[0])
+
+    pm2_raw = "\n".join(sections.get(("pm2", ""), [])).strip()
+    pm2_data = []
+    if pm2_raw:
+        # pm2 may print daemon start-up chatter ("[PM2] ...") before the JSON.
+        decoder = json.JSONDecoder()
+        start = pm2_raw.find("[")
+        while start >= 0:
+            try:
+                value, _ = decoder.raw_decode(pm2_raw, start)
+            except ValueError:
+                start = pm2_raw.find("[", start + 1)
+                continue
+            if isinstance(value, list):
+                pm2_data = value
+                break
+            start = pm2_raw.find("[", start + 1)
+
+    units = {}
+    for (kind, name), lines in sections.items():
+        if kind != "unit":
+            continue
+        unit = {"dirs": set(), "files": set()}
+        for line in lines:
+            key, _, value = line.partition("=")
+            value = value.strip()
+            if key == "ExecStart" and "exec_start" not in unit:
+                unit["exec_start"] = value
+            elif key in ("WorkingDirectory", "FragmentPath") and value:
+                unit[key] = value
+            elif key == "W":
+                unit["working_dir_exists"] = True
+            elif key == "D":
+                unit["dirs"].add(value)
+            elif key == "F":
+                unit["files"].add(value)
+        units[name] = unit
+
+    owned, modified = set(), []
+    for line in sections.get(("conffiles", ""), []):
+        kind, _, path = line.partition(" ")
+        if kind == "O":
+            owned.add(path)
+        elif kind == "M" and path not in modified:
+            modified.append(path)
+
+    return {
+        "installed_packages": [p for p in sections.get(("packages", ""), []) if p.strip()],
+        "conffiles": {"owned": owned, "modified": modified},
+        "config_probes": [p for p in sections.get(("probes", ""), []) if p.strip()],
+        "system_users": users,
+        "crontabs": {name: "\n".join(lines) + "\n" for (kind, name), lines in sections.items() if kind == "crontab"},
+        "pm2": pm2_data,
+        "units": units,
+    }
+
+
+def plan_capture(meta: dict, services: Iterable[str]) -> dict:
+    # Mirrors agent.get_pm2_processes / inspect_systemd_service / get_config_files
+    # using the metadata gathered in the first round trip.
+    pm2_processes = []
+    for proc in meta["pm2"]:
+        env = proc.get("pm2_env", {}) or {}
+        details = {
+            "name": proc.get("name"),
+            "path": env.get("pm_cwd"),
+            "status": env.get("status"),
+            "version": env.get("version", "N/A"),
+            "script": env.get("pm_exec_path"),
+        }
+        pm2_processes.append({k: str(v) for k, v in details.items() if v is not None})
+
+    generic_apps = []
+    for unit_name, unit in meta["units"].items():
+        if any(k in unit_name.lower() for k in INFRA_KEYWORDS):
+            continue
+        exec_start = unit.get("exec_start")
+        working_dir = unit.get("WorkingDirectory")
+        app_path = working_dir if unit.get("working_dir_exists") else None
+        if app_path is None and exec_start:
+            for part in exec_start.split()[1:]:
+                if part.startswith('"') and part.endswith('"'):
+                    part = part[1:-1]
+                if part in unit["dirs"]:
+                    app_path = part
+                    break
+                if part in unit["files"]:
+                    app_path = part.rsplit("/", 1)[0] or "/"
+                    break
+        name = unit_name[:-8] if unit_name.endswith(".service") else unit_name
+        generic_apps.append({
+            "service_name": unit_name,
+            "name": name,
+            "exec_start": exec_start,
+            "working_directory": working_dir,
+            "unit_file_path": unit.get("FragmentPath"),
+            "unit_file_content": None,
+            "app_path": app_path,
+            "files": {},
+        })
+
+    conffiles = meta.get("conffiles") or {"owned": set(), "modified": []}
+    config_paths = sorted(conffiles["modified"])[:MAX_CONFFILES]
+    for service in services:
+        for key, patterns in SERVICE_CONFIG_PATHS.items():
+            if key in service:
+                config_paths.extend(
+                    p for p in meta.get("config_probes") or []
+                    if p not in conffiles["owned"] and p not in config_paths
+                    and any(fnmatch.fnmatchcase(p, pattern) for pattern in patterns)
+                )
+
+    roots = [p["path"] for p in pm2_processes if p.get("name") and p.get("path")]
+    roots += [a["app_path"] for a in generic_apps if a["app_path"]]
+    files = config_paths + [a["unit_file_path"] for a in generic_apps if a["unit_file_path"]]
+    return {
+        "pm2_processes": pm2_processes,
+        "generic_apps": generic_apps,
+        "config_paths": config_paths,
+        "roots": list(dict.fromkeys(roots)),
+        "files": list(dict.fromkeys(files)),
+    }
+
+
+def capture_script(roots: List[str], files: List[str], gzip_level: int = GZIP_LEVEL) -> str:
+    # Selects files with the agent's rules on the remote host and emits them as
+    # one compressed tar stream on stdout.
+    prune = " -o ".join(f"-name {shlex.quote(d)}" for d in sorted(IGNORE_DIRS))
+    skip = " ".join(f"! -name {shlex.quote('*' + e)}" for e in sorted(IGNORE_EXTS))
+    return f"""
+ROOTS=({' '.join(shlex.quote(r) for r in roots)})
+FILES=({' '.join(shlex.quote(f) for f in files)})
+if command -v pigz >/dev/null 2>&1; then Z="pigz -c -{gzip_level}"; else Z="gzip -c -{gzip_level}"; fi
+{{
+for r in "${{ROOTS[@]}}"; do
+  [ -d "$r" ] || continue
+  find "$r" -mindepth 1 \\( -type d \\( {prune} \\) -prune \\) -o \\( -type f -size -{MAX_FILE_SIZE + 1}c {skip} -print0 \\) 2>/dev/null | head -z -n {MAX_TOTAL_FILES}
+done
+for f in "${{FILES[@]}}"; do [ -f "$f" ] && [ -r "$f" ] && printf '%s\\0' "$f"; done
+}} | tar --null --no-recursion -T - -cf - 2>/dev/null | $Z
+"""
+
+
+class _CountingReader:
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes = 0
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.bytes += len(data)
+        return data
+
+
+def _owners(path: str, roots: List[str]) -> List[str]:
+    return [r for r in roots if path.startswith(r.rstrip("/") + "/")]
+
+
+def unpack_capture(stream, roots: List[str], files: List[str]) -> dict:
+    # Streams the tar as it arrives; nothing is spooled to disk.
+    reader = _CountingReader(stream)
+    trees: Dict[str, Dict[str, str]] = {r: {} for r in roots}
+    wanted = set(files)
+    contents: Dict[str, str] = {}
+    seen = set()
+    raw_bytes = 0
+    skipped = 0
+    start = time.perf_counter()
+    with tarfile.open(fileobj=reader, mode="r|gz", bufsize=READ_CHUNK) as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            name = member.name[2:] if member.name.startswith("./") else member.name
+            path = "/" + name.lstrip("/")
+            if path in seen:
+                continue
+            seen.add(path)
+            data = tar.extractfile(member).read()
+            raw_bytes += len(data)
+            text = data.decode("utf-8", errors="ignore")
+            if path in wanted:
+                contents[path] = text
+            if '\0' in text:
+                skipped += 1
+                continue
+            for root in _owners(path, roots):
+                tree = trees[root]
+                if len(tree) < MAX_TOTAL_FILES:
+                    tree[path[len(root.rstrip("/")) + 1:]] = text
+    elapsed = time.perf_counter() - start
+    CAPTURE_BYTES.inc(reader.bytes, encoding="gzip")
+    CAPTURE_BYTES.inc(raw_bytes, encoding="raw")
+    CAPTURE_FILES.inc(len(seen) - skipped, result="captured")
+    CAPTURE_FILES.inc(skipped, result="binary")
+    return {
+        "trees": trees,
+        "files": contents,
+        "stats": {
+            "files": len(seen),
+            "binary_skipped": skipped,
+            "raw_bytes": raw_bytes,
+            "compressed_bytes": reader.bytes,
+            "seconds": elapsed,
+            "mb_per_s": round(reader.bytes / elapsed / 2 ** 20, 2) if elapsed else 0.0,
+        },
+    }
+
+
+def _open_stream(client, script: str):
+    transport = client.get_transport()
+    channel = transport.open_session(window_size=WINDOW_SIZE, max_packet_size=MAX_PACKET_SIZE)
+    channel.exec_command("bash -s")
+    channel.sendall(script.encode())
+    channel.shutdown_write()
+    return channel
+
+
+def capture_host(client, services: Iterable[str]) -> dict:
+    # Two round trips: a small metadata dump used to decide what to collect,
+    # then every app tree, config file and unit file in one tar stream.
+    with CAPTURE_SECONDS.time(phase="metadata"), profiling.span("capture.metadata"):
+        channel = _open_stream(client, METADATA_SCRIPT)
+        meta_text = channel.makefile("rb", READ_CHUNK).read().decode("utf-8", errors="ignore")
+        channel.recv_exit_status()
+        channel.close()
+    meta = parse_metadata(meta_text)
+    plan = plan_capture(meta, services)
+
+    captured = {"trees": {}, "files": {}, "stats": {}}
+    if plan["roots"] or plan["files"]:
+        with CAPTURE_SECONDS.time(phase="bulk"), profiling.span("capture.bulk", roots=len(plan["roots"])):
+            channel = _open_stream(client, capture_script(plan["roots"], plan["files"]))
+            captured = unpack_capture(channel.makefile("rb", READ_CHUNK), plan["roots"], plan["files"])
+            channel.recv_exit_status()
+            channel.close()
+    return assemble(meta, plan, captured)
+
+
+def assemble(meta: dict, plan: dict, captured: dict) -> dict:
+    files = captured["files"]
+    custom_app_configs = {
+        p["name"]: captured["trees"].get(p["path"], {})
+        for p in plan["pm2_processes"]
+        if p.get("name") and p.get("path")
+    }
+    generic_apps = []
+    for app in plan["generic_apps"]:
+        app = dict(app)
+        app["unit_file_content"] = files.get(app["unit_file_path"])
+        app["files"] = captured["trees"].get(app["app_path"], {}) if app["app_path"] else {}
+        generic_apps.append(app)
+    return {
+        "installed_packages": meta["installed_packages"],
+        "system_users": meta["system_users"],
+        "crontabs": meta["crontabs"],
+        "config_files": {
+            p: files[p] for p in plan["config_paths"]
+            if p in files and "\0" not in files[p] and len(files[p].encode()) <= MAX_CONFIG_BYTES
+        },
+        "pm2_processes": plan["pm2_processes"],
+        "custom_app_configs": custom_app_configs,
+        "generic_apps": generic_apps,
+        "capture_stats": captured["stats"],
+    }
@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from app.core import history, metrics
+from app.models import BuildConfig, ScanResult
+
+# Groups near-identical hosts (same packages, services and app trees, give or
+# take host-specific config values) so each group is analyzed and built once.
+# A scan is reduced to a set of feature hashes and sketched with
+# one-permutation MinHash; sketches are banded into LSH buckets and only hosts
+# sharing a bucket are compared exactly, so clustering stays near-linear in
+# the number of hosts.
+NUM_BINS = 64
+BANDS = 16
+ROWS = NUM_BINS // BANDS
+THRESHOLD = float(os.environ.get("MIGRATOR_CLUSTER_THRESHOLD", "0.8"))
+MEDOID_SAMPLE = 16
+MANIFEST_FILE = "clusters.json"
+
+_EMPTY = 1 << 64
+_OFFSET = 1 << 58  # Above any bin value (64-bit hashes over 64 bins).
+
+CLUSTER_SECONDS = metrics.histogram("migrator_cluster_seconds", "Duration of fleet clustering", ("stage",))
+CLUSTERED_HOSTS = metrics.counter("migrator_clustered_hosts_total", "Hosts assigned to clusters", ("result",))
+
+
+def features(scan: ScanResult) -> frozenset:
+    # Package, service, port and user names, plus every captured file both
+    # by path and by content hash: a host whose configs differ only by its
+    # hostname keeps all the path features and most of the content ones.
+    fp = history.fingerprint(scan)
+    tokens = {f"pkg:{p}" for p in scan.installed_packages}
+    tokens.update(f"svc:{s}" for s in scan.running_services)
+    tokens.update(f"port:{p}" for p in scan.open_ports)
+    tokens.update(f"user:{u}" for u in scan.system_users)
+    for group, entries in fp["files"].items():
+        for path, digest in entries.items():
+            tokens.add(f"path:{group}/{path}")
+            tokens.add(f"file:{group}/{path}:{digest}")
+    return frozenset(
+        int.from_bytes(hashlib.blake2b(t.encode(), digest_size=8).digest(), "little") for t in tokens
+    )
+
+
+def sketch(hashes: Iterable[int]) -> Tuple[int, ...]:
+    # One-permutation MinHash: the low bits of a hash pick its bin and the
+    # rest compete for the bin minimum. Empty bins borrow the next non-empty
+    # bin's value, offset by the distance (rotation densification), so sparse
+    # sets still produce comparable sketches.
+    bins = [_EMPTY] * NUM_BINS
+    for h in hashes:
+        b = h % NUM_BINS
+        v = h // NUM_BINS
+        if v < bins[b]:
+            bins[b] = v
+    if _EMPTY in bins and any(v != _EMPTY for v in bins):
+        filled = list(bins)
+        for i in range(NUM_BINS):
+            j, step = i, 0
+            while bins[j] == _EMPTY:
+                j = (j + 1) % NUM_BINS
+                step += 1
+            filled[i] = bins[j] + step * _OFFSET
+        bins = filled
+    return tuple(bins)
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def cluster(hosts: Dict[str, Tuple[str, frozenset]], threshold: float = THRESHOLD) -> List[List[str]]:
+    # hosts: key -> (partition, feature hashes). Hosts are only clustered
+    # within a partition (the OS), and join a cluster through an exact
+    # Jaccard check against one of its members.
+    parent = {key: key for key in hosts}
+
+    def find(key):
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    buckets: Dict[tuple, List[str]] = {}
+    for key in sorted(hosts):
+        partition, hashes = hosts[key]
+        signature = sketch(hashes)
+        for band in range(BANDS):
+            buckets.setdefault((partition, band, signature[band * ROWS:(band + 1) * ROWS]), []).append(key)
+
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        # Compare each member with one representative per distinct group
+        # already in the bucket instead of with every member.
+        anchors: List[str] = []
+        for key in members:
+            for anchor in anchors:
+                if find(anchor) == find(key) or jaccard(hosts[anchor][1], hosts[key][1]) >= threshold:
+                    parent[find(key)] = find(anchor)
+                    break
+            else:
+                anchors.append(key)
+
+    groups: Dict[str, List[str]] = {}
+    for key in sorted(hosts):
+        groups.setdefault(find(key), []).append(key)
+    return sorted(groups.values(), key=lambda g: (-len(g), g[0]))
+
+
+def medoid(keys: List[str], hashes: Dict[str, frozenset]) -> str:
+    # The member most similar to the rest (over a sample for big clusters);
+    # the shared build is rendered from it.
+    sample = keys[:: max(1, len(keys) // MEDOID_SAMPLE)][:MEDOID_SAMPLE]
+    return max(keys if len(keys) <= MEDOID_SAMPLE else sample,
+               key=lambda k: (sum(jaccard(hashes[k], hashes[o]) for o in sample), k))
+
+
+def batch_hosts(results_dir: str) -> Iterator[Tuple[str, str]]:
+    # (host key, result.json path) for completed batch-mode hosts.
+    from app.core.batch import RESULT_FILE
+
+    for entry in sorted(os.scandir(results_dir), key=lambda e: e.name):
+        path = os.path.join(entry.path, RESULT_FILE)
+        if entry.is_dir() and os.path.exists(path):
+            yield entry.name, path
+
+
+def _load(path: str):
+    with open(path, "rb") as f:
+        result = json.loads(f.read())
+    if result.get("status") != "done" or not result.get("scan"):
+        return None, None
+    return result.get("project"), ScanResult.model_validate(result["scan"])
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^a-z0-9-]+", "-", text.lower()).strip("-") or "host"
+
+
+def _key_slug(key: str) -> str:
+    # Batch keys are unique where hostnames need not be. Keys the slug
+    # changes get a digest of the key, so two keys never share a slug.
+    slug = _slug(key)
+    if slug != key:
+        slug = f"{slug}-{hashlib.blake2b(key.encode(), digest_size=3).hexdigest()}"
+    return slug
+
+
+def instance_name(key: str) -> str:
+    return f"migrated-{_key_slug(key)}"
+
+
+def cluster_name(base_key: str) -> str:
+    return f"cluster-{_key_slug(base_key)}"
+
+
+def build_clusters(results_dir: str, output_dir: str, project_id: str = "my-migration-project",
+                   threshold: float = THRESHOLD, source_image: str = "debian-cloud/debian-11") -> dict:
+    # Clusters a batch results directory and writes one directory per cluster:
+    # a shared startup script and analysis from the cluster's medoid, one
+    # override script per member and an instance template main.tf.
+    from app.core import analyzer, builder
+
+    seconds = {}
+    start = time.perf_counter()
+    hosts: Dict[str, Tuple[str, frozenset]] = {}
+    paths = {}
+    for key, path in batch_hosts(results_dir):
+        _, scan = _load(path)
+        if scan is None:
+            continue
+        hosts[key] = (scan.os_info, features(scan))
+        paths[key] = path
+    seconds["features"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    groups = cluster(hosts, threshold)
+    seconds["cluster"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    hashes = {key: value[1] for key, value in hosts.items()}
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {"threshold": threshold, "hosts": len(hosts), "seconds": seconds, "clusters": []}
+    for keys in groups:
+        base_key = medoid(keys, hashes)
+        project, base = _load(paths[base_key])
+        analysis = analyzer.analyze_scan(base)
+        cluster_id = cluster_name(base_key)
+        config = BuildConfig(
+            project_id=project or project_id,
+            region="us-central1",
+            zone="us-central1-a",
+            instance_name=cluster_id,
+            machine_type=analysis.recommended_gcp_instance,
+            source_image=source_image,
+            disk_size_gb=analysis.recommended_disk_gb,
+        )
+        members = []
+        for key in keys:
+            scan = base if key == base_key else _load(paths[key])[1]
+            members.append((key, instance_name(key), scan))
+        result = builder.generate_cluster(config, base, analysis, members, os.path.join(output_dir, cluster_id))
+        CLUSTERED_HOSTS.inc(len(keys), result="clustered" if len(keys) > 1 else "singleton")
+        manifest["clusters"].append({
+            "id": cluster_id,
+            "base": base_key,
+            "hosts": keys,
+            "min_similarity": round(min(jaccard(hashes[base_key], hashes[k]) for k in keys), 4),
+            "machine_type": config.machine_type,
+            "startup_bytes": result["startup_bytes"],
+            "override_bytes": result["override_bytes"],
+        })
+    seconds["build"] = time.perf_counter() - start
+    for stage, value in seconds.items():
+        CLUSTER_SECONDS.observe(value, stage=stage)
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
@@ -0,0 +1,366 @@
+import base64
+import contextlib
+import functools
+import itertools
+import logging
+import os
+import queue
+import shlex
+import stat
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.core import metrics, profiling
+from app.core.capture import MAX_PACKET_SIZE, READ_CHUNK, WINDOW_SIZE
+from app.static import sync_agent
+
+logger = logging.getLogger("migrator.datasync")
+
+SYNC_AGENT_PATH = os.path.join(os.path.dirname(__file__), '../static/sync_agent.py')
+STREAMS = int(os.environ.get("MIGRATOR_SYNC_STREAMS", "4"))
+# Chunks hashed before asking the target which ones it lacks; bounds memory
+# per stream to BATCH_CHUNKS * MAX_CHUNK.
+BATCH_CHUNKS = 32
+TRANSPORTS = ("local", "pipe", "ssh")
+
+SYNC_BYTES = metrics.counter("migrator_sync_bytes_total", "Bytes handled by data sync", ("kind",))
+SYNC_FILES = metrics.counter("migrator_sync_files_total", "Files handled by data sync", ("result",))
+SYNC_SECONDS = metrics.histogram("migrator_sync_seconds", "Duration of data sync passes", ("transport",))
+
+
+class SyncError(RuntimeError):
+    pass
+
+
+@functools.lru_cache(maxsize=1)
+def bootstrap() -> str:
+    # python3 -c payload that runs sync_agent.py from an argument, keeping
+    # stdin/stdout free for the protocol.
+    with open(SYNC_AGENT_PATH, 'rb') as f:
+        packed = base64.b64encode(zlib.compress(f.read(), 9)).decode()
+    return f"import base64,zlib;exec(zlib.decompress(base64.b64decode('{packed}')))"
+
+
+class RemoteTarget:
+    # sync_agent.Target over the frame protocol. Calls from many threads are
+    # pipelined on one connection; chunk uploads don't wait for their reply,
+    # commit() waits for the calling thread's outstanding uploads first.
+    def __init__(self, reader, writer, closer=None):
+        self._reader = reader
+        self._writer = writer
+        self._closer = closer
+        self._ids = itertools.count()
+        self._pending: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        self._error: Optional[str] = None
+        self._thread = threading.Thread(target=self._read_loop, name="sync-reader", daemon=True)
+        self._thread.start()
+
+    def _read_loop(self):
+        try:
+            while True:
+                header, _ = sync_agent.read_frame(self._reader)
+                if header is None:
+                    break
+                with self._lock:
+                    future = self._pending.pop(header.get("id"), None)
+                if future is not None:
+                    future.set_result(header)
+        except Exception as e:
+            self._error = f"{type(e).__name__}: {e}"
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._error = self._error or "Sync target closed the connection"
+        for future in pending.values():
+            future.set_exception(SyncError(self._error))
+
+    def _send(self, op: str, payload: bytes = b"", **fields) -> Future:
+        future: Future = Future()
+        with self._lock:
+            if self._error:
+                raise SyncError(self._error)
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+        with self._write_lock:
+            sync_agent.write_frame(self._writer, dict(fields, id=request_id, op=op), payload)
+        return future
+
+    def _call(self, op: str, payload: bytes = b"", **fields) -> dict:
+        reply = self._send(op, payload, **fields).result()
+        if not reply.get("ok"):
+            raise SyncError(reply.get("error", f"{op} failed"))
+        return reply
+
+    def _wait_uploads(self):
+        uploads = getattr(self._local, "uploads", None) or []
+        self._local.uploads = []
+        for future in uploads:
+            reply = future.result()
+            if not reply.get("ok"):
+                raise SyncError(reply.get("error", "chunk upload failed"))
+
+    def check(self, path, size, mtime_ns, mode=None) -> bool:
+        return self._call("check", path=path, size=size, mtime_ns=mtime_ns, mode=mode)["current"]
+
+    def missing(self, digests) -> List[str]:
+        return self._call("missing", digests=list(digests))["missing"]
+
+    def put_chunk(self, digest, data):
+        uploads = getattr(self._local, "uploads", None)
+        if uploads is None:
+            uploads = self._local.uploads = []
+        uploads.append(self._send("chunk", data, digest=digest))
+
+    def commit(self, path, size, mtime_ns, mode, chunks, uid=None, gid=None) -> List[str]:
+        self._wait_uploads()
+        return self._call(
+            "commit", path=path, size=size, mtime_ns=mtime_ns, mode=mode, chunks=chunks, uid=uid, gid=gid,
+        )["missing"]
+
+    def link(self, path, target) -> bool:
+        return self._call("link", path=path, target=target)["changed"]
+
+    def prune(self, keep) -> int:
+        return self._call("prune", keep=list(keep))["removed"]
+
+    def stats(self) -> dict:
+        reply = self._call("stats")
+        return {k: reply[k] for k in ("files", "chunks", "staged_chunks")}
+
+    def close(self):
+        try:
+            if not self._error:
+                self._send("close").result(timeout=60)
+        finally:
+            if self._closer:
+                self._closer()
+
+
+def _ssh_client(conn):
+    import paramiko
+
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    connect_kwargs = {"hostname": conn.host, "username": conn.username, "port": conn.port}
+    if conn.password:
+        connect_kwargs["password"] = conn.password
+    if conn.key_path:
+        connect_kwargs["key_filename"] = conn.key_path
+    try:
+        client.connect(**connect_kwargs)
+    except paramiko.SSHException as e:
+        # Authentication and host key failures included.
+        client.close()
+        raise SyncError(f"SSH connection to {conn.host} failed: {e}") from e
+    return client
+
+
+def _ssh_channel(client, command: str):
+    import paramiko
+
+    try:
+        channel = client.get_transport().open_session(window_size=WINDOW_SIZE, max_packet_size=MAX_PACKET_SIZE)
+        channel.exec_command(command)
+    except paramiko.SSHException as e:
+        client.close()
+        raise SyncError(f"Could not start the sync agent over SSH: {e}") from e
+    return channel
+
+
+@contextlib.contextmanager
+def open_target(dest: str, transport: str = "local", conn=None, workers: int = STREAMS):
+    # local: in-process Target on a directory. pipe: sync_agent.py in a local
+    # python subprocess, the same code path as ssh without a remote host.
+    # ssh: sync_agent.py started on conn's host over one SSH channel.
+    if transport == "local":
+        target = sync_agent.Target(dest)
+    elif transport == "pipe":
+        proc = subprocess.Popen(
+            [sys.executable, "-c", bootstrap(), "serve", dest, "--workers", str(workers)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        )
+
+        def close_pipe():
+            proc.stdin.close()
+            proc.wait(timeout=60)
+
+        target = RemoteTarget(proc.stdout, proc.stdin, close_pipe)
+    elif transport == "ssh":
+        if conn is None:
+            raise ValueError("ssh transport needs a connection")
+        client = _ssh_client(conn)
+        command = " ".join(shlex.quote(a) for a in ("python3", "-c", bootstrap(), "serve", dest, "--workers", str(workers)))
+        channel = _ssh_channel(client, command)
+
+        def close_channel():
+            channel.close()
+            client.close()
+
+        target = RemoteTarget(channel.makefile("rb", READ_CHUNK), channel.makefile("wb", READ_CHUNK), close_channel)
+    else:
+        raise ValueError(f"Unknown transport {transport!r}; expected one of {', '.join(TRANSPORTS)}")
+    try:
+        yield target
+    finally:
+        target.close()
+
+
+def walk_source(root: str) -> Iterator[Tuple[str, str, os.stat_result]]:
+    # Regular files and symlinks under root, as (relative path, path, lstat).
+    stack = [("", root)]
+    while stack:
+        rel_dir, path = stack.pop()
+        try:
+            entries = list(os.scandir(path))
+        except OSError as e:
+            logger.warning("Cannot list %s: %s", path, e)
+            continue
+        for entry in sorted(entries, key=lambda e: e.name):
+            rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            if not rel_dir and entry.name == sync_agent.STATE_DIR:
+                continue
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if stat.S_ISDIR(st.st_mode):
+                stack.append((rel, entry.path))
+            elif stat.S_ISREG(st.st_mode) or stat.S_ISLNK(st.st_mode):
+                yield rel, entry.path, st
+
+
+class _Pass:
+    def __init__(self, target, chunker):
+        self.target = target
+        self.chunker = chunker
+        self.lock = threading.Lock()
+        self.stats = {
+            "files": 0, "skipped": 0, "transferred": 0, "links": 0, "changed_during_sync": 0,
+            "bytes_total": 0, "bytes_scanned": 0, "bytes_sent": 0, "chunks": 0, "chunks_sent": 0,
+        }
+        self.errors: List[dict] = []
+
+    def add(self, **counts):
+        with self.lock:
+            for key, value in counts.items():
+                self.stats[key] += value
+
+    def _upload(self, batch: List[Tuple[str, bytes]], sent: set):
+        missing = set(self.target.missing([d for d, _ in batch]))
+        size = 0
+        count = 0
+        for digest, data in batch:
+            if digest in missing and digest not in sent:
+                self.target.put_chunk(digest, data)
+                sent.add(digest)
+                size += len(data)
+                count += 1
+        self.add(bytes_sent=size, chunks_sent=count)
+        SYNC_BYTES.inc(size, kind="sent")
+
+    def sync_file(self, rel: str, path: str, st: os.stat_result):
+        self.add(files=1)
+        if stat.S_ISLNK(st.st_mode):
+            self.target.link(rel, os.readlink(path))
+            self.add(links=1)
+            return
+        self.add(bytes_total=st.st_size)
+        mode = stat.S_IMODE(st.st_mode)
+        if self.target.check(rel, st.st_size, st.st_mtime_ns, mode):
+            self.add(skipped=1)
+            SYNC_FILES.inc(result="unchanged")
+            return
+
+        chunks = []
+        offsets = {}
+        batch: List[Tuple[str, bytes]] = []
+        sent: set = set()
+        with open(path, 'rb') as f:
+            for offset, data, digest in self.chunker.split(f):
+                chunks.append([digest, len(data)])
+                offsets.setdefault(digest, (offset, len(data)))
+                batch.append((digest, data))
+                if len(batch) >= BATCH_CHUNKS:
+                    self._upload(batch, sent)
+                    batch = []
+            if batch:
+                self._upload(batch, sent)
+            size = sum(length for _, length in chunks)
+            self.add(bytes_scanned=size, chunks=len(chunks))
+            SYNC_BYTES.inc(size, kind="scanned")
+
+            missing = self.target.commit(rel, size, st.st_mtime_ns, mode, chunks, st.st_uid, st.st_gid)
+            if missing:
+                # The target lost a chunk it had reported present (a file it
+                # reads from changed underneath it); resend those and retry.
+                for digest in missing:
+                    offset, length = offsets[digest]
+                    f.seek(offset)
+                    data = f.read(length)
+                    if sync_agent.chunk_digest(data) != digest:
+                        raise SyncError(f"{rel} changed while it was being synced")
+                    self.target.put_chunk(digest, data)
+                    self.add(bytes_sent=length, chunks_sent=1)
+                if self.target.commit(rel, size, st.st_mtime_ns, mode, chunks, st.st_uid, st.st_gid):
+                    raise SyncError(f"Target could not assemble {rel}")
+        self.add(transferred=1)
+        SYNC_FILES.inc(result="transferred")
+        try:
+            now = os.lstat(path)
+            if (now.st_size, now.st_mtime_ns) != (st.st_size, st.st_mtime_ns):
+                # Synced a moving file; the stale mtime makes the next pass redo it.
+                self.add(changed_during_sync=1)
+        except OSError:
+            pass
+
+
+def sync(source: str, target, streams: int = STREAMS, delete: bool = False,
+         chunker: Optional[sync_agent.Chunker] = None, transport: str = "local") -> dict:
+    # One pass of source into target. Unchanged files (size, mtime, mode)
+    # are skipped without reading; changed files are chunked and only the
+    # chunks the target lacks are sent. Safe to interrupt and re-run.
+    if not os.path.isdir(source):
+        raise ValueError(f"Source {source} is not a directory")
+    state = _Pass(target, chunker or sync_agent.Chunker())
+    files: queue.Queue = queue.Queue(maxsize=streams * 64)
+    seen: List[str] = []
+
+    def worker():
+        while True:
+            item = files.get()
+            if item is None:
+                return
+            rel = item[0]
+            try:
+                state.sync_file(*item)
+            except Exception as e:
+                # Keep draining the queue so the walker never blocks.
+                logger.warning("Sync of %s failed: %s", rel, e)
+                state.errors.append({"path": rel, "error": str(e)})
+                SYNC_FILES.inc(result="failed")
+
+    start = time.perf_counter()
+    with SYNC_SECONDS.time(transport=transport), profiling.span("datasync.sync", transport=transport):
+        threads = [threading.Thread(target=worker, name=f"sync-{i}", daemon=True) for i in range(max(1, streams))]
+        for t in threads:
+            t.start()
+        for rel, path, st in walk_source(source):
+            seen.append(rel)
+            files.put((rel, path, st))
+        for _ in threads:
+            files.put(None)
+        for t in threads:
+            t.join()
+        removed = target.prune(seen) if delete and not state.errors else 0
+    seconds = time.perf_counter() - start
+    stats = dict(state.stats, removed=removed, errors=state.errors, seconds=round(seconds, 3))
+    stats["scan_mbps"] = round(stats["bytes_scanned"] / 2 ** 20 / seconds, 2) if seconds else 0.0
+    stats["effective_mbps"] = round(stats["bytes_total"] / 2 ** 20 / seconds, 2) if seconds else 0.0
+    return stats
@@ -1,6 +1,10 @@
 from app.models import DeployResult
+from app.core import metrics
 import time
 
+DEPLOY_SECONDS = metrics.histogram("migrator_deploy_seconds", "Duration of application deployments")
+
+@DEPLOY_SECONDS.time()
 def deploy_app(target_ip: str) -> DeployResult:
     # 1. Connect to Target (Mock)
     # 2. Install Dependencies
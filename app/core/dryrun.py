@@ -0,0 +1,234 @@
+import os
+import re
+import shutil
+import stat
+import subprocess
+import tempfile
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.core import metrics, profiling
+from app.models import ScriptSection
+
+# Runs a generated startup.sh on the local machine instead of a VM. Absolute
+# paths in the script are rewritten under a throwaway root (/dev excepted),
+# and package, service and process manager commands are replaced by stubs on
+# PATH that log the call, sleep a simulated latency and succeed, or fail when
+# asked to. Each section runs in its own bash, so its wall time, the bytes it
+# wrote under the root and its unhandled failures are reported per section.
+# This is a path rewrite, not isolation: only run scripts the builder made.
+#
+# Seconds per call and per argument (e.g. per package) of the stubbed commands.
+LATENCIES: Dict[str, Tuple[float, float]] = {
+    "apt-get": (1.0, 0.05),
+    "apt": (1.0, 0.05),
+    "dpkg": (0.1, 0.01),
+    "yum": (1.5, 0.05),
+    "dnf": (1.5, 0.05),
+    "systemctl": (0.05, 0.0),
+    "service": (0.05, 0.0),
+    "pm2": (0.3, 0.0),
+    "npm": (2.0, 0.0),
+    "node": (0.1, 0.0),
+    "curl": (0.2, 0.0),
+    "useradd": (0.02, 0.0),
+    "crontab": (0.01, 0.0),
+    "id": (0.0, 0.0),
+}
+SECTION_TIMEOUT = float(os.environ.get("MIGRATOR_DRYRUN_SECTION_TIMEOUT", "600"))
+STATE_DIR = ".dryrun"
+
+DRYRUN_SECONDS = metrics.histogram("migrator_dryrun_section_seconds", "Wall time of dry-run startup script sections",
+                                   ("section",))
+DRYRUN_FAILURES = metrics.counter("migrator_dryrun_failures_total", "Unhandled command failures in dry runs",
+                                  ("section",))
+
+# Single-quoted words (base64 bodies, messages) are kept as they are; any
+# other absolute path at the start of a shell word moves under the root.
+_REWRITE = re.compile(r"('[^'\n]*')|(?<![^\s><(=|;&\"])/(?!dev/)(?=[\w.])")
+
+_PREAMBLE = """export PATH="$MIGRATOR_ROOT/.dryrun/bin:$PATH" HOME="$MIGRATOR_ROOT/root"
+trap '__rc=$?; printf "%s\\t%s\\t%s\\n" "$MIGRATOR_SECTION" "$__rc" "$BASH_COMMAND" >> "$MIGRATOR_ROOT/.dryrun/errors.log"' ERR
+cd "$MIGRATOR_ROOT"
+"""
+
+# Extra behaviour of stubs whose effects later commands depend on.
+_STUB_ACTIONS = {
+    "id": 'exit 1',  # Users never exist yet, so "id -u x || useradd x" adds them.
+    "useradd": 'for __a; do :; done; mkdir -p "$MIGRATOR_ROOT/home/$__a"',
+    "crontab": ('__u=root; while [ $# -gt 0 ]; do [ "$1" = -u ] && { __u=$2; shift; }; shift; done; '
+                'mkdir -p "$MIGRATOR_ROOT/var/spool/cron/crontabs"; '
+                'cat > "$MIGRATOR_ROOT/var/spool/cron/crontabs/$__u"'),
+}
+
+
+def rewrite_paths(text: str) -> str:
+    return _REWRITE.sub(lambda m: m.group(1) or '"$MIGRATOR_ROOT"/', text)
+
+
+def _stub(name: str, per_call: float, per_arg: float, status: int) -> str:
+    call_us, arg_us = int(per_call * 1e6), int(per_arg * 1e6)
+    return (
+        "#!/bin/bash\n"
+        f"__us=$(( {call_us} + {arg_us} * $# ))\n"
+        f'printf "%s\\t%s\\t%s\\t%s\\n" "$MIGRATOR_SECTION" "{status}" "$__us" "{name} $*"'
+        ' >> "$MIGRATOR_ROOT/.dryrun/calls.log"\n'
+        '[ "$__us" -gt 0 ] && sleep "$((__us / 1000000)).$(printf %06d $((__us % 1000000)))"\n'
+        + (f"exit {status}\n" if status else _STUB_ACTIONS.get(name, "") + "\nexit 0\n")
+    )
+
+
+def make_root(root: str, latencies: Dict[str, Tuple[float, float]] = None, scale: float = 1.0,
+              fail: Iterable[str] = ()) -> str:
+    latencies = dict(LATENCIES, **(latencies or {}))
+    fail = set(fail)
+    bin_dir = os.path.join(root, STATE_DIR, "bin")
+    os.makedirs(bin_dir, exist_ok=True)
+    os.makedirs(os.path.join(root, "root"), exist_ok=True)
+    for name in set(latencies) | fail:
+        per_call, per_arg = latencies.get(name, (0.0, 0.0))
+        path = os.path.join(bin_dir, name)
+        with open(path, "w") as f:
+            f.write(_stub(name, per_call * scale, per_arg * scale, 1 if name in fail else 0))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return root
+
+
+def _snapshot(root: str) -> Dict[str, Tuple[int, int]]:
+    files = {}
+    for dirpath, dirs, names in os.walk(root):
+        if dirpath == root and STATE_DIR in dirs:
+            dirs.remove(STATE_DIR)
+        for name in names:
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            files[path] = (st.st_size, st.st_mtime_ns)
+    return files
+
+
+def _read_log(root: str, name: str) -> List[List[str]]:
+    path = os.path.join(root, STATE_DIR, name)
+    if not os.path.exists(path):
+        return []
+    with open(path, errors="replace") as f:
+        return [line.rstrip("\n").split("\t") for line in f if line.strip()]
+
+
+def split_script(script: str, index: Optional[List[ScriptSection]] = None) -> List[Tuple[str, str]]:
+    # Sections from the build's byte index, or else at comment headers that
+    # follow a blank line (what the builder emits for most sections).
+    data = script.encode()
+    if index:
+        sections = [("header", data[:index[0].offset].decode())]
+        sections.extend((s.name, data[s.offset:s.offset + s.length].decode()) for s in index)
+        end = index[-1].offset + index[-1].length
+        if end < len(data):
+            sections.append(("trailer", data[end:].decode()))
+        return [(name, text) for name, text in sections if text.strip()]
+    sections, name, lines = [], "header", []
+    previous = ""
+    for line in script.splitlines(keepends=True):
+        if line.startswith("# ") and not previous.strip() and lines:
+            sections.append((name, "".join(lines)))
+            name = re.sub(r"[^a-z0-9]+", "_", line[2:].split("(")[0].lower()).strip("_") or "section"
+            lines = []
+        lines.append(line)
+        previous = line
+    sections.append((name, "".join(lines)))
+    seen: Dict[str, int] = {}
+    named = []
+    for name, text in sections:
+        if not text.strip():
+            continue
+        seen[name] = seen.get(name, 0) + 1
+        named.append((name if seen[name] == 1 else f"{name}_{seen[name]}", text))
+    return named
+
+
+def run_sections(sections: List[Tuple[str, str]], latencies: Dict[str, Tuple[float, float]] = None,
+                 scale: float = 1.0, fail: Iterable[str] = (), root: str = None,
+                 timeout: float = SECTION_TIMEOUT) -> dict:
+    # Runs (name, text) sections in order against a fresh root and reports
+    # per-section wall time, stubbed call time, bytes and files written and
+    # failures. The root is removed afterwards unless one was given.
+    keep = root is not None
+    root = os.path.abspath(root) if keep else tempfile.mkdtemp(prefix="migrator-dryrun-")
+    make_root(root, latencies, scale, fail)
+    env = dict(os.environ, MIGRATOR_ROOT=root)
+    report = {"root": root if keep else None, "sections": [], "seconds": 0.0, "bytes_written": 0, "failures": 0}
+    try:
+        before = _snapshot(root)
+        for name, text in sections:
+            env["MIGRATOR_SECTION"] = name
+            calls_before = len(_read_log(root, "calls.log"))
+            errors_before = len(_read_log(root, "errors.log"))
+            out_path = os.path.join(root, STATE_DIR, f"{name}.out")
+            script_path = os.path.join(root, STATE_DIR, f"{name}.sh")
+            with open(script_path, "w") as f:
+                f.write(_PREAMBLE + rewrite_paths(text))
+            start = time.perf_counter()
+            with profiling.span(f"dryrun.{name}"), open(out_path, "wb") as out:
+                # Output goes to a file: background jobs ("npm start &") keep
+                # a pipe open long after the section is done.
+                try:
+                    status = subprocess.run(["bash", script_path], env=env,
+                                            stdin=subprocess.DEVNULL, stdout=out, stderr=subprocess.STDOUT,
+                                            timeout=timeout).returncode
+                except subprocess.TimeoutExpired:
+                    status = None
+            seconds = time.perf_counter() - start
+
+            after = _snapshot(root)
+            written = [path for path, entry in after.items() if before.get(path) != entry]
+            before = after
+            calls = _read_log(root, "calls.log")[calls_before:]
+            calls = [c for c in calls if c[0] == name]
+            failures = [{"command": err[2] if len(err) > 2 else "", "status": int(err[1]) if err[1].isdigit() else err[1]}
+                        for err in _read_log(root, "errors.log")[errors_before:]]
+            if status is None:
+                failures.append({"command": f"section exceeded {timeout:g}s", "status": "timeout"})
+            with open(out_path, errors="replace") as f:
+                output_tail = f.read()[-2000:]
+
+            section = {
+                "name": name,
+                "seconds": round(seconds, 4),
+                "simulated_seconds": round(sum(int(c[2]) for c in calls) / 1e6, 4),
+                "commands": len(calls),
+                "bytes_written": sum(after[path][0] for path in written),
+                "files_written": len(written),
+                "exit_status": status,
+                "failures": failures,
+                "stub_failures": [c[3] for c in calls if c[1] != "0"],
+            }
+            if failures:
+                section["output"] = output_tail
+            report["sections"].append(section)
+            report["seconds"] += seconds
+            report["bytes_written"] += section["bytes_written"]
+            report["failures"] += len(failures)
+            DRYRUN_SECONDS.observe(seconds, section=name)
+            if failures:
+                DRYRUN_FAILURES.inc(len(failures), section=name)
+    finally:
+        if not keep:
+            shutil.rmtree(root, ignore_errors=True)
+    report["seconds"] = round(report["seconds"], 4)
+    return report
+
+
+def dry_run_script(path: str, index: Optional[List[ScriptSection]] = None, **kwargs) -> dict:
+    with open(path) as f:
+        return run_sections(split_script(f.read(), index), **kwargs)
+
+
+def dry_run_scan(scan, analysis=None, config=None, **kwargs) -> dict:
+    # Renders the startup script sections for a scan and dry-runs them.
+    from app.core import builder
+
+    sections = [("header", builder.STARTUP_HEADER)]
+    sections.extend((name, text) for name, text, _ in builder.render_startup_sections(scan, analysis, config) if text)
+    return run_sections(sections, **kwargs)
@@ -0,0 +1,279 @@
+import csv
+import gzip
+import io
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.models import ScanResult, AnalysisResult
+from app.core import metrics, profiling
+
+# Flat fleet tables for offline analytics. File bodies are never exported,
+# only their counts and sizes.
+TABLES: Dict[str, List[Tuple[str, str]]] = {
+    "hosts": [
+        ("project", "str"), ("hostname", "str"), ("os_info", "str"), ("cpu_cores", "int"),
+        ("memory_gb", "float"), ("disk_total_gb", "float"), ("services", "int"), ("packages", "int"),
+        ("open_ports", "int"), ("users", "int"), ("apps", "int"), ("config_files", "int"),
+        ("captured_files", "int"), ("captured_bytes", "int"), ("disk_used_bytes", "int"), ("data_bytes", "int"),
+    ],
+    "services": [("project", "str"), ("hostname", "str"), ("service", "str")],
+    "packages": [("project", "str"), ("hostname", "str"), ("package", "str"), ("arch", "str")],
+    "ports": [("project", "str"), ("hostname", "str"), ("port", "int")],
+    "apps": [
+        ("project", "str"), ("hostname", "str"), ("app", "str"), ("kind", "str"), ("path", "str"),
+        ("status", "str"), ("version", "str"), ("files", "int"), ("bytes", "int"),
+    ],
+    "recommendations": [
+        ("project", "str"), ("hostname", "str"), ("instance_type", "str"), ("strategy", "str"),
+        ("estimated_cost_monthly", "float"), ("risks", "int"), ("risk_details", "str"),
+        ("added_components", "str"), ("removed_components", "str"), ("recommended_disk_gb", "int"),
+        ("transfer_seconds", "float"), ("transfer_bandwidth_mbps", "float"),
+    ],
+}
+
+FORMATS = ("csv", "parquet")
+DEFAULT_CHUNK_ROWS = 100_000
+
+EXPORT_ROWS = metrics.counter("migrator_export_rows_total", "Rows written by fleet exports", ("table",))
+EXPORT_SECONDS = metrics.histogram("migrator_export_seconds", "Duration of fleet exports")
+
+
+def _files_size(files: Dict[str, str]) -> int:
+    return sum(len(body) for body in files.values())
+
+
+def host_rows(project: str, scan: ScanResult, analysis: Optional[AnalysisResult] = None) -> Dict[str, List[tuple]]:
+    host = scan.hostname
+    apps = []
+    for proc in scan.pm2_processes:
+        files = scan.custom_app_configs.get(proc.get("name"), {})
+        apps.append((project, host, proc.get("name"), "pm2", proc.get("path"), proc.get("status"),
+                     proc.get("version"), len(files), _files_size(files)))
+    for app in scan.generic_apps:
+        files = app.get("files") or {}
+        apps.append((project, host, app.get("name") or app.get("service_name"), "systemd", app.get("app_path"),
+                     None, None, len(files), _files_size(files)))
+
+    captured = [scan.config_files, scan.crontabs] + list(scan.custom_app_configs.values())
+    captured += [app.get("files") or {} for app in scan.generic_apps]
+    rows = {
+        "hosts": [(
+            project, host, scan.os_info, scan.cpu_cores, scan.memory_gb, sum(scan.disk_space_gb.values()),
+            len(scan.running_services), len(scan.installed_packages), len(scan.open_ports),
+            len(scan.system_users), len(apps), len(scan.config_files),
+            sum(len(files) for files in captured), sum(_files_size(files) for files in captured),
+            sum(v.bytes for v in scan.data_volumes if v.kind == "mount"),
+            sum(v.bytes for v in scan.data_volumes if v.kind != "mount"),
+        )],
+        "services": [(project, host, service) for service in scan.running_services],
+        "packages": [(project, host) + tuple(_split_arch(package)) for package in scan.installed_packages],
+        "ports": [(project, host, port) for port in scan.open_ports],
+        "apps": apps,
+        "recommendations": [],
+    }
+    if analysis is not None:
+        rows["recommendations"].append((
+            project, host, analysis.recommended_gcp_instance, analysis.migration_strategy,
+            analysis.estimated_cost_monthly, len(analysis.risks), "; ".join(analysis.risks),
+            ";".join(c.name for c in analysis.added_components), ";".join(analysis.removed_components),
+            analysis.recommended_disk_gb, analysis.transfer_seconds, analysis.transfer_bandwidth_mbps,
+        ))
+    return rows
+
+
+def _split_arch(package: str):
+    name, _, arch = package.partition(":")
+    return name, arch or None
+
+
+class CsvTableWriter:
+    # Streams rows into <table>/part-NNNNN.csv(.gz); a new part starts every
+    # chunk_rows rows so files stay loadable piecewise.
+    extension = "csv"
+
+    def __init__(self, directory: str, table: str, columns: List[Tuple[str, str]],
+                 chunk_rows: int = DEFAULT_CHUNK_ROWS, compress: bool = True):
+        self.directory = os.path.join(directory, table)
+        self.table = table
+        self.header = [name for name, _ in columns]
+        self.chunk_rows = max(1, chunk_rows)
+        self.compress = compress
+        self.files: List[str] = []
+        self.rows = 0
+        self._file = None
+        self._writer = None
+        self._part_rows = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _open_part(self):
+        self.close()
+        name = f"part-{len(self.files):05d}.csv" + (".gz" if self.compress else "")
+        path = os.path.join(self.directory, name)
+        if self.compress:
+            self._file = io.TextIOWrapper(gzip.open(path, "wb", compresslevel=6), encoding="utf-8", newline="")
+        else:
+            self._file = open(path, "w", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.header)
+        self._part_rows = 0
+        self.files.append(os.path.relpath(path, os.path.dirname(self.directory)))
+
+    def write(self, rows: List[tuple]):
+        for row in rows:
+            if self._writer is None or self._part_rows >= self.chunk_rows:
+                self._open_part()
+            self._writer.writerow(row)
+            self._part_rows += 1
+        self.rows += len(rows)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._writer = None
+
+
+class ParquetTableWriter:
+    # One Parquet file per table, one row group per chunk_rows buffered rows.
+    extension = "parquet"
+
+    def __init__(self, directory: str, table: str, columns: List[Tuple[str, str]],
+                 chunk_rows: int = DEFAULT_CHUNK_ROWS, compress: bool = True):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+        types = {"str": pa.string(), "int": pa.int64(), "float": pa.float64()}
+        self._pa = pa
+        self.schema = pa.schema([(name, types[kind]) for name, kind in columns])
+        self.table = table
+        self.chunk_rows = max(1, chunk_rows)
+        path = os.path.join(directory, f"{table}.parquet")
+        self._writer = pq.ParquetWriter(path, self.schema, compression="zstd" if compress else "none")
+        self._buffer: List[tuple] = []
+        self.files = [os.path.basename(path)]
+        self.rows = 0
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        columns = list(zip(*self._buffer))
+        self._writer.write_table(self._pa.Table.from_arrays(
+            [self._pa.array(values, type=field.type) for values, field in zip(columns, self.schema)],
+            schema=self.schema,
+        ))
+        self._buffer = []
+
+    def write(self, rows: List[tuple]):
+        self._buffer.extend(rows)
+        self.rows += len(rows)
+        if len(self._buffer) >= self.chunk_rows:
+            self._flush()
+
+    def close(self):
+        if self._writer is not None:
+            self._flush()
+            self._writer.close()
+            self._writer = None
+
+
+WRITERS = {"csv": CsvTableWriter, "parquet": ParquetTableWriter}
+
+
+@EXPORT_SECONDS.time()
+@profiling.traced("export.fleet")
+def export_fleet(
+    records: Iterable[Tuple[str, ScanResult, Optional[AnalysisResult]]],
+    output_dir: str,
+    fmt: str = "csv",
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    compress: bool = True,
+    analyze: bool = True,
+) -> dict:
+    # Records are consumed one host at a time and their rows written straight
+    # through, so memory stays flat regardless of fleet size.
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown export format {fmt!r} (expected one of {', '.join(FORMATS)})")
+    from app.core import analyzer
+
+    os.makedirs(output_dir, exist_ok=True)
+    writers = {}
+    hosts = 0
+    try:
+        for table, columns in TABLES.items():
+            writers[table] = WRITERS[fmt](output_dir, table, columns, chunk_rows=chunk_rows, compress=compress)
+        for project, scan, analysis in records:
+            if analysis is None and analyze:
+                analysis = analyzer.analyze_scan(scan)
+            for table, rows in host_rows(project, scan, analysis).items():
+                writers[table].write(rows)
+            hosts += 1
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    manifest = {
+        "format": fmt,
+        "hosts": hosts,
+        "tables": {
+            table: {"columns": [{"name": n, "type": t} for n, t in TABLES[table]],
+                    "rows": writer.rows, "files": writer.files}
+            for table, writer in writers.items()
+        },
+    }
+    for table, writer in writers.items():
+        EXPORT_ROWS.inc(writer.rows, table=table)
+    with open(os.path.join(output_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def stream_csv(table: str, records: Iterable[Tuple[str, ScanResult, Optional[AnalysisResult]]],
+               analyze: bool = True, batch_rows: int = 1000) -> Iterator[bytes]:
+    # Single table as a CSV byte stream (e.g. for an HTTP download).
+    from app.core import analyzer
+
+    columns = TABLES[table]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    pending = 1
+    total = 0
+    for project, scan, analysis in records:
+        if table == "recommendations" and analysis is None and analyze:
+            analysis = analyzer.analyze_scan(scan)
+        rows = host_rows(project, scan, analysis)[table]
+        writer.writerows(rows)
+        pending += len(rows)
+        total += len(rows)
+        if pending >= batch_rows:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    EXPORT_ROWS.inc(total, table=table)
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def batch_records(results_dir: str) -> Iterator[Tuple[str, ScanResult, Optional[AnalysisResult]]]:
+    # Reads batch-mode result.json files one at a time.
+    from app.core.batch import RESULT_FILE
+
+    for entry in sorted(os.scandir(results_dir), key=lambda e: e.name):
+        path = os.path.join(entry.path, RESULT_FILE)
+        if not entry.is_dir() or not os.path.exists(path):
+            continue
+        with open(path, "rb") as f:
+            result = json.loads(f.read())
+        if result.get("status") != "done" or not result.get("scan"):
+            continue
+        analysis = result.get("analysis")
+        project = result.get("project") or "batch"
+        yield (
+            project,
+            ScanResult.model_validate(result["scan"]),
+            AnalysisResult.model_validate(analysis) if analysis else None,
+        )
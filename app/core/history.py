@@ -0,0 +1,196 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from app.models import ScanResult
+from app.core import ingest, metrics
+
+# Scan versions kept per host; older ones are evicted and their content released.
+MAX_VERSIONS = int(os.environ.get("MIGRATOR_SCAN_HISTORY", "10"))
+
+SET_SECTIONS = ("running_services", "open_ports", "installed_packages", "system_users")
+MAP_SECTIONS = ("crontabs", "config_files")
+
+DIFF_SECONDS = metrics.histogram("migrator_scan_diff_seconds", "Duration of scan version diffs")
+HISTORY_VERSIONS = metrics.gauge("migrator_scan_history_versions", "Scan versions retained across all hosts")
+
+
+def _hash(*parts: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part.encode("utf-8", errors="surrogatepass"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _hash_map(values: Dict[str, str]) -> Dict[str, str]:
+    digest = ingest.CONTENT_POOL.digest
+    return {k: digest(v, _hash) for k, v in values.items()}
+
+
+def _combine(hashes: Dict[str, str]) -> str:
+    return _hash(*(f"{k}={v}" for k, v in sorted(hashes.items())))
+
+
+def fingerprint(scan: ScanResult) -> dict:
+    # Per-section hashes plus per-file hashes for sections that hold files.
+    # Computed once per scan and cached on the model; diffs and incremental
+    # builds compare these instead of file contents.
+    cached = scan._fingerprint
+    if cached is not None:
+        return cached
+
+    files = {
+        "crontabs": _hash_map(scan.crontabs),
+        "config_files": _hash_map(scan.config_files),
+    }
+    for name, configs in scan.custom_app_configs.items():
+        files[f"custom_app_configs/{name}"] = _hash_map(configs)
+    for app in scan.generic_apps:
+        name = app.get("name") or app.get("service_name") or "app"
+        if f"generic_apps/{name}" in files:
+            name = f"{name}#{len(files)}"
+        entries = _hash_map(app.get("files") or {})
+        entries[":unit"] = _hash(
+            str(app.get("service_name")), str(app.get("app_path")),
+            str(app.get("unit_file_path")), str(app.get("unit_file_content")),
+        )
+        files[f"generic_apps/{name}"] = entries
+
+    sections = {
+        "system": _hash(scan.hostname, scan.os_info, str(scan.cpu_cores), str(scan.memory_gb),
+                        repr(sorted(scan.disk_space_gb.items())),
+                        repr([(v.path, v.kind, v.bytes) for v in scan.data_volumes])),
+        "running_services": _hash(*scan.running_services),
+        "open_ports": _hash(*map(str, sorted(scan.open_ports))),
+        "installed_packages": _hash(*scan.installed_packages),
+        "system_users": _hash(*scan.system_users),
+        "pm2_processes": _hash(*(repr(sorted(p.items())) for p in scan.pm2_processes)),
+    }
+    for section in MAP_SECTIONS:
+        sections[section] = _combine(files[section])
+    sections["custom_app_configs"] = _combine({
+        k: _combine(v) for k, v in files.items() if k.startswith("custom_app_configs/")
+    })
+    sections["generic_apps"] = _combine({
+        k: _combine(v) for k, v in files.items() if k.startswith("generic_apps/")
+    })
+
+    result = {"sections": sections, "files": files}
+    scan._fingerprint = result
+    return result
+
+
+def diff_scans(old: ScanResult, new: ScanResult) -> dict:
+    with DIFF_SECONDS.time():
+        old_fp, new_fp = fingerprint(old), fingerprint(new)
+        changed = [s for s, h in new_fp["sections"].items() if old_fp["sections"].get(s) != h]
+        result = {"changed_sections": changed, "sections": {}}
+
+        for section in changed:
+            if section in SET_SECTIONS:
+                before, after = set(getattr(old, section)), set(getattr(new, section))
+                result["sections"][section] = {
+                    "added": sorted(after - before),
+                    "removed": sorted(before - after),
+                }
+            elif section == "system":
+                result["sections"][section] = {
+                    field: {"from": getattr(old, field), "to": getattr(new, field)}
+                    for field in ("hostname", "os_info", "cpu_cores", "memory_gb", "disk_space_gb", "data_volumes")
+                    if getattr(old, field) != getattr(new, field)
+                }
+            elif section == "pm2_processes":
+                before = {p.get("name"): p for p in old.pm2_processes}
+                after = {p.get("name"): p for p in new.pm2_processes}
+                result["sections"][section] = {
+                    "added": sorted(k for k in after if k not in before),
+                    "removed": sorted(k for k in before if k not in after),
+                    "modified": sorted(k for k in after if k in before and after[k] != before[k]),
+                }
+            else:
+                # File-bearing sections: only groups whose combined hash moved are
+                # compared, and only by per-file hash.
+                groups = [section] if section in MAP_SECTIONS else sorted(
+                    k for k in set(old_fp["files"]) | set(new_fp["files"]) if k.startswith(section + "/")
+                )
+                detail = {}
+                for group in groups:
+                    before = old_fp["files"].get(group, {})
+                    after = new_fp["files"].get(group, {})
+                    if before == after:
+                        continue
+                    detail[group] = {
+                        "added": sorted(k for k in after if k not in before),
+                        "removed": sorted(k for k in before if k not in after),
+                        "modified": sorted(k for k in after if k in before and after[k] != before[k]),
+                    }
+                result["sections"][section] = detail
+        return result
+
+
+class ScanVersion:
+    __slots__ = ("version", "received_at", "scan")
+
+    def __init__(self, version: int, scan: ScanResult):
+        self.version = version
+        self.received_at = time.time()
+        self.scan = scan
+
+    def summary(self) -> dict:
+        return {
+            "version": self.version,
+            "received_at": self.received_at,
+            "hostname": self.scan.hostname,
+            "sections": fingerprint(self.scan)["sections"],
+        }
+
+
+class ScanHistory:
+    # Versioned scans per (project, hostname). The latest version of a host is
+    # what the rest of the app works with; older versions exist for diffs.
+    def __init__(self, max_versions: int = MAX_VERSIONS, pool: ingest.ContentPool = ingest.CONTENT_POOL):
+        self.max_versions = max(1, max_versions)
+        self.pool = pool
+        self._hosts: Dict[tuple, List[ScanVersion]] = {}
+        self._lock = threading.Lock()
+        HISTORY_VERSIONS.set_function(lambda: sum(len(v) for v in list(self._hosts.values())))
+
+    def record(self, project: str, scan: ScanResult) -> ScanVersion:
+        fingerprint(scan)
+        with self._lock:
+            versions = self._hosts.setdefault((project, scan.hostname), [])
+            entry = ScanVersion(versions[-1].version + 1 if versions else 1, scan)
+            versions.append(entry)
+            evicted = versions[:-self.max_versions]
+            del versions[:-self.max_versions]
+        for old in evicted:
+            self.pool.release(old.scan)
+        return entry
+
+    def versions(self, project: str, hostname: str) -> List[ScanVersion]:
+        return list(self._hosts.get((project, hostname), []))
+
+    def get(self, project: str, hostname: str, version: Optional[int] = None) -> Optional[ScanVersion]:
+        versions = self._hosts.get((project, hostname), [])
+        if not versions:
+            return None
+        if version is None:
+            return versions[-1]
+        if version < 0:
+            return versions[version] if -version <= len(versions) else None
+        return next((v for v in versions if v.version == version), None)
+
+    def hosts(self, project: str) -> List[str]:
+        return sorted(h for p, h in self._hosts if p == project)
+
+    def latest(self):
+        # (project, hostname, scan) for the newest version of every host.
+        for (project, hostname), versions in list(self._hosts.items()):
+            if versions:
+                yield project, hostname, versions[-1].scan
+
+
+HISTORY = ScanHistory()
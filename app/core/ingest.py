@@ -0,0 +1,210 @@
+import functools
+import threading
+from typing import Dict, Iterable, Optional
+
+from pydantic import TypeAdapter
+
+from app.models import ScanPatchOp, ScanResult
+from app.core import metrics, profiling
+
+POOL_ENTRIES = metrics.gauge("migrator_content_pool_entries", "Distinct strings shared across stored scans")
+POOL_BYTES = metrics.gauge("migrator_content_pool_bytes", "Characters held by the shared content pool")
+POOL_HITS = metrics.counter("migrator_content_pool_hits_total", "Strings deduplicated against the content pool")
+
+
+class ContentPool:
+    # Reference-counted string pool. Scans from similar hosts carry the same
+    # package names, paths and often identical file bodies; storing one shared
+    # str per distinct value keeps resident memory proportional to the unique
+    # content rather than to the number of hosts. Counts are explicit (share /
+    # release) so dropping a scan frees its strings deterministically.
+    def __init__(self):
+        self._entries: Dict[str, list] = {}  # value -> [canonical str, refcount]
+        self._lock = threading.Lock()
+        self._hits = 0
+        self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, value: str) -> str:
+        entry = self._entries.get(value)
+        if entry is None:
+            self._entries[value] = [value, 1]
+            self.size += len(value)
+            return value
+        entry[1] += 1
+        self._hits += 1
+        return entry[0]
+
+    def _put(self, value: str):
+        entry = self._entries.get(value)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del self._entries[value]
+            self.size -= len(value)
+
+    def digest(self, value: str, compute) -> str:
+        # Memoizes content hashes on pooled strings so a file body shared by a
+        # thousand hosts is hashed once.
+        entry = self._entries.get(value)
+        if entry is None:
+            return compute(value)
+        if len(entry) < 3:
+            entry.append(compute(value))
+        return entry[2]
+
+    def share(self, scan: ScanResult) -> ScanResult:
+        with self._lock:
+            _walk(scan, self._get)
+            hits, self._hits = self._hits, 0
+        POOL_HITS.inc(hits)
+        self._publish()
+        return scan
+
+    def release(self, scan: Optional[ScanResult]):
+        if scan is None:
+            return
+        with self._lock:
+            for value in _strings(scan):
+                self._put(value)
+        self._publish()
+
+    def _publish(self):
+        POOL_ENTRIES.set(len(self._entries))
+        POOL_BYTES.set(self.size)
+
+
+def _map(values: Dict[str, str], fn) -> Dict[str, str]:
+    return {fn(k): fn(v) if isinstance(v, str) else v for k, v in values.items()}
+
+
+def _walk(scan: ScanResult, fn):
+    # Rewrites every repeated string of the scan through fn, in place.
+    scan.running_services = [fn(s) for s in scan.running_services]
+    scan.installed_packages = [fn(p) for p in scan.installed_packages]
+    scan.system_users = [fn(u) for u in scan.system_users]
+    scan.crontabs = _map(scan.crontabs, fn)
+    scan.config_files = _map(scan.config_files, fn)
+    scan.pm2_processes = [_map(p, fn) for p in scan.pm2_processes]
+    scan.custom_app_configs = {fn(name): _map(files, fn) for name, files in scan.custom_app_configs.items()}
+    for app in scan.generic_apps:
+        for key, value in list(app.items()):
+            if isinstance(value, str):
+                app[key] = fn(value)
+            elif key == "files" and isinstance(value, dict):
+                app[key] = _map(value, fn)
+
+
+def _strings(scan: ScanResult):
+    # Same traversal as _walk, without rebuilding containers.
+    yield from scan.running_services
+    yield from scan.installed_packages
+    yield from scan.system_users
+    for values in (scan.crontabs, scan.config_files, *scan.pm2_processes):
+        for k, v in values.items():
+            yield k
+            if isinstance(v, str):
+                yield v
+    for name, files in scan.custom_app_configs.items():
+        yield name
+        for k, v in files.items():
+            yield k
+            if isinstance(v, str):
+                yield v
+    for app in scan.generic_apps:
+        for key, value in app.items():
+            if isinstance(value, str):
+                yield value
+            elif key == "files" and isinstance(value, dict):
+                for k, v in value.items():
+                    yield k
+                    if isinstance(v, str):
+                        yield v
+
+
+CONTENT_POOL = ContentPool()
+
+
+def decode_scan(body: bytes) -> ScanResult:
+    # Validates straight from the raw JSON bytes; pydantic-core parses into the
+    # model without first materializing a generic dict tree.
+    with profiling.span("ingest.decode", bytes=len(body)):
+        return ScanResult.model_validate_json(body)
+
+
+def store_scan(scan: ScanResult, previous: Optional[ScanResult] = None, pool: ContentPool = CONTENT_POOL) -> ScanResult:
+    with profiling.span("ingest.compact"):
+        pool.share(scan)
+        if previous is not None and previous is not scan:
+            pool.release(previous)
+    return scan
+
+
+LIST_SECTIONS = ("running_services", "open_ports", "installed_packages", "system_users", "pm2_processes")
+FILE_SECTIONS = ("crontabs", "config_files")
+APP_SECTIONS = ("custom_app_configs", "generic_apps")
+
+
+@functools.lru_cache(maxsize=None)
+def _adapter(section: str) -> TypeAdapter:
+    return TypeAdapter(ScanResult.model_fields[section].annotation)
+
+
+def patch_scan(scan: ScanResult, ops: Iterable[ScanPatchOp]) -> ScanResult:
+    # Applies agent deltas (see agent.py --daemon) to a copy of the scan.
+    # Only touched sections, apps and file maps are copied; everything else
+    # stays shared with the original, which is left unchanged.
+    updates = {}
+
+    def section(name):
+        if name not in updates:
+            value = getattr(scan, name)
+            updates[name] = dict(value) if isinstance(value, dict) else list(value)
+        return updates[name]
+
+    copied = set()
+    for op in ops:
+        if op.section in LIST_SECTIONS:
+            if op.key is not None or op.delete:
+                raise ValueError(f"{op.section} is replaced as a whole")
+            updates[op.section] = _adapter(op.section).validate_python(op.value)
+            continue
+        if not op.key:
+            raise ValueError(f"{op.section} ops need a key")
+        if not op.delete and not isinstance(op.value, str):
+            raise ValueError(f"{op.section}/{op.key}: value must be a string")
+        if op.section in FILE_SECTIONS:
+            files = section(op.section)
+        elif op.section == "custom_app_configs":
+            if not op.group:
+                raise ValueError("custom_app_configs ops need a group")
+            apps = section(op.section)
+            if op.group not in copied:
+                apps[op.group] = dict(apps.get(op.group, {}))
+                copied.add(op.group)
+            files = apps[op.group]
+        elif op.section == "generic_apps":
+            apps = section(op.section)
+            index = next((i for i, app in enumerate(apps)
+                          if (app.get("name") or app.get("service_name")) == op.group), None)
+            if index is None:
+                raise ValueError(f"Unknown generic app {op.group!r}")
+            if ("generic_apps", index) not in copied:
+                apps[index] = dict(apps[index], files=dict(apps[index].get("files") or {}))
+                copied.add(("generic_apps", index))
+            if op.key == ":unit":
+                apps[index]["unit_file_content"] = None if op.delete else op.value
+                continue
+            files = apps[index]["files"]
+        else:
+            raise ValueError(f"Section {op.section!r} cannot be patched")
+        if op.delete:
+            files.pop(op.key, None)
+        else:
+            files[op.key] = op.value
+    patched = scan.model_copy(update=updates)
+    patched._fingerprint = None
+    return patched
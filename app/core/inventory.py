@@ -0,0 +1,278 @@
+import bisect
+import re
+import sys
+import threading
+from typing import Dict, List, Optional
+
+from app.models import ScanResult
+from app.core import metrics
+
+# Hosts are numbered documents; every posting list is a Python int used as a
+# bitset over document ids, so AND/OR/NOT are single big-int operations.
+FIELDS = ("host", "project", "os", "service", "package", "port", "user", "pm2", "app", "config")
+
+QUERY_SECONDS = metrics.histogram(
+    "migrator_inventory_query_seconds", "Duration of inventory searches",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1),
+)
+UPDATE_SECONDS = metrics.histogram("migrator_inventory_update_seconds", "Duration of inventory index updates")
+INDEXED_HOSTS = metrics.gauge("migrator_inventory_hosts", "Hosts present in the inventory index")
+
+
+def _popcount(bits: int) -> int:
+    return bin(bits).count("1")
+
+
+if hasattr(int, "bit_count"):
+    _popcount = int.bit_count
+
+
+class QueryError(ValueError):
+    pass
+
+
+def _service_terms(name: str):
+    yield name
+    if name.endswith(".service"):
+        yield name[:-len(".service")]
+
+
+def _package_terms(name: str):
+    yield name
+    if ":" in name:
+        yield name.split(":", 1)[0]
+
+
+def terms_for(project: str, scan: ScanResult) -> Dict[str, set]:
+    terms = {field: set() for field in FIELDS}
+    terms["host"].add(scan.hostname)
+    terms["project"].add(project)
+    terms["os"].add(scan.os_info)
+    for service in scan.running_services:
+        terms["service"].update(_service_terms(service))
+    for package in scan.installed_packages:
+        terms["package"].update(_package_terms(package))
+    terms["port"].update(str(port) for port in scan.open_ports)
+    terms["user"].update(scan.system_users)
+    for proc in scan.pm2_processes:
+        if proc.get("name"):
+            terms["pm2"].add(proc["name"])
+            terms["app"].add(proc["name"])
+    for app in scan.generic_apps:
+        name = app.get("name") or app.get("service_name")
+        if name:
+            terms["app"].add(name)
+        if app.get("unit_file_path"):
+            terms["config"].add(app["unit_file_path"])
+    terms["config"].update(scan.config_files)
+    return {field: {t.lower() for t in values if t} for field, values in terms.items()}
+
+
+_TOKEN = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"|([^\s()"]+))')
+
+
+def _tokenize(query: str) -> List[str]:
+    tokens = []
+    pos = 0
+    query = query.strip()
+    while pos < len(query):
+        match = _TOKEN.match(query, pos)
+        if not match:
+            raise QueryError(f"Unexpected input at position {pos}")
+        pos = match.end()
+        lparen, rparen, quoted, word = match.groups()
+        tokens.append(lparen or rparen or (quoted if quoted is not None else word))
+    return tokens
+
+
+class _Parser:
+    # query := or_expr ; or_expr := and_expr (OR and_expr)* ;
+    # and_expr := unary ([AND] unary)* ; unary := NOT unary | '(' or_expr ')' | field:value
+    def __init__(self, index: "InventoryIndex", tokens: List[str]):
+        self.index = index
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self) -> str:
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def parse(self) -> int:
+        if not self.tokens:
+            return self.index.universe
+        bits = self.or_expr()
+        if self.peek() is not None:
+            raise QueryError(f"Unexpected token {self.peek()!r}")
+        return bits
+
+    def or_expr(self) -> int:
+        bits = self.and_expr()
+        while self.peek() == "OR":
+            self.take()
+            bits |= self.and_expr()
+        return bits
+
+    def and_expr(self) -> int:
+        bits = self.unary()
+        while self.peek() not in (None, "OR", ")"):
+            if self.peek() == "AND":
+                self.take()
+            bits &= self.unary()
+        return bits
+
+    def unary(self) -> int:
+        token = self.take()
+        if token is None:
+            raise QueryError("Unexpected end of query")
+        if token == "NOT":
+            return self.index.universe & ~self.unary()
+        if token == "(":
+            bits = self.or_expr()
+            if self.take() != ")":
+                raise QueryError("Missing closing parenthesis")
+            return bits
+        if token in (")", "AND", "OR"):
+            raise QueryError(f"Unexpected token {token!r}")
+        field, sep, value = token.partition(":")
+        if not sep or field.lower() not in FIELDS or not value:
+            raise QueryError(f"Expected field:value, got {token!r} (fields: {', '.join(FIELDS)})")
+        return self.index.lookup(field.lower(), value.lower())
+
+
+class InventoryIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Dict[str, int]] = {field: {} for field in FIELDS}
+        self._sorted: Dict[str, Optional[List[str]]] = {field: None for field in FIELDS}
+        self._docs: Dict[tuple, int] = {}
+        self._doc_keys: List[Optional[tuple]] = []
+        self._doc_terms: List[Optional[Dict[str, set]]] = []
+        self._free: List[int] = []
+        self.universe = 0
+        INDEXED_HOSTS.set_function(lambda: len(self._docs))
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _add_terms(self, doc: int, terms: Dict[str, set]):
+        bit = 1 << doc
+        for field, values in terms.items():
+            postings = self._postings[field]
+            for term in values:
+                if term not in postings:
+                    postings[term] = 0
+                    self._sorted[field] = None
+                postings[term] |= bit
+
+    def _remove_terms(self, doc: int, terms: Dict[str, set]):
+        mask = ~(1 << doc)
+        for field, values in terms.items():
+            postings = self._postings[field]
+            for term in values:
+                remaining = postings[term] & mask
+                if remaining:
+                    postings[term] = remaining
+                else:
+                    del postings[term]
+                    self._sorted[field] = None
+
+    def update(self, project: str, scan: ScanResult):
+        # Replaces whatever was indexed for this (project, hostname); only the
+        # terms that actually changed touch their posting lists.
+        with UPDATE_SECONDS.time():
+            terms = terms_for(project, scan)
+            key = (project, scan.hostname)
+            with self._lock:
+                doc = self._docs.get(key)
+                if doc is None:
+                    doc = self._free.pop() if self._free else len(self._doc_keys)
+                    if doc == len(self._doc_keys):
+                        self._doc_keys.append(None)
+                        self._doc_terms.append(None)
+                    self._docs[key] = doc
+                    self._doc_keys[doc] = key
+                    self.universe |= 1 << doc
+                    self._add_terms(doc, terms)
+                else:
+                    old = self._doc_terms[doc]
+                    self._remove_terms(doc, {f: old[f] - terms[f] for f in FIELDS})
+                    self._add_terms(doc, {f: terms[f] - old[f] for f in FIELDS})
+                self._doc_terms[doc] = terms
+
+    def remove(self, project: str, hostname: str):
+        with self._lock:
+            doc = self._docs.pop((project, hostname), None)
+            if doc is None:
+                return
+            self._remove_terms(doc, self._doc_terms[doc])
+            self._doc_keys[doc] = None
+            self._doc_terms[doc] = None
+            self.universe &= ~(1 << doc)
+            self._free.append(doc)
+
+    def lookup(self, field: str, value: str) -> int:
+        postings = self._postings[field]
+        if not value.endswith("*"):
+            return postings.get(value, 0)
+        # Prefix match over the sorted term list of the field.
+        prefix = value[:-1]
+        terms = self._sorted[field]
+        if terms is None:
+            terms = self._sorted[field] = sorted(postings)
+        bits = 0
+        for i in range(bisect.bisect_left(terms, prefix), len(terms)):
+            if not terms[i].startswith(prefix):
+                break
+            bits |= postings.get(terms[i], 0)
+        return bits
+
+    def _decode(self, bits: int, limit: int) -> List[tuple]:
+        # Walk the bitset a 64-bit word at a time; shifting the whole big int
+        # per match would make decoding quadratic in the fleet size.
+        keys = []
+        if not bits or limit <= 0:
+            return keys
+        raw = bits.to_bytes((bits.bit_length() + 63) // 64 * 8, sys.byteorder)
+        for word_index, word in enumerate(memoryview(raw).cast("Q")):
+            base = word_index * 64
+            while word:
+                low = word & -word
+                keys.append(self._doc_keys[base + low.bit_length() - 1])
+                if len(keys) >= limit:
+                    return keys
+                word ^= low
+        return keys
+
+    def search(self, query: str, limit: int = 100) -> dict:
+        with QUERY_SECONDS.time():
+            with self._lock:
+                bits = _Parser(self, _tokenize(query)).parse()
+                hosts = self._decode(bits, limit)
+            return {
+                "count": _popcount(bits),
+                "hosts": [{"project": p, "hostname": h} for p, h in hosts],
+            }
+
+    def terms(self, field: str, prefix: str = "", limit: int = 100) -> List[dict]:
+        # Term suggestions with host counts, e.g. for building queries.
+        if field not in FIELDS:
+            raise QueryError(f"Unknown field {field!r}")
+        with self._lock:
+            postings = self._postings[field]
+            names = self._sorted[field]
+            if names is None:
+                names = self._sorted[field] = sorted(postings)
+            start = bisect.bisect_left(names, prefix.lower())
+            result = []
+            for name in names[start:]:
+                if not name.startswith(prefix.lower()) or len(result) >= limit:
+                    break
+                result.append({"term": name, "hosts": _popcount(postings[name])})
+            return result
+
+
+INDEX = InventoryIndex()
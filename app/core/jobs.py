@@ -0,0 +1,310 @@
+import asyncio
+import functools
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from app.core import metrics, profiling
+
+logger = logging.getLogger("migrator.jobs")
+
+# Off-loop execution for request handlers. CPU-bound work (analysis, builds)
+# runs in a small pool of worker processes, so it neither blocks the event
+# loop nor holds the serving process's GIL; blocking file and network I/O runs
+# on a thread pool. At most MAX_QUEUED jobs wait for a worker, the rest are
+# rejected. A job that outlives its timeout or is cancelled has its worker
+# process killed and replaced. MIGRATOR_JOB_WORKERS=0 runs jobs on threads
+# instead (no isolation: timed out jobs are abandoned, not stopped).
+WORKERS = int(os.environ.get("MIGRATOR_JOB_WORKERS", str(min(4, os.cpu_count() or 1))))
+IO_WORKERS = int(os.environ.get("MIGRATOR_JOB_IO_WORKERS", "8"))
+MAX_QUEUED = int(os.environ.get("MIGRATOR_JOB_QUEUE", "16"))
+TIMEOUT = float(os.environ.get("MIGRATOR_JOB_TIMEOUT", "120"))
+POLL_SECONDS = 0.05
+
+JOBS = metrics.counter("migrator_jobs_total", "Offloaded jobs by outcome", ("kind", "result"))
+JOB_SECONDS = metrics.histogram("migrator_job_seconds", "Time offloaded jobs spent running", ("kind",))
+JOB_QUEUE_WAIT = metrics.histogram("migrator_job_queue_wait_seconds", "Time offloaded jobs waited for a worker")
+JOBS_QUEUED = metrics.gauge("migrator_jobs_queued", "Offloaded jobs waiting for a worker")
+JOBS_RUNNING = metrics.gauge("migrator_jobs_running", "Offloaded jobs currently running")
+
+
+class JobError(Exception):
+    pass
+
+
+class JobRejected(JobError):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class JobTimeout(JobError):
+    pass
+
+
+class JobCancelled(JobError):
+    pass
+
+
+class WorkerLost(JobError):
+    pass
+
+
+def _worker_main(conn):
+    # Runs in the worker process: one job at a time, returning its result,
+    # the metrics it recorded and (when the caller profiles) its span tree.
+    while True:
+        try:
+            fn, args, kwargs, profiled = conn.recv()
+        except (EOFError, OSError):
+            return
+        before = metrics.REGISTRY.snapshot()
+        spans = None
+        try:
+            if profiled:
+                with profiling.Profile("job", "job") as profile:
+                    result = fn(*args, **kwargs)
+                spans = profile.root.children
+            else:
+                result = fn(*args, **kwargs)
+            reply = (True, result)
+        except Exception as e:
+            reply = (False, e)
+        try:
+            conn.send(reply + (metrics.REGISTRY.delta(before), spans))
+        except Exception as e:
+            # Unpicklable result or exception.
+            conn.send((False, JobError(f"{type(e).__name__}: {e}"), metrics.REGISTRY.delta(before), None))
+
+
+@functools.lru_cache(maxsize=None)
+def _context():
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    ctx = multiprocessing.get_context("forkserver")
+    ctx.set_forkserver_preload(["app.core.analyzer", "app.core.builder"])
+    return ctx
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child,), name="migrator-job", daemon=True)
+        self.process.start()
+        child.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class Job:
+    __slots__ = ("id", "kind", "timeout", "state", "submitted", "started", "_cancel")
+
+    def __init__(self, job_id: str, kind: str, timeout: float):
+        self.id = job_id
+        self.kind = kind
+        self.timeout = timeout
+        self.state = "queued"
+        self.submitted = time.perf_counter()
+        self.started: Optional[float] = None
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def to_dict(self) -> dict:
+        now = time.perf_counter()
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "waited_seconds": round((self.started or now) - self.submitted, 3),
+            "running_seconds": round(now - self.started, 3) if self.started else 0.0,
+        }
+
+
+class JobRunner:
+    def __init__(self, workers: int = WORKERS, io_workers: int = IO_WORKERS, max_queued: int = MAX_QUEUED,
+                 timeout: float = TIMEOUT):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.jobs: Dict[str, Job] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._idle: List[Optional[_Worker]] = []
+        self._all: List[_Worker] = []
+        self._dispatch: Optional[ThreadPoolExecutor] = None
+        self._io = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="migrator-io")
+        # Exponentially weighted job time, used for Retry-After estimates.
+        self._service_seconds = 1.0
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for job in list(self.jobs.values()) if job.state == "queued")
+
+    @property
+    def running(self) -> int:
+        return sum(1 for job in list(self.jobs.values()) if job.state == "running")
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(len(self.jobs) * self._service_seconds / max(1, self.workers)))
+
+    def _dispatcher(self) -> ThreadPoolExecutor:
+        # One dispatch thread per worker process; each thread owns a worker
+        # while a job runs, so the executor's queue is the job queue.
+        with self._lock:
+            if self._dispatch is None:
+                self._dispatch = ThreadPoolExecutor(max_workers=max(1, self.workers), thread_name_prefix="migrator-job")
+                self._idle = [None] * self.workers
+            return self._dispatch
+
+    def _take_worker(self) -> _Worker:
+        with self._lock:
+            worker = self._idle.pop()
+        if worker is None:
+            # Started on first use, forked from a clean forkserver so workers
+            # carry none of the server's threads or sockets.
+            worker = _Worker(_context())
+            with self._lock:
+                self._all.append(worker)
+        return worker
+
+    def _give_back(self, worker: Optional[_Worker]):
+        with self._lock:
+            self._idle.append(worker)
+
+    def _discard(self, worker: _Worker):
+        worker.kill()
+        with self._lock:
+            if worker in self._all:
+                self._all.remove(worker)
+        self._give_back(None)
+
+    def _start(self, job: Job):
+        if job.cancelled:
+            raise JobCancelled(job.id)
+        job.started = time.perf_counter()
+        job.state = "running"
+        JOB_QUEUE_WAIT.observe(job.started - job.submitted)
+
+    def _run_in_process(self, job: Job, fn: Callable, args: tuple, kwargs: dict, profiled: bool):
+        self._start(job)
+        worker = self._take_worker()
+        healthy = False
+        try:
+            try:
+                worker.conn.send((fn, args, kwargs, profiled))
+                deadline = job.started + job.timeout
+                while not worker.conn.poll(POLL_SECONDS):
+                    if job.cancelled:
+                        raise JobCancelled(job.id)
+                    if time.perf_counter() > deadline:
+                        raise JobTimeout(f"{job.kind} job {job.id} exceeded {job.timeout:g}s")
+                    if not worker.process.is_alive():
+                        raise WorkerLost(f"Worker for {job.kind} job {job.id} exited")
+                ok, value, delta, spans = worker.conn.recv()
+            except (EOFError, OSError) as e:
+                raise WorkerLost(f"Worker for {job.kind} job {job.id} failed: {e}")
+            healthy = True
+        finally:
+            if healthy:
+                self._give_back(worker)
+            else:
+                self._discard(worker)
+        metrics.REGISTRY.merge(delta)
+        if not ok:
+            raise value
+        return value, spans
+
+    def _run_in_thread(self, job: Job, fn: Callable, args: tuple, kwargs: dict, profiled: bool):
+        self._start(job)
+        return fn(*args, **kwargs), None
+
+    async def run(self, kind: str, fn: Callable, *args, timeout: Optional[float] = None, **kwargs):
+        # Runs fn(*args, **kwargs) off the event loop; fn, its arguments and
+        # its result must be picklable.
+        # Jobs beyond the workers wait; count them as queued from submission
+        # so a burst cannot slip past the limit before dispatch catches up.
+        if len(self.jobs) >= max(1, self.workers) + self.max_queued:
+            JOBS.inc(kind=kind, result="rejected")
+            raise JobRejected(f"Too many queued {kind} jobs", self.retry_after())
+        job = Job(str(next(self._ids)), kind, timeout or self.timeout)
+        self.jobs[job.id] = job
+        target = self._run_in_process if self.workers > 0 else self._run_in_thread
+        pool = self._dispatcher() if self.workers > 0 else self._io
+        result = "failed"
+        with profiling.span(f"jobs.{kind}", job=job.id) as span:
+            try:
+                future = pool.submit(target, job, fn, args, kwargs, span is not None)
+                try:
+                    if self.workers > 0:
+                        value, spans = await asyncio.wrap_future(future)
+                    else:
+                        # Threads cannot be stopped; stop waiting instead.
+                        value, spans = await asyncio.wait_for(asyncio.wrap_future(future), job.timeout)
+                except asyncio.TimeoutError:
+                    job.cancel()
+                    raise JobTimeout(f"{kind} job {job.id} exceeded {job.timeout:g}s")
+                except asyncio.CancelledError:
+                    # The caller went away (e.g. the client disconnected).
+                    job.cancel()
+                    result = "cancelled"
+                    raise
+                result = "done"
+                if span is not None and spans:
+                    span.children.extend(spans)
+                return value
+            except JobTimeout:
+                result = "timeout"
+                raise
+            except JobCancelled:
+                result = "cancelled"
+                raise
+            finally:
+                self.jobs.pop(job.id, None)
+                if job.started is not None and result != "cancelled":
+                    seconds = time.perf_counter() - job.started
+                    JOB_SECONDS.observe(seconds, kind=kind)
+                    self._service_seconds = 0.8 * self._service_seconds + 0.2 * seconds
+                JOBS.inc(kind=kind, result=result)
+
+    async def io(self, fn: Callable, *args, **kwargs):
+        # Blocking file or network I/O on the I/O thread pool.
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io, functools.partial(fn, *args, **kwargs))
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.jobs.get(job_id)
+        if job is None:
+            return False
+        job.cancel()
+        return True
+
+    def shutdown(self):
+        with self._lock:
+            workers, self._all = self._all, []
+            dispatch, self._dispatch = self._dispatch, None
+        for job in list(self.jobs.values()):
+            job.cancel()
+        for worker in workers:
+            worker.kill()
+        if dispatch is not None:
+            dispatch.shutdown(wait=True)
+
+
+RUNNER = JobRunner()
+JOBS_QUEUED.set_function(lambda: RUNNER.queued)
+JOBS_RUNNING.set_function(lambda: RUNNER.running)
@@ -0,0 +1,274 @@
+import functools
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.core import metrics
+
+logger = logging.getLogger("migrator.packages")
+
+# Cross-distro package index. The bundled JSON (versioned, hand-maintained)
+# is compiled once into a flat hash table that is memory-mapped read-only, so
+# every worker shares the same pages and a lookup is one crc32 plus a probe.
+SOURCE_PATH = os.path.join(os.path.dirname(__file__), '../data/package_index.json')
+CACHE_DIR = os.environ.get("MIGRATOR_PACKAGE_INDEX_CACHE") or os.path.join(os.path.dirname(__file__), '../data')
+
+MAGIC = b"MIGPKG01"
+# magic, source digest, slot count, record count, slots/records/strings/meta offsets, meta length
+HEADER = struct.Struct("<8s16sIIIIIII")
+RECORD = struct.Struct("<IHBxIHxx")  # key offset, key length, action, value offset, value length
+SLOT = struct.Struct("<I")
+
+KEEP, BASE, MAP, VIRTUAL, DROP = range(1, 6)
+ACTIONS = {"keep": KEEP, "base": BASE, "map": MAP, "virtual": VIRTUAL, "drop": DROP}
+
+RESOLVE_PACKAGES = metrics.counter("migrator_package_resolutions_total", "Packages resolved for restore plans", ("result",))
+
+
+def _key(target: str, scope: str, name: str) -> bytes:
+    return f"{target}\0{scope}\0{name}".encode()
+
+
+def _records(source: dict) -> Tuple[Dict[bytes, Tuple[int, str]], dict]:
+    # Flattens the JSON into {target\0scope\0name: (action, value)}; target
+    # entries override common ones. Every rename must land on a known name.
+    common = source["common"]
+    records = {}
+    rules = {}
+    for target, spec in source["targets"].items():
+        table = {}
+        for name in common.get("available", []) + spec.get("available", []):
+            table[("*", name)] = (KEEP, "")
+        for name in common.get("base", []) + spec.get("base", []):
+            table[("*", name)] = (BASE, "")
+        for section in (common, spec):
+            for name, provider in section.get("virtual", {}).items():
+                table[("*", name)] = (VIRTUAL, provider)
+            for scope, entries in section.get("map", {}).items():
+                for name, names in entries.items():
+                    table[(scope, name)] = (MAP, " ".join(names))
+            for scope, entries in section.get("drop", {}).items():
+                for name, reason in entries.items():
+                    table[(scope, name)] = (DROP, reason)
+        for (scope, name), (action, value) in table.items():
+            if action in (MAP, VIRTUAL):
+                for mapped in value.split():
+                    if table.get(("*", mapped), (None,))[0] not in (KEEP, BASE):
+                        raise ValueError(f"{target}: {name} maps to unknown package {mapped}")
+            records[_key(target, scope, name)] = (action, value)
+        rules[target] = spec.get("rules", []) + common.get("rules", [])
+        for pattern, action, _ in rules[target]:
+            re.compile(pattern)
+            if action not in ("map", "drop"):
+                raise ValueError(f"{target}: unknown rule action {action}")
+    meta = {"version": source["version"], "targets": sorted(source["targets"]), "rules": rules}
+    return records, meta
+
+
+def compile_index(source: dict, digest: bytes = b"\0" * 16) -> bytes:
+    records, meta = _records(source)
+    slots = 1
+    while slots < len(records) * 2:
+        slots *= 2
+    strings = bytearray()
+    offsets: Dict[bytes, int] = {}
+
+    def intern(data: bytes) -> int:
+        if data not in offsets:
+            offsets[data] = len(strings)
+            strings.extend(data)
+        return offsets[data]
+
+    table = [0] * slots
+    packed = bytearray()
+    for index, (key, (action, value)) in enumerate(sorted(records.items())):
+        encoded = value.encode()
+        packed += RECORD.pack(intern(key), len(key), action, intern(encoded), len(encoded))
+        slot = zlib.crc32(key) & (slots - 1)
+        while table[slot]:
+            slot = (slot + 1) & (slots - 1)
+        table[slot] = index + 1
+    meta_raw = json.dumps(meta, separators=(",", ":")).encode()
+    slots_off = HEADER.size
+    records_off = slots_off + SLOT.size * slots
+    strings_off = records_off + len(packed)
+    meta_off = strings_off + len(strings)
+    header = HEADER.pack(MAGIC, digest, slots, len(records), slots_off, records_off, strings_off, meta_off, len(meta_raw))
+    return header + struct.pack(f"<{slots}I", *table) + bytes(packed) + bytes(strings) + meta_raw
+
+
+class PackageIndex:
+    def __init__(self, buf):
+        self._buf = buf
+        (magic, self.digest, self._slots, self.size, self._slots_off, self._records_off,
+         self._strings_off, meta_off, meta_len) = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a compiled package index")
+        meta = json.loads(bytes(buf[meta_off:meta_off + meta_len]))
+        self.version = meta["version"]
+        self.targets = meta["targets"]
+        self._rules = {
+            target: [(re.compile(pattern), ACTIONS[action], value) for pattern, action, value in rules]
+            for target, rules in meta["rules"].items()
+        }
+
+    def lookup(self, target: str, scope: str, name: str) -> Optional[Tuple[int, str]]:
+        key = _key(target, scope, name)
+        buf = self._buf
+        strings = self._strings_off
+        mask = self._slots - 1
+        slot = zlib.crc32(key) & mask
+        while True:
+            index = SLOT.unpack_from(buf, self._slots_off + SLOT.size * slot)[0]
+            if not index:
+                return None
+            key_off, key_len, action, value_off, value_len = RECORD.unpack_from(
+                buf, self._records_off + RECORD.size * (index - 1)
+            )
+            if buf[strings + key_off:strings + key_off + key_len] == key:
+                return action, buf[strings + value_off:strings + value_off + value_len].decode()
+            slot = (slot + 1) & mask
+
+    def resolve(self, packages: Iterable[str], source: str, target: str) -> dict:
+        # One pass over the host's packages: names installable on the target
+        # (renamed and virtual names replaced), names the image already has,
+        # names deliberately dropped, and names the index does not know.
+        family = source.split("-")[0] if source else ""
+        scopes = [s for s in (source, family) if s] + ["*"]
+        rules = self._rules.get(target, [])
+        install: Dict[str, None] = {}
+        renamed: Dict[str, List[str]] = {}
+        dropped: Dict[str, str] = {}
+        base: List[str] = []
+        unresolved: List[str] = []
+        seen = set()
+        for raw in packages:
+            name = raw.split(":", 1)[0].strip().lower()
+            if not name or name in seen:
+                continue
+            seen.add(name)
+            found = None
+            for scope in scopes:
+                found = self.lookup(target, scope, name)
+                if found:
+                    break
+            if found is None:
+                for pattern, action, value in rules:
+                    match = pattern.search(name)
+                    if match:
+                        found = (action, match.expand(value) if action == MAP else value)
+                        break
+            if found is None:
+                unresolved.append(name)
+                continue
+            action, value = found
+            if action == KEEP:
+                install[name] = None
+            elif action == BASE:
+                base.append(name)
+            elif action == DROP:
+                dropped[name] = value
+            else:
+                names = value.split()
+                missing = [n for n in names if (self.lookup(target, "*", n) or (None,))[0] not in (KEEP, BASE)]
+                if missing:
+                    unresolved.append(name)
+                    continue
+                renamed[name] = names
+                for mapped in names:
+                    if self.lookup(target, "*", mapped)[0] == KEEP:
+                        install[mapped] = None
+        for result, count in (("install", len(install)), ("base", len(base)), ("dropped", len(dropped)),
+                              ("renamed", len(renamed)), ("unresolved", len(unresolved))):
+            RESOLVE_PACKAGES.inc(count, result=result)
+        return {
+            "source": source, "target": target, "index_version": self.version,
+            "install": list(install), "renamed": renamed, "base": base, "dropped": dropped, "unresolved": unresolved,
+        }
+
+
+def source_key(os_info: str) -> str:
+    # "Ubuntu 20.04.6 LTS" -> ubuntu-20.04, "Debian GNU/Linux 11 (bullseye)" -> debian-11,
+    # RHEL-likes -> rhel-<major>.
+    text = (os_info or "").lower()
+    if "ubuntu" in text:
+        match = re.search(r"(\d+\.\d+)", text)
+        return f"ubuntu-{match.group(1)}" if match else "ubuntu"
+    match = re.search(r"(\d+)", text)
+    for family, names in (("debian", ("debian",)), ("rhel", ("red hat", "rhel", "centos", "rocky", "alma", "oracle"))):
+        if any(n in text for n in names):
+            return f"{family}-{match.group(1)}" if match else family
+    return ""
+
+
+def target_key(image: str) -> str:
+    # GCE image (family) names: debian-cloud/debian-11, ubuntu-os-cloud/ubuntu-2204-lts.
+    name = (image or "").rsplit("/", 1)[-1].lower()
+    match = re.match(r"debian-(\d+)", name)
+    if match:
+        return f"debian-{match.group(1)}"
+    match = re.match(r"ubuntu-(?:minimal-)?(\d\d)(\d\d)", name)
+    if match:
+        return f"ubuntu-{match.group(1)}.{match.group(2)}"
+    return name
+
+
+def _source_digest(path: str) -> Tuple[dict, bytes]:
+    with open(path, "rb") as f:
+        raw = f.read()
+    return json.loads(raw), hashlib.blake2b(raw, digest_size=16).digest()
+
+
+def _compiled_path(digest: bytes) -> str:
+    return os.path.join(CACHE_DIR, f"package_index.{digest.hex()[:12]}.bin")
+
+
+_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def _load(path: str) -> PackageIndex:
+    source, digest = _source_digest(path)
+    compiled = _compiled_path(digest)
+    with _lock:
+        if not os.path.exists(compiled):
+            data = compile_index(source, digest)
+            try:
+                fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, compiled)
+                for name in os.listdir(CACHE_DIR):
+                    stale = os.path.join(CACHE_DIR, name)
+                    if name.startswith("package_index.") and name.endswith(".bin") and stale != compiled:
+                        os.remove(stale)
+            except OSError as e:
+                # Read-only install: keep the compiled table in memory.
+                logger.info("Cannot cache compiled package index (%s)", e)
+                return PackageIndex(data)
+    with open(compiled, "rb") as f:
+        index = PackageIndex(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    if index.digest != digest:
+        return PackageIndex(compile_index(source, digest))
+    return index
+
+
+def index(path: str = SOURCE_PATH) -> PackageIndex:
+    return _load(os.path.abspath(path))
+
+
+def resolve(packages: Iterable[str], os_info: str, image: str) -> Optional[dict]:
+    # None when the index does not cover the target image.
+    idx = index()
+    target = target_key(image)
+    if target not in idx.targets:
+        return None
+    return idx.resolve(packages, source_key(os_info), target)
@@ -0,0 +1,246 @@
+import functools
+import logging
+import os
+import random
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("migrator.profiling")
+
+# Fraction of requests profiled without being asked (0 disables sampling).
+SAMPLE_RATE = float(os.environ.get("MIGRATOR_PROFILE_SAMPLE_RATE", "0") or 0)
+# Requests slower than this are dumped with their stage breakdown (0 disables).
+SLOW_REQUEST_MS = float(os.environ.get("MIGRATOR_SLOW_REQUEST_MS", "0") or 0)
+# Optional directory that receives one JSON file per dumped profile.
+DUMP_DIR = os.environ.get("MIGRATOR_PROFILE_DUMP_DIR") or None
+MAX_RECENT = 50
+
+_current: ContextVar[Optional["Span"]] = ContextVar("migrator_profile_span", default=None)
+
+RECENT_PROFILES: deque = deque(maxlen=MAX_RECENT)
+
+
+class Span:
+    __slots__ = ("name", "start", "end", "children", "attrs", "calls")
+
+    def __init__(self, name: str, attrs: Optional[Dict] = None):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.children: List["Span"] = []
+        self.attrs = attrs or {}
+        self.calls = 1
+
+    @property
+    def duration(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return end - self.start
+
+    @property
+    def self_time(self) -> float:
+        return max(0.0, self.duration - sum(c.duration for c in self.children))
+
+    def to_dict(self) -> dict:
+        data = {
+            "name": self.name,
+            "duration_ms": round(self.duration * 1000, 3),
+            "self_ms": round(self.self_time * 1000, 3),
+        }
+        if self.calls > 1:
+            data["calls"] = self.calls
+        if self.attrs:
+            data["attrs"] = self.attrs
+        if self.children:
+            data["children"] = [c.to_dict() for c in self.children]
+        return data
+
+
+class _AggregateSpan(Span):
+    # Accumulates many tiny timings (e.g. one per base64 encode) into one node
+    # instead of allocating a span per call.
+    __slots__ = ("_total",)
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._total = 0.0
+        self.calls = 0
+
+    @property
+    def duration(self) -> float:
+        return self._total
+
+
+class _NullContext:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullContext()
+
+
+class _SpanContext:
+    __slots__ = ("span", "token")
+
+    def __init__(self, span: Span):
+        self.span = span
+        self.token = None
+
+    def __enter__(self):
+        self.token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, *exc):
+        self.span.end = time.perf_counter()
+        _current.reset(self.token)
+        return False
+
+
+def active() -> bool:
+    return _current.get() is not None
+
+
+def span(name: str, **attrs):
+    parent = _current.get()
+    if parent is None:
+        return _NULL
+    child = Span(name, attrs)
+    parent.children.append(child)
+    return _SpanContext(child)
+
+
+def traced(name: str):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_timing(name: str, seconds: float, **counts):
+    parent = _current.get()
+    if parent is None:
+        return
+    for child in parent.children:
+        if child.name == name and isinstance(child, _AggregateSpan):
+            break
+    else:
+        child = _AggregateSpan(name)
+        parent.children.append(child)
+    child._total += seconds
+    child.calls += 1
+    for key, value in counts.items():
+        child.attrs[key] = child.attrs.get(key, 0) + value
+
+
+class Profile:
+    def __init__(self, name: str, reason: str, attrs: Optional[Dict] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.reason = reason
+        self.root = Span(name, attrs)
+        self.wall_time = time.time()
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current.set(self.root)
+        return self
+
+    def __exit__(self, *exc):
+        self.root.end = time.perf_counter()
+        _current.reset(self._token)
+        return False
+
+    @property
+    def duration_ms(self) -> float:
+        return self.root.duration * 1000
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "reason": self.reason,
+            "timestamp": self.wall_time,
+            "duration_ms": round(self.duration_ms, 3),
+            "tree": self.root.to_dict(),
+        }
+
+    def server_timing(self) -> str:
+        # Top-level stages only; browsers show these in the network panel.
+        parts = []
+        for child in self.root.children:
+            parts.append(f'{_metric_token(child.name)};dur={child.duration * 1000:.2f};desc="{child.name}"')
+        parts.append(f"total;dur={self.root.duration * 1000:.2f}")
+        return ", ".join(parts)
+
+
+def _metric_token(name: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
+
+
+def should_profile(requested: bool) -> Optional[str]:
+    if requested:
+        return "requested"
+    if SAMPLE_RATE and random.random() < SAMPLE_RATE:
+        return "sampled"
+    if SLOW_REQUEST_MS:
+        return "slow-trace"
+    return None
+
+
+def render_tree(node: dict, indent: int = 0) -> List[str]:
+    line = f"{'  ' * indent}{node['name']}: {node['duration_ms']:.2f} ms (self {node['self_ms']:.2f} ms)"
+    if node.get("calls"):
+        line += f" x{node['calls']}"
+    if node.get("attrs"):
+        line += " " + " ".join(f"{k}={v}" for k, v in node["attrs"].items())
+    lines = [line]
+    for child in node.get("children", []):
+        lines.extend(render_tree(child, indent + 1))
+    return lines
+
+
+def record(profile: Profile) -> bool:
+    # Keeps explicitly requested and sampled profiles, and slow ones when slow
+    # tracing is on; returns True when the profile was dumped as slow.
+    slow = bool(SLOW_REQUEST_MS) and profile.duration_ms >= SLOW_REQUEST_MS
+    if profile.reason == "slow-trace" and not slow:
+        return False
+    data = profile.to_dict()
+    data["slow"] = slow
+    RECENT_PROFILES.append(data)
+    if slow:
+        logger.warning(
+            "Slow request (%.1f ms > %.1f ms) profile %s\n%s",
+            profile.duration_ms, SLOW_REQUEST_MS, profile.id, "\n".join(render_tree(data["tree"])),
+        )
+        if DUMP_DIR:
+            _dump(data)
+    return slow
+
+
+def _dump(data: dict):
+    import json
+
+    try:
+        os.makedirs(DUMP_DIR, exist_ok=True)
+        with open(os.path.join(DUMP_DIR, f"profile-{data['id']}.json"), 'w') as f:
+            json.dump(data, f, indent=2)
+    except OSError as e:
+        logger.error("Could not write profile %s: %s", data["id"], e)
+
+
+def get_profile(profile_id: str) -> Optional[dict]:
+    for data in RECENT_PROFILES:
+        if data["id"] == profile_id:
+            return data
+    return None
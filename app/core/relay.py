@@ -0,0 +1,312 @@
+import itertools
+import json
+import os
+import platform
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from typing import Dict, List, Optional
+
+from app.core import bundles, ingest, metrics, profiling
+from app.static import agent
+
+# Regional relay: agents in an isolated segment submit to a relay next to
+# them instead of the central server. Each scan is validated and written to
+# the relay's spool as a bundle before it is acknowledged, so nothing is
+# lost if the relay or the uplink goes down. Every flush packs the queued
+# bundles into batches (shared file bodies stored once, frames already
+# compressed) and posts them to the central server's /api/scan/relay. A
+# batch is deleted only once the server has confirmed it and is resent
+# under the same id otherwise: delivery is at least once, and the server
+# ignores batch ids it has already imported.
+SPOOL_DIR = os.environ.get("MIGRATOR_RELAY_SPOOL", "relay-spool")
+UPSTREAM = os.environ.get("MIGRATOR_RELAY_UPSTREAM", "")
+NAME = os.environ.get("MIGRATOR_RELAY_NAME") or platform.node() or "relay"
+FLUSH_SECONDS = float(os.environ.get("MIGRATOR_RELAY_FLUSH_SECONDS", "30"))
+BATCH_SCANS = int(os.environ.get("MIGRATOR_RELAY_BATCH_SCANS", "200"))
+BATCH_BYTES = int(float(os.environ.get("MIGRATOR_RELAY_BATCH_MB", "64")) * 1024 * 1024)
+MAX_SPOOL_BYTES = int(float(os.environ.get("MIGRATOR_RELAY_MAX_SPOOL_MB", "4096")) * 1024 * 1024)
+SEND_TIMEOUT = 300
+# The server will never take these batches; every other failure is retried.
+PERMANENT_STATUSES = (400, 422)
+
+RELAY_SCANS = metrics.counter("migrator_relay_scans_total", "Scans received by the relay", ("result",))
+RELAY_BATCHES = metrics.counter("migrator_relay_batches_total", "Relay batch uploads by outcome", ("result",))
+RELAY_BYTES = metrics.counter("migrator_relay_bytes_total", "Bytes received from agents and sent upstream",
+                              ("direction",))
+RELAY_SPOOL = metrics.gauge("migrator_relay_spool_bytes", "Bytes queued in the relay spool", ("queue",))
+
+
+class SpoolFull(Exception):
+    pass
+
+
+class Relay:
+    def __init__(self, spool_dir: str = SPOOL_DIR, upstream: str = UPSTREAM, name: str = NAME,
+                 flush_seconds: float = FLUSH_SECONDS, batch_scans: int = BATCH_SCANS,
+                 batch_bytes: int = BATCH_BYTES, max_spool_bytes: int = MAX_SPOOL_BYTES):
+        self.upstream = upstream.rstrip("/")
+        self.name = name
+        self.flush_seconds = flush_seconds
+        self.batch_scans = batch_scans
+        self.batch_bytes = batch_bytes
+        self.max_spool_bytes = max_spool_bytes
+        self.inbox = os.path.join(spool_dir, "inbox")
+        self.outbox = os.path.join(spool_dir, "outbox")
+        self.rejected = os.path.join(spool_dir, "rejected")
+        for directory in (self.inbox, self.outbox, self.rejected):
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()  # one flush at a time
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.failures = 0
+        self.retry_at = 0.0
+        self.stats = {"received": 0, "duplicates": 0, "batches_sent": 0, "scans_sent": 0, "bytes_sent": 0,
+                      "last_flush": None, "last_error": None}
+        self._sequence = itertools.count(1)
+        # Bundles left in the inbox by a relay that stopped mid-flush are
+        # either in an outbox batch already or still to be packed.
+        self._forget_packed()
+
+    # Spool
+
+    def _size(self, directory: str) -> int:
+        total = 0
+        for entry in os.scandir(directory):
+            if entry.is_file():
+                total += entry.stat().st_size
+        return total
+
+    def spool_bytes(self) -> Dict[str, int]:
+        return {"inbox": self._size(self.inbox), "outbox": self._size(self.outbox)}
+
+    def accept(self, body: bytes, project: Optional[str] = None) -> dict:
+        # Validates the scan and spools it; the agent gets its reply only once
+        # the bundle is on disk.
+        scan = ingest.decode_scan(body)
+        queued = self.spool_bytes()
+        if sum(queued.values()) + len(body) > self.max_spool_bytes:
+            RELAY_SCANS.inc(result="spool_full")
+            raise SpoolFull(f"relay spool is full ({sum(queued.values())} bytes queued)")
+        created = time.time()
+        host = re.sub(r"[^0-9A-Za-z_.-]", "_", scan.hostname)
+        stem = f"{int(created * 1e6)}-{next(self._sequence):06d}-{host}"
+        path = os.path.join(self.inbox, stem + bundles.EXTENSION)
+        meta = {"created": created, "relay": self.name}
+        if project:
+            meta["project"] = project
+        with profiling.span("relay.spool", bytes=len(body)):
+            tmp = path + ".tmp"
+            agent.feed(agent.Bundle(tmp, meta), scan.model_dump(mode="json"))
+            with open(tmp, "rb") as f:
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        self.stats["received"] += 1
+        RELAY_SCANS.inc(result="queued")
+        RELAY_BYTES.inc(len(body), direction="received")
+        if len(os.listdir(self.inbox)) >= self.batch_scans:
+            self.wake.set()
+        return {
+            "status": "queued",
+            "hostname": scan.hostname,
+            "project": project or "default",
+            "relay": self.name,
+        }
+
+    def accept_file(self, path: str, project: Optional[str] = None) -> dict:
+        # As accept, for a body the server streamed to a file.
+        with open(path, "rb") as f:
+            return self.accept(f.read(), project)
+
+    def _batches(self) -> List[str]:
+        return sorted(os.path.join(self.outbox, n) for n in os.listdir(self.outbox)
+                      if n.endswith(bundles.BATCH_EXTENSION))
+
+    def _forget_packed(self):
+        for path in self._batches():
+            try:
+                packed = bundles.read_batch_index(path).get("bundles") or []
+            except (OSError, bundles.BundleError):
+                continue
+            for name in packed:
+                if os.path.exists(os.path.join(self.inbox, name)):
+                    os.remove(os.path.join(self.inbox, name))
+
+    def pack(self) -> List[str]:
+        # Moves the inbox into outbox batches, oldest scans first. Repeated
+        # submissions of the same scan go once.
+        plan, skipped = bundles.plan_import(bundles.bundle_paths(self.inbox))
+        for path, reason in skipped.items():
+            if reason == "duplicate":
+                self.stats["duplicates"] += 1
+                RELAY_SCANS.inc(result="duplicate")
+                os.remove(path)
+            else:
+                os.replace(path, os.path.join(self.rejected, os.path.basename(path)))
+        written = []
+        chunk: List[str] = []
+        size = 0
+        for path, _ in plan:
+            length = os.path.getsize(path)
+            if chunk and (len(chunk) >= self.batch_scans or size + length > self.batch_bytes):
+                written.append(self._write(chunk))
+                chunk, size = [], 0
+            chunk.append(path)
+            size += length
+        if chunk:
+            written.append(self._write(chunk))
+        return written
+
+    def _write(self, paths: List[str]) -> str:
+        batch_id = uuid.uuid4().hex
+        target = os.path.join(self.outbox, f"{int(time.time() * 1e6)}-{batch_id}{bundles.BATCH_EXTENSION}")
+        meta = {"id": batch_id, "relay": self.name, "created": time.time(),
+                "bundles": [os.path.basename(p) for p in paths]}
+        bundles.write_batch(paths, target, meta)
+        for path in paths:
+            os.remove(path)
+        return target
+
+    # Upload
+
+    def _post(self, path: str) -> dict:
+        query = urllib.parse.urlencode({"relay": self.name})
+        with open(path, "rb") as body:
+            request = urllib.request.Request(f"{self.upstream}/api/scan/relay?{query}", data=body, method="POST")
+            request.add_header("Content-Type", "application/octet-stream")
+            request.add_header("Content-Length", str(os.path.getsize(path)))
+            with urllib.request.urlopen(request, timeout=SEND_TIMEOUT) as response:
+                return json.loads(response.read() or b"{}")
+
+    def _split(self, path: str) -> List[str]:
+        # Two batches of half the scans each, in the place of one the server
+        # found too large. They get new ids: the server imported none of it.
+        meta = bundles.read_batch_index(path)
+        names = meta.get("bundles") or []
+        cut = (len(names) + 1) // 2
+        stem = path[:-len(bundles.BATCH_EXTENSION)]
+        halves = []
+        for n, part in enumerate((names[:cut], names[cut:]), 1):
+            halves.append((f"{stem}-{n}{bundles.BATCH_EXTENSION}",
+                           dict(meta, id=uuid.uuid4().hex, created=time.time(), bundles=part)))
+        with profiling.span("relay.split", bytes=os.path.getsize(path)):
+            bundles.split_batch(path, halves)
+        os.remove(path)
+        RELAY_BATCHES.inc(result="split")
+        return [target for target, _ in halves]
+
+    def _reject(self, path: str, outcome: dict):
+        # Kept for inspection.
+        os.replace(path, os.path.join(self.rejected, os.path.basename(path)))
+        RELAY_BATCHES.inc(result="rejected")
+        outcome["rejected"] += 1
+
+    def send(self) -> dict:
+        # Sends outbox batches oldest first and stops at the first one the
+        # server could not take; the rest wait for the next attempt. A batch
+        # refused as too large is split in half and the halves go next.
+        outcome = {"sent": 0, "scans": 0, "rejected": 0, "pending": 0, "error": None}
+        queue = self._batches()
+        while queue:
+            path = queue.pop(0)
+            size = os.path.getsize(path)
+            try:
+                with profiling.span("relay.send", bytes=size):
+                    reply = self._post(path)
+            except urllib.error.HTTPError as e:
+                if e.code in PERMANENT_STATUSES:
+                    self._reject(path, outcome)
+                    continue
+                if e.code == 413:
+                    try:
+                        queue[:0] = self._split(path)
+                    except bundles.BundleError:
+                        # A single scan over the server's limit.
+                        self._reject(path, outcome)
+                    continue
+                retry_after = None
+                try:
+                    retry_after = float(e.headers.get("Retry-After"))
+                except (TypeError, ValueError):
+                    pass
+                self._failed(e, retry_after)
+                outcome["error"] = str(e)
+                outcome["pending"] = len(queue) + 1
+                return outcome
+            except (OSError, ValueError) as e:
+                self._failed(e)
+                outcome["error"] = str(e)
+                outcome["pending"] = len(queue) + 1
+                return outcome
+            os.remove(path)
+            self.failures = 0
+            self.retry_at = 0.0
+            self.stats["batches_sent"] += 1
+            self.stats["scans_sent"] += reply.get("scans", 0)
+            self.stats["bytes_sent"] += size
+            RELAY_BATCHES.inc(result="sent")
+            RELAY_BYTES.inc(size, direction="sent")
+            outcome["sent"] += 1
+            outcome["scans"] += reply.get("scans", 0)
+        return outcome
+
+    def _failed(self, error: Exception, retry_after: Optional[float] = None):
+        self.stats["last_error"] = str(error)
+        self.retry_at = time.monotonic() + agent.backoff_delay(self.failures, retry_after)
+        self.failures += 1
+        RELAY_BATCHES.inc(result="failed")
+
+    def flush(self, force: bool = False) -> dict:
+        with self.lock:
+            if not force and time.monotonic() < self.retry_at:
+                return {"packed": 0, "sent": 0, "scans": 0, "rejected": 0,
+                        "pending": len(self._batches()), "error": "waiting to retry"}
+            with profiling.span("relay.flush"):
+                packed = self.pack()
+                outcome = dict(self.send(), packed=len(packed))
+            self.stats["last_flush"] = time.time()
+            for queue, size in self.spool_bytes().items():
+                RELAY_SPOOL.set(size, queue=queue)
+            return outcome
+
+    # Background loop
+
+    def _run(self):
+        while not self.stopping.is_set():
+            self.wake.wait(self.flush_seconds)
+            self.wake.clear()
+            if self.stopping.is_set():
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                self.stats["last_error"] = str(e)
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="relay-flush", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def status(self) -> dict:
+        return dict(
+            self.stats,
+            relay=self.name,
+            upstream=self.upstream,
+            queued_scans=len(bundles.bundle_paths(self.inbox)),
+            pending_batches=len(self._batches()),
+            rejected=len(os.listdir(self.rejected)),
+            spool_bytes=self.spool_bytes(),
+            consecutive_failures=self.failures,
+        )
@@ -0,0 +1,373 @@
+import bisect
+import functools
+import json
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.core import metrics
+from app.models import RuleFinding, ScanResult
+
+# Declarative risk and strategy rules. Rules are loaded from JSON (or YAML)
+# files and compiled into per-field indexes: hash tables for exact and prefix
+# terms, an Aho-Corasick automaton for substrings and an interval table for
+# numeric ranges. A host's values are each looked up once, so evaluation cost
+# follows the host's size and the rules it hits, not the number of rules.
+# Only regex conditions are tested one by one.
+DEFAULT_PATH = os.path.join(os.path.dirname(__file__), '../data/rules.json')
+# Extra rule files or directories (os.pathsep separated), loaded after the
+# bundled rules; a rule with the same id replaces the earlier one.
+RULES_PATH = os.environ.get("MIGRATOR_RULES_PATH", "")
+
+TEXT_FIELDS = ("host", "os", "service", "package", "port", "user", "pm2", "app", "config")
+NUMERIC_FIELDS = ("port", "cpu", "memory_gb")
+OPS = ("equals", "prefix", "contains", "regex", "range")
+SEVERITIES = ("info", "low", "medium", "high", "critical")
+# A finding can only move the strategy further along this list.
+STRATEGIES = ("Rehost", "Replatform", "Refactor")
+
+RULE_EVALUATIONS = metrics.counter("migrator_rule_evaluations_total", "Hosts evaluated against the rule set")
+RULE_FINDINGS = metrics.counter("migrator_rule_findings_total", "Rule findings by severity", ("severity",))
+
+
+class RuleError(ValueError):
+    pass
+
+
+class Condition:
+    __slots__ = ("field", "op", "values", "negate", "_regex")
+
+    def __init__(self, spec: dict, rule_id: str):
+        ops = [op for op in OPS if op in spec]
+        if len(ops) != 1:
+            raise RuleError(f"{rule_id}: a condition needs exactly one of {', '.join(OPS)}")
+        self.op = ops[0]
+        self.field = spec.get("field")
+        fields = NUMERIC_FIELDS if self.op == "range" else TEXT_FIELDS
+        if self.field not in fields:
+            raise RuleError(f"{rule_id}: {self.op} conditions apply to {', '.join(fields)}, not {self.field!r}")
+        values = spec[self.op]
+        if self.op == "range":
+            if len(values) != 2 or not all(isinstance(v, (int, float)) for v in values) or values[0] > values[1]:
+                raise RuleError(f"{rule_id}: range must be [low, high]")
+            self.values = (values[0], values[1])
+        else:
+            if isinstance(values, str):
+                values = [values]
+            if not values:
+                raise RuleError(f"{rule_id}: {self.op} needs at least one value")
+            self.values = tuple(str(v).lower() for v in values)
+        self.negate = bool(spec.get("not", False))
+        self._regex = None
+        if self.op == "regex":
+            try:
+                self._regex = re.compile("|".join(f"(?:{v})" for v in self.values))
+            except re.error as e:
+                raise RuleError(f"{rule_id}: invalid regex: {e}")
+
+    def test(self, value) -> bool:
+        # Reference semantics for a single (lowercased) value; the engine's
+        # indexes agree with this, regex conditions use it directly.
+        if self.op == "range":
+            return self.values[0] <= value <= self.values[1]
+        if self.op == "equals":
+            return value in self.values
+        if self.op == "prefix":
+            return value.startswith(self.values)
+        if self.op == "contains":
+            return any(v in value for v in self.values)
+        return self._regex.search(value) is not None
+
+
+class Rule:
+    __slots__ = ("id", "conditions", "severity", "risk", "strategy", "source")
+
+    def __init__(self, spec: dict, source: str = ""):
+        self.id = spec.get("id")
+        if not self.id or not isinstance(self.id, str):
+            raise RuleError(f"{source}: every rule needs an id")
+        when = spec.get("when")
+        if isinstance(when, dict):
+            when = [when]
+        if not when:
+            raise RuleError(f"{self.id}: a rule needs at least one condition in 'when'")
+        self.conditions = [Condition(c, self.id) for c in when]
+        self.severity = spec.get("severity", "medium")
+        if self.severity not in SEVERITIES:
+            raise RuleError(f"{self.id}: severity must be one of {', '.join(SEVERITIES)}")
+        self.strategy = spec.get("strategy")
+        if self.strategy is not None and self.strategy not in STRATEGIES:
+            raise RuleError(f"{self.id}: strategy must be one of {', '.join(STRATEGIES)}")
+        self.risk = spec.get("risk") or self.id
+        self.source = source
+
+    def message(self, matches: List[str]) -> str:
+        return self.risk.replace("{matches}", ", ".join(matches))
+
+
+def host_values(scan: ScanResult) -> Dict[str, List[str]]:
+    # Original spellings in scan order; matching is on the lowercased value.
+    values = {
+        "host": [scan.hostname],
+        "os": [scan.os_info],
+        "service": list(scan.running_services),
+        "package": list(scan.installed_packages),
+        "port": [str(p) for p in scan.open_ports],
+        "user": list(scan.system_users),
+        "pm2": [p["name"] for p in scan.pm2_processes if p.get("name")],
+        "app": [p["name"] for p in scan.pm2_processes if p.get("name")],
+        "config": list(scan.config_files),
+    }
+    for app in scan.generic_apps:
+        name = app.get("name") or app.get("service_name")
+        if name:
+            values["app"].append(name)
+        if app.get("unit_file_path"):
+            values["config"].append(app["unit_file_path"])
+    return values
+
+
+def host_numbers(scan: ScanResult) -> Dict[str, list]:
+    return {"port": list(scan.open_ports), "cpu": [scan.cpu_cores], "memory_gb": [scan.memory_gb]}
+
+
+class _Automaton:
+    # Aho-Corasick over all substring terms of one field: one pass over a
+    # value reports every term it contains.
+    def __init__(self):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.out: List[list] = [[]]
+        self.fail: List[int] = [0]
+
+    def add(self, word: str, ref):
+        node = 0
+        for ch in word:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][ch] = nxt
+                self.goto.append({})
+                self.out.append([])
+                self.fail.append(0)
+            node = nxt
+        self.out[node].append(ref)
+
+    def build(self):
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                target = self.goto[f].get(ch, 0)
+                self.fail[nxt] = target if target != nxt else 0
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def search(self, text: str) -> set:
+        found = set()
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
+
+
+class _Intervals:
+    # Closed numeric ranges cut into elementary segments, each holding the
+    # conditions that cover it; a lookup is one bisect.
+    def __init__(self, ranges: List[Tuple[float, float, tuple]]):
+        self.bounds = sorted({(lo, 0) for lo, _, _ in ranges} | {(hi, 1) for _, hi, _ in ranges})
+        self.segments = [[] for _ in self.bounds]
+        for lo, hi, ref in ranges:
+            start = bisect.bisect_left(self.bounds, (lo, 0))
+            end = bisect.bisect_left(self.bounds, (hi, 1))
+            for i in range(start, end):
+                self.segments[i].append(ref)
+
+    def lookup(self, value) -> list:
+        i = bisect.bisect_right(self.bounds, (value, 0)) - 1
+        return self.segments[i] if i >= 0 else []
+
+
+class RuleEngine:
+    def __init__(self, rules: Iterable[Rule]):
+        self.rules: List[Rule] = list(rules)
+        self._equals: Dict[str, Dict[str, list]] = {}
+        self._prefix: Dict[str, Dict[str, list]] = {}
+        self._prefix_lengths: Dict[str, List[int]] = {}
+        self._prefix_stems: Dict[str, set] = {}
+        self._contains: Dict[str, _Automaton] = {}
+        self._regex: Dict[str, list] = {}
+        self._ranges: Dict[str, _Intervals] = {}
+        # Rules made only of negated conditions have nothing to look up and
+        # are checked on every host.
+        self._always: List[int] = []
+        ranges: Dict[str, list] = {}
+        for r, rule in enumerate(self.rules):
+            if all(c.negate for c in rule.conditions):
+                self._always.append(r)
+            for c, cond in enumerate(rule.conditions):
+                ref = (r, c)
+                if cond.op == "equals":
+                    index = self._equals.setdefault(cond.field, {})
+                    for v in cond.values:
+                        index.setdefault(v, []).append(ref)
+                elif cond.op == "prefix":
+                    index = self._prefix.setdefault(cond.field, {})
+                    for v in cond.values:
+                        index.setdefault(v, []).append(ref)
+                elif cond.op == "contains":
+                    automaton = self._contains.setdefault(cond.field, _Automaton())
+                    for v in cond.values:
+                        automaton.add(v, ref)
+                elif cond.op == "regex":
+                    self._regex.setdefault(cond.field, []).append((cond, ref))
+                else:
+                    ranges.setdefault(cond.field, []).append(cond.values + (ref,))
+        for field, index in self._prefix.items():
+            lengths = sorted({len(v) for v in index})
+            self._prefix_lengths[field] = lengths
+            # Most values share no stem with any prefix and skip the probes.
+            self._prefix_stems[field] = {v[:lengths[0]] for v in index}
+        for automaton in self._contains.values():
+            automaton.build()
+        for field, entries in ranges.items():
+            self._ranges[field] = _Intervals(entries)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def _hits(self, scan: ScanResult) -> Dict[int, Dict[int, List[str]]]:
+        # rule -> condition -> matching values (original spelling, scan order).
+        hits: Dict[int, Dict[int, List[str]]] = {}
+
+        def hit(refs, value):
+            for r, c in refs:
+                matched = hits.setdefault(r, {}).setdefault(c, [])
+                if value not in matched:
+                    matched.append(value)
+
+        for field, values in host_values(scan).items():
+            equals = self._equals.get(field)
+            prefix = self._prefix.get(field)
+            lengths = self._prefix_lengths.get(field)
+            stems = self._prefix_stems.get(field)
+            automaton = self._contains.get(field)
+            regex = self._regex.get(field)
+            if not (equals or prefix or automaton or regex):
+                continue
+            for value in values:
+                key = value.lower()
+                if equals and key in equals:
+                    hit(equals[key], value)
+                if prefix and key[:lengths[0]] in stems:
+                    for n in lengths:
+                        if n > len(key):
+                            break
+                        refs = prefix.get(key[:n])
+                        if refs:
+                            hit(refs, value)
+                if automaton:
+                    hit(automaton.search(key), value)
+                if regex:
+                    hit([ref for cond, ref in regex if cond.test(key)], value)
+        for field, numbers in host_numbers(scan).items():
+            intervals = self._ranges.get(field)
+            if intervals:
+                for number in numbers:
+                    hit(intervals.lookup(number), str(number))
+        return hits
+
+    def evaluate(self, scan: ScanResult) -> List[RuleFinding]:
+        hits = self._hits(scan)
+        findings = []
+        severities: Dict[str, int] = {}
+        for r in sorted(set(hits).union(self._always)):
+            rule = self.rules[r]
+            matched = hits.get(r, {})
+            if all((c in matched) != cond.negate for c, cond in enumerate(rule.conditions)):
+                values = []
+                for c, cond in enumerate(rule.conditions):
+                    for v in matched.get(c, ()) if not cond.negate else ():
+                        if v not in values:
+                            values.append(v)
+                findings.append(RuleFinding(
+                    rule_id=rule.id, severity=rule.severity, message=rule.message(values),
+                    strategy=rule.strategy, matches=values,
+                ))
+                severities[rule.severity] = severities.get(rule.severity, 0) + 1
+        for severity, count in severities.items():
+            RULE_FINDINGS.inc(count, severity=severity)
+        RULE_EVALUATIONS.inc()
+        return findings
+
+
+def strategy_for(findings: List[RuleFinding], default: str = STRATEGIES[0]) -> str:
+    rank = STRATEGIES.index(default) if default in STRATEGIES else 0
+    for finding in findings:
+        if finding.strategy:
+            rank = max(rank, STRATEGIES.index(finding.strategy))
+    return STRATEGIES[rank]
+
+
+def _read(path: str) -> dict:
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise RuleError("YAML rule files require PyYAML (pip install pyyaml)")
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    if isinstance(data, list):
+        data = {"rules": data}
+    if not isinstance(data, dict) or not isinstance(data.get("rules"), list):
+        raise RuleError(f"{path}: expected a list of rules or an object with a 'rules' list")
+    return data
+
+
+def rule_files(paths: Iterable[str]) -> List[str]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.endswith((".json", ".yaml", ".yml"))
+            )
+        elif path:
+            files.append(path)
+    return files
+
+
+def load_rules(paths: Iterable[str]) -> List[Rule]:
+    # Later files override earlier ones by rule id; {"id": ..., "disabled":
+    # true} removes a rule.
+    rules: Dict[str, Rule] = {}
+    for path in rule_files(paths):
+        for spec in _read(path)["rules"]:
+            if spec.get("disabled"):
+                rules.pop(spec.get("id"), None)
+                continue
+            rule = Rule(spec, path)
+            rules.pop(rule.id, None)
+            rules[rule.id] = rule
+    return list(rules.values())
+
+
+def compile_rules(paths: Iterable[str]) -> RuleEngine:
+    return RuleEngine(load_rules(paths))
+
+
+@functools.lru_cache(maxsize=None)
+def default_engine() -> RuleEngine:
+    return compile_rules([DEFAULT_PATH] + RULES_PATH.split(os.pathsep))
+
+
+def evaluate(scan: ScanResult, engine: Optional[RuleEngine] = None) -> List[RuleFinding]:
+    return (engine or default_engine()).evaluate(scan)
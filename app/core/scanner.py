@@ -1,7 +1,47 @@
-import paramiko
+import logging
+import time
 from app.models import SSHConnection, ScanResult
+from app.core import capture, metrics, profiling, volumes
+
+logger = logging.getLogger("migrator.scanner")
+
+SCAN_SECONDS = metrics.histogram(
+    "migrator_scan_seconds", "Duration of server scans", ("mode",)
+)
+SCANS_TOTAL = metrics.counter(
+    "migrator_scans_total", "Server scans by mode and result", ("mode", "result")
+)
+SSH_COMMAND_SECONDS = metrics.histogram(
+    "migrator_ssh_command_seconds", "Latency of individual SSH commands during a scan", ("command",)
+)
+
+
+def _run(client, name: str, command: str) -> str:
+    start = time.perf_counter()
+    try:
+        with profiling.span("scanner.ssh", command=name):
+            stdin, stdout, stderr = client.exec_command(command)
+            return stdout.read().decode()
+    finally:
+        SSH_COMMAND_SECONDS.observe(time.perf_counter() - start, command=name)
+
 
 def scan_server(conn: SSHConnection) -> ScanResult:
+    mode = "mock" if conn.host == 'mock' else "ssh"
+    start = time.perf_counter()
+    try:
+        with profiling.span("scanner.scan_server", mode=mode):
+            result = _scan_server(conn)
+    except Exception:
+        SCANS_TOTAL.inc(mode=mode, result="error")
+        raise
+    finally:
+        SCAN_SECONDS.observe(time.perf_counter() - start, mode=mode)
+    SCANS_TOTAL.inc(mode=mode, result="success")
+    return result
+
+
+def _scan_server(conn: SSHConnection) -> ScanResult:
     # Mock behavior for demonstration if host is 'mock'
     if conn.host == 'mock':
         return ScanResult(
@@ -15,6 +55,9 @@ def scan_server(conn: SSHConnection) -> ScanResult:
             installed_packages=["python3", "nginx", "postgresql-12"]
         )
 
+    # paramiko pulls in the whole crypto stack; only SSH scans pay for it.
+    import paramiko
+
     client = paramiko.SSHClient()
     client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
     
@@ -29,37 +72,34 @@ def scan_server(conn: SSHConnection) -> ScanResult:
         if conn.key_path:
             connect_kwargs["key_filename"] = conn.key_path
             
-        client.connect(**connect_kwargs)
+        with profiling.span("scanner.connect"):
+            client.connect(**connect_kwargs)
         
         # Gather System Info
         # OS
-        stdin, stdout, stderr = client.exec_command("cat /etc/os-release | grep PRETTY_NAME")
-        os_info = stdout.read().decode().strip().split('=')[1].replace('"', '')
+        os_info = _run(client, "os_release", "cat /etc/os-release | grep PRETTY_NAME").strip().split('=')[1].replace('"', '')
         
         # CPU
-        stdin, stdout, stderr = client.exec_command("nproc")
-        cpu_cores = int(stdout.read().decode().strip())
+        cpu_cores = int(_run(client, "nproc", "nproc").strip())
         
         # RAM
-        stdin, stdout, stderr = client.exec_command("free -g | grep Mem | awk '{print $2}'")
-        memory_gb = float(stdout.read().decode().strip())
+        memory_gb = float(_run(client, "free", "free -g | grep Mem | awk '{print $2}'").strip())
         
-        # Disk (Simplified: just root)
-        stdin, stdout, stderr = client.exec_command("df -h / | awk 'NR==2 {print $2}'")
-        disk_size_str = stdout.read().decode().strip()
-        # Naive parsing, assuming G
-        disk_space_gb = {"/": float(disk_size_str.replace('G', ''))} 
+        # Disk: every real filesystem, in bytes
+        mounts = volumes.parse_df(_run(
+            client, "df",
+            "df -PB1 -x tmpfs -x devtmpfs -x squashfs -x overlay | awk 'NR>1 {print \"mount\\t\" $6 \"\\t\" $2 \"\\t\" $3}'",
+        ))
+        disk_space_gb = volumes.disk_space_gb(mounts)
 
         # Services (Systemd)
-        stdin, stdout, stderr = client.exec_command("systemctl list-units --type=service --state=running --no-pager | head -n 10")
-        services_raw = stdout.read().decode().split('\n')
+        services_raw = _run(client, "systemctl", "systemctl list-units --type=service --state=running --no-pager | head -n 10").split('\n')
         running_services = [line.split()[0] for line in services_raw if line and '.service' in line]
         
         # Open Ports
         # This might fail if netstat/ss is not installed or requires sudo. 
         # Using a simple check or mocking if empty.
-        stdin, stdout, stderr = client.exec_command("ss -tuln")
-        ports_raw = stdout.read().decode().split('\n')
+        ports_raw = _run(client, "ss", "ss -tuln").split('\n')
         open_ports = []
         for line in ports_raw:
             if 'LISTEN' in line:
@@ -73,9 +113,26 @@ def scan_server(conn: SSHConnection) -> ScanResult:
         open_ports = list(set(open_ports))
 
         # Hostname
-        stdin, stdout, stderr = client.exec_command("hostname")
-        hostname = stdout.read().decode().strip()
+        hostname = _run(client, "hostname", "hostname").strip()
+
+        # Packages, users, crontabs, configs and app trees in one tar stream
+        captured = {"installed_packages": []}
+        if conn.capture_files:
+            captured = capture.capture_host(client, running_services)
+            stats = captured.pop("capture_stats", {})
+            if stats:
+                logger.info(
+                    "Captured %s files (%s bytes, %s compressed) from %s at %s MB/s",
+                    stats["files"], stats["raw_bytes"], stats["compressed_bytes"], conn.host, stats["mb_per_s"],
+                )
         
+        # Data volumes: mounts plus app, database and system data directories
+        data_volumes = mounts
+        if conn.capture_volumes:
+            app_paths = [p.get("path") for p in captured.get("pm2_processes", [])]
+            app_paths += [a.get("app_path") for a in captured.get("generic_apps", [])]
+            data_volumes = volumes.collect(client, running_services, [p for p in app_paths if p])
+
         client.close()
         
         return ScanResult(
@@ -86,10 +143,8 @@ def scan_server(conn: SSHConnection) -> ScanResult:
             disk_space_gb=disk_space_gb,
             running_services=running_services,
             open_ports=open_ports,
-            installed_packages=[], # Keeping empty for simplicity
-            system_users=[],
-            crontabs={},
-            config_files={}
+            data_volumes=data_volumes,
+            **captured
         )
 
     except Exception as e:
@@ -0,0 +1,107 @@
+import functools
+import json
+import logging
+import os
+import shlex
+from typing import Iterable, List
+
+from app.core import metrics, profiling
+from app.core.capture import READ_CHUNK
+
+logger = logging.getLogger("migrator.volumes")
+
+AGENT_PATH = os.path.join(os.path.dirname(__file__), '../static/agent.py')
+TIME_BUDGET = float(os.environ.get("MIGRATOR_VOLUME_SCAN_SECONDS", "60"))
+
+VOLUME_SECONDS = metrics.histogram("migrator_volume_scan_seconds", "Duration of remote data volume sizing", ("method",))
+
+# Used when the host has no python3: df for mounts and a time-boxed du per
+# directory, run in parallel. No sampling, so a timed out directory is
+# reported as truncated with whatever du could not finish left at 0.
+FALLBACK_SCRIPT = r"""
+df -PB1 -x tmpfs -x devtmpfs -x squashfs -x overlay 2>/dev/null | awk 'NR>1 {print "mount\t" $6 "\t" $2 "\t" $3}'
+for d in "$@"; do
+  [ -d "$d" ] || continue
+  ( out=$(timeout {budget} du -sxb --apparent-size "$d" 2>/dev/null | cut -f1)
+    if [ -n "$out" ]; then printf 'dir\t%s\t%s\n' "$d" "$out"; else printf 'dir\t%s\t\n' "$d"; fi ) &
+done
+wait
+"""
+
+
+@functools.lru_cache(maxsize=1)
+def agent_source() -> bytes:
+    with open(AGENT_PATH, 'rb') as f:
+        return f.read()
+
+
+def parse_df(text: str) -> List[dict]:
+    mounts = []
+    for line in text.splitlines():
+        parts = line.split("\t")
+        if len(parts) == 4 and parts[0] == "mount" and parts[2].isdigit() and parts[3].isdigit():
+            mounts.append({"path": parts[1], "kind": "mount", "total_bytes": int(parts[2]), "bytes": int(parts[3])})
+    return mounts
+
+
+def disk_space_gb(volumes: Iterable[dict]) -> dict:
+    disks = {v["path"]: round(v["total_bytes"] / 1024 ** 3, 2) for v in volumes if v["kind"] == "mount"}
+    return disks or {"/": 0.0}
+
+
+def _fallback(client, roots: List[tuple], time_budget: float) -> List[dict]:
+    kinds = dict(roots)
+    script = FALLBACK_SCRIPT.replace("{budget}", str(int(time_budget)))
+    command = "bash -s -- " + " ".join(shlex.quote(p) for p in kinds)
+    transport = client.get_transport()
+    channel = transport.open_session()
+    channel.exec_command(command)
+    channel.sendall(script.encode())
+    channel.shutdown_write()
+    text = channel.makefile("rb", READ_CHUNK).read().decode("utf-8", errors="ignore")
+    channel.recv_exit_status()
+    channel.close()
+
+    volumes = parse_df(text)
+    for line in text.splitlines():
+        parts = line.split("\t")
+        if len(parts) == 3 and parts[0] == "dir":
+            size = parts[2].strip()
+            # du ran out of time: the size is unknown, not zero.
+            volumes.append({
+                "path": parts[1], "kind": kinds.get(parts[1], "system"),
+                "bytes": int(size) if size.isdigit() else 0,
+                "truncated": not size.isdigit(), "estimated": not size.isdigit(),
+            })
+    return volumes
+
+
+def fallback_roots(services: Iterable[str], app_paths: Iterable[str]) -> List[tuple]:
+    # Existence can't be checked locally; du skips missing paths remotely.
+    from app.static import agent
+
+    return agent.data_volume_roots(list(services), list(app_paths), exists=lambda path: True)
+
+
+def collect(client, services: Iterable[str], app_paths: Iterable[str], time_budget: float = TIME_BUDGET) -> List[dict]:
+    # Runs the agent's parallel scandir collector on the remote host by piping
+    # agent.py into python3; hosts without python3 get df + du instead.
+    services, app_paths = list(services), list(app_paths)
+    spec = json.dumps({"services": services, "app_paths": app_paths})
+    command = f"python3 - --volumes {shlex.quote(spec)} --volumes-budget {time_budget:g}"
+    with VOLUME_SECONDS.time(method="python"), profiling.span("volumes.collect", method="python"):
+        transport = client.get_transport()
+        channel = transport.open_session()
+        channel.exec_command(f"command -v python3 >/dev/null 2>&1 || exit 127; exec {command}")
+        channel.sendall(agent_source())
+        channel.shutdown_write()
+        output = channel.makefile("rb", READ_CHUNK).read().decode("utf-8", errors="ignore")
+        status = channel.recv_exit_status()
+        channel.close()
+    if status == 0:
+        try:
+            return json.loads(output)
+        except ValueError:
+            logger.warning("Unparseable data volume output, falling back to du")
+    with VOLUME_SECONDS.time(method="du"), profiling.span("volumes.collect", method="du"):
+        return _fallback(client, fallback_roots(services, app_paths), time_budget)
@@ -1,9 +1,16 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from app.api import routes, web
+from app.api.middleware import AdmissionMiddleware, MetricsMiddleware, ProfilingMiddleware
+from app.core import jobs, metrics, profiling
 
 app = FastAPI(title="Migration Automater", version="1.0.0")
 
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 # Mount static files (for agent script)
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
@@ -13,6 +20,47 @@ app.include_router(routes.router)
 # Include Web UI routes
 app.include_router(web.router)
 
+@app.exception_handler(jobs.JobRejected)
+async def job_rejected(request: Request, exc: jobs.JobRejected):
+    return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": str(exc.retry_after)})
+
+
+@app.exception_handler(jobs.JobTimeout)
+async def job_timeout(request: Request, exc: jobs.JobTimeout):
+    return JSONResponse({"detail": str(exc)}, status_code=504)
+
+
+@app.exception_handler(jobs.JobCancelled)
+async def job_cancelled(request: Request, exc: jobs.JobCancelled):
+    return JSONResponse({"detail": "Job was cancelled"}, status_code=409)
+
+
+@app.exception_handler(jobs.WorkerLost)
+async def worker_lost(request: Request, exc: jobs.WorkerLost):
+    return JSONResponse({"detail": str(exc)}, status_code=500)
+
+
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/debug/profiles", include_in_schema=False)
+def list_profiles():
+    return [
+        dict({k: p[k] for k in ("id", "reason", "timestamp", "duration_ms", "slow")}, name=p["tree"]["name"])
+        for p in reversed(profiling.RECENT_PROFILES)
+    ]
+
+
+@app.get("/debug/profiles/{profile_id}", include_in_schema=False)
+def get_profile(profile_id: str):
+    profile = profiling.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional, Dict
+from pydantic import BaseModel, PrivateAttr
+from typing import Any, List, Optional, Dict
 
 class SSHConnection(BaseModel):
     host: str
@@ -7,6 +7,24 @@ class SSHConnection(BaseModel):
     password: Optional[str] = None
     key_path: Optional[str] = None
     port: int = 22
+    capture_files: bool = True # Agentless capture of packages, users, crontabs, configs and app trees
+    capture_volumes: bool = True # Size app, database and system data directories (time-boxed)
+
+class InventoryHost(SSHConnection):
+    name: Optional[str] = None # Stable key for results/checkpoints, defaults to host
+    project_id: Optional[str] = None
+
+class DataVolume(BaseModel):
+    path: str
+    kind: str # mount, app, data (database dirs) or system (/var/log, /home, ...)
+    bytes: int # Used bytes for mounts, apparent size of files for directories
+    files: int = 0
+    dirs: int = 0
+    total_bytes: Optional[int] = None # Mount capacity
+    fstype: Optional[str] = None
+    estimated: bool = False # Sampled huge directories or extrapolated after the time budget
+    truncated: bool = False
+    seconds: Optional[float] = None
 
 class ScanResult(BaseModel):
     hostname: str
@@ -23,11 +41,41 @@ class ScanResult(BaseModel):
     pm2_processes: List[Dict[str, str]] = [] # List of {name, path, status, version}
     custom_app_configs: Dict[str, Dict[str, str]] = {} # AppName -> {FileName -> Content}
     generic_apps: List[Dict] = []
+    data_volumes: List[DataVolume] = []
+    collection_stats: Optional[Dict] = None # Agent resource usage: bytes read, throttling, skipped sections/files
+
+    _fingerprint: Optional[Dict] = PrivateAttr(default=None) # Section/file hashes, see app.core.history
+
+class ScanPatchOp(BaseModel):
+    section: str
+    group: Optional[str] = None # App name, for custom_app_configs and generic_apps
+    key: Optional[str] = None # Path, user or file name (":unit" for a generic app's unit file); None replaces a list section
+    value: Any = None
+    delete: bool = False
+
+class ScanPatch(BaseModel):
+    hostname: str
+    base_version: Optional[int] = None # Version the agent's state is based on; stale patches are refused
+    ops: List[ScanPatchOp]
 
 class Component(BaseModel):
     name: str
     type: str # Service, Database, LoadBalancer, etc.
 
+class TransferEstimate(BaseModel):
+    path: str
+    kind: str
+    bytes: int
+    seconds: float
+    estimated: bool = False
+
+class RuleFinding(BaseModel):
+    rule_id: str
+    severity: str # info, low, medium, high or critical
+    message: str
+    strategy: Optional[str] = None # Strategy the rule calls for, if any
+    matches: List[str] = [] # Host values that triggered the rule
+
 class AnalysisResult(BaseModel):
     scan_id: str
     recommended_gcp_instance: str
@@ -37,6 +85,12 @@ class AnalysisResult(BaseModel):
     added_components: List[Component] = []
     architecture_diagram: Optional[str] = None # Mermaid.js graph definition
     removed_components: List[str] = []
+    data_volume_bytes: int = 0 # Data that has to be copied at cutover
+    transfer_bandwidth_mbps: Optional[float] = None
+    transfer_seconds: Optional[float] = None
+    transfer_estimates: List[TransferEstimate] = []
+    recommended_disk_gb: Optional[int] = None
+    findings: List[RuleFinding] = [] # Rule engine results behind the rule-based risks
 
 class BuildConfig(BaseModel):
     project_id: str
@@ -45,11 +99,24 @@ class BuildConfig(BaseModel):
     instance_name: str
     machine_type: str
     source_image: str
+    disk_size_gb: Optional[int] = None
+    bake_image: bool = False # Restore into a Packer-built image; instances only run boot.sh
+
+class ScriptSection(BaseModel):
+    name: str
+    offset: int # Byte offset in startup.sh
+    length: int
+    lines: int
 
 class BuildResult(BaseModel):
     terraform_code_path: str
     status: str
     message: str
+    rebuilt_sections: List[str] = [] # Startup script sections re-rendered by this build
+    written_files: List[str] = [] # Artifacts whose content changed on disk
+    startup_sections: List[ScriptSection] = [] # Byte ranges of non-empty sections, for on-demand loading
+    unavailable_packages: List[str] = [] # Source packages the package index has no target name for
+    image_name: Optional[str] = None # Baked image main.tf boots from, when bake_image is set
 
 class DeployResult(BaseModel):
     status: str
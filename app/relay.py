@@ -0,0 +1,83 @@
+import contextlib
+import os
+
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from pydantic import ValidationError
+
+from app.api.middleware import AdmissionMiddleware, MetricsMiddleware, spool_request
+from app.core import admission, metrics, relay
+
+# Relay mode: a small server for one network segment. Agents submit to it
+# as they would to the central server (python3 agent.py http://<relay>/api/scan/submit),
+# and it forwards their scans upstream in batches (see app/core/relay.py).
+# Run with MIGRATOR_RELAY_UPSTREAM set, e.g. `migrator_cli.py relay --upstream ...`.
+RELAY = None
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    global RELAY
+    RELAY = relay.Relay()
+    RELAY.start()
+    try:
+        yield
+    finally:
+        RELAY.stop()
+
+
+app = FastAPI(title="Migration Automater relay", version="1.0.0", lifespan=lifespan)
+# Submissions are streamed to disk under the same admission limits as on
+# the central server.
+app.add_middleware(AdmissionMiddleware, paths={"/api/scan/submit": admission.MAX_BODY_BYTES},
+                   streamed=("/api/scan/submit",))
+app.add_middleware(MetricsMiddleware)
+
+
+def _head(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read(1024)
+
+
+@app.post("/api/scan/submit")
+async def submit_scan(request: Request):
+    path = await spool_request(request, admission.MAX_BODY_BYTES)
+    try:
+        return await run_in_threadpool(RELAY.accept_file, path, request.query_params.get("project"))
+    except ValidationError as e:
+        errors = [dict(err, loc=("body",) + tuple(err["loc"])) for err in e.errors(include_url=False)]
+        raise RequestValidationError(errors, body=await run_in_threadpool(_head, path))
+    except relay.SpoolFull as e:
+        # The agent backs off and retries, as it does for an overloaded server.
+        return JSONResponse({"detail": str(e)}, status_code=503, headers={"Retry-After": str(int(RELAY.flush_seconds))})
+    finally:
+        os.remove(path)
+
+
+@app.post("/api/scan/patch")
+async def patch_scan(request: Request):
+    # Deltas need the host's latest version, which only the central server
+    # has; agent daemons answer this with a full scan.
+    raise HTTPException(status_code=409, detail="Relays take full scans only, submit a full scan")
+
+
+@app.get("/api/relay/status")
+def relay_status():
+    return RELAY.status()
+
+
+@app.post("/api/relay/flush")
+def relay_flush():
+    return RELAY.flush(force=True)
+
+
+@app.get("/health")
+def health_check():
+    return {"status": "ok", "mode": "relay"}
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
@@ -1,9 +1,17 @@
 import platform
 import subprocess
+import glob
+import hashlib
 import json
+import struct
+import urllib.error
+import urllib.parse
 import urllib.request
+import zlib
+import random
 import sys
 import os
+import time
 
 def get_os_info():
     try:
@@ -33,16 +41,46 @@ def get_memory_gb():
     except:
         return 1.0
 
+PSEUDO_FS = {
+    "proc", "sysfs", "devtmpfs", "devpts", "tmpfs", "securityfs", "cgroup", "cgroup2", "pstore", "bpf",
+    "debugfs", "tracefs", "mqueue", "hugetlbfs", "configfs", "fusectl", "autofs", "binfmt_misc",
+    "rpc_pipefs", "nsfs", "overlay", "squashfs", "ramfs", "efivarfs", "selinuxfs", "fuse.lxcfs",
+}
+
+def get_mounts():
+    # Real filesystems with capacity and usage, from /proc/mounts + statvfs.
+    mounts = []
+    seen = set()
+    try:
+        with open('/proc/mounts') as f:
+            entries = [line.split()[:3] for line in f]
+    except OSError:
+        entries = [["rootfs", "/", "unknown"]]
+    for device, path, fstype in entries:
+        path = path.replace("\\040", " ")
+        if fstype in PSEUDO_FS or path in seen or path.startswith(("/proc", "/sys", "/dev", "/run", "/snap")):
+            continue
+        try:
+            st = os.statvfs(path)
+        except OSError:
+            continue
+        if not st.f_blocks:
+            continue
+        seen.add(path)
+        total = st.f_blocks * st.f_frsize
+        mounts.append({
+            "path": path,
+            "kind": "mount",
+            "fstype": fstype,
+            "total_bytes": total,
+            "bytes": total - st.f_bfree * st.f_frsize,
+        })
+    return mounts
+
 def get_disk_space():
     try:
-        result = subprocess.check_output("df -h / | awk 'NR==2 {print $2}'", shell=True)
-        size_str = result.decode().strip()
-        # Simplified parsing
-        val = float(size_str.replace('G', '').replace('M', '').replace('T', ''))
-        # Normalize to GB approx
-        if 'T' in size_str: val *= 1024
-        if 'M' in size_str: val /= 1024
-        return {"/": val}
+        disks = {m["path"]: round(m["total_bytes"] / 1024 ** 3, 2) for m in get_mounts()}
+        return disks or {"/": 0.0}
     except:
         return {"/": 0.0}
 
@@ -141,18 +179,540 @@ def get_pm2_processes():
         pass
     return processes
 
-def capture_app_tree(root_path):
-    configs = {}
-    IGNORE_DIRS = {
-        'node_modules', '.git', '.next', '.nuxt', 'dist', 'build', 'coverage',
-        '__pycache__', 'venv', '.idea', '.vscode', 'tmp', 'logs', 'log'
-    }
-    IGNORE_EXTS = {
-        '.log', '.lock', '.gz', '.zip', '.tar', '.png', '.jpg', '.jpeg', '.gif',
-        '.ico', '.pdf', '.bin', '.exe', '.pyc', '.so', '.dll', '.woff', '.woff2', '.ttf'
-    }
-    MAX_FILE_SIZE = 100 * 1024
-    MAX_TOTAL_FILES = 200
+# Data volume discovery. Database data dirs by service keyword, plus the usual
+# places application data accumulates.
+DATA_DIRS = {
+    "postgres": ["/var/lib/postgresql", "/var/lib/pgsql"],
+    "mysql": ["/var/lib/mysql"],
+    "mariadb": ["/var/lib/mysql"],
+    "mongo": ["/var/lib/mongodb", "/var/lib/mongo"],
+    "redis": ["/var/lib/redis"],
+    "elasticsearch": ["/var/lib/elasticsearch"],
+    "rabbitmq": ["/var/lib/rabbitmq"],
+    "kafka": ["/var/lib/kafka", "/var/lib/zookeeper"],
+    "docker": ["/var/lib/docker"],
+    "containerd": ["/var/lib/containerd"],
+    "influx": ["/var/lib/influxdb"],
+    "cassandra": ["/var/lib/cassandra"],
+}
+SYSTEM_DATA_DIRS = ["/var/www", "/var/log", "/home", "/srv", "/opt"]
+DU_WORKERS = 8
+DU_TIME_BUDGET = 60.0
+# Directories with more entries than this are sized from a random sample.
+DU_SAMPLE_THRESHOLD = 5000
+DU_SAMPLE_SIZE = 500
+
+def disk_usage(roots, workers=DU_WORKERS, time_budget=DU_TIME_BUDGET,
+               sample_threshold=DU_SAMPLE_THRESHOLD, sample_size=DU_SAMPLE_SIZE):
+    # Parallel scandir walk over all roots at once, staying on each root's
+    # filesystem. Stops at the deadline; anything left is extrapolated from
+    # the average directory seen so far and flagged as truncated.
+    import queue
+    import threading
+
+    deadline = time.monotonic() + time_budget
+    results = []
+    for path, kind in roots:
+        try:
+            dev = os.stat(path).st_dev
+        except OSError:
+            continue
+        results.append({"path": path, "kind": kind, "bytes": 0, "files": 0, "dirs": 0,
+                        "estimated": False, "truncated": False, "pending_dirs": 0, "_dev": dev})
+    work = queue.Queue()
+    for index, result in enumerate(results):
+        work.put((index, result["path"]))
+    lock = threading.Lock()
+    started = time.monotonic()
+
+    def walk(index, path):
+        result = results[index]
+        size = files = 0
+        subdirs = []
+        estimated = False
+        try:
+            with os.scandir(path) as it:
+                entries = list(it)
+        except OSError:
+            return
+        plain = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    plain.append(entry)
+            except OSError:
+                pass
+        if len(plain) > sample_threshold:
+            sample = random.sample(plain, sample_size)
+            sampled = 0
+            for entry in sample:
+                try:
+                    sampled += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    pass
+            size = sampled * len(plain) // sample_size
+            estimated = True
+        else:
+            for entry in plain:
+                try:
+                    size += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    pass
+        files = len(plain)
+        for sub in subdirs:
+            try:
+                if os.lstat(sub).st_dev == result["_dev"]:
+                    work.put((index, sub))
+            except OSError:
+                pass
+        with lock:
+            result["bytes"] += size
+            result["files"] += files
+            result["dirs"] += 1
+            result["estimated"] = result["estimated"] or estimated
+
+    def worker():
+        while True:
+            item = work.get()
+            if item is None:
+                work.task_done()
+                return
+            index, path = item
+            if time.monotonic() > deadline:
+                with lock:
+                    results[index]["pending_dirs"] += 1
+            else:
+                walk(index, path)
+            work.task_done()
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, workers))]
+    for t in threads:
+        t.start()
+    work.join()
+    for _ in threads:
+        work.put(None)
+
+    elapsed = round(time.monotonic() - started, 3)
+    for result in results:
+        del result["_dev"]
+        pending = result.pop("pending_dirs")
+        if pending:
+            result["truncated"] = True
+            result["estimated"] = True
+            if result["dirs"]:
+                result["bytes"] += result["bytes"] * pending // result["dirs"]
+                result["files"] += result["files"] * pending // result["dirs"]
+        result["seconds"] = elapsed
+    return results
+
+def data_volume_roots(services, app_paths, exists=os.path.isdir):
+    roots = []
+    for path in app_paths:
+        if path and path != "/":
+            roots.append((path, "app"))
+    for service in services:
+        for key, paths in DATA_DIRS.items():
+            if key in service:
+                roots.extend((p, "data") for p in paths if exists(p))
+    roots.extend((p, "system") for p in SYSTEM_DATA_DIRS if exists(p))
+    # Drop duplicates and directories already covered by another root.
+    unique = []
+    for path, kind in sorted(dict(reversed(roots)).items(), key=lambda r: len(r[0])):
+        if not any(path == p or path.startswith(p.rstrip("/") + "/") for p, _ in unique):
+            unique.append((path, kind))
+    return unique
+
+def get_data_volumes(services, app_paths, workers=None, time_budget=None):
+    if time_budget is None:
+        time_budget = DU_TIME_BUDGET
+    if GOVERNOR.time_budget:
+        time_budget = min(time_budget, max(1.0, GOVERNOR.remaining()))
+    if workers is None:
+        workers = 2 if GOVERNOR.priority else DU_WORKERS
+    return get_mounts() + disk_usage(data_volume_roots(services, app_paths), workers=workers, time_budget=time_budget)
+
+
+# App tree capture rules. The agentless SSH scanner applies the same rules on
+# the remote side (app/core/capture.py), so keep them at module level.
+IGNORE_DIRS = {
+    'node_modules', '.git', '.next', '.nuxt', 'dist', 'build', 'coverage',
+    '__pycache__', 'venv', '.idea', '.vscode', 'tmp', 'logs', 'log'
+}
+IGNORE_EXTS = {
+    '.log', '.lock', '.gz', '.zip', '.tar', '.png', '.jpg', '.jpeg', '.gif',
+    '.ico', '.pdf', '.bin', '.exe', '.pyc', '.so', '.dll', '.woff', '.woff2', '.ttf'
+}
+MAX_FILE_SIZE = 100 * 1024
+MAX_TOTAL_FILES = 200
+
+# Config files come from the package database: every conffile a package
+# ships, captured only when it differs from the packaged version. These
+# per-service paths (globs allowed) are probed for what no package owns:
+# tarball installs and files generated at install time.
+SERVICE_CONFIG_PATHS = {
+    "nginx": ["/etc/nginx/nginx.conf", "/etc/nginx/conf.d/default.conf"],
+    "apache2": ["/etc/apache2/apache2.conf", "/etc/apache2/ports.conf"],
+    "httpd": ["/etc/httpd/conf/httpd.conf"],
+    "mysql": ["/etc/mysql/my.cnf"],
+    "postgresql": ["/etc/postgresql/*/main/postgresql.conf", "/etc/postgresql/*/main/pg_hba.conf"],
+    "tomcat": ["/opt/tomcat/conf/server.xml", "/usr/local/tomcat/conf/server.xml"]
+}
+DPKG_STATUS = "/var/lib/dpkg/status"
+# Packaged digests by length: dpkg records md5, rpm whatever it was built with.
+CONFFILE_DIGESTS = {32: hashlib.md5, 40: hashlib.sha1, 64: hashlib.sha256, 128: hashlib.sha512}
+# Larger config files are skipped, not cut off mid-file.
+MAX_CONFIG_BYTES = 1024 * 1024
+MAX_CONFFILES = 500
+# How long after writing a package's file list dpkg may still be moving its
+# conffiles into place; any later inode change means the file is hashed.
+CONFFILE_SLACK_SECONDS = 60
+
+# Units matching these are infrastructure, not applications to migrate
+INFRA_KEYWORDS = [
+    "nginx",
+    "apache2",
+    "httpd",
+    "postgres",
+    "mysql",
+    "mariadb",
+    "docker",
+    "containerd",
+    "sshd",
+    "systemd-",
+    "cron",
+    "rsyslog",
+    "networkd",
+    "dbus",
+    "polkit",
+    "logind",
+]
+
+
+class Governor:
+    # Resource limits for running on busy production hosts. The default
+    # instance is unlimited; --low-impact installs a limited one.
+    def __init__(self, max_read_bytes_per_sec=0, time_budget=0):
+        self.max_read_bytes_per_sec = max_read_bytes_per_sec
+        self.time_budget = time_budget
+        self.started = time.monotonic()
+        self.bytes_read = 0
+        self.files_read = 0
+        self.throttled_seconds = 0.0
+        self.skipped_sections = []
+        self.skipped_files = {}
+        self.priority = {}
+        self._window_start = self.started
+        self._window_bytes = 0
+
+    def lower_priority(self):
+        # Applies to this process and every command it forks.
+        try:
+            self.priority["nice"] = os.nice(19 - os.nice(0))
+        except (AttributeError, OSError):
+            pass
+        try:
+            subprocess.check_call(["ionice", "-c", "3", "-p", str(os.getpid())],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            self.priority["ionice"] = "idle"
+        except Exception:
+            pass
+
+    def expired(self):
+        return bool(self.time_budget) and time.monotonic() - self.started > self.time_budget
+
+    def remaining(self):
+        return self.time_budget - (time.monotonic() - self.started) if self.time_budget else float("inf")
+
+    def skip_file(self, reason):
+        self.skipped_files[reason] = self.skipped_files.get(reason, 0) + 1
+
+    def skip_section(self, name):
+        self.skipped_sections.append(name)
+
+    def _throttle(self, size):
+        if not self.max_read_bytes_per_sec:
+            return
+        self._window_bytes += size
+        now = time.monotonic()
+        ahead = self._window_bytes / self.max_read_bytes_per_sec - (now - self._window_start)
+        if ahead > 0:
+            time.sleep(ahead)
+            self.throttled_seconds += ahead
+        if now - self._window_start > 1:
+            # Keep the window short so an idle stretch is not saved up as burst.
+            self._window_start = time.monotonic()
+            self._window_bytes = 0
+
+    def read_text(self, path, limit=-1):
+        return self.read_bytes(path, limit).decode('utf-8', errors='ignore')
+
+    def read_bytes(self, path, limit=-1):
+        chunks = []
+        remaining = limit
+        with open(path, 'rb') as f:
+            while remaining:
+                chunk = f.read(65536 if remaining < 0 else min(65536, remaining))
+                if not chunk:
+                    break
+                self._throttle(len(chunk))
+                self.bytes_read += len(chunk)
+                chunks.append(chunk)
+                if remaining > 0:
+                    remaining -= len(chunk)
+        self.files_read += 1
+        return b"".join(chunks)
+
+    def stats(self):
+        stats = {
+            "elapsed_seconds": round(time.monotonic() - self.started, 3),
+            "bytes_read": self.bytes_read,
+            "files_read": self.files_read,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "skipped_sections": self.skipped_sections,
+            "skipped_files": self.skipped_files,
+            "limits": {"max_read_bytes_per_sec": self.max_read_bytes_per_sec, "time_budget": self.time_budget},
+            "priority": self.priority,
+        }
+        try:
+            import resource
+            stats["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        except ImportError:
+            pass
+        return stats
+
+
+GOVERNOR = Governor()
+
+
+class Spool:
+    # Writes the scan JSON section by section (and app file by app file) to
+    # disk so memory holds one file at a time instead of the whole scan.
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, 'w')
+        self.first = [True]
+        self.f.write("{")
+
+    def _sep(self):
+        if not self.first[-1]:
+            self.f.write(",")
+        self.first[-1] = False
+
+    def field(self, key, value):
+        self._sep()
+        self.f.write(json.dumps(key) + ":" + json.dumps(value))
+
+    def begin(self, key=None, array=False):
+        self._sep()
+        if key is not None:
+            self.f.write(json.dumps(key) + ":")
+        self.f.write("[" if array else "{")
+        self.first.append(True)
+
+    def end(self, array=False):
+        self.first.pop()
+        self.f.write("]" if array else "}")
+
+    def close(self):
+        self.f.write("}")
+        self.f.close()
+        return self.path
+
+
+class _DictSink:
+    # Same interface as Spool, building an in-memory dict (default mode).
+    def __init__(self):
+        self.data = {}
+        self.stack = [self.data]
+
+    def field(self, key, value):
+        self._put(key, value)
+
+    def _put(self, key, value):
+        top = self.stack[-1]
+        if isinstance(top, list):
+            top.append(value)
+        else:
+            top[key] = value
+
+    def begin(self, key=None, array=False):
+        value = [] if array else {}
+        self._put(key, value)
+        self.stack.append(value)
+
+    def end(self, array=False):
+        self.stack.pop()
+
+    def close(self):
+        return self.data
+
+
+# Offline bundles (--bundle) for hosts that cannot reach the API: the scan is
+# written as zlib frames, one per section and one per app, followed by a JSON
+# index of frame offsets and a fixed footer pointing at the index. The server
+# maps the file and inflates one frame at a time (app/core/bundles.py). File
+# bodies of BUNDLE_BLOB_MIN bytes or more are stored once per distinct content
+# as blob frames and referenced from their file map as {"blob": digest}.
+BUNDLE_MAGIC = b"MIGBNDL1"
+BUNDLE_FOOTER = struct.Struct("<QI8s")  # index offset, index length, magic
+BUNDLE_EXTENSION = ".migb"
+BUNDLE_LEVEL = 6
+BUNDLE_BLOB_MIN = 256
+# Sections holding file maps: the section value itself (None), or a key of
+# each of its entries.
+BUNDLE_FILE_MAPS = {"crontabs": None, "config_files": None, "custom_app_configs": None, "generic_apps": "files"}
+
+
+class Bundle:
+    # Same interface as Spool. Entries of the app sections are written out as
+    # they close, so memory holds one app's file list at a time.
+    def __init__(self, path, meta=None):
+        self.path = path
+        self.f = open(path, 'wb')
+        self.f.write(BUNDLE_MAGIC)
+        self.meta = dict(meta or {})
+        self.sections = []
+        self.blobs = {}
+        self.digest = hashlib.blake2b(digest_size=16)
+        self.stack = []  # [key, value] of open containers; the section's own value is not kept
+        self.entries = 0
+
+    def _frame(self, raw):
+        offset = self.f.tell()
+        data = zlib.compress(raw, BUNDLE_LEVEL)
+        self.f.write(data)
+        return offset, len(data)
+
+    def _section(self, name, key, value):
+        raw = json.dumps(value).encode('utf-8', 'surrogatepass')
+        if name != "collection_stats":
+            # Identifies the scan content; run statistics differ on every run.
+            self.digest.update(json.dumps([name, key]).encode() + raw)
+        self.sections.append([name, key, *self._frame(raw)])
+
+    def _file(self, content):
+        if not isinstance(content, str) or len(content) < BUNDLE_BLOB_MIN:
+            return content
+        raw = content.encode('utf-8', 'surrogatepass')
+        digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+        if digest not in self.blobs:
+            self.blobs[digest] = list(self._frame(raw))
+        return {"blob": digest}
+
+    def _in_file_map(self):
+        inner = BUNDLE_FILE_MAPS.get(self.stack[0][0], False)
+        if inner is None:
+            return len(self.stack) == 2
+        return len(self.stack) == 3 and self.stack[-1][0] == inner
+
+    def field(self, key, value):
+        if not self.stack:
+            if key == "hostname":
+                self.meta.setdefault("hostname", value)
+            if BUNDLE_FILE_MAPS.get(key, False) is None and isinstance(value, dict):
+                value = {k: self._file(v) for k, v in value.items()}
+            self._section(key, None, value)
+        elif len(self.stack) == 1:
+            self._section(self.stack[0][0], self._key(key), value)
+        else:
+            top = self.stack[-1][1]
+            value = self._file(value) if self._in_file_map() else value
+            if isinstance(top, list):
+                top.append(value)
+            else:
+                top[key] = value
+
+    def _key(self, key):
+        if isinstance(self.stack[0][1], list):
+            key, self.entries = self.entries, self.entries + 1
+        return key
+
+    def begin(self, key=None, array=False):
+        value = [] if array else {}
+        if not self.stack:
+            self._section(key, None, value)
+            self.entries = 0
+        elif len(self.stack) > 1:
+            top = self.stack[-1][1]
+            if isinstance(top, list):
+                top.append(value)
+            else:
+                top[key] = value
+        self.stack.append([key, value])
+
+    def end(self, array=False):
+        key, value = self.stack.pop()
+        if len(self.stack) == 1:
+            self._section(self.stack[0][0], self._key(key), value)
+
+    def close(self):
+        index = dict(self.meta, version=1, created=self.meta.get("created", time.time()),
+                     digest=self.digest.hexdigest(), sections=self.sections, blobs=self.blobs)
+        offset, length = self._frame(json.dumps(index).encode('utf-8', 'surrogatepass'))
+        self.f.write(BUNDLE_FOOTER.pack(offset, length, BUNDLE_MAGIC))
+        self.f.close()
+        return self.path
+
+
+def feed(sink, data):
+    # Replays an already collected scan dict into a sink.
+    for key, value in data.items():
+        if key in ("custom_app_configs", "generic_apps") and isinstance(value, (dict, list)):
+            array = isinstance(value, list)
+            sink.begin(key, array=array)
+            for name, entry in (enumerate(value) if array else value.items()):
+                sink.begin(None if array else name)
+                for k, v in entry.items():
+                    if isinstance(v, dict):
+                        sink.begin(k)
+                        for rel, content in v.items():
+                            sink.field(rel, content)
+                        sink.end()
+                    else:
+                        sink.field(k, v)
+                sink.end()
+            sink.end(array=array)
+        else:
+            sink.field(key, value)
+    return sink.close()
+
+
+def write_bundle(target, project=None, data=None):
+    # target is a bundle file or a directory for <hostname>-<time>.migb. The
+    # bundle is written under a temporary name and renamed once complete, so
+    # an import never picks up a partial one.
+    created = time.time()
+    path = target
+    if os.path.isdir(target):
+        stamp = time.strftime("%Y%m%d%H%M%S", time.gmtime(created))
+        path = os.path.join(target, f"{platform.node() or 'host'}-{stamp}{BUNDLE_EXTENSION}")
+    meta = {"created": created}
+    if project:
+        meta["project"] = project
+    tmp = path + ".tmp"
+    sink = Bundle(tmp, meta)
+    try:
+        if data is None:
+            scan(sink)
+        else:
+            feed(sink, data)
+    except BaseException:
+        sink.f.close()
+        os.remove(tmp)
+        raise
+    os.replace(tmp, path)
+    return path
+
+
+def url_project(url):
+    values = urllib.parse.parse_qs(urllib.parse.urlparse(url or "").query).get("project")
+    return values[0] if values else None
+
+
+
+def iter_app_tree(root_path):
     file_count = 0
 
     for root, dirs, files in os.walk(root_path):
@@ -160,32 +720,39 @@ def capture_app_tree(root_path):
 
         for file_name in files:
             if file_count >= MAX_TOTAL_FILES:
-                break
+                GOVERNOR.skip_file("max_files")
+                continue
 
             if any(file_name.endswith(ext) for ext in IGNORE_EXTS):
                 continue
 
+            if GOVERNOR.expired():
+                GOVERNOR.skip_file("time_budget")
+                continue
+
             full_path = os.path.join(root, file_name)
 
             try:
                 if os.path.getsize(full_path) > MAX_FILE_SIZE:
+                    GOVERNOR.skip_file("too_large")
                     continue
 
                 rel_path = os.path.relpath(full_path, root_path)
 
-                with open(full_path, 'r', errors='ignore') as f:
-                    content = f.read()
-                    if '\0' in content:
-                        continue
-                    configs[rel_path] = content
-                    file_count += 1
+                content = GOVERNOR.read_text(full_path)
+                if '\0' in content:
+                    continue
+                file_count += 1
+                yield rel_path, content
             except Exception:
                 pass
 
         if file_count >= MAX_TOTAL_FILES:
             break
 
-    return configs
+
+def capture_app_tree(root_path):
+    return dict(iter_app_tree(root_path))
 
 
 def get_app_configs(pm2_procs):
@@ -202,32 +769,177 @@ def get_app_configs(pm2_procs):
 
     return app_configs
 
-def get_config_files(services):
-    configs = {}
-    # Common paths for services
-    possible_paths = {
-        "nginx": ["/etc/nginx/nginx.conf", "/etc/nginx/conf.d/default.conf"],
-        "apache2": ["/etc/apache2/apache2.conf", "/etc/apache2/ports.conf"],
-        "httpd": ["/etc/httpd/conf/httpd.conf"],
-        "mysql": ["/etc/mysql/my.cnf"],
-        "postgresql": ["/etc/postgresql/12/main/postgresql.conf", "/etc/postgresql/13/main/postgresql.conf"],
-        "tomcat": ["/opt/tomcat/conf/server.xml", "/usr/local/tomcat/conf/server.xml"]
-    }
-    
+def parse_dpkg_status(text):
+    # {path: (md5, package)} of the conffiles of installed packages, from
+    # the Conffiles fields of dpkg's status database. Obsolete entries are
+    # left out. Packages are named as their files under /var/lib/dpkg/info
+    # are ("libc6:amd64" when several architectures can be installed).
+    conffiles = {}
+    pending, fields, in_conffiles = {}, {}, False
+    for line in text.splitlines() + [""]:
+        if not line.strip():
+            if fields.get("Status", "").split()[-1:] == ["installed"]:
+                package = fields.get("Package", "")
+                if fields.get("Multi-Arch") == "same" and fields.get("Architecture"):
+                    package += ":" + fields["Architecture"]
+                conffiles.update((path, (digest, package)) for path, digest in pending.items())
+            pending, fields, in_conffiles = {}, {}, False
+        elif line[0] in " \t":
+            if in_conffiles:
+                words = line.strip().split(" ")
+                flags = set()
+                while len(words) > 2 and words[-1] in ("obsolete", "remove-on-upgrade"):
+                    flags.add(words.pop())
+                if len(words) >= 2 and not flags:
+                    pending[" ".join(words[:-1])] = words[-1]
+        else:
+            name, _, value = line.partition(":")
+            fields[name] = value.strip()
+            in_conffiles = name == "Conffiles"
+    return conffiles
+
+
+def parse_dpkg_conffiles(text):
+    # {path: md5} of the conffiles of installed packages.
+    return {path: digest for path, (digest, _) in parse_dpkg_status(text).items()}
+
+
+def parse_rpm_verify(text):
+    # Config files whose size or digest differ from the rpm database, from
+    # "rpm -Va --configfiles" lines such as "S.5....T.  c /etc/my.cnf".
+    modified = []
+    for line in text.splitlines():
+        flags, rest = line[:9], line[9:].strip()
+        if rest.startswith("c ") and ("5" in flags or flags.startswith("S")):
+            modified.append(rest[2:].strip())
+    return modified
+
+
+def parse_rpm_conffiles(text):
+    # {path: digest} of config files, from
+    # "rpm -qa --qf '[%{FILEFLAGS:fflags} %{FILEDIGESTS} %{FILENAMES}\n]'" lines.
+    conffiles = {}
+    for line in text.splitlines():
+        fields = line.split(" ", 2)
+        if len(fields) == 3 and "c" in fields[0] and fields[2].startswith("/"):
+            conffiles[fields[2]] = fields[1]
+    return conffiles
+
+
+def conffile_modified(data, digest):
+    algorithm = CONFFILE_DIGESTS.get(len(digest or ""))
+    return algorithm is None or algorithm(data).hexdigest() != digest
+
+
+def package_conffiles(status_path=DPKG_STATUS):
+    # {path: packaged digest} of every config file the package database
+    # knows, or None when the host has no dpkg or rpm.
+    if os.path.exists(status_path):
+        return parse_dpkg_conffiles(GOVERNOR.read_text(status_path))
+    try:
+        listed = subprocess.check_output(
+            ["rpm", "-qa", "--qf", "[%{FILEFLAGS:fflags} %{FILEDIGESTS} %{FILENAMES}\\n]"], stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return parse_rpm_conffiles(listed.decode("utf-8", errors="ignore"))
+
+
+def _unpacked_as_is(path, unpacked):
+    # dpkg gives a conffile its packaged mtime and moves it into place right
+    # around writing the package's file list (unpacked: that list's mtime).
+    # Any other inode change since, such as an edit, a copy that kept the old
+    # mtime or an edit kept across an upgrade, leaves the ctime outside that
+    # window, and the file is hashed.
+    if unpacked is None:
+        return False
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return st.st_mtime <= unpacked and abs(st.st_ctime - unpacked) <= CONFFILE_SLACK_SECONDS
+
+
+def _read_config(path):
+    try:
+        if os.path.getsize(path) > MAX_CONFIG_BYTES:
+            GOVERNOR.skip_file("too_large")
+            return None
+        data = GOVERNOR.read_bytes(path)
+    except OSError:
+        return None
+    if b"\0" in data:
+        return None
+    return data
+
+
+def discover_conffiles(status_path=DPKG_STATUS):
+    # (owned, modified): {path: packaged digest} of every config file the
+    # package database knows and {path: content} of those edited since
+    # installation, or None when the host has no dpkg or rpm. dpkg digests
+    # are checked here in one pass over its status file; rpm checks its own.
+    # Files dpkg left as it unpacked them are not read at all.
+    modified = {}
+    if os.path.exists(status_path):
+        entries = parse_dpkg_status(GOVERNOR.read_text(status_path))
+        owned = {path: digest for path, (digest, _) in entries.items()}
+        info = os.path.join(os.path.dirname(status_path), "info")
+        unpacked = {}
+        for path, (digest, package) in sorted(entries.items()):
+            if GOVERNOR.expired():
+                GOVERNOR.skip_file("time_budget")
+                continue
+            if package not in unpacked:
+                try:
+                    unpacked[package] = os.stat(os.path.join(info, package + ".list")).st_mtime
+                except OSError:
+                    unpacked[package] = None
+            if _unpacked_as_is(path, unpacked[package]):
+                continue
+            data = _read_config(path)
+            if data is not None and conffile_modified(data, digest):
+                modified[path] = data
+    else:
+        owned = package_conffiles(status_path)
+        if owned is None:
+            return None
+        try:
+            # rpm -V exits non-zero whenever something differs.
+            verify = subprocess.run(["rpm", "-Va", "--configfiles", "--nodeps", "--noscripts"],
+                                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+        except OSError:
+            return None
+        for path in parse_rpm_verify(verify.decode("utf-8", errors="ignore")):
+            data = _read_config(path)
+            if data is not None:
+                modified[path] = data
+    if len(modified) > MAX_CONFFILES:
+        for path in sorted(modified)[MAX_CONFFILES:]:
+            GOVERNOR.skip_file("max_files")
+            del modified[path]
+    return owned, {path: data.decode("utf-8", errors="ignore") for path, data in modified.items()}
+
+
+def service_config_paths(services, owned=()):
+    # Existing per-service config paths that no package owns.
+    paths = []
     for service in services:
         # Match service name loosely
-        for key, paths in possible_paths.items():
+        for key, patterns in SERVICE_CONFIG_PATHS.items():
             if key in service:
-                for path in paths:
-                    if os.path.exists(path):
-                        try:
-                            with open(path, 'r') as f:
-                                # Limit size to avoid huge payloads
-                                content = f.read(10000) 
-                                configs[path] = content
-                        except Exception as e:
-                            print(f"Could not read {path}: {e}")
-                            
+                for pattern in patterns:
+                    for path in sorted(glob.glob(pattern)):
+                        if path not in owned and path not in paths and os.path.isfile(path):
+                            paths.append(path)
+    return paths
+
+
+def get_config_files(services, status_path=DPKG_STATUS):
+    found = discover_conffiles(status_path)
+    owned, configs = found if found is not None else ({}, {})
+    for path in service_config_paths(services, owned):
+        data = _read_config(path)
+        if data is not None:
+            configs[path] = data.decode("utf-8", errors="ignore")
     return configs
 
 
@@ -242,25 +954,6 @@ def get_systemd_app_services():
     except Exception:
         return services
 
-    infra_keywords = [
-        "nginx",
-        "apache2",
-        "httpd",
-        "postgres",
-        "mysql",
-        "mariadb",
-        "docker",
-        "containerd",
-        "sshd",
-        "systemd-",
-        "cron",
-        "rsyslog",
-        "networkd",
-        "dbus",
-        "polkit",
-        "logind",
-    ]
-
     for line in output.splitlines():
         parts = line.split()
         if not parts:
@@ -269,14 +962,14 @@ def get_systemd_app_services():
         if not unit.endswith(".service"):
             continue
         lowered = unit.lower()
-        if any(k in lowered for k in infra_keywords):
+        if any(k in lowered for k in INFRA_KEYWORDS):
             continue
         services.append(unit)
 
     return services
 
 
-def inspect_systemd_service(unit_name):
+def inspect_systemd_service(unit_name, capture_files=True):
     details = {
         "service_name": unit_name,
     }
@@ -326,13 +1019,12 @@ def inspect_systemd_service(unit_name):
     unit_file_content = None
     if fragment_path and os.path.exists(fragment_path):
         try:
-            with open(fragment_path, 'r') as f:
-                unit_file_content = f.read()
+            unit_file_content = GOVERNOR.read_text(fragment_path)
         except Exception:
             unit_file_content = None
 
     files = {}
-    if app_path and os.path.isdir(app_path):
+    if capture_files and app_path and os.path.isdir(app_path):
         try:
             files = capture_app_tree(app_path)
         except Exception:
@@ -366,54 +1058,700 @@ def get_generic_apps():
     return generic_apps
 
 
-def scan():
+def scan(sink=None):
+    # Sections are collected and handed to the sink one at a time; with a
+    # Spool sink only the section being collected is held in memory. Once the
+    # time budget runs out the remaining sections are skipped.
     print("Gathering system information...")
-    services = get_services()
-    users = get_system_users()
-    pm2_procs = get_pm2_processes()
-    generic_apps = get_generic_apps()
-
-    data = {
-        "hostname": platform.node(),
-        "os_info": get_os_info(),
-        "cpu_cores": get_cpu_cores(),
-        "memory_gb": get_memory_gb(),
-        "disk_space_gb": get_disk_space(),
-        "running_services": services,
-        "open_ports": get_open_ports(),
-        "installed_packages": get_installed_packages(),
-        "system_users": users,
-        "crontabs": get_crontabs(users),
-        "config_files": get_config_files(services),
-        "pm2_processes": pm2_procs,
-        "custom_app_configs": get_app_configs(pm2_procs),
-        "generic_apps": generic_apps,
-    }
-    return data
+    sink = sink or _DictSink()
+    context = {}
+
+    def section(name, collect, default):
+        if GOVERNOR.expired():
+            GOVERNOR.skip_section(name)
+            value = default
+        else:
+            value = collect()
+        context[name] = value
+        sink.field(name, value)
+
+    sink.field("hostname", platform.node())
+    section("os_info", get_os_info, "Unknown Linux")
+    section("cpu_cores", get_cpu_cores, 1)
+    section("memory_gb", get_memory_gb, 0.0)
+    section("disk_space_gb", get_disk_space, {})
+    section("running_services", get_services, [])
+    section("open_ports", get_open_ports, [])
+    section("installed_packages", get_installed_packages, [])
+    section("system_users", get_system_users, [])
+    section("crontabs", lambda: get_crontabs(context["system_users"]), {})
+    section("config_files", lambda: get_config_files(context["running_services"]), {})
+    section("pm2_processes", get_pm2_processes, [])
+
+    app_paths = []
+    sink.begin("custom_app_configs")
+    for proc in context["pm2_processes"]:
+        app_name = proc.get("name")
+        app_path = proc.get("path")
+        if not app_name or not app_path or not os.path.exists(app_path):
+            continue
+        app_paths.append(app_path)
+        sink.begin(app_name)
+        for rel_path, content in iter_app_tree(app_path):
+            sink.field(rel_path, content)
+        sink.end()
+    sink.end()
+
+    sink.begin("generic_apps", array=True)
+    units = [] if GOVERNOR.expired() else get_systemd_app_services()
+    for unit in units:
+        if GOVERNOR.expired():
+            GOVERNOR.skip_section(f"generic_apps/{unit}")
+            continue
+        details = inspect_systemd_service(unit, capture_files=False)
+        if details is None:
+            continue
+        sink.begin()
+        for key, value in details.items():
+            if key != "files":
+                sink.field(key, value)
+        sink.begin("files")
+        if details["app_path"] and os.path.isdir(details["app_path"]):
+            app_paths.append(details["app_path"])
+            for rel_path, content in iter_app_tree(details["app_path"]):
+                sink.field(rel_path, content)
+        sink.end()
+        sink.end()
+    sink.end(array=True)
+
+    section("data_volumes", lambda: get_data_volumes(context["running_services"], app_paths), [])
+    sink.field("collection_stats", GOVERNOR.stats())
+    return sink.close()
+
+# Retry policy for uploads: jittered exponential backoff so a fleet-wide
+# rollout spreads out instead of hammering the server in lockstep.
+SEND_MAX_ATTEMPTS = int(os.environ.get("MIGRATOR_SEND_ATTEMPTS", "8"))
+SEND_BASE_DELAY = 1.0
+SEND_MAX_DELAY = 60.0
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+
+def backoff_delay(attempt, retry_after=None):
+    # "Full jitter": uniform between 0 and the exponential cap, but never
+    # earlier than the server's Retry-After hint.
+    delay = random.uniform(0, min(SEND_MAX_DELAY, SEND_BASE_DELAY * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after + random.uniform(0, retry_after))
+    return delay
 
-def send_data(data, url):
+def send_data(data, url, max_attempts=None, sleep=time.sleep):
+    # data is the scan dict, or the path of a spooled scan which is streamed
+    # from disk instead of being loaded.
     print(f"Sending data to {url}...")
-    req = urllib.request.Request(url)
-    req.add_header('Content-Type', 'application/json')
-    jsondata = json.dumps(data).encode('utf-8')
+    spooled = isinstance(data, str)
+    jsondata = None if spooled else json.dumps(data).encode('utf-8')
+    max_attempts = max_attempts or SEND_MAX_ATTEMPTS
+    for attempt in range(max_attempts):
+        req = urllib.request.Request(url)
+        req.add_header('Content-Type', 'application/json')
+        retry_after = None
+        try:
+            if spooled:
+                req.add_header('Content-Length', str(os.path.getsize(data)))
+                body = open(data, 'rb')
+            else:
+                body = jsondata
+            try:
+                response = urllib.request.urlopen(req, body)
+            finally:
+                if spooled:
+                    body.close()
+            with response:
+                text = response.read().decode()
+                print("Success! Server response:", text)
+                # The parsed reply (e.g. the stored scan version), or True.
+                try:
+                    return json.loads(text) or True
+                except ValueError:
+                    return True
+        except urllib.error.HTTPError as e:
+            if e.code not in RETRY_STATUSES:
+                print(f"Error sending data: {e}")
+                return False
+            try:
+                retry_after = float(e.headers.get("Retry-After"))
+            except (TypeError, ValueError):
+                pass
+            error = e
+        except Exception as e:
+            error = e
+        if attempt + 1 < max_attempts:
+            delay = backoff_delay(attempt, retry_after)
+            print(f"Error sending data: {error}; retrying in {delay:.1f}s ({attempt + 1}/{max_attempts})")
+            sleep(delay)
+    print(f"Error sending data: {error}; giving up after {max_attempts} attempts")
+    return False
+
+# Continuous discovery (--daemon): one full baseline, then the captured files
+# are watched and only what changed is re-read and sent as a delta
+# (POST /api/scan/patch). Uses inotify through libc when available and
+# falls back to polling directory listings.
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF)
+GONE = IN_DELETE | IN_MOVED_FROM
+
+CRON_SPOOL_DIRS = ["/var/spool/cron/crontabs", "/var/spool/cron"]
+# Files whose change means a list section has to be collected again.
+REFRESH_FILES = {
+    "/var/lib/dpkg/status": "installed_packages",
+    "/var/lib/rpm/Packages": "installed_packages",
+    "/var/lib/rpm/rpmdb.sqlite": "installed_packages",
+    "/etc/passwd": "system_users",
+}
+DAEMON_SETTLE = 2.0
+DAEMON_MAX_DELAY = 30.0
+DAEMON_REFRESH = 600.0
+
+
+class Inotify:
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            self._add_watch = libc.inotify_add_watch
+            self._rm_watch = libc.inotify_rm_watch
+            init = libc.inotify_init1
+        except (OSError, AttributeError) as e:
+            raise OSError(f"inotify unavailable: {e}")
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._get_errno = ctypes.get_errno
+        self.fd = init(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(self._get_errno(), "inotify_init1 failed")
+        self.paths = {}  # wd -> directory
+        self.wds = {}  # directory -> wd
+
+    def add(self, path):
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(self._get_errno(), "inotify_add_watch failed", path)
+        self.paths[wd] = path
+        self.wds[path] = wd
+
+    def remove(self, path):
+        wd = self.wds.pop(path, None)
+        if wd is not None:
+            self.paths.pop(wd, None)
+            self._rm_watch(self.fd, wd)
+
+    def read(self, timeout):
+        # [(directory, name, mask)]; name is "" for events on the directory itself.
+        import select
+        import struct
+
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, size = struct.unpack_from("iIII", data, offset)
+            name = data[offset + 16:offset + 16 + size].rstrip(b"\0").decode(errors="surrogateescape")
+            offset += 16 + size
+            if mask & IN_Q_OVERFLOW:
+                events.append(("", "", IN_Q_OVERFLOW))
+                continue
+            path = self.paths.get(wd)
+            if mask & IN_IGNORED:
+                if path is not None and self.wds.get(path) == wd:
+                    del self.wds[path]
+                self.paths.pop(wd, None)
+                continue
+            if path is not None:
+                events.append((path, name, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    # Same interface as Inotify, comparing directory listings (mtime, size).
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        self.dirs = {}
+
+    @staticmethod
+    def _listing(path):
+        entries = {}
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                    entries[entry.name] = (entry.is_dir(follow_symlinks=False), st.st_mtime_ns, st.st_size)
+                except OSError:
+                    pass
+        return entries
+
+    def add(self, path):
+        self.dirs[path] = self._listing(path)
+
+    def remove(self, path):
+        self.dirs.pop(path, None)
+
+    def read(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        events = []
+        for path, before in list(self.dirs.items()):
+            try:
+                after = self._listing(path)
+            except OSError:
+                del self.dirs[path]
+                events.append((path, "", IN_DELETE_SELF))
+                continue
+            self.dirs[path] = after
+            for name, (is_dir, mtime, size) in after.items():
+                flag = IN_ISDIR if is_dir else 0
+                if name not in before:
+                    events.append((path, name, IN_CREATE | flag))
+                elif before[name] != (is_dir, mtime, size) and not is_dir:
+                    events.append((path, name, IN_CLOSE_WRITE))
+            for name, (is_dir, _, _) in before.items():
+                if name not in after:
+                    events.append((path, name, IN_DELETE | (IN_ISDIR if is_dir else 0)))
+        return events
+
+    def close(self):
+        self.dirs.clear()
+
+
+def open_watcher(poll_interval=5.0):
     try:
-        with urllib.request.urlopen(req, jsondata) as response:
-            print("Success! Server response:", response.read().decode())
-    except Exception as e:
-        print(f"Error sending data: {e}")
+        return Inotify()
+    except OSError:
+        return PollingWatcher(poll_interval)
+
+
+def read_app_file(path):
+    # The capture rules of iter_app_tree for one file; None if it is not captured.
+    if any(path.endswith(ext) for ext in IGNORE_EXTS):
+        return None
+    try:
+        if not os.path.isfile(path) or os.path.getsize(path) > MAX_FILE_SIZE:
+            return None
+        content = GOVERNOR.read_text(path)
+    except OSError:
+        return None
+    return None if '\0' in content else content
+
+
+class Daemon:
+    def __init__(self, data, push, watcher=None, settle=DAEMON_SETTLE, max_delay=DAEMON_MAX_DELAY,
+                 refresh=DAEMON_REFRESH, cron_dirs=None, refresh_files=None, conffiles=None):
+        # data: the baseline scan dict, kept current as deltas are applied.
+        # push(ops) returns False when the server refused the delta.
+        # conffiles: {path: packaged digest}, read from the package database
+        # at start when not given.
+        self.data = data
+        self.conffiles = conffiles
+        self.push = push
+        self.watcher = watcher or open_watcher()
+        self.settle = settle
+        self.max_delay = max_delay
+        self.refresh = refresh
+        self.cron_dirs = CRON_SPOOL_DIRS if cron_dirs is None else cron_dirs
+        self.refresh_files = REFRESH_FILES if refresh_files is None else refresh_files
+        self.targets = {}  # directory -> [target]
+        self.dirty = {}  # (section, group, key) -> path
+        self.first_dirty = self.last_event = None
+        self.next_refresh = time.monotonic() + refresh
+        self.stats = {"events": 0, "batches": 0, "ops": 0, "watches": 0}
+
+    # Watches
+
+    def _watch(self, directory, target):
+        if directory not in self.targets:
+            try:
+                self.watcher.add(directory)
+            except OSError:
+                return False
+            self.targets[directory] = []
+            self.stats["watches"] += 1
+        if target not in self.targets[directory]:
+            self.targets[directory].append(target)
+        return True
+
+    def _watch_file(self, path, section, group, key):
+        self._watch(os.path.dirname(path) or "/", ("file", os.path.basename(path), section, group, key))
+
+    def _watch_tree(self, section, group, root, top=None):
+        for directory, dirs, _ in os.walk(top or root):
+            dirs[:] = [d for d in dirs if d not in IGNORE_DIRS]
+            self._watch(directory, ("tree", section, group, root))
+
+    def start(self):
+        data = self.data
+        if self.conffiles is None:
+            self.conffiles = package_conffiles() or {}
+        # Every owned conffile is watched, edited yet or not; collect keeps
+        # only those that differ from the package.
+        paths = set(data.get("config_files") or {})
+        paths.update(self.conffiles)
+        paths.update(service_config_paths(data.get("running_services") or [], self.conffiles))
+        for path in sorted(paths):
+            self._watch_file(path, "config_files", None, path)
+        for directory in self.cron_dirs:
+            if os.path.isdir(directory):
+                self._watch(directory, ("cron",))
+        for path, section in self.refresh_files.items():
+            if os.path.exists(path):
+                self._watch_file(path, section, None, None)
+        for proc in data.get("pm2_processes") or []:
+            name, path = proc.get("name"), proc.get("path")
+            if name and path and os.path.isdir(path):
+                data.setdefault("custom_app_configs", {}).setdefault(name, {})
+                self._watch_tree("custom_app_configs", name, path)
+        for app in data.get("generic_apps") or []:
+            name = app.get("name") or app.get("service_name")
+            if not name:
+                continue
+            if app.get("app_path") and os.path.isdir(app["app_path"]):
+                self._watch_tree("generic_apps", name, app["app_path"])
+            if app.get("unit_file_path"):
+                self._watch_file(app["unit_file_path"], "generic_apps", name, ":unit")
+
+    # Events
+
+    def handle(self, events):
+        now = time.monotonic()
+        for directory, name, mask in events:
+            self.stats["events"] += 1
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost: re-check every watched file and tree.
+                self._mark_everything()
+                continue
+            for target in list(self.targets.get(directory, ())):
+                self._mark(target, directory, name, mask)
+            if not name and mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                self.targets.pop(directory, None)
+                self.watcher.remove(directory)
+        if events:
+            self.last_event = now
+            if self.first_dirty is None and self.dirty:
+                self.first_dirty = now
+
+    def _mark(self, target, directory, name, mask):
+        if not name:
+            return
+        kind = target[0]
+        path = os.path.join(directory, name)
+        if kind == "file":
+            if name == target[1]:
+                self.dirty[target[2:]] = path
+        elif kind == "cron":
+            if name in (self.data.get("system_users") or []):
+                self.dirty[("crontabs", None, name)] = None
+        elif kind == "tree":
+            _, section, group, root = target
+            rel = os.path.relpath(path, root)
+            if mask & IN_ISDIR:
+                if name in IGNORE_DIRS:
+                    return
+                # A directory moved or created: (re)read everything under it.
+                self.dirty[(section, group, rel + "/")] = path
+                if not mask & GONE and os.path.isdir(path):
+                    self._watch_tree(section, group, root, path)
+                    for sub, dirs, files in os.walk(path):
+                        dirs[:] = [d for d in dirs if d not in IGNORE_DIRS]
+                        for file_name in files:
+                            full = os.path.join(sub, file_name)
+                            self.dirty[(section, group, os.path.relpath(full, root))] = full
+            else:
+                self.dirty[(section, group, rel)] = path
+
+    def _mark_everything(self):
+        for directory, targets in list(self.targets.items()):
+            for target in targets:
+                if target[0] == "file":
+                    self._mark(target, directory, target[1], IN_CLOSE_WRITE)
+                elif target[0] == "cron":
+                    for user in self.data.get("system_users") or []:
+                        self.dirty[("crontabs", None, user)] = None
+                elif target[0] == "tree":
+                    try:
+                        names = [e.name for e in os.scandir(directory) if e.is_file(follow_symlinks=False)]
+                    except OSError:
+                        continue
+                    for name in names:
+                        self._mark(target, directory, name, IN_CLOSE_WRITE)
+        # Captured files that may have been deleted meanwhile.
+        for group, files in (self.data.get("custom_app_configs") or {}).items():
+            roots = [p.get("path") for p in self.data.get("pm2_processes") or [] if p.get("name") == group]
+            for key in files:
+                if roots and roots[0]:
+                    self.dirty.setdefault(("custom_app_configs", group, key), os.path.join(roots[0], key))
+        for app in self.data.get("generic_apps") or []:
+            name = app.get("name") or app.get("service_name")
+            if name and app.get("app_path"):
+                for key in app.get("files") or {}:
+                    self.dirty.setdefault(("generic_apps", name, key), os.path.join(app["app_path"], key))
+
+    def _due(self, now):
+        if not self.dirty:
+            return False
+        if self.first_dirty is None:
+            self.first_dirty = now
+        return now - (self.last_event or 0) >= self.settle or now - self.first_dirty >= self.max_delay
+
+    # Deltas
+
+    def _files(self, section, group):
+        if section == "custom_app_configs":
+            return self.data.setdefault(section, {}).setdefault(group, {}), None
+        for app in self.data.get("generic_apps") or []:
+            if (app.get("name") or app.get("service_name")) == group:
+                return app.setdefault("files", {}), app
+        return None, None
+
+    def collect(self):
+        # Re-reads what the coalesced events touched and returns the ops
+        # that change the in-memory scan, applying them to it.
+        dirty, self.dirty = self.dirty, {}
+        self.first_dirty = None
+        ops = []
+        refreshed = set()
+        for (section, group, key), path in sorted(dirty.items(), key=lambda i: [str(p) for p in i[0]]):
+            if key is None:
+                if section not in refreshed:
+                    refreshed.add(section)
+                    ops.extend(self._refresh(section))
+                continue
+            if section == "config_files":
+                value = None
+                if os.path.isfile(key):
+                    data = _read_config(key)
+                    # Back to the packaged content: no longer captured.
+                    if data is not None and (key not in self.conffiles
+                                             or conffile_modified(data, self.conffiles[key])):
+                        value = data.decode("utf-8", errors="ignore")
+                ops.extend(self._set(self.data.setdefault("config_files", {}), section, None, key, value))
+            elif section == "crontabs":
+                value = get_crontabs([key]).get(key)
+                ops.extend(self._set(self.data.setdefault("crontabs", {}), section, None, key, value))
+            elif key == ":unit":
+                _, app = self._files(section, group)
+                if app is not None:
+                    value = None
+                    try:
+                        value = GOVERNOR.read_text(path)
+                    except OSError:
+                        pass
+                    if value != app.get("unit_file_content"):
+                        app["unit_file_content"] = value
+                        ops.append(self._op(section, group, key, value))
+            else:
+                files, _ = self._files(section, group)
+                if files is None:
+                    continue
+                if key.endswith("/"):
+                    # Directory gone: drop everything captured under it.
+                    if path and os.path.isdir(path):
+                        continue
+                    for name in sorted(k for k in files if k.startswith(key)):
+                        ops.extend(self._set(files, section, group, name, None))
+                    for directory in [d for d in self.targets if d == path.rstrip("/") or d.startswith(path + "/")]:
+                        self.targets.pop(directory, None)
+                        self.watcher.remove(directory)
+                    continue
+                value = read_app_file(path) if path else None
+                if value is not None and key not in files and len(files) >= MAX_TOTAL_FILES:
+                    GOVERNOR.skip_file("max_files")
+                    continue
+                ops.extend(self._set(files, section, group, key, value))
+        return ops
+
+    @staticmethod
+    def _op(section, group, key, value):
+        op = {"section": section, "key": key}
+        if group is not None:
+            op["group"] = group
+        if value is None:
+            op["delete"] = True
+        else:
+            op["value"] = value
+        return op
+
+    def _set(self, files, section, group, key, value):
+        if files.get(key) == value:
+            return []
+        if value is None:
+            del files[key]
+        else:
+            files[key] = value
+        return [self._op(section, group, key, value)]
+
+    def _refresh(self, section):
+        collectors = {
+            "installed_packages": get_installed_packages,
+            "system_users": get_system_users,
+            "running_services": get_services,
+            "pm2_processes": get_pm2_processes,
+        }
+        value = collectors[section]()
+        if value == self.data.get(section):
+            return []
+        self.data[section] = value
+        return [{"section": section, "value": value}]
+
+    def flush(self):
+        ops = self.collect()
+        if not ops:
+            return True
+        self.stats["batches"] += 1
+        self.stats["ops"] += len(ops)
+        return self.push(ops) is not False
+
+    def step(self, timeout=1.0):
+        # One turn of the loop; False when the server refused a delta and the
+        # caller has to send a new baseline.
+        self.handle(self.watcher.read(timeout))
+        now = time.monotonic()
+        if self.refresh and now >= self.next_refresh:
+            self.next_refresh = now + self.refresh
+            for section in ("running_services", "pm2_processes", "installed_packages", "system_users"):
+                self.dirty[(section, None, None)] = None
+        if self._due(now):
+            return self.flush()
+        return True
+
+    def close(self):
+        self.watcher.close()
+
+
+def run_daemon(url, patch_url=None, settle=DAEMON_SETTLE, max_delay=DAEMON_MAX_DELAY, refresh=DAEMON_REFRESH):
+    patch_url = patch_url or url.replace("/api/scan/submit", "/api/scan/patch")
+    while True:
+        data = scan()
+        print("Baseline scan complete, submitting...")
+        reply = send_data(data, url)
+        if not reply:
+            time.sleep(backoff_delay(SEND_MAX_ATTEMPTS, None))
+            continue
+        state = {"version": reply.get("version") if isinstance(reply, dict) else None}
+
+        def push(ops):
+            print(f"Sending {len(ops)} change(s)...")
+            patch = {"hostname": data["hostname"], "base_version": state["version"], "ops": ops}
+            result = send_data(patch, patch_url)
+            if isinstance(result, dict):
+                state["version"] = result.get("version")
+            return result
+
+        daemon = Daemon(data, push, settle=settle, max_delay=max_delay, refresh=refresh)
+        daemon.start()
+        print(f"Watching {daemon.stats['watches']} directories ({type(daemon.watcher).__name__}).")
+        try:
+            while daemon.step():
+                pass
+        finally:
+            daemon.close()
+        print("Server refused the delta; sending a new baseline.")
+
+
+def main(argv=None):
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Collect a migration scan of this host and submit it.")
+    # Default URL if not provided (assume running from curl default)
+    # In a real scenario, the download command would inject the URL
+    parser.add_argument("url", nargs="?", default="http://localhost:8000/api/scan/submit")
+    parser.add_argument("--low-impact", action="store_true",
+                        help="Lowest CPU/IO priority, throttled file reads, time budget, scan spooled to disk")
+    parser.add_argument("--max-read-kbps", type=int, default=None,
+                        help="Cap file capture reads (KiB/s, default 2048 in low-impact mode)")
+    parser.add_argument("--time-budget", type=float, default=None,
+                        help="Seconds after which remaining sections/files are skipped (default 300 in low-impact mode)")
+    parser.add_argument("--spool-dir", default=None, help="Directory for the spooled scan (default: system temp)")
+    parser.add_argument("--bundle", default=None, metavar="PATH",
+                        help="Write an offline bundle file (or <hostname>-<time>.migb into a directory) instead of sending")
+    parser.add_argument("--volumes", default=None, metavar="JSON",
+                        help='Only print data volumes as JSON for {"services": [...], "app_paths": [...]}')
+    parser.add_argument("--volumes-budget", type=float, default=DU_TIME_BUDGET, help="Seconds for data volume sizing")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Keep running: send a baseline, then watch captured files and send deltas")
+    parser.add_argument("--settle", type=float, default=DAEMON_SETTLE,
+                        help="Daemon: seconds without changes before a delta is sent")
+    parser.add_argument("--max-delay", type=float, default=DAEMON_MAX_DELAY,
+                        help="Daemon: longest a change waits while events keep arriving")
+    parser.add_argument("--refresh", type=float, default=DAEMON_REFRESH,
+                        help="Daemon: seconds between re-checks of services, pm2 apps, packages and users")
+    args = parser.parse_args(argv)
+
+    if args.volumes is not None:
+        spec = json.loads(args.volumes)
+        print(json.dumps(get_data_volumes(spec.get("services", []), spec.get("app_paths", []),
+                                          time_budget=args.volumes_budget)))
+        return
+
+    global GOVERNOR
+    low = args.low_impact
+    read_kbps = args.max_read_kbps if args.max_read_kbps is not None else (2048 if low else 0)
+    budget = args.time_budget if args.time_budget is not None else (300 if low else 0)
+    GOVERNOR = Governor(max_read_bytes_per_sec=read_kbps * 1024, time_budget=budget)
+
+    if args.daemon:
+        if low:
+            GOVERNOR.lower_priority()
+        # The time budget is for one-shot scans; a daemon's reads are spread out.
+        GOVERNOR.time_budget = 0
+        run_daemon(args.url, settle=args.settle, max_delay=args.max_delay, refresh=args.refresh)
+        return
+
+    if args.bundle:
+        if low:
+            GOVERNOR.lower_priority()
+        path = write_bundle(args.bundle, project=url_project(args.url))
+        print(f"Scan Complete ({os.path.getsize(path)} bytes bundled to {path}).")
+        print("Import it with: migrator_cli.py import-bundles, or POST /api/scan/import on the server.")
+        return
+
+    if not low:
+        scan_data = scan()
+        print("Scan Complete.")
+        print(json.dumps(scan_data, indent=2))
+
+        # Auto-send
+        if args.url:
+            send_data(scan_data, args.url)
+        return
+
+    GOVERNOR.lower_priority()
+    fd, spool_path = tempfile.mkstemp(prefix="migrator-scan-", suffix=".json", dir=args.spool_dir)
+    os.close(fd)
+    try:
+        scan(Spool(spool_path))
+        stats = GOVERNOR.stats()
+        print(f"Scan Complete ({os.path.getsize(spool_path)} bytes spooled).")
+        print(json.dumps(stats, indent=2))
+        if args.url:
+            send_data(spool_path, args.url)
+    finally:
+        os.remove(spool_path)
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        # Default URL if not provided (assume running from curl default)
-        # In a real scenario, the download command would inject the URL
-        target_url = "http://localhost:8000/api/scan/submit"
-    else:
-        target_url = sys.argv[1]
-    
-    scan_data = scan()
-    print("Scan Complete.")
-    print(json.dumps(scan_data, indent=2))
-    
-    # Auto-send
-    if target_url:
-        send_data(scan_data, target_url)
+    main()
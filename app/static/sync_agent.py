@@ -0,0 +1,417 @@
+import hashlib
+import json
+import os
+import random
+import struct
+import sys
+import threading
+
+# Data sync target side. Runs on the migrated host (piped over SSH, see
+# app/core/datasync.py), so like agent.py it must stay a standalone script.
+
+STATE_DIR = ".migrator-sync"
+WINDOW = 32
+AVG_BITS = 16
+MIN_CHUNK = 16 * 1024
+MAX_CHUNK = 256 * 1024
+READ_BLOCK = 512 * 1024
+DIGEST_SIZE = 16
+
+
+def chunk_digest(data):
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).hexdigest()
+
+
+class Chunker:
+    # Content-defined chunking. The rolling hash at byte i is the sum of two
+    # random 8-bit table lookups (one 16-bit value per byte) over the last
+    # WINDOW bytes; a chunk may end where its low AVG_BITS bits are zero. All
+    # window sums of a block are computed at once with big-int lanes (24 bits
+    # per byte, log2(WINDOW) shift+add steps), so no per-byte Python loop runs.
+    def __init__(self, avg_bits=AVG_BITS, min_size=MIN_CHUNK, max_size=MAX_CHUNK, window=WINDOW, seed=0x6d696772):
+        if window & (window - 1) or not 1 <= avg_bits <= 16:
+            raise ValueError("window must be a power of two and avg_bits between 1 and 16")
+        self.window = window
+        self.min_size = min_size
+        self.max_size = max_size
+        rng = random.Random(seed)
+        self._lo = bytes(rng.randrange(256) for _ in range(256))
+        self._hi = bytes(rng.randrange(256) for _ in range(256))
+        low_mask = (1 << min(avg_bits, 8)) - 1
+        high_mask = (1 << max(avg_bits - 8, 0)) - 1
+        self._zero_lo = bytes(1 if v & low_mask == 0 else 0 for v in range(256))
+        self._zero_hi = bytes(1 if v & high_mask == 0 else 0 for v in range(256))
+
+    def candidates(self, data, skip=0):
+        # End offsets (exclusive) of every window position past `skip` whose
+        # hash matches. Positions before WINDOW-1 see a partial window.
+        n = len(data)
+        if n == 0:
+            return []
+        lanes = bytearray(3 * n)
+        lanes[0::3] = data.translate(self._lo)
+        lanes[1::3] = data.translate(self._hi)
+        x = int.from_bytes(lanes, "little")
+        width = 1
+        while width < self.window:
+            x += x << (24 * width)
+            width *= 2
+        sums = (x & ((1 << (24 * n)) - 1)).to_bytes(3 * n, "little")
+        hits = (
+            int.from_bytes(sums[0::3].translate(self._zero_lo), "little")
+            & int.from_bytes(sums[1::3].translate(self._zero_hi), "little")
+        ).to_bytes(n, "little")
+        found = []
+        pos = hits.find(1, skip)
+        while pos != -1:
+            found.append(pos + 1)
+            pos = hits.find(1, pos + 1)
+        return found
+
+    def _cuts(self, candidates, length, start, final):
+        cuts = []
+        for c in candidates:
+            while c - start > self.max_size:
+                start += self.max_size
+                cuts.append(start)
+            if c - start >= self.min_size:
+                cuts.append(c)
+                start = c
+        while length - start >= self.max_size:
+            start += self.max_size
+            cuts.append(start)
+        if final and length > start:
+            cuts.append(length)
+        return cuts
+
+    def split(self, f, block_size=READ_BLOCK):
+        # Yields (offset, data, digest). Boundaries do not depend on the read
+        # block size; memory is one block plus one pending chunk.
+        context = b""
+        pending = b""
+        pending_candidates = []
+        offset = 0
+        while True:
+            block = f.read(block_size)
+            final = not block
+            data = pending + block
+            if block:
+                ctx = (context + pending)[-(self.window - 1):] if self.window > 1 else b""
+                found = self.candidates(ctx + block, skip=len(ctx))
+                shift = len(pending) - len(ctx)
+                candidates = pending_candidates + [p + shift for p in found]
+            else:
+                candidates = pending_candidates
+            start = 0
+            for cut in self._cuts(candidates, len(data), 0, final):
+                chunk = data[start:cut]
+                yield offset + start, chunk, chunk_digest(chunk)
+                start = cut
+            full = context + data
+            tail = len(context) + start
+            context = full[max(0, tail - (self.window - 1)):tail]
+            pending = data[start:]
+            pending_candidates = [c - start for c in candidates if c > start]
+            offset += start
+            if final:
+                return
+
+
+def safe_path(root, rel):
+    rel = rel.replace("\\", "/")
+    if rel.startswith("/") or any(part in ("", "..") for part in rel.split("/")) or rel.split("/")[0] == STATE_DIR:
+        raise ValueError(f"Unsafe path: {rel!r}")
+    return os.path.join(root, *rel.split("/"))
+
+
+class Target:
+    # Receives chunks and assembles files under root. Known chunks are read
+    # back from files already synced (recorded in an append-only journal),
+    # new ones are staged on disk until their file is committed, so an
+    # interrupted sync resumes without resending anything it already sent.
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.state_dir = os.path.join(self.root, STATE_DIR)
+        self.staging = os.path.join(self.state_dir, "staging")
+        self.journal_path = os.path.join(self.state_dir, "manifest.jsonl")
+        os.makedirs(self.staging, exist_ok=True)
+        self.files = {}
+        self.index = {}
+        self.lock = threading.RLock()
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line after a crash
+                    self._apply(record)
+        self.journal = open(self.journal_path, "a")
+
+    def _apply(self, record):
+        path = record["path"]
+        old = self.files.pop(path, None)
+        if old is not None:
+            for digest, _ in old.get("chunks", ()):
+                location = self.index.get(digest)
+                if location is not None and location[0] == path:
+                    del self.index[digest]
+        if record.get("deleted"):
+            return
+        self.files[path] = record
+        offset = 0
+        for digest, length in record.get("chunks", ()):
+            self.index.setdefault(digest, (path, offset, length))
+            offset += length
+
+    def _record(self, record):
+        self._apply(record)
+        self.journal.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.journal.flush()
+
+    def _intact(self, path):
+        record = self.files.get(path)
+        if record is None:
+            return False
+        try:
+            st = os.lstat(safe_path(self.root, path))
+        except OSError:
+            return False
+        return [st.st_size, st.st_mtime_ns] == record.get("local")
+
+    def _staged(self, digest):
+        return os.path.join(self.staging, digest)
+
+    def check(self, path, size, mtime_ns, mode=None):
+        with self.lock:
+            record = self.files.get(path)
+            return (
+                record is not None and record.get("size") == size and record.get("mtime_ns") == mtime_ns
+                and (mode is None or record.get("mode") == mode) and self._intact(path)
+            )
+
+    def _available(self, digest):
+        location = self.index.get(digest)
+        if location is not None and self._intact(location[0]):
+            return True
+        return os.path.exists(self._staged(digest))
+
+    def missing(self, digests):
+        with self.lock:
+            return [d for d in dict.fromkeys(digests) if not self._available(d)]
+
+    def put_chunk(self, digest, data):
+        if chunk_digest(data) != digest:
+            raise ValueError(f"Chunk {digest} does not match its content")
+        path = self._staged(digest)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _read_chunk(self, digest, handles):
+        with self.lock:
+            location = self.index.get(digest)
+            if location is not None and not self._intact(location[0]):
+                location = None
+        if location is not None:
+            path, offset, length = location
+            f = handles.get(path)
+            if f is None:
+                f = handles[path] = open(safe_path(self.root, path), "rb")
+            f.seek(offset)
+            data = f.read(length)
+            if chunk_digest(data) == digest:
+                return data, False
+        try:
+            with open(self._staged(digest), "rb") as f:
+                return f.read(), True
+        except OSError:
+            return None, False
+
+    def commit(self, path, size, mtime_ns, mode, chunks, uid=None, gid=None):
+        # Returns the digests that are not available (nothing is written then).
+        dest = safe_path(self.root, path)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = os.path.join(os.path.dirname(dest), f".{os.path.basename(dest)}.migrator-tmp")
+        handles = {}
+        staged = []
+        missing = []
+        try:
+            with open(tmp, "wb") as out:
+                for digest, _ in chunks:
+                    data, from_staging = self._read_chunk(digest, handles)
+                    if data is None:
+                        missing.append(digest)
+                    elif not missing:
+                        out.write(data)
+                        if from_staging:
+                            staged.append(digest)
+        finally:
+            for f in handles.values():
+                f.close()
+        if missing:
+            os.remove(tmp)
+            return list(dict.fromkeys(missing))
+        os.chmod(tmp, mode & 0o7777)
+        if uid is not None and hasattr(os, "geteuid") and os.geteuid() == 0:
+            try:
+                os.chown(tmp, uid, gid)
+            except OSError:
+                pass
+        os.utime(tmp, ns=(mtime_ns, mtime_ns))
+        with self.lock:
+            os.replace(tmp, dest)
+            st = os.lstat(dest)
+            self._record({
+                "path": path, "size": size, "mtime_ns": mtime_ns, "mode": mode,
+                "chunks": chunks, "local": [st.st_size, st.st_mtime_ns],
+            })
+            for digest in staged:
+                try:
+                    os.remove(self._staged(digest))
+                except OSError:
+                    pass
+        return []
+
+    def link(self, path, target, mtime_ns=None):
+        dest = safe_path(self.root, path)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        with self.lock:
+            if os.path.islink(dest) and os.readlink(dest) == target:
+                return False
+            if os.path.lexists(dest):
+                os.remove(dest)
+            os.symlink(target, dest)
+            self._record({"path": path, "deleted": True})
+        return True
+
+    def prune(self, keep):
+        # Removes files under root that the source no longer has.
+        keep = set(keep)
+        removed = 0
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            rel_dir = os.path.relpath(dirpath, self.root).replace(os.sep, "/")
+            if rel_dir == ".":
+                dirnames[:] = [d for d in dirnames if d != STATE_DIR]
+                rel_dir = ""
+            for name in filenames + [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]:
+                rel = f"{rel_dir}/{name}" if rel_dir else name
+                if rel not in keep and not name.endswith(".migrator-tmp"):
+                    os.remove(os.path.join(dirpath, name))
+                    with self.lock:
+                        if rel in self.files:
+                            self._record({"path": rel, "deleted": True})
+                    removed += 1
+        return removed
+
+    def stats(self):
+        with self.lock:
+            staged = len(os.listdir(self.staging))
+            return {"files": len(self.files), "chunks": len(self.index), "staged_chunks": staged}
+
+    def close(self):
+        # Compacts the journal to one line per file.
+        with self.lock:
+            self.journal.close()
+            tmp = self.journal_path + ".tmp"
+            with open(tmp, "w") as f:
+                for record in self.files.values():
+                    f.write(json.dumps(record, separators=(",", ":")) + "\n")
+            os.replace(tmp, self.journal_path)
+
+
+# Wire protocol: frames of a 4-byte big-endian header length, a JSON header,
+# and header["bytes"] bytes of payload. Requests carry an "id"; replies echo it
+# and may arrive out of order.
+def write_frame(f, header, payload=b""):
+    if payload:
+        header = dict(header, bytes=len(payload))
+    raw = json.dumps(header, separators=(",", ":")).encode()
+    f.write(struct.pack(">I", len(raw)) + raw)
+    if payload:
+        f.write(payload)
+    f.flush()
+
+
+def _read_exact(f, size):
+    data = f.read(size)
+    while data is not None and len(data) < size:
+        more = f.read(size - len(data))
+        if not more:
+            break
+        data += more
+    return data
+
+
+def read_frame(f):
+    head = _read_exact(f, 4)
+    if not head or len(head) < 4:
+        return None, b""
+    header = json.loads(_read_exact(f, struct.unpack(">I", head)[0]))
+    payload = _read_exact(f, header["bytes"]) if header.get("bytes") else b""
+    return header, payload
+
+
+def handle(target, header, payload):
+    op = header["op"]
+    if op == "check":
+        return {"current": target.check(header["path"], header["size"], header["mtime_ns"], header.get("mode"))}
+    if op == "missing":
+        return {"missing": target.missing(header["digests"])}
+    if op == "chunk":
+        target.put_chunk(header["digest"], payload)
+        return {}
+    if op == "commit":
+        return {"missing": target.commit(header["path"], header["size"], header["mtime_ns"], header["mode"],
+                                         header["chunks"], header.get("uid"), header.get("gid"))}
+    if op == "link":
+        return {"changed": target.link(header["path"], header["target"])}
+    if op == "prune":
+        return {"removed": target.prune(header["keep"])}
+    if op == "stats":
+        return target.stats()
+    raise ValueError(f"Unknown op {op!r}")
+
+
+def serve(root, reader, writer, workers=4):
+    from concurrent.futures import ThreadPoolExecutor
+
+    target = Target(root)
+    write_lock = threading.Lock()
+
+    def run(header, payload):
+        try:
+            reply = handle(target, header, payload)
+            reply["ok"] = True
+        except Exception as e:
+            reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        reply["id"] = header.get("id")
+        with write_lock:
+            write_frame(writer, reply)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            header, payload = read_frame(reader)
+            if header is None or header.get("op") == "close":
+                break
+            pool.submit(run, header, payload)
+    target.close()
+    with write_lock:
+        write_frame(writer, {"id": header.get("id") if header else None, "ok": True, "closed": True})
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Data sync target: receives chunked files over stdin/stdout.")
+    parser.add_argument("command", choices=["serve"])
+    parser.add_argument("root")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args(argv)
+    os.makedirs(args.root, exist_ok=True)
+    serve(args.root, sys.stdin.buffer, sys.stdout.buffer, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
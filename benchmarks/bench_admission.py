@@ -0,0 +1,167 @@
+import contextlib
+import io
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.fleet import generate_scan
+from benchmarks.harness import ROOT_DIR, summarize, write_results
+from app.static import agent
+
+app = typer.Typer()
+console = Console()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _peak_rss(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _wait_ready(url: str, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url + "/health", timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def run_herd(hosts: int, projects: int, env: dict, payloads: list, attempts: int) -> dict:
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT_DIR, env=dict(os.environ, **env),
+    )
+    try:
+        _wait_ready(url)
+        done = threading.Event()
+        health = []
+        retries = []
+        outcomes = []
+        lock = threading.Lock()
+
+        def probe():
+            # Health checks during the herd show whether the server stays responsive.
+            while not done.is_set():
+                t0 = time.perf_counter()
+                try:
+                    urllib.request.urlopen(url + "/health", timeout=30).read()
+                    health.append(time.perf_counter() - t0)
+                except OSError:
+                    health.append(30.0)
+                time.sleep(0.05)
+
+        def client(index: int):
+            waits = []
+
+            def sleep(seconds):
+                waits.append(seconds)
+                time.sleep(seconds)
+
+            target = f"{url}/api/scan/submit?project=herd-{index % projects}"
+            t0 = time.perf_counter()
+            ok = agent.send_data(payloads[index % len(payloads)], target, max_attempts=attempts, sleep=sleep)
+            with lock:
+                outcomes.append((ok, time.perf_counter() - t0))
+                retries.append(len(waits))
+
+        prober = threading.Thread(target=probe, daemon=True)
+        prober.start()
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(hosts)]
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        elapsed = time.perf_counter() - start
+        done.set()
+        prober.join()
+
+        metrics_text = urllib.request.urlopen(url + "/metrics").read().decode()
+        rejected = sum(
+            float(line.rsplit(" ", 1)[1]) for line in metrics_text.splitlines()
+            if line.startswith("migrator_ingest_rejected_total{")
+        )
+        return {
+            "elapsed": elapsed,
+            "succeeded": sum(1 for ok, _ in outcomes if ok),
+            "failed": sum(1 for ok, _ in outcomes if not ok),
+            "latencies": [seconds for _, seconds in outcomes],
+            "health": health,
+            "retries": sum(retries),
+            "rejected": int(rejected),
+            "peak_rss": _peak_rss(server.pid),
+        }
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+@app.command()
+def run(
+    hosts: int = typer.Option(300, help="Agents posting at the same moment"),
+    projects: int = typer.Option(3, help="Projects the agents are spread over"),
+    files_per_app: int = typer.Option(40, help="Captured files per app (payload size)"),
+    file_size: int = typer.Option(4096, help="Bytes per captured file"),
+    concurrency: int = typer.Option(4, help="MIGRATOR_INGEST_CONCURRENCY for the guarded run"),
+    queue: int = typer.Option(64, help="MIGRATOR_INGEST_QUEUE for the guarded run"),
+    attempts: int = typer.Option(10, help="Agent upload attempts"),
+    unguarded: bool = typer.Option(True, help="Also run with admission control disabled"),
+    output: str = typer.Option(None, help="Write JSON results to this path"),
+):
+    params = {"hosts": hosts, "projects": projects, "files_per_app": files_per_app, "file_size": file_size,
+              "concurrency": concurrency, "queue": queue, "attempts": attempts}
+    payloads = [generate_scan(i, files_per_app=files_per_app, file_size=file_size).model_dump() for i in range(20)]
+    modes = [("admission", {"MIGRATOR_INGEST_CONCURRENCY": str(concurrency), "MIGRATOR_INGEST_QUEUE": str(queue)})]
+    if unguarded:
+        modes.append(("unguarded", {"MIGRATOR_INGEST_CONCURRENCY": "0"}))
+
+    results = []
+    for name, env in modes:
+        console.print(f"Running {hosts} agents against the {name} server...")
+        herd = run_herd(hosts, projects, env, payloads, attempts)
+        results.append(summarize(
+            name, herd["latencies"], herd["elapsed"], herd["peak_rss"],
+            succeeded=herd["succeeded"], failed=herd["failed"], retries=herd["retries"],
+            rejected=herd["rejected"], health=summarize("health", herd["health"], herd["elapsed"]),
+        ))
+
+    table = Table(title=f"Scan Submit Herd ({hosts} agents)")
+    for column in ("Mode", "OK", "Failed", "429s", "Upload p50 s", "Upload p99 s", "Health p99 ms", "Server peak RSS MiB"):
+        table.add_column(column, justify="left" if column == "Mode" else "right")
+    for r in results:
+        table.add_row(
+            r["name"], str(r["succeeded"]), str(r["failed"]), str(r["rejected"]),
+            f"{r['latency_ms']['p50'] / 1000:.2f}", f"{r['latency_ms']['p99'] / 1000:.2f}",
+            f"{r['health']['latency_ms']['p99']:.1f}", f"{r['peak_memory_bytes'] / 2 ** 20:.0f}",
+        )
+    console.print(table)
+    write_results(output, "admission", params, results)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,118 @@
+import gzip
+import os
+import tempfile
+import time
+import tracemalloc
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.fleet import generate_similar_scan
+from benchmarks.harness import summarize, write_results
+from app.core import bundles
+from app.models import ScanResult
+from app.static import agent
+
+app = typer.Typer()
+console = Console()
+
+
+def _gzip_json(path: str) -> ScanResult:
+    # Baseline: one gzip-compressed JSON document, read and inflated whole.
+    with open(path, "rb") as f:
+        return ScanResult.model_validate_json(gzip.decompress(f.read()))
+
+
+def _peak(fn, path: str) -> int:
+    bundles._blobs.clear()
+    tracemalloc.start()
+    fn(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+@app.command()
+def run(
+    hosts: int = typer.Option(300, help="Bundles in the import directory"),
+    roles: int = typer.Option(6, help="Server images the hosts are deployed from"),
+    files_per_app: int = typer.Option(100, help="Captured files per app"),
+    file_size: int = typer.Option(4096, help="Bytes per captured file"),
+    workers: int = typer.Option(os.cpu_count() or 1, help="Import worker processes"),
+    output: str = typer.Option(None, help="Write JSON results to this path"),
+):
+    params = {"hosts": hosts, "roles": roles, "files_per_app": files_per_app, "file_size": file_size,
+              "workers": workers}
+    with tempfile.TemporaryDirectory() as tmp:
+        src, plain = os.path.join(tmp, "bundles"), os.path.join(tmp, "gzip")
+        os.makedirs(src)
+        os.makedirs(plain)
+        json_bytes = gzip_bytes = 0
+        for i in range(hosts):
+            scan = generate_similar_scan(i, roles=roles, files_per_app=files_per_app, file_size=file_size)
+            body = scan.model_dump_json().encode()
+            json_bytes += len(body)
+            packed = gzip.compress(body, 6)
+            gzip_bytes += len(packed)
+            with open(os.path.join(plain, f"{scan.hostname}.json.gz"), "wb") as f:
+                f.write(packed)
+            agent.feed(agent.Bundle(os.path.join(src, f"{scan.hostname}.migb"), {"created": float(i)}),
+                       scan.model_dump(mode="json"))
+        bundle_bytes = sum(os.path.getsize(p) for p in bundles.bundle_paths(src))
+        # A second drop of the same bundles, as when sites re-send everything.
+        for name in os.listdir(src)[: hosts // 4]:
+            os.link(os.path.join(src, name), os.path.join(src, "resent-" + name))
+
+        results = []
+        gz_paths = sorted(os.path.join(plain, n) for n in os.listdir(plain))
+        latencies = []
+        start = time.perf_counter()
+        for path in gz_paths:
+            t0 = time.perf_counter()
+            _gzip_json(path)
+            latencies.append(time.perf_counter() - t0)
+        results.append(summarize("gzip json, decode", latencies, time.perf_counter() - start,
+                                 _peak(_gzip_json, gz_paths[0]), bytes=gzip_bytes))
+
+        paths = [p for p in bundles.bundle_paths(src) if "resent-" not in p]
+        bundles._blobs.clear()
+        latencies = []
+        start = time.perf_counter()
+        for path in paths:
+            t0 = time.perf_counter()
+            bundles.read_bundle(path)
+            latencies.append(time.perf_counter() - t0)
+        results.append(summarize("bundle, decode", latencies, time.perf_counter() - start,
+                                 _peak(bundles.read_bundle, paths[0]), bytes=bundle_bytes))
+
+        # Import into batch results: decode, dedup and write result.json.
+        for count in sorted({1, workers}):
+            bundles._blobs.clear()
+            reused = bundles.BLOB_REUSED.value()
+            out = os.path.join(tmp, f"results-{count}")
+            start = time.perf_counter()
+            summary = bundles.import_to_results(src, out, workers=count)
+            elapsed = time.perf_counter() - start
+            assert len(summary["imported"]) == hosts and not summary["failed"], summary["failed"]
+            results.append(summarize(
+                f"bundle import, {count} worker(s)", [elapsed / hosts] * hosts, elapsed,
+                results[1]["peak_memory_bytes"], bytes=bundle_bytes,
+                skipped=len(summary["skipped"]), blobs_reused=int(bundles.BLOB_REUSED.value() - reused),
+            ))
+
+    table = Table(title=f"Importing {hosts} offline scans ({json_bytes / 2 ** 20:.1f} MiB of scan JSON)")
+    for column in ("Mode", "On disk MiB", "Total s", "Hosts/s", "Peak MiB per bundle"):
+        table.add_column(column, justify="left" if column == "Mode" else "right")
+    for r in results:
+        table.add_row(r["name"], f"{r['bytes'] / 2 ** 20:.1f}", f"{r['elapsed_s']:.2f}",
+                      f"{r['throughput_ops_s']:.1f}", f"{r['peak_memory_bytes'] / 2 ** 20:.1f}")
+    console.print(table)
+    console.print(f"Duplicate bundles skipped from the index alone: {results[-1]['skipped']}; "
+                  f"file bodies reused (single process): {results[2]['blobs_reused']:,}")
+    params["json_bytes"] = json_bytes
+    write_results(output, "bundles", params, results)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,83 @@
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+
+import typer
+from rich.console import Console
+
+from benchmarks.harness import summarize, write_results
+from app.core import capture
+
+app = typer.Typer()
+console = Console()
+
+
+def build_tree(root: str, apps: int, files: int, size: int, seed: int = 0):
+    rng = random.Random(seed)
+    words = [f"key{n}" for n in range(500)]
+    roots = []
+    for a in range(apps):
+        app_root = os.path.join(root, f"app-{a}")
+        roots.append(app_root)
+        for n in range(files):
+            path = os.path.join(app_root, f"dir{n % 10}", f"file{n}.js")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                text = []
+                total = 0
+                while total < size:
+                    line = f"const {rng.choice(words)} = {rng.randint(0, 10 ** 6)};\n"
+                    text.append(line)
+                    total += len(line)
+                f.write("".join(text)[:size])
+    return roots
+
+
+@app.command()
+def run(
+    apps: int = typer.Option(20, help="App trees to capture"),
+    files: int = typer.Option(200, help="Files per app"),
+    size: int = typer.Option(16384, help="Bytes per file"),
+    repeat: int = typer.Option(3, help="Capture passes"),
+    gzip_level: int = typer.Option(capture.GZIP_LEVEL, help="Remote gzip level"),
+    output: str = typer.Option(None, help="Write JSON results to this path"),
+):
+    # Runs the remote capture script through a local shell, which isolates the
+    # find/tar/gzip pipeline and the streaming unpack from the network link.
+    tmp = tempfile.mkdtemp(prefix="bench-capture-")
+    try:
+        roots = build_tree(tmp, apps, files, size)
+        script = capture.capture_script(roots, [], gzip_level=gzip_level)
+        latencies, stats = [], []
+        for _ in range(repeat):
+            proc = subprocess.Popen(["bash", "-s"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            proc.stdin.write(script.encode())
+            proc.stdin.close()
+            result = capture.unpack_capture(proc.stdout, roots, [])
+            proc.wait()
+            latencies.append(result["stats"]["seconds"])
+            stats.append(result["stats"])
+        last = stats[-1]
+        report = summarize(
+            "bulk_capture", latencies, sum(latencies),
+            files=last["files"],
+            raw_bytes=last["raw_bytes"],
+            compressed_bytes=last["compressed_bytes"],
+            raw_mb_per_s=round(last["raw_bytes"] / min(latencies) / 2 ** 20, 2),
+            compressed_mb_per_s=round(last["compressed_bytes"] / min(latencies) / 2 ** 20, 2),
+        )
+        console.print(
+            f"{last['files']} files, {last['raw_bytes'] / 2 ** 20:.1f} MiB raw, "
+            f"{last['compressed_bytes'] / 2 ** 20:.1f} MiB on the wire: "
+            f"{report['raw_mb_per_s']} MiB/s raw, {report['compressed_mb_per_s']} MiB/s compressed "
+            f"(link bandwidth above this is not the bottleneck)"
+        )
+        write_results(output, "capture", {"apps": apps, "files": files, "size": size, "gzip_level": gzip_level}, [report])
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,94 @@
+import json
+import os
+import tempfile
+import time
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.fleet import generate_scan, generate_similar_scan
+from benchmarks.harness import write_results
+from app.core import analyzer, builder, clusters
+from app.models import BuildConfig
+
+app = typer.Typer()
+console = Console()
+
+
+def _write_batch(results_dir: str, hosts: int, roles: int, unique: int, files_per_app: int):
+    # A batch results directory: `roles` groups of near-identical hosts plus
+    # `unique` unrelated ones.
+    for i in range(hosts):
+        if i < hosts - unique:
+            scan = generate_similar_scan(i, roles=roles, files_per_app=files_per_app)
+        else:
+            scan = generate_scan(100_000 + i, files_per_app=files_per_app)
+        host_dir = os.path.join(results_dir, f"host-{i:05d}")
+        os.makedirs(host_dir)
+        with open(os.path.join(host_dir, "result.json"), "w") as f:
+            json.dump({"status": "done", "project": "bench", "scan": scan.model_dump()}, f)
+
+
+@app.command()
+def run(
+    hosts: int = typer.Option(2000, help="Hosts in the batch results"),
+    roles: int = typer.Option(10, help="Groups of near-identical hosts"),
+    unique: int = typer.Option(50, help="Unrelated hosts"),
+    files_per_app: int = typer.Option(20, help="Captured files per app"),
+    sample: int = typer.Option(50, help="Hosts built individually to estimate the per-host cost"),
+    output: str = typer.Option(None, help="Write JSON results to this path"),
+):
+    params = {"hosts": hosts, "roles": roles, "unique": unique, "files_per_app": files_per_app, "sample": sample}
+    with tempfile.TemporaryDirectory() as tmp:
+        results_dir = os.path.join(tmp, "batch")
+        console.print(f"Writing {hosts} host results...")
+        _write_batch(results_dir, hosts, roles, unique, files_per_app)
+
+        start = time.perf_counter()
+        manifest = clusters.build_clusters(results_dir, os.path.join(tmp, "clusters"))
+        clustered_seconds = time.perf_counter() - start
+
+        # Per-host baseline: analyze and build a sample of hosts one by one.
+        per_host_seconds, per_host_bytes = 0.0, 0
+        keys = [key for key, _ in clusters.batch_hosts(results_dir)]
+        for key in keys[:: max(1, len(keys) // sample)][:sample]:
+            _, scan = clusters._load(os.path.join(results_dir, key, "result.json"))
+            start = time.perf_counter()
+            analysis = analyzer.analyze_scan(scan)
+            config = BuildConfig(project_id="bench", region="r", zone="z", instance_name=key,
+                                 machine_type=analysis.recommended_gcp_instance, source_image="debian-cloud/debian-11")
+            result = builder.generate_terraform(config, scan, analysis, output_dir=os.path.join(tmp, "hosts", key))
+            per_host_seconds += time.perf_counter() - start
+            per_host_bytes += os.path.getsize(os.path.join(os.path.dirname(result.terraform_code_path), "startup.sh"))
+        scale = hosts / min(sample, len(keys))
+
+    sizes = [len(c["hosts"]) for c in manifest["clusters"]]
+    shared_bytes = sum(c["startup_bytes"] + c["override_bytes"] for c in manifest["clusters"])
+    result = {
+        "name": "cluster",
+        "clusters": len(sizes),
+        "largest": max(sizes),
+        "singletons": sum(1 for n in sizes if n == 1),
+        "seconds": {k: round(v, 3) for k, v in manifest["seconds"].items()},
+        "clustered_total_s": round(clustered_seconds, 3),
+        "per_host_total_s_est": round(per_host_seconds * scale, 3),
+        "clustered_script_bytes": shared_bytes,
+        "per_host_script_bytes_est": int(per_host_bytes * scale),
+    }
+    table = Table(title=f"Clustering {hosts} hosts ({roles} roles, {unique} unique)")
+    for column in ("Clusters", "Singletons", "Sketch+LSH s", "Clustered build s", "Per-host build s (est)",
+                   "Script MiB", "Per-host script MiB (est)"):
+        table.add_column(column, justify="right")
+    table.add_row(
+        str(result["clusters"]), str(result["singletons"]),
+        f"{manifest['seconds']['features'] + manifest['seconds']['cluster']:.2f}",
+        f"{clustered_seconds:.2f}", f"{result['per_host_total_s_est']:.2f}",
+        f"{shared_bytes / 2 ** 20:.1f}", f"{result['per_host_script_bytes_est'] / 2 ** 20:.1f}",
+    )
+    console.print(table)
+    write_results(output, "cluster", params, [result])
+
+
+if __name__ == "__main__":
+    app()
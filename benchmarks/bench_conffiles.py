@@ -0,0 +1,120 @@
+import hashlib
+import os
+import random
+import tempfile
+import time
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.harness import summarize, write_results
+from app.static import agent
+
+app = typer.Typer()
+console = Console()
+
+
+def _make_host(root: str, packages: int, conffiles: int, file_size: int, modified: float, seed: int = 7) -> dict:
+    # A dpkg status database and info directory with `conffiles` per package
+    # under root, a `modified` fraction of them edited since installation.
+    # Unpacked files keep the package's build time as their mtime.
+    rng = random.Random(seed)
+    edited = set()
+    stanzas = []
+    built = time.time() - 86400
+    os.makedirs(os.path.join(root, "info"))
+    for p in range(packages):
+        lines = [f"Package: pkg{p}", "Status: install ok installed", "Conffiles:"]
+        for c in range(conffiles):
+            path = os.path.join(root, "etc", f"pkg{p}", f"conf{c}.conf")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            body = (f"# pkg{p} conf{c}\n" + "option = value\n" * (file_size // 15)).encode()
+            lines.append(f" {path} {hashlib.md5(body).hexdigest()}")
+            with open(path, "wb") as f:
+                f.write(body)
+            os.utime(path, (built, built))
+            if rng.random() < modified:
+                edited.add(path)
+        info = os.path.join(root, "info", f"pkg{p}.list")
+        with open(info, "w") as f:
+            f.write(f"/etc/pkg{p}\n")
+        lines.append(f"Description: package {p}")
+        stanzas.append("\n".join(lines) + "\n")
+    # Edits come after installation.
+    for path in edited:
+        with open(path, "ab") as f:
+            f.write(b"option = local\n")
+    status = os.path.join(root, "status")
+    with open(status, "w") as f:
+        f.write("\n".join(stanzas))
+    return {"status": status, "edited": edited}
+
+
+def _capture_all(status: str) -> dict:
+    # Baseline: every file the packages own, read and sent as it is.
+    conffiles = agent.parse_dpkg_conffiles(agent.GOVERNOR.read_text(status))
+    return {path: agent.GOVERNOR.read_text(path) for path in conffiles}
+
+
+def _hash_all(status: str) -> dict:
+    # Every conffile read and hashed, without looking at its timestamps first.
+    conffiles = agent.parse_dpkg_conffiles(agent.GOVERNOR.read_text(status))
+    configs = {}
+    for path, digest in conffiles.items():
+        data = agent.GOVERNOR.read_bytes(path)
+        if agent.conffile_modified(data, digest):
+            configs[path] = data.decode()
+    return configs
+
+
+@app.command()
+def run(
+    packages: int = typer.Option(400, help="Installed packages with conffiles"),
+    conffiles: int = typer.Option(3, help="Conffiles per package"),
+    file_size: int = typer.Option(2048, help="Bytes per conffile"),
+    modified: float = typer.Option(0.05, help="Fraction of conffiles edited since installation"),
+    repeat: int = typer.Option(5, help="Discovery runs per mode"),
+    output: str = typer.Option(None, help="Write JSON results to this path"),
+):
+    params = {"packages": packages, "conffiles": conffiles, "file_size": file_size, "modified": modified,
+              "repeat": repeat}
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        host = _make_host(tmp, packages, conffiles, file_size, modified)
+        modes = [
+            ("every conffile", _capture_all),
+            ("hash every conffile", _hash_all),
+            ("prefiltered by mtime", lambda status: agent.discover_conffiles(status)[1]),
+        ]
+        for name, fn in modes:
+            latencies = []
+            for _ in range(repeat):
+                previous, agent.GOVERNOR = agent.GOVERNOR, agent.Governor()
+                try:
+                    t0 = time.perf_counter()
+                    configs = fn(host["status"])
+                    latencies.append(time.perf_counter() - t0)
+                    read = agent.GOVERNOR.bytes_read
+                finally:
+                    agent.GOVERNOR = previous
+            results.append(summarize(
+                name, latencies, sum(latencies), bytes_read=read,
+                bytes_captured=sum(len(c.encode()) for c in configs.values()), files_captured=len(configs),
+                edits_found=len(host["edited"] & set(configs)),
+            ))
+
+    edits = len(host["edited"])
+    table = Table(title=f"Conffile discovery over {packages * conffiles} conffiles ({edits} edited)")
+    for column in ("Mode", "p50 ms", "KiB read", "KiB captured", "Files", "Edits found"):
+        table.add_column(column, justify="left" if column == "Mode" else "right")
+    for r in results:
+        table.add_row(r["name"], f"{r['latency_ms']['p50']:.1f}", f"{r['bytes_read'] / 1024:.0f}",
+                      f"{r['bytes_captured'] / 1024:.0f}", str(r["files_captured"]), f"{r['edits_found']}/{edits}")
+    console.print(table)
+    params["edited"] = edits
+    write_results(output, "conffiles", params, results)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,118 @@
+import json
+import os
+import random
+import tempfile
+import time
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.fleet import generate_scan
+from benchmarks.harness import AsgiClient, summarize, write_results
+from app.main import app as api
+from app.static import agent
+
+app = typer.Typer()
+console = Console()
+
+
+def _agent_side(files: int, file_size: int, changed: int) -> dict:
+    # Picking up a few edited files in a captured app tree: full re-walk
+    # against the daemon's watch, coalesce and re-read.
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(files):
+            path = os.path.join(tmp, f"d{i % 20}", f"f{i}.js")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write("x" * file_size)
+            paths.append(path)
+        agent.MAX_TOTAL_FILES, limit = files, agent.MAX_TOTAL_FILES
+        try:
+            start = time.perf_counter()
+            tree = agent.capture_app_tree(tmp)
+            rescan_s = time.perf_counter() - start
+
+            data = {"hostname": "bench", "pm2_processes": [{"name": "app", "path": tmp}],
+                    "custom_app_configs": {"app": tree}, "generic_apps": []}
+            pushed = []
+            daemon = agent.Daemon(data, pushed.append, settle=0, refresh=0, cron_dirs=[], refresh_files={},
+                                  conffiles={})
+            daemon.start()
+            for path in random.Random(0).sample(paths, changed):
+                with open(path, "a") as f:
+                    f.write("y")
+            start = time.perf_counter()
+            while not pushed:
+                daemon.step(0.01)
+            delta_s = time.perf_counter() - start
+            daemon.close()
+        finally:
+            agent.MAX_TOTAL_FILES = limit
+    return {"rescan_s": rescan_s, "delta_s": delta_s, "ops": len(pushed[0]), "watcher": type(daemon.watcher).__name__}
+
+
+@app.command()
+def run(
+    hosts: int = typer.Option(50, help="Hosts submitting baselines and then changes"),
+    files_per_app: int = typer.Option(200, help="Captured files per app"),
+    file_size: int = typer.Option(4096, help="Bytes per captured file"),
+    changed: int = typer.Option(5, help="Files edited per host between syncs"),
+    output: str = typer.Option(None, help="Write JSON results to this path"),
+):
+    params = {"hosts": hosts, "files_per_app": files_per_app, "file_size": file_size, "changed": changed}
+    client = AsgiClient(api)
+    scans = [json.loads(generate_scan(i, files_per_app=files_per_app, file_size=file_size).model_dump_json())
+             for i in range(hosts)]
+    versions = []
+    for data in scans:
+        reply = client.request("POST", "/api/scan/submit", json.dumps(data).encode(), query="project=bench")
+        versions.append(json.loads(reply["body"])["version"])
+
+    full_latencies, patch_latencies = [], []
+    full_bytes = patch_bytes = 0
+    rng = random.Random(1)
+    for index, data in enumerate(scans):
+        ops = []
+        app_name = rng.choice(sorted(data["custom_app_configs"]))
+        files = data["custom_app_configs"][app_name]
+        for key in rng.sample(sorted(files), min(changed, len(files))):
+            files[key] = files[key] + "// edited\n"
+            ops.append({"section": "custom_app_configs", "group": app_name, "key": key, "value": files[key]})
+
+        body = json.dumps({"hostname": data["hostname"], "base_version": versions[index], "ops": ops}).encode()
+        t0 = time.perf_counter()
+        reply = client.request("POST", "/api/scan/patch", body, query="project=bench")
+        patch_latencies.append(time.perf_counter() - t0)
+        assert reply["status"] == 200, reply["body"]
+        patch_bytes += len(body)
+
+        body = json.dumps(data).encode()
+        t0 = time.perf_counter()
+        reply = client.request("POST", "/api/scan/submit", body, query="project=bench")
+        full_latencies.append(time.perf_counter() - t0)
+        full_bytes += len(body)
+    client.close()
+
+    results = [
+        summarize("full resubmit", full_latencies, sum(full_latencies), bytes=full_bytes),
+        summarize("delta patch", patch_latencies, sum(patch_latencies), bytes=patch_bytes),
+    ]
+    local = _agent_side(files_per_app, file_size, changed)
+
+    table = Table(title=f"Syncing {changed} changed files per host ({hosts} hosts, {files_per_app} files per app)")
+    for column in ("Mode", "Server p50 ms", "Server p99 ms", "Bytes per host"):
+        table.add_column(column, justify="left" if column == "Mode" else "right")
+    for r in results:
+        table.add_row(r["name"], f"{r['latency_ms']['p50']:.2f}", f"{r['latency_ms']['p99']:.2f}",
+                      f"{r['bytes'] // hosts:,}")
+    console.print(table)
+    console.print(f"Agent: full app tree re-walk {local['rescan_s'] * 1000:.1f} ms; "
+                  f"{local['watcher']} delta of {local['ops']} file(s) {local['delta_s'] * 1000:.1f} ms")
+    params.update(local)
+    write_results(output, "daemon", params, results)
+
+
+if __name__ == "__main__":
+    app()
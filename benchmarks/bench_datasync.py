@@ -0,0 +1,131 @@
+import io
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.harness import summarize, write_results
+from app.core import datasync
+from app.static import sync_agent
+
+app = typer.Typer()
+console = Console()
+
+
+def _make_tree(root: str, files: int, total_mb: int, seed: int) -> list:
+    rng = random.Random(seed)
+    # Mostly small files with a few large ones, like an uploads dir next to a database.
+    weights = [rng.paretovariate(1.2) for _ in range(files)]
+    scale = total_mb * 2 ** 20 / sum(weights)
+    paths = []
+    for i, w in enumerate(weights):
+        path = os.path.join(root, f"d{i % 16:02d}", f"file{i:05d}.bin")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(rng.randbytes(max(1, int(w * scale))))
+        paths.append(path)
+    return paths
+
+
+def _mutate(paths: list, fraction: float, seed: int) -> int:
+    # Inserts a few bytes into the middle of a fraction of the files (shifts
+    # everything after them) and appends to the rest of that sample.
+    rng = random.Random(seed)
+    changed = rng.sample(paths, max(1, int(len(paths) * fraction)))
+    for n, path in enumerate(changed):
+        with open(path, "rb") as f:
+            data = f.read()
+        if n % 2:
+            data += rng.randbytes(4096)
+        else:
+            at = len(data) // 2
+            data = data[:at] + rng.randbytes(64) + data[at:]
+        with open(path, "wb") as f:
+            f.write(data)
+    return len(changed)
+
+
+class _Dropping(sync_agent.Target):
+    def __init__(self, root, after):
+        super().__init__(root)
+        self.after = after
+
+    def put_chunk(self, digest, data):
+        if self.after <= 0:
+            raise ConnectionError("link dropped")
+        self.after -= 1
+        super().put_chunk(digest, data)
+
+
+def _pass(source: str, dest: str, transport: str, streams: int) -> dict:
+    with datasync.open_target(dest, transport, workers=streams) as target:
+        return datasync.sync(source, target, streams=streams, transport=transport)
+
+
+def _result(name: str, stats: dict) -> dict:
+    return summarize(
+        name, [stats["seconds"]], stats["seconds"], bytes_total=stats["bytes_total"], bytes_sent=stats["bytes_sent"],
+        bytes_scanned=stats["bytes_scanned"], chunks=stats["chunks"], transferred=stats["transferred"], skipped=stats["skipped"],
+        effective_mbps=stats["effective_mbps"], scan_mbps=stats["scan_mbps"], errors=len(stats["errors"]),
+    )
+
+
+@app.command()
+def run(
+    files: int = typer.Option(400, help="Files in the synthetic data directory"),
+    total_mb: int = typer.Option(256, help="Total size of the data directory"),
+    changed: float = typer.Option(0.05, help="Fraction of files modified before the delta pass"),
+    streams: int = typer.Option(4, help="Parallel sync streams"),
+    transport: str = typer.Option("pipe", help="local or pipe (sync_agent.py in a subprocess)"),
+    output: str = typer.Option(None, help="Write JSON results to this path"),
+):
+    params = {"files": files, "total_mb": total_mb, "changed": changed, "streams": streams, "transport": transport}
+    work = tempfile.mkdtemp(prefix="migrator-sync-")
+    source, dest, resumed = (os.path.join(work, name) for name in ("source", "dest", "resumed"))
+    try:
+        paths = _make_tree(source, files, total_mb, seed=7)
+
+        chunker = sync_agent.Chunker()
+        sample = random.Random(1).randbytes(32 * 2 ** 20)
+        start = time.perf_counter()
+        for _ in chunker.split(io.BytesIO(sample)):
+            pass
+        chunk_seconds = time.perf_counter() - start
+        results = [summarize("chunker", [chunk_seconds], chunk_seconds, mbps=round(32 / chunk_seconds, 1))]
+
+        results.append(_result("initial", _pass(source, dest, transport, streams)))
+        results.append(_result("unchanged", _pass(source, dest, transport, streams)))
+        mutated = _mutate(paths, changed, seed=11)
+        results.append(_result("delta", _pass(source, dest, transport, streams)))
+
+        # Interrupted halfway through the initial copy, then resumed.
+        target = _Dropping(resumed, after=results[1]["chunks"] // 2)
+        logging.getLogger("migrator.datasync").setLevel(logging.ERROR)
+        broken = datasync.sync(source, target, streams=streams)
+        target.close()
+        results.append(_result("interrupted", broken))
+        results.append(_result("resume", _pass(source, resumed, transport, streams)))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    table = Table(title=f"Data Sync ({files} files, {total_mb} MiB, {mutated} changed, {transport})")
+    for column in ("Pass", "Seconds", "Sent MiB", "Scanned MiB", "Files sent", "Effective MiB/s"):
+        table.add_column(column, justify="left" if column == "Pass" else "right")
+    console.print(f"Chunker: {results[0]['mbps']} MiB/s (single thread)")
+    for r in results[1:]:
+        table.add_row(
+            r["name"], f"{r['elapsed_s']:.2f}", f"{r['bytes_sent'] / 2 ** 20:.1f}",
+            f"{r['bytes_scanned'] / 2 ** 20:.1f}", str(r["transferred"]), f"{r['effective_mbps']:.1f}",
+        )
+    console.print(table)
+    write_results(output, "datasync", params, results)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,61 @@
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.fleet import generate_scan
+from benchmarks.harness import summarize, write_results
+from app.core import dryrun
+from app.models import BuildConfig
+
+app = typer.Typer()
+console = Console()
+
+
+@app.command()
+def run(
+    hosts: int = typer.Option(10, help="Synthetic hosts whose startup scripts are dry-run"),
+    files_per_app: int = typer.Option(100, help="Captured files per app"),
+    file_size: int = typer.Option(4096, help="Bytes per captured file"),
+    scale: float = typer.Option(0.01, help="Multiplier for the simulated command latencies"),
+    output: str = typer.Option(None, help="Write JSON results to this path"),
+):
+    params = {"hosts": hosts, "files_per_app": files_per_app, "file_size": file_size, "scale": scale}
+    config = BuildConfig(project_id="bench", region="us-central1", zone="us-central1-a", instance_name="bench",
+                         machine_type="e2-medium", source_image="debian-cloud/debian-11")
+    seconds, simulated, written, failures = {}, {}, {}, {}
+    totals = []
+    for i in range(hosts):
+        scan = generate_scan(i, files_per_app=files_per_app, file_size=file_size)
+        report = dryrun.dry_run_scan(scan, config=config, scale=scale)
+        totals.append(report["seconds"])
+        for s in report["sections"]:
+            seconds.setdefault(s["name"], []).append(s["seconds"])
+            simulated[s["name"]] = simulated.get(s["name"], 0.0) + s["simulated_seconds"]
+            written[s["name"]] = written.get(s["name"], 0) + s["bytes_written"]
+            failures[s["name"]] = failures.get(s["name"], 0) + len(s["failures"])
+
+    # One result per section plus the whole script, so compare.py flags a
+    # regression in any single section.
+    results = [
+        summarize(name, values, sum(values), bytes_written=written[name] // len(values),
+                  simulated_s=round(simulated[name] / len(values), 4), failures=failures[name])
+        for name, values in seconds.items()
+    ]
+    results.append(summarize("startup.sh", totals, sum(totals), bytes_written=sum(written.values()) // hosts,
+                             simulated_s=round(sum(simulated.values()) / hosts, 4),
+                             failures=sum(failures.values())))
+
+    table = Table(title=f"Dry-run of {hosts} startup scripts (latency scale {scale:g})")
+    for column in ("Section", "p50 s", "p99 s", "Simulated s", "Overhead s", "KiB written", "Failures"):
+        table.add_column(column, justify="left" if column == "Section" else "right")
+    for r in results:
+        p50 = r["latency_ms"]["p50"] / 1000
+        table.add_row(r["name"], f"{p50:.3f}", f"{r['latency_ms']['p99'] / 1000:.3f}", f"{r['simulated_s']:.3f}",
+                      f"{max(0.0, r['latency_ms']['mean'] / 1000 - r['simulated_s']):.3f}",
+                      f"{r['bytes_written'] / 1024:.1f}", str(r["failures"]))
+    console.print(table)
+    write_results(output, "dryrun", params, results)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import typer
+from rich.console import Console
+
+from benchmarks.fleet import generate_fleet
+from benchmarks.harness import summarize, write_results
+from app.core import export
+
+app = typer.Typer()
+console = Console()
+
+
+def _dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+@app.command()
+def run(
+    hosts: int = typer.Option(10000, help="Number of synthetic hosts"),
+    fmt: str = typer.Option("csv", "--format", help="csv or parquet"),
+    chunk_rows: int = typer.Option(100000, help="Rows per part / row group"),
+    output: str = typer.Option(None, help="Write JSON results to this path"),
+):
+    params = {"hosts": hosts, "format": fmt, "chunk_rows": chunk_rows}
+    # Scans are generated lazily, as if read one by one from storage: peak
+    # memory should not grow with the number of hosts.
+    records = (("bench", scan, None) for scan in generate_fleet(hosts, files_per_app=4, file_size=512))
+    target = tempfile.mkdtemp(prefix="migrator-export-")
+    try:
+        tracemalloc.start()
+        start = time.perf_counter()
+        manifest = export.export_fleet(records, target, fmt=fmt, chunk_rows=chunk_rows)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        size = _dir_size(target)
+    finally:
+        shutil.rmtree(target, ignore_errors=True)
+
+    rows = sum(t["rows"] for t in manifest["tables"].values())
+    result = summarize(f"export_{fmt}", [elapsed], elapsed, peak, rows=rows, output_bytes=size,
+                       rows_per_s=round(rows / elapsed, 1))
+    console.print(f"{hosts} hosts, {rows} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s, tracemalloc overhead "
+                  f"included), {size / 2 ** 20:.1f} MiB on disk, peak traced memory {peak / 2 ** 20:.1f} MiB")
+    write_results(output, "export", params, [result])
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,99 @@
+import gc
+import json
+import time
+import tracemalloc
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.fleet import generate_fleet
+from benchmarks.harness import summarize, write_results
+from app.models import ScanResult
+from app.core import ingest
+
+app = typer.Typer()
+console = Console()
+
+
+def retained_bytes(load, payloads) -> int:
+    # Memory still held after every payload has been decoded and stored.
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [load(body) for body in payloads]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+
+def timed(load, payloads):
+    latencies = []
+    start = time.perf_counter()
+    for body in payloads:
+        t0 = time.perf_counter()
+        load(body)
+        latencies.append(time.perf_counter() - t0)
+    return latencies, time.perf_counter() - start
+
+
+@app.command()
+def run(
+    hosts: int = typer.Option(200, help="Number of synthetic hosts"),
+    pm2_apps: int = typer.Option(2, help="PM2 apps per host"),
+    generic_apps: int = typer.Option(1, help="Generic systemd apps per host"),
+    files_per_app: int = typer.Option(40, help="Captured files per app"),
+    file_size: int = typer.Option(4096, help="Bytes per captured file"),
+    app_variants: int = typer.Option(8, help="Distinct application releases across the fleet (0 = all unique)"),
+    output: str = typer.Option(None, help="Write JSON results to this path"),
+):
+    params = {
+        "hosts": hosts, "pm2_apps": pm2_apps, "generic_apps": generic_apps,
+        "files_per_app": files_per_app, "file_size": file_size, "app_variants": app_variants,
+    }
+    payloads = [
+        s.model_dump_json().encode()
+        for s in generate_fleet(hosts, pm2_apps=pm2_apps, generic_apps=generic_apps,
+                                files_per_app=files_per_app, file_size=file_size, app_variants=app_variants)
+    ]
+    payload_bytes = sum(len(p) for p in payloads)
+
+    def baseline(body):
+        # What FastAPI did before: generic JSON tree, then model validation.
+        return ScanResult(**json.loads(body))
+
+    def fast_path():
+        # Fresh pool per pass so each measurement starts from an empty store.
+        pool = ingest.ContentPool()
+        return lambda body: ingest.store_scan(ingest.decode_scan(body), pool=pool)
+
+    results = []
+    for name, factory in (
+        ("json_loads_then_validate", lambda: baseline),
+        ("fast_path_pooled", fast_path),
+    ):
+        latencies, elapsed = timed(factory(), payloads)
+        memory = retained_bytes(factory(), payloads)
+        results.append(summarize(
+            name, latencies, elapsed, memory,
+            payload_bytes=payload_bytes,
+            mb_per_s=round(payload_bytes / elapsed / 2 ** 20, 2),
+            bytes_per_scan=memory // max(1, hosts),
+        ))
+
+    table = Table(title=f"Scan Ingest ({hosts} hosts, {payload_bytes / 2 ** 20:.1f} MiB JSON)")
+    for column in ("Path", "p50 ms", "p99 ms", "MiB/s", "Retained MiB", "KiB per scan"):
+        table.add_column(column, justify="right" if column != "Path" else "left")
+    for r in results:
+        table.add_row(
+            r["name"], f"{r['latency_ms']['p50']:.3f}", f"{r['latency_ms']['p99']:.3f}", f"{r['mb_per_s']:.1f}",
+            f"{r['peak_memory_bytes'] / 2 ** 20:.1f}", f"{r['bytes_per_scan'] / 1024:.1f}",
+        )
+    console.print(table)
+    write_results(output, "ingest", params, results)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,83 @@
+import time
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.fleet import generate_fleet
+from benchmarks.harness import measure, write_results
+from app.core import inventory
+
+app = typer.Typer()
+console = Console()
+
+# Each query with the predicate a caller would otherwise run over every scan.
+QUERIES = [
+    ("service:postgresql", lambda p, s: "postgresql" in s.running_services),
+    ("package:postgresql-12", lambda p, s: "postgresql-12" in s.installed_packages),
+    ("port:8080", lambda p, s: 8080 in s.open_ports),
+    ("service:nginx AND port:443 AND NOT package:apache2",
+     lambda p, s: "nginx" in s.running_services and 443 in s.open_ports and "apache2" not in s.installed_packages),
+    ("(service:mysql OR service:postgresql) AND user:user3",
+     lambda p, s: ("mysql" in s.running_services or "postgresql" in s.running_services) and "user3" in s.system_users),
+    ("package:openjdk* AND NOT service:tomcat",
+     lambda p, s: any(x.startswith("openjdk") for x in s.installed_packages) and "tomcat" not in s.running_services),
+    ("pm2:node-app-1 AND config:/etc/nginx/nginx.conf",
+     lambda p, s: any(x["name"] == "node-app-1" for x in s.pm2_processes) and "/etc/nginx/nginx.conf" in s.config_files),
+]
+
+
+@app.command()
+def run(
+    hosts: int = typer.Option(10000, help="Number of synthetic hosts"),
+    repeat: int = typer.Option(200, help="Runs of every query per strategy"),
+    limit: int = typer.Option(100, help="Hosts returned per query"),
+    output: str = typer.Option(None, help="Write JSON results to this path"),
+):
+    params = {"hosts": hosts, "repeat": repeat, "limit": limit}
+    # Tiny captured files: this benchmark is about metadata, not content.
+    console.print(f"Generating {hosts} hosts...")
+    scans = [
+        ("bench", s) for s in generate_fleet(hosts, pm2_apps=2, generic_apps=1, files_per_app=2, file_size=64)
+    ]
+
+    index = inventory.InventoryIndex()
+    start = time.perf_counter()
+    for project, scan in scans:
+        index.update(project, scan)
+    build_s = time.perf_counter() - start
+
+    results = []
+    linear_repeat = max(1, repeat // 20)
+    for query, predicate in QUERIES:
+        expected = [(p, s.hostname) for p, s in scans if predicate(p, s)]
+        found = index.search(query, limit=hosts)
+        assert found["count"] == len(expected), query
+        assert [(h["project"], h["hostname"]) for h in found["hosts"]] == expected, query
+
+        results.append(measure(
+            f"index: {query}", lambda _: index.search(query, limit=limit), range(repeat),
+            trace_memory=False, matches=len(expected), strategy="index",
+        ))
+        results.append(measure(
+            f"linear: {query}", lambda _: [s.hostname for p, s in scans if predicate(p, s)][:limit],
+            range(linear_repeat), trace_memory=False, matches=len(expected), strategy="linear",
+        ))
+
+    table = Table(title=f"Inventory Queries ({hosts} hosts, index built in {build_s * 1000:.0f} ms)")
+    for column in ("Query", "Matches", "Index p50 ms", "Index p99 ms", "Linear p50 ms", "Speedup"):
+        table.add_column(column, justify="left" if column == "Query" else "right")
+    for indexed, linear in zip(results[::2], results[1::2]):
+        table.add_row(
+            indexed["name"][len("index: "):], str(indexed["matches"]),
+            f"{indexed['latency_ms']['p50']:.4f}", f"{indexed['latency_ms']['p99']:.4f}",
+            f"{linear['latency_ms']['p50']:.3f}",
+            f"{linear['latency_ms']['p50'] / max(indexed['latency_ms']['p50'], 1e-6):.0f}x",
+        )
+    console.print(table)
+    params["index_build_s"] = round(build_s, 4)
+    write_results(output, "inventory", params, results)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,136 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.bench_admission import _free_port, _peak_rss, _wait_ready
+from benchmarks.fleet import generate_scan
+from benchmarks.harness import ROOT_DIR, summarize, write_results
+
+app = typer.Typer()
+console = Console()
+
+
+def _post(url: str, payload: dict, timeout: float = 120):
+    request = urllib.request.Request(url, json.dumps(payload).encode(), {"Content-Type": "application/json"})
+    return urllib.request.urlopen(request, timeout=timeout).read()
+
+
+def run_load(env: dict, payloads: list, builders: int, pages: int, duration: float, pause: float) -> dict:
+    # Builders loop on /api/build/trigger (section cache disabled, so every
+    # build renders and encodes everything) while page clients load a page
+    # that does no work of its own; page latency shows how much the builds
+    # hold up the event loop.
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT_DIR, env=dict(os.environ, MIGRATOR_BUILD_CACHE_MB="0", **env),
+    )
+    try:
+        _wait_ready(url)
+        for i, payload in enumerate(payloads):
+            _post(f"{url}/api/scan/submit?project=load-{i}", payload)
+        # Warm up worker processes before measuring.
+        for i in range(len(payloads)):
+            _post(f"{url}/api/build/trigger?project=load-{i}", _config(i))
+
+        done = threading.Event()
+        lock = threading.Lock()
+        page_latencies, build_latencies, errors = [], [], []
+
+        def page_client():
+            while not done.is_set():
+                t0 = time.perf_counter()
+                try:
+                    urllib.request.urlopen(f"{url}/guide/scan?project=idle", timeout=60).read()
+                    with lock:
+                        page_latencies.append(time.perf_counter() - t0)
+                except OSError as e:
+                    errors.append(str(e))
+                time.sleep(0.02)
+
+        def build_client(index: int):
+            n = index
+            while not done.is_set():
+                t0 = time.perf_counter()
+                try:
+                    _post(f"{url}/api/build/trigger?project=load-{n % len(payloads)}", _config(n % len(payloads)))
+                    with lock:
+                        build_latencies.append(time.perf_counter() - t0)
+                except OSError as e:
+                    errors.append(str(e))
+                n += 1
+                time.sleep(pause)
+
+        threads = [threading.Thread(target=page_client) for _ in range(pages)]
+        threads += [threading.Thread(target=build_client, args=(i,)) for i in range(builders)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        time.sleep(duration)
+        done.set()
+        for t in threads:
+            t.join()
+        return {
+            "elapsed": time.perf_counter() - start,
+            "pages": page_latencies,
+            "builds": build_latencies,
+            "errors": len(errors),
+            "peak_rss": _peak_rss(server.pid),
+        }
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def _config(index: int) -> dict:
+    return {"project_id": f"load-{index}", "region": "us-central1", "zone": "us-central1-a",
+            "instance_name": f"load-{index}", "machine_type": "e2-small", "source_image": "debian-cloud/debian-11"}
+
+
+@app.command()
+def run(
+    builders: int = typer.Option(2, help="Clients triggering builds back to back"),
+    pages: int = typer.Option(4, help="Clients loading pages"),
+    duration: float = typer.Option(10.0, help="Seconds of load per mode"),
+    pause: float = typer.Option(0.25, help="Seconds each builder waits between builds"),
+    files_per_app: int = typer.Option(200, help="Captured files per app (build size)"),
+    file_size: int = typer.Option(8192, help="Bytes per captured file"),
+    workers: int = typer.Option(2, help="MIGRATOR_JOB_WORKERS for the process pool run"),
+    output: str = typer.Option(None, help="Write JSON results to this path"),
+):
+    params = {"builders": builders, "pages": pages, "duration": duration, "pause": pause, "files_per_app": files_per_app,
+              "file_size": file_size, "workers": workers}
+    payloads = [generate_scan(i, files_per_app=files_per_app, file_size=file_size).model_dump() for i in range(4)]
+    results = []
+    for name, env in (("process-pool", {"MIGRATOR_JOB_WORKERS": str(workers)}), ("threads", {"MIGRATOR_JOB_WORKERS": "0"})):
+        console.print(f"Running {builders} builders and {pages} page clients ({name})...")
+        load = run_load(env, payloads, builders, pages, duration, pause)
+        results.append(summarize(
+            name, load["pages"], load["elapsed"], load["peak_rss"], errors=load["errors"],
+            builds=summarize("builds", load["builds"], load["elapsed"]),
+        ))
+
+    table = Table(title=f"Page Loads During Builds ({builders} builders, {pages} page clients)")
+    for column in ("Mode", "Pages", "Page p50 ms", "Page p99 ms", "Page max ms", "Builds", "Build p50 s", "Errors"):
+        table.add_column(column, justify="left" if column == "Mode" else "right")
+    for r in results:
+        table.add_row(
+            r["name"], str(r["ops"]), f"{r['latency_ms']['p50']:.1f}", f"{r['latency_ms']['p99']:.1f}",
+            f"{r['latency_ms']['max']:.1f}", str(r["builds"]["ops"]), f"{r['builds']['latency_ms']['p50'] / 1000:.2f}",
+            str(r["errors"]),
+        )
+    console.print(table)
+    write_results(output, "jobs", params, results)
+
+
+if __name__ == "__main__":
+    app()
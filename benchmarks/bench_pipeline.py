@@ -0,0 +1,132 @@
+import os
+import shutil
+import tempfile
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.fleet import generate_fleet
+from benchmarks.harness import ROOT_DIR, AsgiClient, measure, write_results
+
+app = typer.Typer()
+console = Console()
+
+
+def print_results(results):
+    table = Table(title="Pipeline Benchmark")
+    table.add_column("Stage", style="cyan")
+    table.add_column("Ops", justify="right")
+    table.add_column("Ops/s", justify="right")
+    table.add_column("p50 ms", justify="right")
+    table.add_column("p90 ms", justify="right")
+    table.add_column("p99 ms", justify="right")
+    table.add_column("Peak MiB", justify="right")
+    for r in results:
+        table.add_row(
+            r["name"],
+            str(r["ops"]),
+            f"{r['throughput_ops_s']:.1f}",
+            f"{r['latency_ms']['p50']:.3f}",
+            f"{r['latency_ms']['p90']:.3f}",
+            f"{r['latency_ms']['p99']:.3f}",
+            f"{r['peak_memory_bytes'] / 2 ** 20:.2f}",
+        )
+    console.print(table)
+
+
+@app.command()
+def run(
+    hosts: int = typer.Option(50, help="Number of synthetic hosts"),
+    services: int = typer.Option(6, help="Running services per host"),
+    pm2_apps: int = typer.Option(2, help="PM2 apps per host"),
+    generic_apps: int = typer.Option(1, help="Generic systemd apps per host"),
+    files_per_app: int = typer.Option(20, help="Captured files per app"),
+    file_size: int = typer.Option(2048, help="Bytes per captured file"),
+    app_variants: int = typer.Option(8, help="Distinct application releases across the fleet (0 = all unique)"),
+    seed: int = typer.Option(0, help="Generator seed"),
+    output: str = typer.Option(None, help="Write JSON results to this path"),
+):
+    # The API mounts app/static relative to the working directory.
+    os.chdir(ROOT_DIR)
+    from app.main import app as api
+    from app.api import web
+    from app.core import analyzer, builder
+    from app.models import BuildConfig
+
+    params = {
+        "hosts": hosts,
+        "services": services,
+        "pm2_apps": pm2_apps,
+        "generic_apps": generic_apps,
+        "files_per_app": files_per_app,
+        "file_size": file_size,
+        "app_variants": app_variants,
+        "seed": seed,
+    }
+    scans = list(generate_fleet(
+        hosts,
+        seed=seed,
+        services=services,
+        pm2_apps=pm2_apps,
+        generic_apps=generic_apps,
+        files_per_app=files_per_app,
+        file_size=file_size,
+        app_variants=app_variants,
+    ))
+    payloads = [(f"bench-{i}", s.model_dump_json().encode()) for i, s in enumerate(scans)]
+    payload_bytes = sum(len(body) for _, body in payloads)
+
+    results = []
+
+    client = AsgiClient(api)
+
+    def ingest(item):
+        project, body = item
+        response = client.request("POST", "/api/scan/submit", body, query=f"project={project}")
+        if response["status"] != 200:
+            raise RuntimeError(f"ingest failed with {response['status']}: {response['body'][:200]!r}")
+
+    results.append(measure("ingest_scan_submit", ingest, payloads, payload_bytes=payload_bytes))
+    client.close()
+    web.PROJECTS.clear()
+
+    analyses = [analyzer.analyze_scan(s) for s in scans]
+    results.append(measure("analyze_scan", analyzer.analyze_scan, scans))
+    results.append(measure(
+        "generate_architecture_diagram",
+        lambda pair: analyzer.generate_architecture_diagram(*pair),
+        list(zip(scans, analyses)),
+    ))
+
+    out_dir = tempfile.mkdtemp(prefix="bench-build-")
+    original_dir = builder.GENERATED_DIR
+    builder.GENERATED_DIR = out_dir
+    try:
+        def build(pair):
+            scan, analysis = pair
+            config = BuildConfig(
+                project_id="bench",
+                region="us-central1",
+                zone="us-central1-a",
+                instance_name=f"migrated-{scan.hostname}",
+                machine_type=analysis.recommended_gcp_instance,
+                source_image="debian-cloud/debian-11",
+            )
+            builder.generate_terraform(config, scan_result=scan, analysis_result=analysis)
+
+        result = measure("generate_terraform", build, list(zip(scans, analyses)))
+        result["last_startup_script_bytes"] = os.path.getsize(os.path.join(out_dir, "startup.sh"))
+        results.append(result)
+    finally:
+        builder.GENERATED_DIR = original_dir
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    print_results(results)
+    write_results(output, "pipeline", params, results)
+    if output:
+        console.print(f"Results written to [bold]{output}[/bold]")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,89 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.bench_admission import _free_port, _wait_ready
+from benchmarks.fleet import generate_similar_scan
+from benchmarks.harness import ROOT_DIR, summarize, write_results
+from app.core import relay
+from app.static import agent
+
+app = typer.Typer()
+console = Console()
+
+
+@app.command()
+def run(
+    hosts: int = typer.Option(200, help="Agents in the segment"),
+    roles: int = typer.Option(6, help="Server images the hosts are deployed from"),
+    files_per_app: int = typer.Option(50, help="Captured files per app"),
+    file_size: int = typer.Option(4096, help="Bytes per captured file"),
+    batch_scans: int = typer.Option(100, help="Scans per relay batch"),
+    output: str = typer.Option(None, help="Write JSON results to this path"),
+):
+    params = {"hosts": hosts, "roles": roles, "files_per_app": files_per_app, "file_size": file_size,
+              "batch_scans": batch_scans}
+    bodies = [json.dumps(generate_similar_scan(i, roles=roles, files_per_app=files_per_app,
+                                               file_size=file_size).model_dump(mode="json")).encode()
+              for i in range(hosts)]
+    results = []
+    for mode in ("direct", "relay"):
+        port = _free_port()
+        url = f"http://127.0.0.1:{port}"
+        # A fresh central server per mode, so both start from empty history.
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=ROOT_DIR, env=dict(os.environ),
+        )
+        try:
+            _wait_ready(url)
+            latencies = []
+            if mode == "direct":
+                start = time.perf_counter()
+                for body in bodies:
+                    t0 = time.perf_counter()
+                    agent.send_data(json.loads(body), f"{url}/api/scan/submit?project=bench", max_attempts=1)
+                    latencies.append(time.perf_counter() - t0)
+                elapsed = time.perf_counter() - start
+                results.append(summarize("direct to central", latencies, elapsed, upstream_bytes=sum(map(len, bodies)),
+                                         upstream_requests=hosts, flush_s=0.0))
+                continue
+            with tempfile.TemporaryDirectory() as spool:
+                node = relay.Relay(spool, upstream=url, name="bench", batch_scans=batch_scans)
+                start = time.perf_counter()
+                for body in bodies:
+                    t0 = time.perf_counter()
+                    node.accept(body, "bench")
+                    latencies.append(time.perf_counter() - t0)
+                t0 = time.perf_counter()
+                outcome = node.flush(force=True)
+                flush = time.perf_counter() - t0
+                elapsed = time.perf_counter() - start
+                assert outcome["scans"] == hosts and not outcome["error"], outcome
+                results.append(summarize("via relay", latencies, elapsed, upstream_bytes=node.stats["bytes_sent"],
+                                         upstream_requests=node.stats["batches_sent"], flush_s=round(flush, 4)))
+        finally:
+            server.terminate()
+            server.wait()
+
+    table = Table(title=f"{hosts} agent uploads ({sum(map(len, bodies)) / 2 ** 20:.1f} MiB of scan JSON)")
+    columns = ("Mode", "Per scan p50 ms", "Per scan p99 ms", "Upstream MiB", "Upstream requests", "Flush s", "Total s")
+    for column in columns:
+        table.add_column(column, justify="left" if column == "Mode" else "right")
+    for r in results:
+        table.add_row(r["name"], f"{r['latency_ms']['p50']:.1f}", f"{r['latency_ms']['p99']:.1f}",
+                      f"{r['upstream_bytes'] / 2 ** 20:.2f}", str(r["upstream_requests"]), f"{r['flush_s']:.2f}",
+                      f"{r['elapsed_s']:.2f}")
+    console.print(table)
+    write_results(output, "relay", params, results)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,113 @@
+import random
+import time
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.fleet import EXTRA_PACKAGES, OS_POOL, SERVICE_POOL, generate_fleet
+from benchmarks.harness import measure, write_results
+from app.core import rules
+
+app = typer.Typer()
+console = Console()
+
+
+def generate_rules(count: int, seed: int = 0) -> list:
+    # Organisation-style rules: mostly exact package/port terms, plus
+    # prefixes, substrings, ranges, a few compound, negated and regex rules.
+    rng = random.Random(seed)
+    specs = []
+    for i in range(count):
+        kind = rng.random()
+        if kind < 0.45:
+            # Mostly names no host has (the long tail of an EOL list).
+            names = [rng.choice(EXTRA_PACKAGES) if rng.random() < 0.01 else f"pkg-{rng.randrange(10 ** 6)}"
+                     for _ in range(rng.randint(1, 5))]
+            when = [{"field": "package", "equals": names}]
+        elif kind < 0.6:
+            when = [{"field": "package", "prefix": [rng.choice(EXTRA_PACKAGES)[:rng.randint(4, 8)] if rng.random() < 0.02
+                                                     else f"lib{rng.randrange(10 ** 5)}"]}]
+        elif kind < 0.72:
+            when = [{"field": "service", "contains": [rng.choice(SERVICE_POOL)[:rng.randint(3, 6)] if rng.random() < 0.1
+                                                      else f"svc{rng.randrange(10 ** 5)}"]}]
+        elif kind < 0.82:
+            low = rng.randrange(1, 65000)
+            when = [{"field": "port", "range": [low, low + rng.choice((0, 0, 10, 100))]}]
+        elif kind < 0.95:
+            when = [{"field": "os", "contains": [rng.choice(OS_POOL).split()[-2].strip("()").lower() if rng.random() < 0.02
+                                                 else f"os{rng.randrange(10 ** 4)}"]}]
+        elif kind < 0.99:
+            when = [
+                {"field": "service", "equals": [rng.choice(SERVICE_POOL) if rng.random() < 0.2 else f"svc{rng.randrange(10 ** 5)}"]},
+                {"field": "package", "equals": [rng.choice(EXTRA_PACKAGES)], "not": rng.random() < 0.5},
+            ]
+        else:
+            when = [{"field": "config", "regex": [rf"/etc/app{rng.randrange(100)}/.*\.conf$"]}]
+        specs.append({"id": f"rule-{i:05d}", "when": when, "severity": rng.choice(rules.SEVERITIES),
+                      "risk": f"rule {i}: {{matches}}"})
+    return specs
+
+
+def evaluate_linear(rule_list, scan):
+    # The pre-index approach: every condition of every rule against every
+    # value of its field.
+    values = {f: [(v, v.lower()) for v in vs] for f, vs in rules.host_values(scan).items()}
+    numbers = {f: [(str(v), v) for v in vs] for f, vs in rules.host_numbers(scan).items()}
+    found = []
+    for rule in rule_list:
+        matched, ok = [], True
+        for cond in rule.conditions:
+            pool = numbers[cond.field] if cond.op == "range" else values[cond.field]
+            hits = [v for v, key in pool if cond.test(key)]
+            if bool(hits) == cond.negate:
+                ok = False
+                break
+            if not cond.negate:
+                matched.extend(v for v in hits if v not in matched)
+        if ok:
+            found.append((rule.id, matched))
+    return found
+
+
+@app.command()
+def run(
+    hosts: int = typer.Option(10000, help="Number of synthetic hosts"),
+    rule_count: int = typer.Option(1000, "--rules", help="Number of synthetic rules"),
+    linear_sample: int = typer.Option(200, help="Hosts evaluated with the linear baseline"),
+    output: str = typer.Option(None, help="Write JSON results to this path"),
+):
+    params = {"hosts": hosts, "rules": rule_count, "linear_sample": linear_sample}
+    console.print(f"Generating {hosts} hosts and {rule_count} rules...")
+    scans = list(generate_fleet(hosts, pm2_apps=2, generic_apps=1, files_per_app=2, file_size=64))
+    specs = generate_rules(rule_count)
+    start = time.perf_counter()
+    engine = rules.RuleEngine(rules.Rule(spec) for spec in specs)
+    compile_s = time.perf_counter() - start
+
+    sample = scans[:: max(1, hosts // linear_sample)][:linear_sample]
+    for scan in sample:
+        assert [(f.rule_id, f.matches) for f in engine.evaluate(scan)] == evaluate_linear(engine.rules, scan)
+
+    indexed = measure("indexed", engine.evaluate, scans, trace_memory=False)
+    linear = measure("linear", lambda s: evaluate_linear(engine.rules, s), sample, trace_memory=False)
+    findings = sum(len(engine.evaluate(s)) for s in sample)
+    linear_fleet_s = linear["latency_ms"]["mean"] / 1000 * hosts
+    results = [indexed, linear]
+
+    table = Table(title=f"Rule Evaluation ({hosts} hosts x {rule_count} rules, compiled in {compile_s * 1000:.0f} ms)")
+    for column in ("Engine", "Hosts", "Per host p50 ms", "p99 ms", "Fleet s"):
+        table.add_column(column, justify="left" if column == "Engine" else "right")
+    table.add_row("indexed", str(indexed["ops"]), f"{indexed['latency_ms']['p50']:.3f}",
+                  f"{indexed['latency_ms']['p99']:.3f}", f"{indexed['elapsed_s']:.2f}")
+    table.add_row("linear", str(linear["ops"]), f"{linear['latency_ms']['p50']:.3f}",
+                  f"{linear['latency_ms']['p99']:.3f}", f"{linear_fleet_s:.2f} (est)")
+    console.print(table)
+    console.print(f"{findings / max(1, len(sample)):.1f} findings per host, "
+                  f"{linear_fleet_s / max(indexed['elapsed_s'], 1e-9):.0f}x faster than linear")
+    params.update(compile_s=round(compile_s, 4), linear_fleet_s_est=round(linear_fleet_s, 3))
+    write_results(output, "rules", params, results)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,116 @@
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.harness import ROOT_DIR, summarize, write_results
+
+app = typer.Typer()
+console = Console()
+
+TARGETS = ["migrator_cli", "app.main"]
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    # Lines look like "import time:   self [us] | cumulative | imported package".
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, _, rest = line.partition(":")
+        self_us, cumulative_us, name = rest.split("|", 2)
+        rows.append((name.rstrip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def import_profile(module: str) -> Tuple[float, int, List[Tuple[str, int, int]]]:
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR, capture_output=True, text=True, check=True,
+    )
+    wall = time.perf_counter() - start
+    rows = parse_importtime(proc.stderr)
+    total = next((cum for name, _, cum in reversed(rows) if name.strip() == module), 0)
+    return wall, total, rows
+
+
+def time_to_first_prompt(timeout: float = 30.0) -> float:
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "migrator_cli.py"],
+        cwd=ROOT_DIR, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        env=dict(os.environ, PYTHONUNBUFFERED="1", TERM="dumb"),
+    )
+    seen = b""
+    try:
+        while b"Select Mode" not in seen:
+            chunk = proc.stdout.read1(4096)
+            if not chunk or time.perf_counter() - start > timeout:
+                raise RuntimeError("CLI exited before showing the first prompt")
+            seen += chunk
+        return time.perf_counter() - start
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+@app.command()
+def run(
+    repeat: int = typer.Option(10, help="Cold process starts per target"),
+    top: int = typer.Option(10, help="Heaviest imports to report per target"),
+    output: str = typer.Option(None, help="Write JSON results to this path"),
+):
+    results = []
+    table = Table(title="Cold Start")
+    table.add_column("Target", style="cyan")
+    table.add_column("Process p50 ms", justify="right")
+    table.add_column("Import p50 ms", justify="right")
+    table.add_column("Heaviest imports")
+
+    for module in TARGETS:
+        walls, imports = [], []
+        rows: List[Tuple[str, int, int]] = []
+        for _ in range(repeat):
+            wall, total_us, rows = import_profile(module)
+            walls.append(wall)
+            imports.append(total_us / 1e6)
+        heaviest: Dict[str, int] = {}
+        for name, _, cumulative in rows:
+            name = name.strip()
+            if name != module:
+                heaviest[name] = max(heaviest.get(name, 0), cumulative)
+        top_imports = sorted(heaviest.items(), key=lambda kv: kv[1], reverse=True)[:top]
+
+        process = summarize(f"process_start:{module}", walls, sum(walls))
+        imported = summarize(
+            f"import:{module}", imports, sum(imports),
+            top_imports_us=dict(top_imports),
+            modules_loaded=len(rows),
+        )
+        results.extend([process, imported])
+        table.add_row(
+            module,
+            f"{process['latency_ms']['p50']:.1f}",
+            f"{imported['latency_ms']['p50']:.1f}",
+            ", ".join(f"{n} ({us / 1000:.0f})" for n, us in top_imports[:4]),
+        )
+
+    prompts = [time_to_first_prompt() for _ in range(repeat)]
+    prompt = summarize("cli_first_prompt", prompts, sum(prompts))
+    results.append(prompt)
+    table.add_row("migrator_cli first prompt", f"{prompt['latency_ms']['p50']:.1f}", "-", "")
+
+    console.print(table)
+    write_results(output, "startup", {"repeat": repeat, "python": sys.executable}, results)
+    if output:
+        console.print(f"Results written to [bold]{output}[/bold]")
+
+
+if __name__ == "__main__":
+    app()
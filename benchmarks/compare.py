@@ -0,0 +1,50 @@
+import json
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+app = typer.Typer()
+console = Console()
+
+
+def _load(path: str) -> dict:
+    with open(path) as f:
+        report = json.load(f)
+    return {r["name"]: r for r in report["results"]}
+
+
+@app.command()
+def compare(
+    baseline: str = typer.Argument(..., help="Baseline results JSON"),
+    candidate: str = typer.Argument(..., help="Candidate results JSON"),
+    metric: str = typer.Option("p50", help="Latency percentile to compare"),
+    threshold: float = typer.Option(10.0, help="Allowed slowdown in percent before failing"),
+):
+    old = _load(baseline)
+    new = _load(candidate)
+
+    table = Table(title=f"Latency {metric} (ms)")
+    table.add_column("Benchmark", style="cyan")
+    table.add_column("Baseline", justify="right")
+    table.add_column("Candidate", justify="right")
+    table.add_column("Change", justify="right")
+
+    regressions = []
+    for name in sorted(set(old) & set(new)):
+        before = old[name]["latency_ms"][metric]
+        after = new[name]["latency_ms"][metric]
+        change = ((after - before) / before * 100) if before else 0.0
+        style = "red" if change > threshold else "green" if change < -threshold else ""
+        table.add_row(name, f"{before:.3f}", f"{after:.3f}", f"[{style}]{change:+.1f}%[/{style}]" if style else f"{change:+.1f}%")
+        if change > threshold:
+            regressions.append(name)
+
+    console.print(table)
+    if regressions:
+        console.print(f"[bold red]Regressions:[/bold red] {', '.join(regressions)}")
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    app()
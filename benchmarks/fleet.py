@@ -0,0 +1,208 @@
+import functools
+import random
+import string
+from typing import Iterator
+
+from app.models import ScanResult
+
+OS_POOL = [
+    "Ubuntu 20.04.6 LTS",
+    "Ubuntu 22.04.4 LTS",
+    "Ubuntu 18.04.6 LTS",
+    "Ubuntu 16.04.7 LTS",
+    "Debian GNU/Linux 10 (buster)",
+    "Debian GNU/Linux 11 (bullseye)",
+    "CentOS Linux 7 (Core)",
+    "Red Hat Enterprise Linux 8.9 (Ootpa)",
+]
+
+SERVICE_POOL = [
+    "nginx", "apache2", "postgresql", "mysql", "mongod", "redis-server",
+    "docker", "ssh", "gunicorn", "cron", "rsyslog", "memcached", "rabbitmq-server",
+    "elasticsearch", "haproxy", "tomcat", "php7.4-fpm", "supervisor", "node-exporter",
+    "filebeat", "chrony", "postfix", "containerd", "kafka", "zookeeper",
+]
+
+SERVICE_PORTS = {
+    "nginx": [80, 443], "apache2": [80, 443], "postgresql": [5432], "mysql": [3306],
+    "mongod": [27017], "redis-server": [6379], "ssh": [22], "gunicorn": [8000],
+    "memcached": [11211], "rabbitmq-server": [5672, 15672], "elasticsearch": [9200, 9300],
+    "haproxy": [8404], "tomcat": [8080], "php7.4-fpm": [9000], "node-exporter": [9100],
+    "postfix": [25], "kafka": [9092], "zookeeper": [2181],
+}
+
+# Base system packages every host shares plus an optional tail drawn per host.
+BASE_PACKAGES = [
+    "adduser", "apt", "apt-utils", "base-files", "base-passwd", "bash", "bash-completion",
+    "bsdutils", "ca-certificates", "coreutils", "cron", "curl", "dash", "debconf",
+    "debianutils", "diffutils", "dpkg", "e2fsprogs", "findutils", "gcc-10-base:amd64",
+    "gpgv", "grep", "gzip", "hostname", "init-system-helpers", "iproute2", "iputils-ping",
+    "less", "libc-bin", "libc6:amd64", "libssl1.1:amd64", "libsystemd0:amd64", "login",
+    "logrotate", "lsb-base", "mawk", "mount", "ncurses-base", "netbase", "openssh-client",
+    "openssh-server", "openssl", "passwd", "perl-base", "procps", "python3", "python3-minimal",
+    "rsyslog", "sed", "sensible-utils", "sudo", "systemd", "systemd-sysv", "sysvinit-utils",
+    "tar", "tzdata", "ubuntu-keyring", "util-linux", "vim", "wget", "zlib1g:amd64",
+]
+
+EXTRA_PACKAGES = [
+    "nginx", "nginx-common", "apache2", "apache2-utils", "postgresql-12", "postgresql-13",
+    "postgresql-client-12", "mysql-server-8.0", "mysql-client-8.0", "mongodb-org",
+    "redis-server", "redis-tools", "memcached", "rabbitmq-server", "openjdk-11-jre-headless",
+    "openjdk-8-jre-headless", "tomcat9", "php7.4", "php7.4-fpm", "php7.4-mysql", "nodejs",
+    "npm", "python3-pip", "python3-venv", "python2.7", "git", "make", "build-essential",
+    "docker-ce", "containerd.io", "haproxy", "supervisor", "htop", "jq", "unzip", "zip",
+    "rsync", "net-tools", "dnsutils", "telnet", "tcpdump", "strace", "lsof", "sysstat",
+    "postfix", "mailutils", "chrony", "ntp", "snapd", "cloud-init", "linux-image-5.4.0-150-generic",
+    "linux-headers-5.4.0-150-generic", "linux-modules-5.4.0-150-generic", "libpq5:amd64",
+    "libmysqlclient21:amd64", "libxml2:amd64", "libcurl4:amd64", "imagemagick", "ffmpeg",
+]
+
+APP_DIRS = ["src", "src/config", "src/routes", "src/models", "config", "lib", "public", "scripts"]
+APP_EXTS = [".js", ".json", ".ts", ".yml", ".env", ".conf", ".py", ".sh"]
+
+CONFIG_TEMPLATES = {
+    "/etc/nginx/nginx.conf": "user www-data;\nworker_processes auto;\npid /run/nginx.pid;\n",
+    "/etc/nginx/conf.d/default.conf": "server {\n    listen 80;\n    server_name {host};\n}\n",
+    "/etc/postgresql/12/main/postgresql.conf": "listen_addresses = '*'\nport = 5432\nmax_connections = 100\n",
+    "/etc/mysql/my.cnf": "[mysqld]\nbind-address = 0.0.0.0\n",
+    "/etc/apache2/ports.conf": "Listen 80\n<IfModule ssl_module>\n    Listen 443\n</IfModule>\n",
+}
+
+
+def _text(rng: random.Random, size: int, host: str) -> str:
+    # Config-like text: mostly shared lines with the odd host-specific value so
+    # near-identical hosts still produce near-identical files.
+    lines = []
+    total = 0
+    while total < size:
+        key = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 12)))
+        if host and rng.random() < 0.05:
+            line = f"{key} = {host}\n"
+        else:
+            line = f"{key} = {rng.randint(0, 10 ** 6)}\n"
+        lines.append(line)
+        total += len(line)
+    return "".join(lines)[:size]
+
+
+def _app_files(rng: random.Random, count: int, file_size: int, host: str) -> dict:
+    # Only environment/config style files carry host specific values; the rest
+    # of the tree is identical for hosts deployed from the same release.
+    files = {"package.json": '{\n  "name": "app",\n  "version": "1.0.0",\n  "scripts": {"start": "node index.js"}\n}\n'}
+    if count > 1:
+        files["ecosystem.config.js"] = "module.exports = { apps: [{ name: 'app', script: 'index.js' }] };\n"
+    while len(files) < count:
+        ext = rng.choice(APP_EXTS)
+        rel = f"{rng.choice(APP_DIRS)}/file_{len(files)}{ext}"
+        files[rel] = _text(rng, file_size, host if ext in (".env", ".conf") else "")
+    return files
+
+
+def generate_scan(
+    index: int,
+    seed: int = 0,
+    services: int = 6,
+    pm2_apps: int = 2,
+    generic_apps: int = 1,
+    files_per_app: int = 20,
+    file_size: int = 2048,
+    extra_packages: int = 40,
+    app_variants: int = 8,
+) -> ScanResult:
+    rng = random.Random(seed * 1_000_003 + index)
+    hostname = f"srv-{index:05d}"
+    # Hosts sharing a variant run the same application release (0 = all unique).
+    variant = index % app_variants if app_variants else index
+
+    running_services = rng.sample(SERVICE_POOL, min(services, len(SERVICE_POOL)))
+    if "ssh" not in running_services:
+        running_services[-1:] = ["ssh"]
+    open_ports = sorted({p for s in running_services for p in SERVICE_PORTS.get(s, [])})
+
+    packages = BASE_PACKAGES + rng.sample(EXTRA_PACKAGES, min(extra_packages, len(EXTRA_PACKAGES)))
+    users = ["root"] + [f"user{n}" for n in range(rng.randint(1, 4))]
+
+    config_files = {
+        path: body.replace("{host}", hostname)
+        for path, body in CONFIG_TEMPLATES.items()
+        if any(part in path for part in running_services) or "nginx" in path
+    }
+
+    pm2_processes = []
+    custom_app_configs = {}
+    for n in range(pm2_apps):
+        name = f"node-app-{n}"
+        path = f"/opt/{name}"
+        pm2_processes.append({
+            "name": name,
+            "path": path,
+            "status": "online",
+            "version": f"1.{n}.0",
+            "script": f"{path}/index.js",
+        })
+        app_rng = random.Random(f"{seed}-{variant}-{name}")
+        custom_app_configs[name] = _app_files(app_rng, files_per_app, file_size, hostname)
+
+    generic = []
+    for n in range(generic_apps):
+        name = f"svc-app-{n}"
+        path = f"/srv/{name}"
+        generic.append({
+            "service_name": f"{name}.service",
+            "name": name,
+            "exec_start": f"/usr/bin/python3 {path}/main.py",
+            "working_directory": path,
+            "unit_file_path": f"/etc/systemd/system/{name}.service",
+            "unit_file_content": f"[Unit]\nDescription={name}\n\n[Service]\nWorkingDirectory={path}\nExecStart=/usr/bin/python3 {path}/main.py\n\n[Install]\nWantedBy=multi-user.target\n",
+            "app_path": path,
+            "files": _app_files(random.Random(f"{seed}-{variant}-{name}"), files_per_app, file_size, hostname),
+        })
+
+    crontabs = {
+        user: f"# m h dom mon dow command\n*/5 * * * * /usr/local/bin/report-{user}.sh\n"
+        for user in users
+        if rng.random() < 0.5
+    }
+
+    return ScanResult(
+        hostname=hostname,
+        os_info=rng.choice(OS_POOL),
+        cpu_cores=rng.choice([1, 2, 4, 8, 16]),
+        memory_gb=float(rng.choice([2, 4, 8, 16, 32, 64])),
+        disk_space_gb={"/": float(rng.choice([20, 50, 100, 250, 500]))},
+        running_services=running_services,
+        open_ports=open_ports,
+        installed_packages=packages,
+        system_users=users,
+        crontabs=crontabs,
+        config_files=config_files,
+        pm2_processes=pm2_processes,
+        custom_app_configs=custom_app_configs,
+        generic_apps=generic,
+    )
+
+
+def generate_fleet(count: int, **kwargs) -> Iterator[ScanResult]:
+    for index in range(count):
+        yield generate_scan(index, **kwargs)
+
+
+@functools.lru_cache(maxsize=64)
+def _role_json(role: int, seed: int, kwargs: tuple) -> str:
+    return generate_scan(role, seed=seed, **dict(kwargs)).model_dump_json()
+
+
+def generate_similar_scan(index: int, roles: int = 4, seed: int = 0, drift: float = 0.1, **kwargs) -> ScanResult:
+    # Hosts deployed from one of `roles` server images: identical apart from
+    # the hostname inside their configs, and a `drift` share of them carrying
+    # one extra package.
+    role = index % roles
+    base = _role_json(role, seed, tuple(sorted(kwargs.items())))
+    hostname = f"node-{index:05d}"
+    scan = ScanResult.model_validate_json(base.replace(f"srv-{role:05d}", hostname))
+    rng = random.Random(f"{seed}-drift-{index}")
+    if rng.random() < drift:
+        missing = [p for p in EXTRA_PACKAGES if p not in scan.installed_packages]
+        if missing:
+            scan.installed_packages.append(rng.choice(missing))
+    return scan
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Iterable, List, Optional
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def summarize(name: str, latencies: List[float], elapsed: float, peak_bytes: int = 0, **extra) -> dict:
+    ordered = sorted(latencies)
+    ops = len(ordered)
+    result = {
+        "name": name,
+        "ops": ops,
+        "elapsed_s": round(elapsed, 6),
+        "throughput_ops_s": round(ops / elapsed, 3) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "min": round(ordered[0] * 1000, 4) if ordered else 0.0,
+            "mean": round(sum(ordered) / ops * 1000, 4) if ops else 0.0,
+            "p50": round(percentile(ordered, 50) * 1000, 4),
+            "p90": round(percentile(ordered, 90) * 1000, 4),
+            "p99": round(percentile(ordered, 99) * 1000, 4),
+            "max": round(ordered[-1] * 1000, 4) if ordered else 0.0,
+        },
+        "peak_memory_bytes": peak_bytes,
+    }
+    result.update(extra)
+    return result
+
+
+def measure(name: str, fn: Callable, items: Iterable, trace_memory: bool = True, **extra) -> dict:
+    # Runs fn once per item and records per-call latency. Memory is traced
+    # separately from timing because tracemalloc slows allocations noticeably.
+    items = list(items)
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+
+    peak = 0
+    if trace_memory and items:
+        tracemalloc.start()
+        for item in items[: max(1, min(len(items), 20))]:
+            fn(item)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return summarize(name, latencies, elapsed, peak, **extra)
+
+
+def environment() -> dict:
+    try:
+        revision = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        revision = "unknown"
+    return {
+        "git_revision": revision,
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def write_results(path: Optional[str], suite: str, params: dict, results: List[dict]) -> dict:
+    report = {
+        "suite": suite,
+        "environment": environment(),
+        "params": params,
+        "results": results,
+    }
+    if path:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+async def asgi_request(app, method: str, path: str, body: bytes = b"", query: str = "", headers: dict = None):
+    # Minimal in-process ASGI client so benchmarks exercise routing, request
+    # parsing and validation without a socket or an HTTP client dependency.
+    raw_headers = [
+        (b"host", b"bench"),
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+    ]
+    for key, value in (headers or {}).items():
+        raw_headers.append((key.lower().encode(), str(value).encode()))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": raw_headers,
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # Like a real server, only report a disconnect once the client goes
+        # away; streaming responses watch receive() while they send.
+        await asyncio.Event().wait()
+
+    response = {"status": None, "headers": [], "body": b""}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = message.get("headers", [])
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    await app(scope, receive, send)
+    return response
+
+
+class AsgiClient:
+    def __init__(self, app):
+        self.app = app
+        self.loop = asyncio.new_event_loop()
+
+    def request(self, method: str, path: str, body: bytes = b"", query: str = "", headers: dict = None):
+        return self.loop.run_until_complete(asgi_request(self.app, method, path, body, query, headers))
+
+    def close(self):
+        self.loop.close()
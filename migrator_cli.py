@@ -1,22 +1,52 @@
+import os
+import threading
+import importlib
+import time
+from typing import List
+
 import typer
 from rich.console import Console
-from rich.table import Table
 from rich.prompt import Prompt, Confirm
-import json
-from app.models import SSHConnection, ScanResult, BuildConfig
-from app.core import scanner, analyzer, builder, deployer
 
+# pydantic models and the core modules (paramiko, jinja2) are imported inside
+# the commands so the first prompt appears before they are loaded.
 app = typer.Typer()
 console = Console()
 
+CORE_MODULES = ("app.models", "app.core.scanner", "app.core.analyzer", "app.core.builder", "app.core.deployer")
+
+
+def preload(modules=CORE_MODULES):
+    # Warm the import cache while the user is answering prompts.
+    def load():
+        for name in modules:
+            try:
+                importlib.import_module(name)
+            except Exception:
+                pass
+    threading.Thread(target=load, name="preload", daemon=True).start()
+
+
+@app.callback(invoke_without_command=True)
+def main(ctx: typer.Context):
+    # Keep `python3 migrator_cli.py` starting the interactive flow.
+    if ctx.invoked_subcommand is None:
+        migrate()
+
+
 @app.command()
 def migrate():
     console.print("[bold blue]Migration Automater CLI[/bold blue]")
     console.print("======================================")
+    preload()
     
     # Phase 1: Scan
     console.print("\n[bold green]Phase 1: Scan (Discovery & Inventory)[/bold green]")
     mode = Prompt.ask("Select Mode", choices=["mock", "real"], default="mock")
+
+    from rich.table import Table
+    from app.models import SSHConnection, BuildConfig
+    from app.core import scanner, analyzer, builder, deployer
     
     if mode == "real":
         host = Prompt.ask("Enter Host IP")
@@ -55,6 +85,12 @@ def migrate():
     console.print(f"[bold]Recommended Strategy:[/bold] {analysis.migration_strategy}")
     console.print(f"[bold]Recommended Instance:[/bold] {analysis.recommended_gcp_instance}")
     console.print(f"[bold]Estimated Cost:[/bold] ${analysis.estimated_cost_monthly}/month")
+    console.print(f"[bold]Recommended Disk:[/bold] {analysis.recommended_disk_gb} GB")
+    if analysis.transfer_seconds is not None:
+        console.print(
+            f"[bold]Data Transfer:[/bold] {analysis.data_volume_bytes / 1024 ** 3:.1f} GB, "
+            f"~{analysis.transfer_seconds / 3600:.1f}h at {analysis.transfer_bandwidth_mbps:g} Mbps"
+        )
     
     if analysis.risks:
         console.print("[bold yellow]Risks Identified:[/bold yellow]")
@@ -74,7 +110,8 @@ def migrate():
         zone="us-central1-a",
         instance_name=f"migrated-{scan_result.hostname}",
         machine_type=analysis.recommended_gcp_instance,
-        source_image="debian-cloud/debian-11" # Defaulting for demo
+        source_image="debian-cloud/debian-11", # Defaulting for demo
+        disk_size_gb=analysis.recommended_disk_gb,
     )
     
     with console.status("Generating Infrastructure Code..."):
@@ -82,6 +119,11 @@ def migrate():
         
     console.print(f"[bold]Terraform Code:[/bold] {build_result.terraform_code_path}")
     console.print(build_result.message)
+    if build_result.unavailable_packages:
+        console.print(
+            f"[bold yellow]Not available on {config.source_image}:[/bold yellow] "
+            + " ".join(build_result.unavailable_packages)
+        )
     
     if not Confirm.ask("Proceed to Deploy?"):
         return
@@ -99,5 +141,305 @@ def migrate():
     
     console.print("\n[bold blue]Migration Completed Successfully![/bold blue]")
 
+@app.command()
+def batch(
+    inventory: str = typer.Argument(..., help="Inventory file (.json, .csv, .yaml)"),
+    output_dir: str = typer.Option("batch-results", help="Directory for per-host results and checkpoint"),
+    project_id: str = typer.Option("my-migration-project", help="Default GCP project ID"),
+    scan_workers: int = typer.Option(4, help="Concurrent scans"),
+    build_workers: int = typer.Option(2, help="Concurrent analyze/build workers"),
+    queue_size: int = typer.Option(8, help="Max scanned hosts waiting for analysis"),
+    build: bool = typer.Option(True, help="Generate Terraform for each host"),
+    bake_image: bool = typer.Option(False, help="Restore into a Packer-baked image instead of at first boot"),
+    resume: bool = typer.Option(True, help="Skip hosts completed in a previous run"),
+):
+    from rich.live import Live
+    from rich.table import Table
+    from app.core import batch as batch_runner
+
+    try:
+        hosts = batch_runner.load_inventory(inventory)
+    except (OSError, ValueError) as e:
+        console.print(f"[bold red]Invalid inventory:[/bold red] {e}")
+        raise typer.Exit(code=1)
+
+    rows = {}
+    started = {}
+    styles = {"done": "green", "failed": "red", "running": "yellow", "pending": "dim"}
+
+    def on_event(key, stage, status, detail):
+        row = rows.setdefault(key, {"stage": "", "status": "", "scan": "", "analyze": "", "build": "", "detail": ""})
+        row["stage"], row["status"] = stage, status
+        if status == "running":
+            started[key] = time.perf_counter()
+        if "seconds" in detail:
+            row[stage] = f"{detail['seconds']:.2f}s"
+        if detail.get("error"):
+            row["detail"] = detail["error"]
+
+    def render():
+        table = Table(title=f"Batch Migration ({len(hosts)} hosts)")
+        for column in ("Host", "Stage", "Status", "Scan", "Analyze", "Build", "Detail"):
+            table.add_column(column)
+        for key, row in rows.items():
+            status = row["status"]
+            if status == "running":
+                status = f"running {time.perf_counter() - started[key]:.1f}s"
+            style = styles.get(row["status"], "")
+            table.add_row(key, row["stage"], f"[{style}]{status}[/{style}]" if style else status,
+                          row["scan"], row["analyze"], row["build"], row["detail"][:60])
+        counts = {}
+        for row in rows.values():
+            counts[row["status"]] = counts.get(row["status"], 0) + 1
+        table.caption = "  ".join(f"{k}: {v}" for k, v in sorted(counts.items()))
+        return table
+
+    try:
+        with Live(get_renderable=render, console=console, refresh_per_second=4):
+            summary = batch_runner.run_batch(
+                hosts,
+                output_dir,
+                project_id=project_id,
+                scan_workers=scan_workers,
+                build_workers=build_workers,
+                queue_size=queue_size,
+                build=build,
+                bake_image=bake_image,
+                resume=resume,
+                on_event=on_event,
+            )
+    except KeyboardInterrupt:
+        console.print(f"[bold yellow]Interrupted.[/bold yellow] Re-run the same command to resume from {output_dir}.")
+        raise typer.Exit(code=130)
+
+    failed = [k for k, r in summary.items() if r["status"] != "done"]
+    console.print(f"[bold]Results:[/bold] {output_dir} ({len(summary) - len(failed)} done, {len(failed)} failed)")
+    if failed:
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def export(
+    results_dir: str = typer.Argument(..., help="Batch results directory to export"),
+    output_dir: str = typer.Option("fleet-export", help="Directory for the exported tables"),
+    format: str = typer.Option("csv", help="csv (chunked, gzipped) or parquet (needs pyarrow)"),
+    chunk_rows: int = typer.Option(100000, help="Rows per CSV part / Parquet row group"),
+    compress: bool = typer.Option(True, help="gzip CSV parts / zstd Parquet pages"),
+):
+    from app.core import export as exporter
+
+    try:
+        manifest = exporter.export_fleet(
+            exporter.batch_records(results_dir), output_dir, fmt=format, chunk_rows=chunk_rows, compress=compress,
+        )
+    except (OSError, ValueError, RuntimeError) as e:
+        console.print(f"[bold red]Export failed:[/bold red] {e}")
+        raise typer.Exit(code=1)
+    for table, info in manifest["tables"].items():
+        console.print(f"{table}: {info['rows']} rows in {len(info['files'])} file(s)")
+    console.print(f"[bold]Exported {manifest['hosts']} hosts to {output_dir}[/bold]")
+
+
+@app.command()
+def cluster(
+    results_dir: str = typer.Argument(..., help="Batch results directory to cluster"),
+    output_dir: str = typer.Option("clusters", help="Directory for the per-cluster builds"),
+    threshold: float = typer.Option(None, help="Minimum similarity to join a cluster (default MIGRATOR_CLUSTER_THRESHOLD)"),
+    project_id: str = typer.Option("my-migration-project", help="GCP project for hosts without one"),
+    source_image: str = typer.Option("debian-cloud/debian-11", help="Source image for the instance templates"),
+):
+    from rich.table import Table
+    from app.core import clusters
+
+    try:
+        with console.status(f"Clustering hosts in {results_dir}..."):
+            manifest = clusters.build_clusters(
+                results_dir, output_dir, project_id=project_id, source_image=source_image,
+                threshold=clusters.THRESHOLD if threshold is None else threshold,
+            )
+    except (OSError, ValueError) as e:
+        console.print(f"[bold red]Clustering failed:[/bold red] {e}")
+        raise typer.Exit(code=1)
+
+    table = Table(title=f"{len(manifest['clusters'])} clusters for {manifest['hosts']} hosts")
+    for column in ("Cluster", "Hosts", "Min similarity", "Machine type", "Startup KiB", "Overrides KiB"):
+        table.add_column(column, justify="left" if column in ("Cluster", "Machine type") else "right")
+    for c in manifest["clusters"]:
+        table.add_row(
+            c["id"], str(len(c["hosts"])), f"{c['min_similarity']:.2f}", c["machine_type"],
+            f"{c['startup_bytes'] / 1024:.1f}", f"{c['override_bytes'] / 1024:.1f}",
+        )
+    console.print(table)
+    console.print(f"[bold]Wrote cluster builds to {output_dir}[/bold]")
+
+
+@app.command("import-bundles")
+def import_bundles(
+    directory: str = typer.Argument(..., help="Directory of offline scan bundles (agent.py --bundle)"),
+    output_dir: str = typer.Option("batch-results", help="Batch results directory to import into"),
+    project: str = typer.Option(None, help="Project for imported hosts (default: the project each bundle names)"),
+    workers: int = typer.Option(None, help="Bundles decoded in parallel (default MIGRATOR_IMPORT_WORKERS)"),
+):
+    from app.core import bundles
+
+    try:
+        with console.status(f"Importing bundles from {directory}..."):
+            summary = bundles.import_to_results(
+                directory, output_dir, project=project, workers=bundles.WORKERS if workers is None else workers,
+            )
+    except OSError as e:
+        console.print(f"[bold red]Import failed:[/bold red] {e}")
+        raise typer.Exit(code=1)
+
+    reasons = {}
+    for reason in summary["skipped"].values():
+        reason = reason.split(":")[0]
+        reasons[reason] = reasons.get(reason, 0) + 1
+    skipped = ", ".join(f"{count} {reason}" for reason, count in sorted(reasons.items()))
+    console.print(f"{summary['bundles']} bundles: {len(summary['imported'])} hosts imported"
+                  + (f", skipped {skipped}" if skipped else "") + f" in {summary['seconds']:.1f}s")
+    for path, error in summary["failed"].items():
+        console.print(f"[bold red]Failed:[/bold red] {path}: {error}")
+    console.print(f"[bold]Results:[/bold] {output_dir}")
+    if summary["failed"]:
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def relay(
+    upstream: str = typer.Option(..., help="Central server URL, e.g. http://migrator.example.com:8000"),
+    host: str = typer.Option("0.0.0.0", help="Address agents in this segment submit to"),
+    port: int = typer.Option(8100, help="Port agents in this segment submit to"),
+    spool_dir: str = typer.Option("relay-spool", help="Directory for queued scans and batches"),
+    flush_seconds: float = typer.Option(30, help="Seconds between bulk transfers to the central server"),
+    batch_scans: int = typer.Option(200, help="Scans per batch (a full inbox also starts a transfer)"),
+    name: str = typer.Option(None, help="Relay name reported upstream (default: this host's name)"),
+):
+    import uvicorn
+
+    # The relay reads its settings from the environment when it is imported.
+    os.environ.update({
+        "MIGRATOR_RELAY_UPSTREAM": upstream,
+        "MIGRATOR_RELAY_SPOOL": spool_dir,
+        "MIGRATOR_RELAY_FLUSH_SECONDS": str(flush_seconds),
+        "MIGRATOR_RELAY_BATCH_SCANS": str(batch_scans),
+    })
+    if name:
+        os.environ["MIGRATOR_RELAY_NAME"] = name
+    console.print(f"Relaying scans from http://{host}:{port}/api/scan/submit to [bold]{upstream}[/bold]")
+    uvicorn.run("app.relay:app", host=host, port=port, log_level="warning")
+
+
+@app.command("dry-run")
+def dry_run(
+    source: str = typer.Argument(..., help="Generated startup.sh, or a batch result.json to render the script from"),
+    scale: float = typer.Option(1.0, help="Multiplier for the simulated command latencies (0 = no delays)"),
+    latency: List[str] = typer.Option([], help="Override a stub latency: COMMAND=SECONDS[/PER_ARG], repeatable"),
+    fail: List[str] = typer.Option([], help="Stubbed command that exits non-zero, repeatable"),
+    root: str = typer.Option(None, help="Keep the sandbox root here instead of a removed temp dir"),
+    output: str = typer.Option(None, help="Write the JSON report to this path"),
+):
+    import json
+    from rich.table import Table
+    from app.core import dryrun
+    from app.models import BuildResult, ScanResult
+
+    latencies = {}
+    for spec in latency:
+        name, _, value = spec.partition("=")
+        per_call, _, per_arg = value.partition("/")
+        try:
+            latencies[name] = (float(per_call), float(per_arg or 0))
+        except ValueError:
+            console.print(f"[bold red]Invalid latency '{spec}'[/bold red] (use COMMAND=SECONDS[/PER_ARG])")
+            raise typer.Exit(code=1)
+    options = {"latencies": latencies, "scale": scale, "fail": fail, "root": root}
+
+    try:
+        with console.status(f"Dry-running {source}..."):
+            if source.endswith(".json"):
+                with open(source) as f:
+                    result = json.load(f)
+                build = BuildResult.model_validate(result["build"]) if result.get("build") else None
+                script = os.path.join(os.path.dirname(build.terraform_code_path), "startup.sh") if build else None
+                if script and os.path.exists(script):
+                    report = dryrun.dry_run_script(script, build.startup_sections, **options)
+                else:
+                    report = dryrun.dry_run_scan(ScanResult.model_validate(result["scan"]), **options)
+            else:
+                report = dryrun.dry_run_script(source, **options)
+    except (OSError, ValueError, KeyError) as e:
+        console.print(f"[bold red]Dry run failed:[/bold red] {e}")
+        raise typer.Exit(code=1)
+
+    table = Table(title=f"Dry run of {source}")
+    for column in ("Section", "Wall s", "Simulated s", "Commands", "Files", "KiB written", "Failures"):
+        table.add_column(column, justify="left" if column == "Section" else "right")
+    for s in report["sections"]:
+        table.add_row(s["name"], f"{s['seconds']:.2f}", f"{s['simulated_seconds']:.2f}", str(s["commands"]),
+                      str(s["files_written"]), f"{s['bytes_written'] / 1024:.1f}", str(len(s["failures"])))
+    console.print(table)
+    for s in report["sections"]:
+        for failure in s["failures"]:
+            console.print(f"[bold red]{s['name']}:[/bold red] {failure['command']} (exit {failure['status']})")
+    console.print(f"[bold]Total:[/bold] {report['seconds']:.2f}s, {report['bytes_written'] / 1024:.1f} KiB written, "
+                  f"{report['failures']} unhandled failure(s)")
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+    if report["failures"]:
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def sync(
+    source: str = typer.Argument(..., help="Local data directory to copy"),
+    dest: str = typer.Argument(..., help="Target directory, or user@host:/path on the migrated host"),
+    transport: str = typer.Option(None, help="local, pipe (local subprocess stand-in) or ssh; inferred from DEST"),
+    streams: int = typer.Option(4, help="Files chunked and uploaded in parallel"),
+    delete: bool = typer.Option(False, help="Remove target files that are gone from the source"),
+    port: int = typer.Option(22, help="SSH port"),
+    key_path: str = typer.Option(None, help="SSH private key"),
+    password: bool = typer.Option(False, help="Prompt for an SSH password"),
+):
+    from app.core import datasync
+    from app.models import SSHConnection
+
+    conn = None
+    if transport is None:
+        transport = "ssh" if ":" in dest and not os.path.exists(dest) else "local"
+    if transport == "ssh":
+        remote, _, dest = dest.partition(":")
+        username, _, host = remote.rpartition("@")
+        conn = SSHConnection(
+            host=host, username=username or os.environ.get("USER", "root"), port=port, key_path=key_path,
+            password=Prompt.ask("Enter Password", password=True) if password else None,
+        )
+
+    try:
+        with datasync.open_target(dest, transport, conn=conn, workers=streams) as target:
+            with console.status(f"Syncing {source} to {dest}..."):
+                stats = datasync.sync(source, target, streams=streams, delete=delete, transport=transport)
+    except KeyboardInterrupt:
+        console.print("[bold yellow]Interrupted.[/bold yellow] Re-run the same command to resume.")
+        raise typer.Exit(code=130)
+    except (OSError, ValueError, RuntimeError) as e:
+        console.print(f"[bold red]Sync failed:[/bold red] {e}")
+        raise typer.Exit(code=1)
+
+    console.print(
+        f"{stats['files']} files: {stats['transferred']} transferred, {stats['skipped']} unchanged, "
+        f"{stats['links']} links, {stats['removed']} removed"
+    )
+    console.print(
+        f"Sent {stats['bytes_sent'] / 2 ** 20:.1f} MiB of {stats['bytes_total'] / 2 ** 20:.1f} MiB "
+        f"in {stats['seconds']:.1f}s ({stats['effective_mbps']:.1f} MiB/s effective)"
+    )
+    for error in stats["errors"][:10]:
+        console.print(f"[red]{error['path']}:[/red] {error['error']}")
+    if stats["errors"]:
+        raise typer.Exit(code=1)
+
+
 if __name__ == "__main__":
     app()
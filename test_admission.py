@@ -0,0 +1,137 @@
+import asyncio
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from fastapi import FastAPI, Request
+
+from benchmarks.harness import AsgiClient
+from app.api.middleware import AdmissionMiddleware, spool_request
+from app.core import admission
+from app.static import agent
+
+
+def test_round_robin_across_projects_and_rejection():
+    async def scenario():
+        controller = admission.AdmissionController(max_concurrent=1, max_queued=4, max_queued_per_project=3)
+        await controller.acquire("big")
+        order = []
+
+        async def submit(project):
+            await controller.acquire(project)
+            order.append(project)
+            controller.release(0.01)
+
+        tasks = [asyncio.ensure_future(submit(p)) for p in ("big", "big", "big", "small")]
+        await asyncio.sleep(0)
+        try:
+            await controller.acquire("other")
+            assert False, "queue should be full"
+        except admission.Rejected as e:
+            assert e.retry_after >= 1
+        controller.release(0.01)
+        await asyncio.gather(*tasks)
+        return order, controller.in_flight
+
+    order, in_flight = asyncio.new_event_loop().run_until_complete(scenario())
+    assert order == ["big", "small", "big", "big"]
+    assert in_flight == 0
+
+
+async def _echo(scope, receive, send):
+    message = await receive()
+    await asyncio.sleep(0.01)
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": message["body"]})
+
+
+def test_middleware_limits_body_and_queue():
+    controller = admission.AdmissionController(max_concurrent=1, max_queued=0)
+    client = AsgiClient(AdmissionMiddleware(_echo, controller=controller, max_body_bytes=10))
+    try:
+        assert client.request("POST", "/api/scan/submit", b"x" * 11)["status"] == 413
+        assert client.request("POST", "/api/scan/submit", b"ok")["body"] == b"ok"
+
+        async def herd():
+            from benchmarks.harness import asgi_request
+            return await asyncio.gather(*(
+                asgi_request(client.app, "POST", "/api/scan/submit", b"hi") for _ in range(3)
+            ))
+
+        responses = client.loop.run_until_complete(herd())
+        statuses = sorted(r["status"] for r in responses)
+        assert statuses == [200, 429, 429]
+        assert (b"retry-after", b"1") in next(r for r in responses if r["status"] == 429)["headers"]
+    finally:
+        client.close()
+
+
+def test_streamed_routes_are_capped_per_route():
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        path = await spool_request(request, 8)
+        try:
+            with open(path, "rb") as f:
+                return {"body": f.read().decode()}
+        finally:
+            os.remove(path)
+
+    controller = admission.AdmissionController(max_concurrent=1, max_queued=0)
+    app.add_middleware(AdmissionMiddleware, controller=controller, paths={"/upload": 8, "/api/scan/import": 0},
+                       streamed=("/upload",))
+    client = AsgiClient(app)
+    previous = tempfile.tempdir
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            tempfile.tempdir = tmp
+            assert client.request("POST", "/upload", b"12345678")["body"] == b'{"body":"12345678"}'
+            assert client.request("POST", "/upload", b"123456789")["status"] == 413
+            # Without an honest length the route stops reading at its limit.
+            assert client.request("POST", "/upload", b"123456789", headers={"content-length": "1"})["status"] == 413
+            assert not os.listdir(tmp)
+        assert client.request("POST", "/api/scan/import", b"x")["status"] == 413
+        assert controller.in_flight == 0
+    finally:
+        tempfile.tempdir = previous
+        client.close()
+
+
+def test_agent_retries_with_backoff():
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            calls.append(1)
+            if len(calls) < 3:
+                self.send_response(429)
+                self.send_header("Retry-After", "2")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(b'{"status": "received"}')
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    delays = []
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/api/scan/submit"
+        assert agent.send_data({"hostname": "h"}, url, max_attempts=5, sleep=delays.append)
+    finally:
+        server.shutdown()
+    assert len(calls) == 3
+    assert len(delays) == 2 and all(2 <= d <= 4 for d in delays)
+
+
+if __name__ == "__main__":
+    test_round_robin_across_projects_and_rejection()
+    test_middleware_limits_body_and_queue()
+    test_streamed_routes_are_capped_per_route()
+    test_agent_retries_with_backoff()
@@ -0,0 +1,291 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.fleet import generate_scan
+from benchmarks.harness import AsgiClient
+from app.core import history
+from app.main import app
+from app.models import ScanResult
+from app.static import agent
+
+
+def _with_governor(governor, fn):
+    previous = agent.GOVERNOR
+    agent.GOVERNOR = governor
+    try:
+        return fn()
+    finally:
+        agent.GOVERNOR = previous
+
+
+def test_read_rate_is_capped():
+    with tempfile.TemporaryDirectory() as root:
+        for n in range(4):
+            with open(os.path.join(root, f"f{n}.js"), "w") as f:
+                f.write("x" * 50000)
+        governor = agent.Governor(max_read_bytes_per_sec=100000)
+        start = time.monotonic()
+        files = _with_governor(governor, lambda: agent.capture_app_tree(root))
+        elapsed = time.monotonic() - start
+    assert len(files) == 4
+    assert elapsed >= 1.5
+    assert governor.stats()["bytes_read"] == 200000
+    assert governor.throttled_seconds > 1
+
+
+def test_spooled_scan_matches_and_budget_skips_sections():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "scan.json")
+        governor = agent.Governor(time_budget=0.000001)
+        time.sleep(0.01)
+        _with_governor(governor, lambda: agent.scan(agent.Spool(path)))
+        with open(path) as f:
+            data = json.load(f)
+    scan = ScanResult.model_validate(data)
+    stats = scan.collection_stats
+    assert "installed_packages" in stats["skipped_sections"]
+    assert scan.installed_packages == []
+
+
+def test_only_modified_conffiles_are_captured():
+    with tempfile.TemporaryDirectory() as tmp:
+        files = {"pristine.conf": b"listen 80;\n", "edited.conf": b"listen 80;\n", "old.conf": b"x",
+                 "gone.conf": None, "removed-pkg.conf": b"y", "big.conf": b"#" * (agent.MAX_CONFIG_BYTES + 1)}
+        paths = {name: os.path.join(tmp, name) for name in files}
+        for name, data in files.items():
+            if data is not None:
+                with open(paths[name], "wb") as f:
+                    f.write(data)
+        digest = hashlib.md5(b"listen 80;\n").hexdigest()
+        status = os.path.join(tmp, "status")
+        with open(status, "w") as f:
+            f.write(
+                "Package: web\nStatus: install ok installed\nConffiles:\n"
+                f" {paths['pristine.conf']} {digest}\n {paths['edited.conf']} {'0' * 32}\n"
+                f" {paths['old.conf']} {'1' * 32} obsolete\n {paths['gone.conf']} {digest}\n"
+                f" {paths['big.conf']} {digest}\nDescription: web\n more text\n\n"
+                "Package: removed\nStatus: deinstall ok config-files\nConffiles:\n"
+                f" {paths['removed-pkg.conf']} {'2' * 32}\n"
+            )
+        governor = agent.Governor()
+        owned, modified = _with_governor(governor, lambda: agent.discover_conffiles(status))
+        assert set(owned) == {paths[n] for n in ("pristine.conf", "edited.conf", "gone.conf", "big.conf")}
+        assert owned[paths["pristine.conf"]] == digest
+        assert modified == {paths["edited.conf"]: "listen 80;\n"}
+        assert governor.skipped_files == {"too_large": 1}
+
+    assert agent.parse_rpm_verify(
+        "S.5....T.  c /etc/my.cnf\n.......T.  c /etc/touched.conf\nmissing     c /etc/gone.conf\n"
+        "..5......    /usr/bin/tool\n"
+    ) == ["/etc/my.cnf"]
+    assert agent.parse_rpm_conffiles(
+        f"c {'a' * 64} /etc/my.cnf\n {'b' * 64} /usr/bin/tool\ncn  /etc/logrotate.d\n"
+    ) == {"/etc/my.cnf": "a" * 64, "/etc/logrotate.d": ""}
+
+
+def test_conffiles_left_as_unpacked_are_not_read():
+    with tempfile.TemporaryDirectory() as tmp:
+        os.makedirs(os.path.join(tmp, "info"))
+        body = b"listen 80;\n"
+        paths = {name: os.path.join(tmp, name) for name in ("pristine.conf", "edited.conf", "libc.conf", "nolist.conf")}
+        built = time.time() - 1000
+        # Packaged mtimes predate the unpack, which writes the file lists.
+        for path in paths.values():
+            with open(path, "wb") as f:
+                f.write(body)
+            os.utime(path, (built, built))
+        for name in ("web.list", "libc6:amd64.list"):
+            with open(os.path.join(tmp, "info", name), "w") as f:
+                f.write("/.\n")
+        with open(paths["edited.conf"], "ab") as f:
+            f.write(b"gzip on;\n")
+        os.utime(paths["edited.conf"], (time.time() + 1, time.time() + 1))
+        digest = hashlib.md5(body).hexdigest()
+        status = os.path.join(tmp, "status")
+        with open(status, "w") as f:
+            f.write(
+                "Package: web\nStatus: install ok installed\nConffiles:\n"
+                f" {paths['pristine.conf']} {digest}\n {paths['edited.conf']} {digest}\n\n"
+                "Package: libc6\nStatus: install ok installed\nMulti-Arch: same\nArchitecture: amd64\n"
+                f"Conffiles:\n {paths['libc.conf']} {digest}\n\n"
+                f"Package: nolist\nStatus: install ok installed\nConffiles:\n {paths['nolist.conf']} {digest}\n"
+            )
+        governor = agent.Governor()
+        owned, modified = _with_governor(governor, lambda: agent.discover_conffiles(status))
+        assert len(owned) == 4 and modified == {paths["edited.conf"]: "listen 80;\ngzip on;\n"}
+        # Only the edited file and the one whose package has no file list are hashed.
+        assert governor.bytes_read == os.path.getsize(status) + len(body) * 2 + len(b"gzip on;\n")
+
+        # An edit that keeps the old mtime (cp -p, tar -x, rsync -a) still
+        # changes the ctime, so the file is hashed.
+        slack, agent.CONFFILE_SLACK_SECONDS = agent.CONFFILE_SLACK_SECONDS, 0.2
+        try:
+            time.sleep(0.3)
+            with open(paths["pristine.conf"], "wb") as f:
+                f.write(b"listen 8443 ssl;\n")
+            os.utime(paths["pristine.conf"], (built, built))
+            _, modified = _with_governor(agent.Governor(), lambda: agent.discover_conffiles(status))
+        finally:
+            agent.CONFFILE_SLACK_SECONDS = slack
+        assert modified[paths["pristine.conf"]] == "listen 8443 ssl;\n" and paths["libc.conf"] not in modified
+
+
+def test_spool_writes_nested_json():
+    with tempfile.TemporaryDirectory() as tmp:
+        spool = agent.Spool(os.path.join(tmp, "out.json"))
+        spool.field("a", 1)
+        spool.begin("apps")
+        spool.begin("x")
+        spool.field("f.js", "body")
+        spool.end()
+        spool.end()
+        spool.begin("list", array=True)
+        spool.begin()
+        spool.field("k", "v")
+        spool.end()
+        spool.end(array=True)
+        with open(spool.close()) as f:
+            assert json.load(f) == {"a": 1, "apps": {"x": {"f.js": "body"}}, "list": [{"k": "v"}]}
+
+
+def _wait_for(daemon, pushed, seconds=5.0):
+    deadline = time.monotonic() + seconds
+    while not pushed and time.monotonic() < deadline:
+        assert daemon.step(0.05)
+    return pushed
+
+
+def _daemon_roundtrip(client, watcher, host):
+    with tempfile.TemporaryDirectory() as tmp:
+        app_dir = os.path.join(tmp, "web")
+        os.makedirs(os.path.join(app_dir, "src"))
+        with open(os.path.join(app_dir, "src", "index.js"), "w") as f:
+            f.write("v1")
+        conf = os.path.join(tmp, "nginx.conf")
+        with open(conf, "w") as f:
+            f.write("worker_processes 1;")
+        data = json.loads(generate_scan(7, files_per_app=3).model_dump_json())
+        data.update(hostname=host, config_files={conf: "worker_processes 1;"},
+                    pm2_processes=[{"name": "web", "path": app_dir}],
+                    custom_app_configs={"web": {"src/index.js": "v1"}})
+        reply = client.request("POST", "/api/scan/submit", json.dumps(data).encode(), query="project=daemon")
+        state = {"version": json.loads(reply["body"])["version"]}
+        pushed = []
+
+        def push(ops):
+            pushed.append(ops)
+            patch = {"hostname": host, "base_version": state["version"], "ops": ops}
+            response = client.request("POST", "/api/scan/patch", json.dumps(patch).encode(), query="project=daemon")
+            if response["status"] != 200:
+                return False
+            state["version"] = json.loads(response["body"])["version"]
+            return True
+
+        daemon = agent.Daemon(data, push, watcher=watcher, settle=0.2, refresh=0, cron_dirs=[], refresh_files={},
+                              conffiles={})
+        daemon.start()
+        try:
+            # Several writes to one file end up as a single op; ignored
+            # directories are not captured.
+            for n in range(3):
+                with open(os.path.join(app_dir, "src", "index.js"), "w") as f:
+                    f.write(f"v{n + 2}")
+            os.makedirs(os.path.join(app_dir, "node_modules"))
+            with open(os.path.join(app_dir, "node_modules", "x.js"), "w") as f:
+                f.write("ignored")
+            with open(conf, "w") as f:
+                f.write("worker_processes 4;")
+            ops = _wait_for(daemon, pushed)[0]
+            assert sorted((op["section"], op["key"]) for op in ops) == [
+                ("config_files", conf), ("custom_app_configs", "src/index.js"),
+            ]
+            stored = history.HISTORY.get("daemon", host).scan
+            assert stored.custom_app_configs["web"] == {"src/index.js": "v4"}
+            assert stored.config_files[conf] == "worker_processes 4;"
+
+            pushed.clear()
+            os.remove(conf)
+            assert _wait_for(daemon, pushed)[0] == [{"section": "config_files", "key": conf, "delete": True}]
+            assert conf not in history.HISTORY.get("daemon", host).scan.config_files
+        finally:
+            daemon.close()
+
+    diff = client.request("GET", "/api/scan/diff", query=f"project=daemon&host={host}&from=1&to=-1")
+    assert json.loads(diff["body"])["changed_sections"] == ["config_files", "custom_app_configs"]
+
+
+def test_daemon_sends_coalesced_deltas_that_patch_the_stored_scan():
+    client = AsgiClient(app)
+    try:
+        _daemon_roundtrip(client, agent.open_watcher(), "daemon-inotify")
+        _daemon_roundtrip(client, agent.PollingWatcher(0.05), "daemon-polling")
+    finally:
+        client.close()
+
+
+def test_daemon_captures_conffiles_only_while_they_differ_from_the_package():
+    with tempfile.TemporaryDirectory() as tmp:
+        conf = os.path.join(tmp, "sshd_config")
+        with open(conf, "wb") as f:
+            f.write(b"Port 22\n")
+        data = {"hostname": "conf", "config_files": {}, "pm2_processes": [], "generic_apps": []}
+        pushed = []
+        daemon = agent.Daemon(data, pushed.append, watcher=agent.PollingWatcher(0.05), settle=0.1, refresh=0,
+                              cron_dirs=[], refresh_files={}, conffiles={conf: hashlib.md5(b"Port 22\n").hexdigest()})
+        daemon.start()
+        try:
+            # A pristine conffile is watched although the baseline did not capture it.
+            with open(conf, "wb") as f:
+                f.write(b"Port 2222\n")
+            assert _wait_for(daemon, pushed)[0] == [{"section": "config_files", "key": conf, "value": "Port 2222\n"}]
+            pushed.clear()
+            with open(conf, "wb") as f:
+                f.write(b"Port 22\n")
+            assert _wait_for(daemon, pushed)[0] == [{"section": "config_files", "key": conf, "delete": True}]
+            # Rewriting the packaged content again changes nothing.
+            pushed.clear()
+            os.utime(conf, (0, 0))
+            assert not _wait_for(daemon, pushed, 0.5)
+            assert data["config_files"] == {}
+        finally:
+            daemon.close()
+
+
+def test_patch_endpoint_refuses_stale_and_invalid_deltas():
+    client = AsgiClient(app)
+    try:
+        scan = generate_scan(8, files_per_app=2)
+        reply = client.request("POST", "/api/scan/submit", scan.model_dump_json().encode(), query="project=patch")
+        version = json.loads(reply["body"])["version"]
+
+        def patch(ops, base=version, host=scan.hostname):
+            body = json.dumps({"hostname": host, "base_version": base, "ops": ops}).encode()
+            return client.request("POST", "/api/scan/patch", body, query="project=patch")
+
+        assert patch([], base=version - 1)["status"] == 409
+        assert patch([], host="unknown-host")["status"] == 409
+        assert patch([{"section": "hostname", "value": "x"}])["status"] == 400
+        assert patch([{"section": "open_ports", "value": ["not-a-port"]}])["status"] == 400
+
+        ok = patch([{"section": "open_ports", "value": [22, 8443]},
+                    {"section": "crontabs", "key": "root", "value": "* * * * * true\n"}])
+        assert ok["status"] == 200 and json.loads(ok["body"])["version"] == version + 1
+        stored = history.HISTORY.get("patch", scan.hostname).scan
+        previous = history.HISTORY.get("patch", scan.hostname, version).scan
+        assert stored.open_ports == [22, 8443] and stored.crontabs["root"] == "* * * * * true\n"
+        # Untouched sections are shared with the previous version, which is unchanged.
+        assert stored.installed_packages == previous.installed_packages
+        assert previous.open_ports == scan.open_ports and previous.crontabs == scan.crontabs
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    test_read_rate_is_capped()
+    test_spooled_scan_matches_and_budget_skips_sections()
+    test_spool_writes_nested_json()
+    test_daemon_sends_coalesced_deltas_that_patch_the_stored_scan()
+    test_patch_endpoint_refuses_stale_and_invalid_deltas()
@@ -0,0 +1,94 @@
+import contextlib
+import io
+import tempfile
+import zipfile
+
+from benchmarks.fleet import generate_scan
+from benchmarks.harness import AsgiClient
+from app.api import web
+from app.core import analyzer, artifacts, builder
+from app.main import app
+from app.models import BuildConfig
+
+
+def _header(response, name):
+    return dict(response["headers"]).get(name.encode(), b"").decode()
+
+
+@contextlib.contextmanager
+def _served():
+    # A build of the "art" project and a client for it: (client, build, startup.sh bytes).
+    scan = generate_scan(3, files_per_app=40, file_size=4096)
+    analysis = analyzer.analyze_scan(scan)
+    config = BuildConfig(project_id="art", region="r", zone="z", instance_name="i", machine_type="e2-small", source_image="debian-11")
+    client = AsgiClient(app)
+    with tempfile.TemporaryDirectory() as out:
+        build = builder.generate_terraform(config, scan, analysis, output_dir=out)
+        web.PROJECTS["art"] = {"scan": scan, "analysis": analysis, "build": build}
+        with open(artifacts.artifact_path(build, "startup.sh"), "rb") as f:
+            script = f.read()
+        try:
+            yield client, build, script
+        finally:
+            web.PROJECTS.pop("art", None)
+            client.close()
+
+
+def _get(client, name, **headers):
+    return client.request("GET", f"/api/build/artifacts/{name}", query="project=art", headers=headers)
+
+
+def test_build_page_indexes_sections_instead_of_inlining_the_script():
+    with _served() as (client, _, script):
+        page = client.request("GET", "/guide/build", query="project=art")
+        assert page["status"] == 200
+        assert len(page["body"]) < len(script) and b"pm2_apps" in page["body"]
+
+
+def test_artifact_etag_and_not_modified():
+    with _served() as (client, _, script):
+        full = _get(client, "startup.sh")
+        assert full["status"] == 200 and full["body"] == script
+        cached = _get(client, "startup.sh", **{"If-None-Match": _header(full, "etag")})
+        assert cached["status"] == 304 and cached["body"] == b""
+
+
+def test_artifact_range_of_one_section():
+    with _served() as (client, build, script):
+        tag = _header(_get(client, "startup.sh"), "etag")
+        section = next(s for s in build.startup_sections if s.name == "pm2_apps")
+        end = section.offset + section.length - 1
+        part = _get(client, "startup.sh", Range=f"bytes={section.offset}-{end}", **{"If-Match": tag})
+        assert part["status"] == 206 and part["body"].startswith(b"# Restore PM2")
+        assert part["body"] == script[section.offset:end + 1]
+        assert _header(part, "content-range") == f"bytes {section.offset}-{end}/{len(script)}"
+
+
+def test_artifact_precondition_failed_unsatisfiable_range_and_unknown_name():
+    with _served() as (client, _, script):
+        assert _get(client, "startup.sh", Range="bytes=0-9", **{"If-Match": '"old"'})["status"] == 412
+        assert _get(client, "startup.sh", Range=f"bytes={len(script)}-")["status"] == 416
+        assert _get(client, "secrets.txt")["status"] == 404
+
+
+def test_artifact_if_match_and_if_range_need_a_strong_etag():
+    with _served() as (client, _, script):
+        tag = _header(_get(client, "startup.sh"), "etag")
+        assert _get(client, "startup.sh", Range="bytes=0-9", **{"If-Match": "W/" + tag})["status"] == 412
+        assert _get(client, "startup.sh", Range="bytes=0-9", **{"If-Match": tag})["status"] == 206
+        whole = _get(client, "startup.sh", Range="bytes=0-9", **{"If-Range": "W/" + tag})
+        assert whole["status"] == 200 and whole["body"] == script
+        assert _get(client, "startup.sh", Range="bytes=0-9", **{"If-Range": tag})["status"] == 206
+        assert artifacts.etag_matches("W/" + tag, tag) and not artifacts.etag_matches("W/" + tag, tag, strong=True)
+
+
+def test_artifacts_zip_is_cached():
+    with _served() as (client, _, script):
+        bundle = client.request("GET", "/api/build/artifacts.zip", query="project=art")
+        assert bundle["status"] == 200
+        with zipfile.ZipFile(io.BytesIO(bundle["body"])) as zf:
+            assert sorted(zf.namelist()) == ["main.tf", "startup.sh"]
+            assert zf.read("startup.sh") == script
+        again = client.request("GET", "/api/build/artifacts.zip", query="project=art",
+                               headers={"If-None-Match": _header(bundle, "etag")})
+        assert again["status"] == 304
@@ -0,0 +1,55 @@
+import json
+import os
+import tempfile
+
+from app.core import batch
+
+
+def write_inventory(directory):
+    path = os.path.join(directory, "inventory.json")
+    with open(path, 'w') as f:
+        json.dump({"hosts": [
+            {"name": "web-1", "host": "mock", "username": "test"},
+            {"name": "web-2", "host": "mock", "username": "test", "project_id": "other"},
+            {"name": "down-1", "host": "127.0.0.1", "port": 1, "username": "test"},
+        ]}, f)
+    return path
+
+
+def test_batch_pipeline_and_resume():
+    with tempfile.TemporaryDirectory() as tmp:
+        hosts = batch.load_inventory(write_inventory(tmp))
+        out = os.path.join(tmp, "results")
+        events = []
+
+        summary = batch.run_batch(hosts, out, scan_workers=2, build_workers=1, queue_size=1,
+                                  on_event=lambda *e: events.append(e[:3]))
+        assert summary["web-1"]["status"] == "done"
+        assert summary["down-1"]["status"] == "failed"
+        assert summary["down-1"]["stage"] == "scan"
+        assert os.path.exists(os.path.join(out, "web-2", "main.tf"))
+        with open(os.path.join(out, "web-2", "result.json")) as f:
+            assert json.load(f)["analysis"]["recommended_gcp_instance"] == "e2-standard-4"
+        assert ("web-1", "analyze", "done") in events
+
+        # A second run only retries what did not finish.
+        events.clear()
+        summary = batch.run_batch(hosts, out, on_event=lambda *e: events.append(e[:3]))
+        assert summary["web-1"].get("skipped")
+        assert ("web-1", "skipped", "done") in events
+        assert ("down-1", "scan", "running") in events
+
+
+def test_csv_inventory():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "hosts.csv")
+        with open(path, 'w') as f:
+            f.write("name,host,username,port\napp-1,10.0.0.5,deploy,2222\napp-2,10.0.0.6,deploy,\n")
+        hosts = batch.load_inventory(path)
+        assert hosts[0].port == 2222
+        assert hosts[1].port == 22
+
+
+if __name__ == "__main__":
+    test_batch_pipeline_and_resume()
+    test_csv_inventory()
@@ -0,0 +1,128 @@
+import json
+import os
+import tempfile
+
+import pytest
+
+from benchmarks.fleet import generate_scan, generate_similar_scan
+from benchmarks.harness import AsgiClient
+from app.core import bundles, history
+from app.main import app
+from app.static import agent
+
+
+def _bundle(directory, scan, name=None, project=None, created=None):
+    path = os.path.join(directory, name or f"{scan.hostname}.migb")
+    meta = {"created": created or 1.0}
+    if project:
+        meta["project"] = project
+    return agent.feed(agent.Bundle(path, meta), scan.model_dump(mode="json"))
+
+
+def test_bundle_round_trip_and_blob_dedup():
+    scan = generate_scan(3, files_per_app=30, file_size=4096)
+    # The same release deployed twice on one host: the bodies are stored once.
+    scan.custom_app_configs["copy"] = dict(scan.custom_app_configs["node-app-0"])
+    with tempfile.TemporaryDirectory() as tmp:
+        path = _bundle(tmp, scan, project="air-gap")
+        meta, loaded = bundles.read_bundle(path)
+        assert loaded == scan
+        assert meta["hostname"] == scan.hostname and meta["project"] == "air-gap"
+        assert history.fingerprint(loaded)["sections"] == history.fingerprint(scan)["sections"]
+
+        with open(path, "rb") as f:
+            data = f.read()
+        assert len(data) < len(scan.model_dump_json()) / 2
+        assert bundles.read_index(path)["digest"] == meta["digest"]
+        # Same content, different collection run: same digest.
+        scan.collection_stats = {"elapsed": 1.5}
+        assert bundles.read_index(_bundle(tmp, scan, name="again.migb"))["digest"] == meta["digest"]
+
+        broken = os.path.join(tmp, "broken.migb")
+        with open(broken, "wb") as f:
+            f.write(data[:len(data) // 2])
+        for bad in (broken, os.path.join(tmp, "empty.migb")):
+            open(bad, "ab").close()
+            try:
+                bundles.read_bundle(bad)
+                assert False, bad
+            except bundles.BundleError:
+                pass
+
+
+class _SwappedBlob(agent.Bundle):
+    # Files one body under another body's digest.
+    def close(self):
+        first, second = sorted(self.blobs)[:2]
+        self.blobs[first] = self.blobs[second]
+        self.meta["swapped"] = first
+        return super().close()
+
+
+def test_blob_under_a_wrong_digest_is_refused():
+    scan = generate_scan(5, files_per_app=4, file_size=1024)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = agent.feed(_SwappedBlob(os.path.join(tmp, "crafted.migb"), {"created": 1.0}), scan.model_dump(mode="json"))
+        bundles._blobs.clear()
+        with pytest.raises(bundles.BundleError, match="does not match"):
+            bundles.read_bundle(path)
+        assert bundles.read_index(path)["swapped"] not in bundles._blobs
+
+
+def test_agent_writes_bundle_into_directory():
+    scan = generate_scan(4, files_per_app=3).model_dump(mode="json")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = agent.write_bundle(tmp, project=agent.url_project("http://api/api/scan/submit?project=dc1"), data=scan)
+        assert path.endswith(".migb") and os.listdir(tmp) == [os.path.basename(path)]
+        meta, loaded = bundles.read_bundle(path)
+        assert meta["project"] == "dc1" and loaded.model_dump(mode="json") == scan
+
+
+def test_import_to_results_skips_duplicates_and_unchanged():
+    scans = [generate_similar_scan(i, roles=2, files_per_app=5) for i in range(6)]
+    with tempfile.TemporaryDirectory() as tmp:
+        src, out = os.path.join(tmp, "bundles"), os.path.join(tmp, "results")
+        os.makedirs(os.path.join(src, "site-b"))
+        for i, scan in enumerate(scans):
+            _bundle(src if i % 2 else os.path.join(src, "site-b"), scan, project="fleet", created=10.0 + i)
+        _bundle(src, scans[0], name="copy.migb", created=99.0)
+        summary = bundles.import_to_results(src, out, workers=2)
+        assert summary["bundles"] == 7 and not summary["failed"]
+        assert summary["imported"] == sorted(s.hostname for s in scans)
+        assert list(summary["skipped"].values()) == ["duplicate"]
+        with open(os.path.join(out, scans[1].hostname, "result.json")) as f:
+            result = json.load(f)
+        assert result["project"] == "fleet" and result["scan"]["hostname"] == scans[1].hostname
+
+        again = bundles.import_to_results(src, out, workers=1)
+        assert again["imported"] == [] and list(again["skipped"].values()).count("unchanged") == 6
+
+
+def test_import_endpoint_populates_projects():
+    client = AsgiClient(app)
+    previous = bundles.IMPORT_DIR
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            bundles.IMPORT_DIR = tmp
+            drop = os.path.join(tmp, "drop")
+            os.makedirs(drop)
+            for i in range(4):
+                _bundle(drop, generate_scan(800 + i, files_per_app=3), project="dc-east" if i < 3 else None)
+            _bundle(drop, generate_scan(800, files_per_app=3), name="dup.migb", project="dc-east")
+            with open(os.path.join(drop, "junk.migb"), "wb") as f:
+                f.write(b"not a bundle")
+
+            response = client.request("POST", "/api/scan/import", query="path=drop")
+            assert response["status"] == 200
+            body = json.loads(response["body"])
+            assert (body["imported"], body["duplicate"], body["failed"]) == (4, 1, 1)
+            assert body["projects"] == {"dc-east": 3, "default": 1}
+            assert list(body["errors"]) == ["drop/junk.migb"]
+            assert history.HISTORY.get("dc-east", "srv-00801").version == 1
+
+            again = json.loads(client.request("POST", "/api/scan/import", query="path=drop")["body"])
+            assert again["imported"] == 0 and again["unchanged"] == 4
+            assert client.request("POST", "/api/scan/import", query="path=../")["status"] == 400
+    finally:
+        bundles.IMPORT_DIR = previous
+        client.close()
@@ -0,0 +1,82 @@
+import os
+import subprocess
+import tempfile
+
+from app.core import capture
+from app.static import agent
+
+
+def make_tree(root):
+    layout = {
+        "package.json": '{"name": "demo"}',
+        "ecosystem.config.js": "module.exports = {};",
+        "src/config/db.js": "module.exports = { host: 'db' };",
+        "src/app.log": "ignored by extension",
+        "node_modules/left-pad/index.js": "ignored directory",
+        "build/out.js": "ignored directory",
+        "assets/blob.dat": "bin\0ary",
+        "big.txt": "x" * (capture.MAX_FILE_SIZE + 1),
+        "edge.txt": "y" * capture.MAX_FILE_SIZE,
+    }
+    for rel, content in layout.items():
+        path = os.path.join(root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+
+def test_remote_capture_matches_agent_rules():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, "srv", "app")
+        make_tree(root)
+        conf = os.path.join(tmp, "etc", "nginx.conf")
+        os.makedirs(os.path.dirname(conf))
+        with open(conf, 'w') as f:
+            f.write("worker_processes auto;\n")
+
+        script = capture.capture_script([root], [conf, os.path.join(tmp, "missing.conf")])
+        proc = subprocess.Popen(["bash", "-s"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        proc.stdin.write(script.encode())
+        proc.stdin.close()
+        result = capture.unpack_capture(proc.stdout, [root], [conf])
+        assert proc.wait() == 0
+
+        assert result["trees"][root] == agent.capture_app_tree(root)
+        assert result["files"] == {conf: "worker_processes auto;\n"}
+        assert result["stats"]["binary_skipped"] == 1
+
+
+def test_plan_from_metadata():
+    text = "\n".join([
+        "@@migrator@@ packages", "nginx", "nodejs",
+        "@@migrator@@ conffiles", "O /etc/nginx/nginx.conf", "O /etc/nginx/sites-available/default",
+        "M /etc/nginx/sites-available/default",
+        "@@migrator@@ passwd", "root:x:0:0::/root:/bin/bash", "daemon:x:1:1::/:/bin/false", "deploy:x:1000:1000::/home/deploy:/bin/bash",
+        "@@migrator@@ crontab deploy", "*/5 * * * * /opt/report.sh",
+        "@@migrator@@ pm2", "[PM2] Spawning daemon",
+        '[{"name": "api", "pm2_env": {"pm_cwd": "/opt/api", "status": "online", "version": null}}]',
+        "@@migrator@@ units",
+        "@@migrator@@ unit nginx.service", "ExecStart={ path=/usr/sbin/nginx ; argv[]=/usr/sbin/nginx }",
+        "@@migrator@@ unit worker.service",
+        "ExecStart={ path=/usr/bin/python3 ; argv[]=/usr/bin/python3 /srv/worker/main.py ; }",
+        "WorkingDirectory=", "FragmentPath=/etc/systemd/system/worker.service", "F=/srv/worker/main.py",
+        "@@migrator@@ probes", "/etc/nginx/nginx.conf", "/etc/postgresql/16/main/postgresql.conf",
+    ])
+    meta = capture.parse_metadata(text)
+    assert meta["system_users"] == ["root", "deploy"]
+    assert meta["crontabs"] == {"deploy": "*/5 * * * * /opt/report.sh\n"}
+
+    plan = capture.plan_capture(meta, ["nginx.service"])
+    assert plan["pm2_processes"] == [{"name": "api", "path": "/opt/api", "status": "online"}]
+    assert [a["name"] for a in plan["generic_apps"]] == ["worker"]
+    assert plan["roots"] == ["/opt/api", "/srv/worker"]
+    # Package-owned paths only come back when modified; unowned probes match by service.
+    assert plan["config_paths"] == ["/etc/nginx/sites-available/default"]
+    plan = capture.plan_capture(meta, ["nginx.service", "postgresql@16-main.service"])
+    assert plan["config_paths"] == ["/etc/nginx/sites-available/default", "/etc/postgresql/16/main/postgresql.conf"]
+    assert "/etc/systemd/system/worker.service" in plan["files"]
+
+
+if __name__ == "__main__":
+    test_remote_capture_matches_agent_rules()
+    test_plan_from_metadata()
@@ -0,0 +1,118 @@
+import json
+import os
+import random
+import tempfile
+
+from benchmarks.fleet import generate_scan, generate_similar_scan
+from app.core import builder, clusters
+from app.models import ScanResult
+
+
+def _write_results(results_dir, scans):
+    for key, scan in scans.items():
+        os.makedirs(os.path.join(results_dir, key))
+        with open(os.path.join(results_dir, key, "result.json"), "w") as f:
+            json.dump({"status": "done", "project": "fleet", "scan": scan.model_dump()}, f)
+
+
+def test_similar_hosts_share_one_build_with_per_host_overrides():
+    scans = {f"host-{i:03d}": generate_similar_scan(i, roles=4, drift=0.3, files_per_app=5) for i in range(40)}
+    scans.update({f"odd-{i}": generate_scan(500 + i, files_per_app=5) for i in range(3)})
+    with tempfile.TemporaryDirectory() as tmp:
+        results_dir, out = os.path.join(tmp, "batch"), os.path.join(tmp, "clusters")
+        _write_results(results_dir, scans)
+        manifest = clusters.build_clusters(results_dir, out)
+
+        groups = [c["hosts"] for c in manifest["clusters"]]
+        assert manifest["hosts"] == 43 and len(groups) == 7
+        for role in range(4):
+            assert [f"host-{i:03d}" for i in range(role, 40, 4)] in groups
+        assert [["odd-0"], ["odd-1"], ["odd-2"]] == sorted(g for g in groups if len(g) == 1)
+        with open(os.path.join(out, clusters.MANIFEST_FILE)) as f:
+            assert json.load(f)["clusters"] == manifest["clusters"]
+
+        c = manifest["clusters"][0]
+        cluster_dir = os.path.join(out, c["id"])
+        with open(os.path.join(cluster_dir, "main.tf")) as f:
+            main_tf = f.read()
+        assert main_tf.count('resource "google_compute_instance_template"') == 1
+        assert main_tf.count('resource "google_compute_instance_from_template"') == len(c["hosts"])
+        with open(os.path.join(cluster_dir, "startup.sh")) as f:
+            assert "migrator-override" in f.read()
+
+        # A member's override carries what differs from the base: files
+        # mentioning its hostname and any extra package, not the whole restore.
+        base = scans[c["base"]]
+        key = next(k for k in c["hosts"] if set(scans[k].installed_packages) - set(base.installed_packages))
+        scan = scans[key]
+        with open(os.path.join(cluster_dir, "overrides", f"{key}.sh")) as f:
+            override = f.read()
+        assert "Restore Packages" in override
+        extra = sorted(set(scan.installed_packages) - set(base.installed_packages))
+        unresolved = builder.generate_override_script(base, scan)
+        assert all(p in unresolved for p in extra)
+        assert not any(f"  {p}" in unresolved for p in base.installed_packages)
+        changed = [p for p, body in scan.config_files.items() if body != base.config_files.get(p)]
+        assert changed and all(f"{p}.tmp" in override or p in override for p in changed)
+        assert len(override) < c["startup_bytes"] / 2
+
+
+def test_override_is_empty_for_identical_host():
+    scan = generate_scan(2, files_per_app=3)
+    same = ScanResult(**scan.model_dump())
+    assert builder.generate_override_script(scan, same) == builder.OVERRIDE_HEADER
+
+
+def test_override_removes_what_only_the_base_has():
+    base = generate_scan(2, files_per_app=3)
+    scan = ScanResult(**base.model_dump())
+    scan.crontabs.pop("user1")
+    scan.pm2_processes = [p for p in scan.pm2_processes if p["name"] != "node-app-1"]
+    scan.custom_app_configs.pop("node-app-1")
+    scan.generic_apps = []
+    override = builder.generate_override_script(base, scan)
+    app_path = next(p["path"] for p in base.pm2_processes if p["name"] == "node-app-1")
+    for line in ("crontab -r -u user1 || true", "pm2 delete node-app-1 || true", "pm2 save", f"rm -rf {app_path}",
+                 "systemctl disable --now svc-app-0.service || true",
+                 "rm -f /etc/systemd/system/svc-app-0.service", "rm -rf /srv/svc-app-0"):
+        assert line + "\n" in override
+    assert override.count("pm2 delete node-app-1") == 1
+    assert "user0" not in override and "node-app-0" not in override
+
+
+def test_hosts_sharing_a_hostname_get_distinct_instances():
+    scan = generate_scan(3, files_per_app=2)
+    scans = {"web-01": scan, "web_01": scan, "Web-01": scan}
+    with tempfile.TemporaryDirectory() as tmp:
+        results_dir, out = os.path.join(tmp, "batch"), os.path.join(tmp, "clusters")
+        _write_results(results_dir, scans)
+        manifest = clusters.build_clusters(results_dir, out)
+        c, = manifest["clusters"]
+        with open(os.path.join(out, c["id"], "main.tf")) as f:
+            main_tf = f.read()
+    names = [clusters.instance_name(key) for key in scans]
+    assert len(set(names)) == 3 and clusters.instance_name("web-01") == "migrated-web-01"
+    assert all(f'"{name}"' in main_tf for name in names)
+
+
+def test_clusters_of_keys_with_the_same_slug_get_their_own_directories():
+    scans = {"Web_1": generate_scan(500, files_per_app=2), "web.1": generate_scan(501, files_per_app=2)}
+    with tempfile.TemporaryDirectory() as tmp:
+        results_dir, out = os.path.join(tmp, "batch"), os.path.join(tmp, "clusters")
+        _write_results(results_dir, scans)
+        manifest = clusters.build_clusters(results_dir, out)
+        ids = [c["id"] for c in manifest["clusters"]]
+        assert len(ids) == 2 and len(set(ids)) == 2
+        for c in manifest["clusters"]:
+            assert os.listdir(os.path.join(out, c["id"], "overrides")) == [f"{c['base']}.sh"]
+
+
+def test_sketch_similarity_tracks_jaccard():
+    rng = random.Random(7)
+    universe = [rng.getrandbits(64) for _ in range(4000)]
+    a = frozenset(universe[:1000])
+    for shared in (950, 800, 500, 100):
+        b = frozenset(universe[1000 - shared:2000 - shared])
+        sa, sb = clusters.sketch(a), clusters.sketch(b)
+        estimate = sum(x == y for x, y in zip(sa, sb)) / clusters.NUM_BINS
+        assert abs(estimate - clusters.jaccard(a, b)) < 0.15
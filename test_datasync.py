@@ -0,0 +1,133 @@
+import filecmp
+import io
+import os
+import random
+import socket
+import tempfile
+import threading
+
+import pytest
+
+from app.core import datasync
+from app.models import SSHConnection
+from app.static import sync_agent
+
+
+def _tree(root, files=12, seed=5):
+    rng = random.Random(seed)
+    for i in range(files):
+        os.makedirs(os.path.join(root, f"dir{i % 3}"), exist_ok=True)
+        with open(os.path.join(root, f"dir{i % 3}", f"file{i}.bin"), "wb") as f:
+            f.write(rng.randbytes(rng.randrange(1, 600_000)))
+    os.symlink("dir0/file0.bin", os.path.join(root, "latest"))
+
+
+def _same(a, b):
+    cmp = filecmp.dircmp(a, b, ignore=[sync_agent.STATE_DIR])
+    stack = [cmp]
+    while stack:
+        c = stack.pop()
+        _, mismatch, errors = filecmp.cmpfiles(c.left, c.right, c.common_files, shallow=False)
+        if c.left_only or c.right_only or mismatch or errors:
+            return False
+        stack.extend(c.subdirs.values())
+    return True
+
+
+class _Interrupted(sync_agent.Target):
+    def __init__(self, root, after):
+        super().__init__(root)
+        self.after = after
+
+    def put_chunk(self, digest, data):
+        if self.after <= 0:
+            raise ConnectionError("link dropped")
+        self.after -= 1
+        super().put_chunk(digest, data)
+
+
+def test_chunk_boundaries_survive_inserts_and_block_size():
+    chunker = sync_agent.Chunker()
+    data = random.Random(1).randbytes(3_000_000)
+    chunks = [(o, len(d), h) for o, d, h in chunker.split(io.BytesIO(data))]
+    assert chunks == [(o, len(d), h) for o, d, h in chunker.split(io.BytesIO(data), block_size=70_001)]
+    assert sum(length for _, length, _ in chunks) == len(data)
+    assert all(length <= sync_agent.MAX_CHUNK for _, length, _ in chunks)
+
+    edited = data[:1_500_000] + b"inserted" + data[1_500_000:]
+    new = {h for _, _, h in chunker.split(io.BytesIO(edited))}
+    assert len(new - {h for _, _, h in chunks}) <= 2
+
+
+def test_repeat_passes_send_only_deltas():
+    with tempfile.TemporaryDirectory() as src, tempfile.TemporaryDirectory() as dst:
+        _tree(src)
+        with datasync.open_target(dst) as target:
+            first = datasync.sync(src, target)
+        assert first["errors"] == [] and first["bytes_sent"] == first["bytes_total"]
+        assert _same(src, dst) and os.readlink(os.path.join(dst, "latest")) == "dir0/file0.bin"
+
+        with datasync.open_target(dst) as target:
+            again = datasync.sync(src, target)
+        assert again["skipped"] == 12 and again["bytes_sent"] == 0
+
+        path = os.path.join(src, "dir1", "file1.bin")
+        with open(path, "rb") as f:
+            data = f.read()
+        with open(path, "wb") as f:
+            f.write(data[:100] + b"patched" + data[100:])
+        os.remove(os.path.join(src, "dir2", "file2.bin"))
+        with datasync.open_target(dst) as target:
+            delta = datasync.sync(src, target, delete=True)
+        assert delta["transferred"] == 1 and delta["removed"] == 1
+        assert 0 < delta["bytes_sent"] <= 2 * sync_agent.MAX_CHUNK
+        assert _same(src, dst)
+
+
+def test_resume_after_interruption():
+    with tempfile.TemporaryDirectory() as src, tempfile.TemporaryDirectory() as dst:
+        _tree(src, files=6)
+        target = _Interrupted(dst, after=20)
+        broken = datasync.sync(src, target, streams=2)
+        target.close()
+        assert broken["errors"]
+
+        with datasync.open_target(dst) as target:
+            resumed = datasync.sync(src, target, streams=2)
+        assert resumed["errors"] == []
+        assert resumed["bytes_sent"] + broken["bytes_sent"] - resumed["bytes_total"] < sync_agent.MAX_CHUNK * 2
+        assert _same(src, dst)
+        assert target.stats()["staged_chunks"] == 0
+
+
+def test_pipe_transport_matches_local():
+    with tempfile.TemporaryDirectory() as src, tempfile.TemporaryDirectory() as dst:
+        _tree(src, files=5)
+        with datasync.open_target(dst, "pipe", workers=2) as target:
+            stats = datasync.sync(src, target, streams=2, transport="pipe")
+        assert stats["errors"] == [] and _same(src, dst)
+        with datasync.open_target(dst, "pipe") as target:
+            assert datasync.sync(src, target, transport="pipe")["skipped"] == 5
+
+
+def test_ssh_failures_surface_as_sync_errors():
+    # Something that is not an SSH server: paramiko fails reading the banner.
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+
+    def reply():
+        conn, _ = server.accept()
+        conn.sendall(b"HTTP/1.0 400 Bad Request\r\n\r\n")
+        conn.close()
+
+    thread = threading.Thread(target=reply, daemon=True)
+    thread.start()
+    conn = SSHConnection(host="127.0.0.1", port=server.getsockname()[1], username="nobody", password="wrong")
+    try:
+        with pytest.raises(datasync.SyncError):
+            with datasync.open_target("/tmp/unused", "ssh", conn=conn):
+                pass
+    finally:
+        thread.join(5)
+        server.close()
@@ -0,0 +1,84 @@
+import base64
+import os
+import tempfile
+
+from benchmarks.fleet import generate_scan
+from app.core import builder, dryrun
+from app.models import BuildConfig
+
+
+def _scan():
+    scan = generate_scan(21, files_per_app=4)
+    scan.config_files["/etc/migrator-dryrun-test/app.conf"] = "port = 8080\n"
+    scan.crontabs = {"root": "*/5 * * * * /usr/local/bin/report.sh\n"}
+    return scan
+
+
+def test_rewrite_keeps_urls_devices_and_quoted_text():
+    line = "id -u bob &>/dev/null || useradd -m bob\ncurl -fsSL https://deb.nodesource.com/setup | bash -\n"
+    assert dryrun.rewrite_paths(line) == line
+    assert dryrun.rewrite_paths("mkdir -p $(dirname /etc/a.conf)\necho '/x' | base64 -d > /etc/a.conf\n") == (
+        'mkdir -p $(dirname "$MIGRATOR_ROOT"/etc/a.conf)\necho \'/x\' | base64 -d > "$MIGRATOR_ROOT"/etc/a.conf\n'
+    )
+
+
+def test_dry_run_restores_files_under_the_root():
+    scan = _scan()
+    with tempfile.TemporaryDirectory() as tmp:
+        report = dryrun.dry_run_scan(scan, scale=0, root=tmp)
+        names = [s["name"] for s in report["sections"]]
+        assert names == ["header", "packages", "nodejs", "users", "config_files", "pm2_apps", "generic_apps", "crontabs"]
+        assert report["failures"] == 0
+        assert not os.path.exists("/etc/migrator-dryrun-test")
+        with open(os.path.join(tmp, "etc/migrator-dryrun-test/app.conf")) as f:
+            assert f.read() == "port = 8080\n"
+        with open(os.path.join(tmp, "var/spool/cron/crontabs/root")) as f:
+            assert f.read() == scan.crontabs["root"]
+        app = os.path.join(tmp, "opt/node-app-0")
+        for rel, content in scan.custom_app_configs["node-app-0"].items():
+            with open(os.path.join(app, rel)) as f:
+                assert f.read() == content
+
+        sections = {s["name"]: s for s in report["sections"]}
+        files = sum(len(v) for v in scan.custom_app_configs.values())
+        assert sections["pm2_apps"]["files_written"] == files
+        assert sections["pm2_apps"]["bytes_written"] == sum(
+            len(c.encode()) for v in scan.custom_app_configs.values() for c in v.values())
+        assert sections["packages"]["commands"] >= 1 and sections["packages"]["bytes_written"] == 0
+        assert report["bytes_written"] == sum(s["bytes_written"] for s in report["sections"])
+
+
+def test_dry_run_reports_failures_and_simulated_latency():
+    scan = _scan()
+    report = dryrun.dry_run_scan(scan, scale=0, fail=["systemctl", "npm"],
+                                 latencies={"useradd": (0.05, 0.0)}, timeout=30)
+    sections = {s["name"]: s for s in report["sections"]}
+    # "npm install || echo ..." is handled by the script, daemon-reload is not.
+    assert sections["pm2_apps"]["failures"] == [] and sections["pm2_apps"]["stub_failures"]
+    assert [f["command"] for f in sections["generic_apps"]["failures"]] == ["systemctl daemon-reload"]
+    assert [f["command"] for f in sections["nodejs"]["failures"]] == ["npm install -g pm2"]
+    assert report["failures"] == 2 and "output" in sections["generic_apps"]
+    # Latencies are scaled, explicit overrides included.
+    assert sections["users"]["simulated_seconds"] == 0
+    latencies = {k: (0.0, 0.0) for k in dryrun.LATENCIES}
+    latencies["useradd"] = (0.05, 0.0)
+    report = dryrun.dry_run_scan(scan, latencies=latencies)
+    users = next(s for s in report["sections"] if s["name"] == "users")
+    assert users["simulated_seconds"] >= 0.05 * (len(scan.system_users) - 1) and users["seconds"] >= 0.05
+
+
+def test_split_script_by_index_and_by_headers():
+    scan = _scan()
+    config = BuildConfig(project_id="p", region="r", zone="z", instance_name="i", machine_type="m",
+                         source_image="debian-cloud/debian-11")
+    with tempfile.TemporaryDirectory() as tmp:
+        build = builder.generate_terraform(config, scan, output_dir=tmp)
+        with open(os.path.join(tmp, "startup.sh")) as f:
+            script = f.read()
+    by_index = dryrun.split_script(script, build.startup_sections)
+    assert [n for n, _ in by_index] == ["header"] + [s.name for s in build.startup_sections]
+    assert "".join(text for _, text in by_index) == script
+    by_header = dryrun.split_script(script)
+    assert "".join(text for _, text in by_header) == script
+    assert by_header[0][0] == "header" and "restore_packages" in [n for n, _ in by_header]
+    assert base64.b64encode(b"port = 8080\n").decode() in dict(by_index)["config_files"]
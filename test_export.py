@@ -0,0 +1,58 @@
+import csv
+import gzip
+import json
+import os
+import tempfile
+
+from benchmarks.fleet import generate_fleet, generate_scan
+from benchmarks.harness import AsgiClient
+from app.core import export
+from app.main import app
+
+
+def _read(directory, files):
+    rows = []
+    for name in files:
+        with gzip.open(os.path.join(directory, name), "rt", newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            rows.extend(reader)
+    return header, rows
+
+
+def test_export_writes_chunked_tables():
+    scans = list(generate_fleet(25, files_per_app=3, file_size=128))
+    with tempfile.TemporaryDirectory() as out:
+        manifest = export.export_fleet((("p", s, None) for s in scans), out, chunk_rows=200)
+        assert manifest["hosts"] == 25
+        packages = manifest["tables"]["packages"]
+        assert packages["rows"] == sum(len(s.installed_packages) for s in scans)
+        assert len(packages["files"]) == -(-packages["rows"] // 200)
+
+        header, rows = _read(out, packages["files"])
+        assert header == ["project", "hostname", "package", "arch"]
+        assert ["p", "srv-00000", "libc6", "amd64"] in rows
+
+        _, hosts = _read(out, manifest["tables"]["hosts"]["files"])
+        _, recs = _read(out, manifest["tables"]["recommendations"]["files"])
+        assert len(hosts) == len(recs) == 25
+        with open(os.path.join(out, "manifest.json")) as f:
+            assert json.load(f)["tables"]["ports"]["rows"] == sum(len(s.open_ports) for s in scans)
+
+
+def test_export_endpoint_streams_csv():
+    client = AsgiClient(app)
+    try:
+        client.request("POST", "/api/scan/submit", generate_scan(3).model_dump_json().encode(), query="project=exp")
+        response = client.request("GET", "/api/export/services.csv")
+        assert response["status"] == 200
+        assert response["body"].startswith(b"project,hostname,service")
+        assert b"exp,srv-00003,ssh" in response["body"]
+        assert client.request("GET", "/api/export/nope.csv")["status"] == 404
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    test_export_writes_chunked_tables()
+    test_export_endpoint_streams_csv()
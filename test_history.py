@@ -0,0 +1,77 @@
+import tempfile
+
+from benchmarks.fleet import generate_scan
+from benchmarks.harness import AsgiClient
+from app.core import analyzer, builder, history, ingest
+from app.main import app
+from app.models import BuildConfig
+
+
+def _modified(scan):
+    changed = scan.model_copy(deep=True)
+    changed.installed_packages = changed.installed_packages + ["redis-server"]
+    app_name = next(iter(changed.custom_app_configs))
+    changed.custom_app_configs[app_name]["config/app.conf"] = "port=9999\n"
+    return changed
+
+
+def test_diff_reports_changed_sections_and_files():
+    old = generate_scan(0)
+    new = _modified(old)
+    assert history.diff_scans(old, generate_scan(0))["changed_sections"] == []
+
+    result = history.diff_scans(old, new)
+    assert set(result["changed_sections"]) == {"installed_packages", "custom_app_configs"}
+    assert result["sections"]["installed_packages"] == {"added": ["redis-server"], "removed": []}
+    group = result["sections"]["custom_app_configs"]
+    assert list(group) == ["custom_app_configs/node-app-0"]
+
+
+def test_history_evicts_and_releases_content():
+    pool = ingest.ContentPool()
+    store = history.ScanHistory(max_versions=2, pool=pool)
+    for _ in range(3):
+        scan = ingest.decode_scan(generate_scan(0).model_dump_json().encode())
+        store.record("p", ingest.store_scan(scan, pool=pool))
+    assert [v.version for v in store.versions("p", "srv-00000")] == [2, 3]
+    assert store.get("p", "srv-00000", -2).version == 2
+    for version in store.versions("p", "srv-00000"):
+        pool.release(version.scan)
+    assert len(pool) == 0
+
+
+def test_incremental_build_rebuilds_only_changed_sections():
+    old = generate_scan(1, generic_apps=1)
+    new = _modified(old)
+    config = BuildConfig(project_id="p", region="r", zone="z", instance_name="i", machine_type="e2-small", source_image="debian-11")
+    with tempfile.TemporaryDirectory() as out:
+        first = builder.generate_terraform(config, old, analyzer.analyze_scan(old), output_dir=out)
+        again = builder.generate_terraform(config, old, analyzer.analyze_scan(old), output_dir=out)
+        second = builder.generate_terraform(config, new, analyzer.analyze_scan(new), output_dir=out)
+    assert again.rebuilt_sections == [] and again.written_files == []
+    assert second.rebuilt_sections == ["packages", "pm2_apps"]
+    assert second.written_files == ["startup.sh"]
+
+
+def test_history_endpoints():
+    client = AsgiClient(app)
+    try:
+        scan = generate_scan(7)
+        for body in (scan, _modified(scan)):
+            response = client.request("POST", "/api/scan/submit", body.model_dump_json().encode(), query="project=hist")
+            assert response["status"] == 200
+        versions = client.request("GET", "/api/scan/history", query="project=hist&host=srv-00007")
+        assert versions["status"] == 200
+        diff = client.request("GET", "/api/scan/diff", query="project=hist&host=srv-00007&from=1&to=2")
+        assert b"redis-server" in diff["body"]
+        missing = client.request("GET", "/api/scan/diff", query="project=hist&host=nope")
+        assert missing["status"] == 404
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    test_diff_reports_changed_sections_and_files()
+    test_history_evicts_and_releases_content()
+    test_incremental_build_rebuilds_only_changed_sections()
+    test_history_endpoints()
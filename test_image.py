@@ -0,0 +1,92 @@
+import os
+import tempfile
+
+from benchmarks.fleet import generate_scan
+from benchmarks.harness import AsgiClient
+from app.api import web
+from app.core import analyzer, builder
+from app.main import app
+from app.models import BuildConfig, ScanResult
+
+
+def _config(**kwargs):
+    return BuildConfig(project_id="img", region="r", zone="z", instance_name="Migrated_Web-01", machine_type="e2-small",
+                       source_image="debian-cloud/debian-11", disk_size_gb=20, **kwargs)
+
+
+def _read(out, name):
+    with open(os.path.join(out, name)) as f:
+        return f.read()
+
+
+def _scan():
+    scan = generate_scan(4, files_per_app=5)
+    return scan, analyzer.analyze_scan(scan)
+
+
+def test_bake_image_writes_packer_template_and_boots_the_image():
+    scan, analysis = _scan()
+    with tempfile.TemporaryDirectory() as out:
+        plain = builder.generate_terraform(_config(), scan, analysis, output_dir=out)
+        assert plain.image_name is None and "./startup.sh" in _read(out, "main.tf")
+
+        baked = builder.generate_terraform(_config(bake_image=True), scan, analysis, output_dir=out)
+        name = baked.image_name
+        assert name.startswith("migrated-web-01-") and len(name) <= 63
+        assert sorted(baked.written_files) == ["boot.sh", "image.pkr.hcl", "main.tf", "startup.sh"]
+        assert "image_cleanup" in baked.rebuilt_sections
+
+        main_tf = _read(out, "main.tf")
+        assert f'image = "projects/img/global/images/{name}"' in main_tf
+        assert 'file("./boot.sh")' in main_tf and "startup.sh" not in main_tf
+        packer = _read(out, "image.pkr.hcl")
+        assert f'image_name   = "{name}"' in packer and 'source_image_family     = "debian-11"' in packer
+        assert 'script          = "./startup.sh"' in packer and "'{{ .Path }}'" in packer
+
+
+def test_bake_image_moves_restore_into_the_image():
+    scan, analysis = _scan()
+    with tempfile.TemporaryDirectory() as out:
+        builder.generate_terraform(_config(), scan, analysis, output_dir=out)
+        first_boot = _read(out, "startup.sh")
+        builder.generate_terraform(_config(bake_image=True), scan, analysis, output_dir=out)
+        provision = _read(out, "startup.sh")
+        boot = _read(out, "boot.sh")
+    # The heavy work moves into the image; boot.sh only starts services.
+    assert "apt-get install" in provision and "npm install" in provision and "pm2 startup systemd" in provision
+    assert "systemctl restart" not in provision and "systemctl restart" in first_boot
+    assert "apt-get" not in boot and "base64" not in boot and "npm install" not in boot
+    assert "systemctl start svc-app-0.service" in boot
+    assert len(boot) * 50 < len(provision)
+
+
+def test_image_name_follows_provisioning_content():
+    scan, analysis = _scan()
+    with tempfile.TemporaryDirectory() as out:
+        name = builder.generate_terraform(_config(bake_image=True), scan, analysis, output_dir=out).image_name
+        assert builder.generate_terraform(_config(bake_image=True), scan, analysis, output_dir=out).image_name == name
+        changed = ScanResult(**dict(scan.model_dump(), crontabs={"root": "0 3 * * * /usr/local/bin/backup\n"}))
+        assert builder.generate_terraform(_config(bake_image=True), changed, analysis, output_dir=out).image_name != name
+
+
+def test_boot_script_is_served_as_artifact():
+    scan, analysis = _scan()
+    client = AsgiClient(app)
+    with tempfile.TemporaryDirectory() as out:
+        baked = builder.generate_terraform(_config(bake_image=True), scan, analysis, output_dir=out)
+        web.PROJECTS["img"] = {"scan": scan, "analysis": analysis, "build": baked}
+        try:
+            response = client.request("GET", "/api/build/artifacts/boot.sh", query="project=img")
+            assert response["body"] == _read(out, "boot.sh").encode()
+        finally:
+            web.PROJECTS.pop("img", None)
+            client.close()
+
+
+def test_plain_build_removes_stale_boot_script():
+    scan, analysis = _scan()
+    with tempfile.TemporaryDirectory() as out:
+        builder.generate_terraform(_config(bake_image=True), scan, analysis, output_dir=out)
+        assert os.path.exists(os.path.join(out, "boot.sh"))
+        builder.generate_terraform(_config(), scan, analysis, output_dir=out)
+        assert not os.path.exists(os.path.join(out, "boot.sh"))
@@ -0,0 +1,40 @@
+from benchmarks.fleet import generate_scan
+from app.core import ingest
+
+
+def test_pool_shares_identical_content():
+    pool = ingest.ContentPool()
+    a = ingest.decode_scan(generate_scan(0, app_variants=2).model_dump_json().encode())
+    b = ingest.decode_scan(generate_scan(2, app_variants=2).model_dump_json().encode())
+    ingest.store_scan(a, pool=pool)
+    ingest.store_scan(b, pool=pool)
+
+    shared = [
+        name for name, body in a.custom_app_configs["node-app-0"].items()
+        if body is b.custom_app_configs["node-app-0"][name]
+    ]
+    assert shared
+    # Each shared body is held once by the pool.
+    assert len(pool) > 0 and pool.size >= sum(len(a.custom_app_configs["node-app-0"][name]) for name in shared)
+    assert a.installed_packages[0] is b.installed_packages[0]
+
+    # Replacing a with a new scan keeps b's strings alive.
+    c = ingest.decode_scan(generate_scan(4, app_variants=2).model_dump_json().encode())
+    ingest.store_scan(c, previous=a, pool=pool)
+    pool.release(b)
+    pool.release(c)
+    assert len(pool) == 0
+
+
+def test_release_frees_everything():
+    pool = ingest.ContentPool()
+    scan = ingest.decode_scan(generate_scan(1).model_dump_json().encode())
+    ingest.store_scan(scan, pool=pool)
+    pool.release(scan)
+    assert len(pool) == 0
+    assert pool.size == 0
+
+
+if __name__ == "__main__":
+    test_pool_shares_identical_content()
+    test_release_frees_everything()
@@ -0,0 +1,63 @@
+from benchmarks.fleet import generate_fleet, generate_scan
+from benchmarks.harness import AsgiClient
+from app.core import inventory
+from app.main import app
+
+
+def _hosts(result):
+    return [h["hostname"] for h in result["hosts"]]
+
+
+def test_queries_match_linear_scan():
+    scans = list(generate_fleet(300, files_per_app=2, file_size=64))
+    index = inventory.InventoryIndex()
+    for scan in scans:
+        index.update("p", scan)
+
+    cases = [
+        ("service:postgresql", lambda s: "postgresql" in s.running_services),
+        ("port:443 NOT service:nginx", lambda s: 443 in s.open_ports and "nginx" not in s.running_services),
+        ("(package:mysql* OR port:5432) AND user:user2",
+         lambda s: (any(p.startswith("mysql") for p in s.installed_packages) or 5432 in s.open_ports)
+         and "user2" in s.system_users),
+        ("package:libc6", lambda s: True),
+    ]
+    for query, predicate in cases:
+        expected = [s.hostname for s in scans if predicate(s)]
+        result = index.search(query, limit=len(scans))
+        assert result["count"] == len(expected), query
+        assert _hosts(result) == expected, query
+    assert len(index.search("", limit=5)["hosts"]) == 5
+
+
+def test_update_replaces_host_terms():
+    index = inventory.InventoryIndex()
+    scan = generate_scan(0)
+    index.update("p", scan)
+    changed = scan.model_copy(deep=True)
+    changed.running_services = ["ssh", "kafka"]
+    index.update("p", changed)
+    assert index.search("service:kafka")["count"] == 1
+    assert index.search("service:" + scan.running_services[0])["count"] == 0
+    index.remove("p", scan.hostname)
+    assert index.search("package:bash")["count"] == 0
+    assert len(index) == 0
+
+
+def test_search_endpoint():
+    client = AsgiClient(app)
+    try:
+        scan = generate_scan(42)
+        client.request("POST", "/api/scan/submit", scan.model_dump_json().encode(), query="project=inv")
+        ok = client.request("GET", "/api/inventory/search", query="q=project:inv+AND+host:srv-00042")
+        assert ok["status"] == 200 and b"srv-00042" in ok["body"]
+        bad = client.request("GET", "/api/inventory/search", query="q=nginx+AND")
+        assert bad["status"] == 400
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    test_queries_match_linear_scan()
+    test_update_replaces_host_terms()
+    test_search_endpoint()
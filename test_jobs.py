@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+import pytest
+
+from benchmarks.fleet import generate_scan
+from benchmarks.harness import AsgiClient
+from app.api import web
+from app.core import jobs, metrics
+from app.main import app
+
+
+def test_process_jobs_time_out_cancel_and_reject():
+    runner = jobs.JobRunner(workers=1, max_queued=1, timeout=5)
+
+    async def scenario():
+        assert await runner.run("test", pow, 2, 10) == 1024
+        with pytest.raises(ValueError):
+            await runner.run("test", int, "not a number")
+
+        # A job past its timeout has its worker killed; the next job gets a new one.
+        start = time.perf_counter()
+        with pytest.raises(jobs.JobTimeout):
+            await runner.run("test", time.sleep, 30, timeout=0.3)
+        assert time.perf_counter() - start < 5
+        assert await runner.run("test", pow, 3, 3) == 27
+
+        # One running, one queued, the third is rejected.
+        running = asyncio.ensure_future(runner.run("test", time.sleep, 30))
+        queued = asyncio.ensure_future(runner.run("test", pow, 2, 2))
+        await asyncio.sleep(0.2)
+        assert [j.state for j in runner.jobs.values()] == ["running", "queued"]
+        with pytest.raises(jobs.JobRejected):
+            await runner.run("test", pow, 2, 3)
+
+        assert runner.cancel(next(iter(runner.jobs)))
+        with pytest.raises(jobs.JobCancelled):
+            await running
+        assert await queued == 4
+
+        # Cancelling the awaiting task (client gone) stops the job too.
+        task = asyncio.ensure_future(runner.run("test", time.sleep, 30))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert not runner.jobs
+        assert await asyncio.wait_for(runner.run("test", pow, 2, 5), 10) == 32
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+        runner.shutdown()
+    assert jobs.JOBS.value(kind="test", result="timeout") >= 1
+    assert jobs.JOBS.value(kind="test", result="rejected") >= 1
+
+
+def test_pages_build_in_worker_process():
+    web.PROJECTS["jobs"] = {"scan": generate_scan(1), "analysis": None, "build": None}
+    builds = metrics.REGISTRY._metrics["migrator_build_seconds"].count()
+    client = AsgiClient(app)
+    try:
+        assert client.request("GET", "/guide/analyze", query="project=jobs")["status"] == 200
+        page = client.request("GET", "/guide/build", query="project=jobs", headers={"X-Profile": "1"})
+        assert page["status"] == 200
+        assert web.PROJECTS["jobs"]["build"].written_files is not None
+        # Metrics and profile spans recorded in the worker come back with the result.
+        assert metrics.REGISTRY._metrics["migrator_build_seconds"].count() == builds + 1
+        assert b"jobs_build" in dict(page["headers"])[b"server-timing"]
+        assert client.request("GET", "/api/jobs")["body"] == b"[]"
+        assert client.request("POST", "/api/jobs/nope/cancel")["status"] == 404
+    finally:
+        web.PROJECTS.pop("jobs", None)
+        client.close()
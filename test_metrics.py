@@ -0,0 +1,61 @@
+from app.core import metrics
+
+
+def test_metrics_render():
+    registry = metrics.Registry()
+    requests = registry.register(metrics.Counter("test_requests_total", "Requests", ("route",)))
+    inflight = registry.register(metrics.Gauge("test_inflight", "In flight"))
+    latency = registry.register(metrics.Histogram("test_latency_seconds", "Latency", buckets=(0.1, 1.0)))
+
+    requests.inc(route="/a")
+    requests.inc(2, route="/a")
+    requests.inc(route='/b"')
+    inflight.set(3)
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    text = registry.render()
+    assert "# TYPE test_requests_total counter" in text
+    assert 'test_requests_total{route="/a"} 3' in text
+    assert 'test_requests_total{route="/b\\""} 1' in text
+    assert "test_inflight 3" in text
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{le="1"} 2' in text
+    assert 'test_latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "test_latency_seconds_count 3" in text
+
+
+def test_register_reuses_only_an_identical_metric():
+    registry = metrics.Registry()
+    latency = registry.register(metrics.Histogram("test_seconds", "Latency", ("route",), buckets=(0.1, 1.0)))
+    assert registry.register(metrics.Histogram("test_seconds", "Latency", ("route",), buckets=(1.0, 0.1))) is latency
+    for clash in (metrics.Counter("test_seconds", "Latency", ("route",)),
+                  metrics.Histogram("test_seconds", "Latency", ("method",), buckets=(0.1, 1.0)),
+                  metrics.Histogram("test_seconds", "Latency", ("route",), buckets=(0.5,))):
+        try:
+            registry.register(clash)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"{clash.kind} re-registered")
+
+
+def test_metrics_endpoint():
+    from benchmarks.harness import AsgiClient
+    from app.main import app
+
+    client = AsgiClient(app)
+    client.request("GET", "/health")
+    response = client.request("GET", "/metrics")
+    client.close()
+    body = response["body"].decode()
+    assert response["status"] == 200
+    assert "migrator_projects " in body
+    assert 'migrator_http_request_seconds_count{method="GET",route="/health",status="200"}' in body
+
+
+if __name__ == "__main__":
+    test_metrics_render()
+    test_register_reuses_only_an_identical_metric()
+    test_metrics_endpoint()
@@ -0,0 +1,64 @@
+import tempfile
+
+import pytest
+
+from benchmarks.fleet import BASE_PACKAGES, EXTRA_PACKAGES, generate_scan
+from app.core import builder, packages
+from app.models import BuildConfig
+
+SOURCE = {
+    "format": 1, "version": "test",
+    "common": {"base": ["bash"], "available": ["nginx", "postgresql-13"], "virtual": {"httpd": "nginx"},
+               "map": {"*": {"pg": ["postgresql-13"]}}, "drop": {"*": {"snapd": "snaps"}},
+               "rules": [["^postgresql-\\d+$", "map", "postgresql-13"]]},
+    "targets": {"debian-11": {}},
+}
+
+
+def test_compiled_index_lookups():
+    index = packages.PackageIndex(packages.compile_index(SOURCE))
+    assert index.lookup("debian-11", "*", "nginx") == (packages.KEEP, "")
+    assert index.lookup("debian-11", "*", "pg") == (packages.MAP, "postgresql-13")
+    assert index.lookup("debian-11", "*", "missing") is None
+    plan = index.resolve(["bash", "httpd", "postgresql-12:amd64", "snapd", "foo", "nginx"], "ubuntu-20.04", "debian-11")
+    assert plan["install"] == ["nginx", "postgresql-13"]
+    assert plan["renamed"] == {"httpd": ["nginx"], "postgresql-12": ["postgresql-13"]}
+    assert plan["base"] == ["bash"] and plan["dropped"] == {"snapd": "snaps"} and plan["unresolved"] == ["foo"]
+
+    broken = dict(SOURCE, common=dict(SOURCE["common"], map={"*": {"pg": ["postgresql-99"]}}))
+    with pytest.raises(ValueError):
+        packages.compile_index(broken)
+
+
+def test_bundled_index_resolves_fleet_packages():
+    names = BASE_PACKAGES + EXTRA_PACKAGES
+    assert packages.index().digest == packages._source_digest(packages.SOURCE_PATH)[1]
+    for image in ("debian-cloud/debian-11", "debian-cloud/debian-12", "ubuntu-os-cloud/ubuntu-2204-lts"):
+        plan = packages.resolve(names, "Ubuntu 20.04.6 LTS", image)
+        assert plan["unresolved"] == [], (image, plan["unresolved"])
+        assert not any(p.startswith(("linux-image", "lib", "snapd")) for p in plan["install"])
+    assert packages.resolve(names, "Ubuntu 20.04.6 LTS", "debian-cloud/debian-12")["renamed"]["postgresql-12"] == ["postgresql-15"]
+    assert packages.resolve(names, "Ubuntu 20.04.6 LTS", "custom/golden-1") is None
+    assert packages.source_key("CentOS Linux 7 (Core)") == "rhel-7"
+    assert packages.target_key("ubuntu-os-cloud/ubuntu-2204-lts") == "ubuntu-22.04"
+
+
+def _available():
+    source, _ = packages._source_digest(packages.SOURCE_PATH)
+    return source["common"]["available"][:60]
+
+
+def test_startup_script_installs_every_resolved_package():
+    scan = generate_scan(2, extra_packages=len(EXTRA_PACKAGES))
+    scan.installed_packages += [n for n in _available() if n not in scan.installed_packages]
+    config = BuildConfig(project_id="p", region="r", zone="z", instance_name="i", machine_type="e2-small",
+                         source_image="debian-cloud/debian-11")
+    plan = packages.resolve(scan.installed_packages, scan.os_info, config.source_image)
+    assert len(plan["install"]) > 50
+    with tempfile.TemporaryDirectory() as out:
+        result = builder.generate_terraform(config, scan, output_dir=out)
+        with open(f"{out}/startup.sh") as f:
+            script = f.read()
+    install = script.split("apt-get install -y \\\n", 1)[1].split("\n\n", 1)[0]
+    assert install.replace("\\\n", " ").split() == plan["install"]
+    assert result.unavailable_packages == plan["unresolved"]
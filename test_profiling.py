@@ -0,0 +1,45 @@
+from app.core import profiling
+
+
+def test_spans_are_noops_without_profile():
+    assert not profiling.active()
+    with profiling.span("ignored") as s:
+        assert s is None
+    profiling.add_timing("ignored", 1.0)
+
+
+def test_profile_span_tree():
+    with profiling.Profile("GET /guide/build", "requested") as profile:
+        with profiling.span("builder.generate_terraform"):
+            with profiling.span("builder.startup_script"):
+                profiling.add_timing("builder.base64", 0.001, bytes=10)
+                profiling.add_timing("builder.base64", 0.002, bytes=20)
+        with profiling.span("web.render_template", template="build.html"):
+            pass
+
+    tree = profile.to_dict()["tree"]
+    assert [c["name"] for c in tree["children"]] == ["builder.generate_terraform", "web.render_template"]
+    base64 = tree["children"][0]["children"][0]["children"][0]
+    assert base64["name"] == "builder.base64"
+    assert base64["calls"] == 2
+    assert base64["attrs"]["bytes"] == 30
+    assert "builder_generate_terraform;dur=" in profile.server_timing()
+    assert not profiling.active()
+
+
+def test_slow_requests_are_recorded():
+    original = profiling.SLOW_REQUEST_MS
+    profiling.SLOW_REQUEST_MS = 0.0001
+    try:
+        with profiling.Profile("POST /api/scan/submit", "slow-trace") as profile:
+            sum(range(10000))
+        assert profiling.record(profile)
+        assert profiling.get_profile(profile.id)["slow"]
+    finally:
+        profiling.SLOW_REQUEST_MS = original
+
+
+if __name__ == "__main__":
+    test_spans_are_noops_without_profile()
+    test_profile_span_tree()
+    test_slow_requests_are_recorded()
@@ -0,0 +1,173 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from benchmarks.fleet import generate_similar_scan
+from app.core import bundles, relay
+from app.static import agent
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _server(module, port, **env):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", module, "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=dict(os.environ, **env),
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1).read()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{module} did not start")
+
+
+def _call(url, method="GET"):
+    request = urllib.request.Request(url, data=b"" if method == "POST" else None, method=method)
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+
+def test_relay_batches_scans_and_delivers_after_upstream_outage():
+    central_port, relay_port = _free_port(), _free_port()
+    central_url, relay_url = f"http://127.0.0.1:{central_port}", f"http://127.0.0.1:{relay_port}"
+    scans = [generate_similar_scan(i, roles=2, files_per_app=20, file_size=2048) for i in range(6)]
+    with tempfile.TemporaryDirectory() as spool:
+        relay = _server("app.relay:app", relay_port, MIGRATOR_RELAY_UPSTREAM=central_url,
+                        MIGRATOR_RELAY_SPOOL=spool, MIGRATOR_RELAY_FLUSH_SECONDS="3600", MIGRATOR_RELAY_NAME="dc-west")
+        central = None
+        try:
+            for scan in scans + scans[:2]:
+                reply = agent.send_data(scan.model_dump(mode="json"), f"{relay_url}/api/scan/submit?project=west",
+                                        max_attempts=1)
+                assert reply["status"] == "queued" and reply["relay"] == "dc-west"
+
+            # The central server is not up yet: the batch is kept for later.
+            outcome = _call(f"{relay_url}/api/relay/flush", "POST")
+            assert (outcome["packed"], outcome["sent"], outcome["pending"]) == (1, 0, 1) and outcome["error"]
+            status = _call(f"{relay_url}/api/relay/status")
+            assert status["duplicates"] == 2 and status["queued_scans"] == 0 and status["pending_batches"] == 1
+            batch = os.path.join(spool, "outbox", os.listdir(os.path.join(spool, "outbox"))[0])
+            # Similar hosts share file bodies, which the batch stores once.
+            assert os.path.getsize(batch) < sum(len(s.model_dump_json()) for s in scans) / 2
+            with open(batch, "rb") as f:
+                body = f.read()
+
+            central = _server("app.main:app", central_port)
+            outcome = _call(f"{relay_url}/api/relay/flush", "POST")
+            assert (outcome["sent"], outcome["scans"], outcome["pending"]) == (1, 6, 0)
+            hosts = _call(f"{central_url}/api/scan/history?project=west")["hosts"]
+            assert sorted(h["hostname"] if isinstance(h, dict) else h for h in hosts) == sorted(s.hostname for s in scans)
+
+            # A batch delivered twice (lost reply) is not imported again.
+            request = urllib.request.Request(f"{central_url}/api/scan/relay", data=body, method="POST")
+            with urllib.request.urlopen(request, timeout=30) as response:
+                again = json.loads(response.read())
+            assert again["status"] == "duplicate" and again["imported"] == 6
+            history = _call(f"{central_url}/api/scan/history?project=west&host={scans[0].hostname}")
+            assert len(history["versions"]) == 1
+
+            # Deltas need the central version, so daemons send full scans instead.
+            assert agent.send_data({"hostname": "x", "ops": []}, f"{relay_url}/api/scan/patch", max_attempts=1) is False
+            assert not os.listdir(os.path.join(spool, "inbox"))
+        finally:
+            for process in (relay, central):
+                if process is not None:
+                    process.terminate()
+                    process.wait()
+
+
+def test_batch_shares_file_bodies_across_bundles():
+    scans = [generate_similar_scan(i, roles=1, files_per_app=10, file_size=1024) for i in range(3)]
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i, scan in enumerate(scans):
+            paths.append(os.path.join(tmp, f"{i}.migb"))
+            agent.feed(agent.Bundle(paths[-1], {"created": float(i), "project": "p"}), scan.model_dump(mode="json"))
+        target = os.path.join(tmp, "out" + bundles.BATCH_EXTENSION)
+        metas = bundles.write_batch(paths, target, {"id": "b1", "relay": "r"})
+        assert [m["hostname"] for m in metas] == [s.hostname for s in scans]
+        assert os.path.getsize(target) < sum(os.path.getsize(p) for p in paths) * 0.75
+        batch, loaded = bundles.read_batch(target)
+        assert batch["id"] == "b1" and bundles.read_batch_index(target)["relay"] == "r"
+        assert [scan for _, scan in loaded] == scans and loaded[0][0]["project"] == "p"
+        with pytest.raises(bundles.BundleError):
+            bundles.read_batch(paths[0])
+
+        # Each half of a split batch keeps only the file bodies its scans use.
+        halves = [(os.path.join(tmp, f"half{n}" + bundles.BATCH_EXTENSION), {"id": f"b1-{n}"}) for n in (1, 2)]
+        metas = bundles.split_batch(target, halves)
+        assert [[m["hostname"] for m in part] for part in metas] == [[s.hostname for s in scans[:2]], [scans[2].hostname]]
+        assert [scan for half, _ in halves for _, scan in bundles.read_batch(half)[1]] == scans
+        single = os.path.join(tmp, "single" + bundles.BATCH_EXTENSION)
+        bundles.write_batch(paths[2:], single, {"id": "b1-2"})
+        assert abs(os.path.getsize(halves[1][0]) - os.path.getsize(single)) < 256
+        with pytest.raises(bundles.BundleError):
+            bundles.split_batch(halves[1][0], halves)
+
+
+def test_relay_splits_oversized_batches_and_keeps_failed_ones():
+    statuses = []
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            with tempfile.NamedTemporaryFile(suffix=bundles.BATCH_EXTENSION) as f:
+                f.write(body)
+                f.flush()
+                _, scans = bundles.read_batch(f.name)
+            # Bodies of more than two scans are too large for this server.
+            status = statuses.pop(0) if statuses else (413 if len(scans) > 2 else 200)
+            self.send_response(status)
+            self.end_headers()
+            if status == 200:
+                received.append(len(scans))
+                self.wfile.write(json.dumps({"scans": len(scans)}).encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    scans = [generate_similar_scan(i, roles=2, files_per_app=5, file_size=512) for i in range(7)]
+    try:
+        with tempfile.TemporaryDirectory() as spool:
+            node = relay.Relay(spool, upstream=f"http://127.0.0.1:{server.server_port}", name="r")
+            for scan in scans:
+                node.accept(scan.model_dump_json().encode(), "p")
+            outcome = node.flush(force=True)
+            assert (outcome["sent"], outcome["scans"], outcome["rejected"], outcome["pending"]) == (4, 7, 0, 0)
+            assert received == [2, 2, 2, 1]
+
+            # Anything but a malformed batch stays queued for a retry.
+            node.accept(scans[0].model_dump_json().encode(), "p")
+            for status in (404, 503, 409):
+                statuses.append(status)
+                outcome = node.flush(force=True)
+                assert outcome["pending"] == 1 and outcome["error"] and outcome["rejected"] == 0
+                assert node.retry_at > time.monotonic()
+            statuses.append(400)
+            outcome = node.flush(force=True)
+            assert outcome["rejected"] == 1 and outcome["pending"] == 0
+            assert len(os.listdir(os.path.join(spool, "rejected"))) == 1
+    finally:
+        server.shutdown()
@@ -0,0 +1,107 @@
+import json
+import os
+import tempfile
+
+import pytest
+
+from benchmarks.bench_rules import evaluate_linear, generate_rules
+from benchmarks.fleet import generate_fleet, generate_scan
+from benchmarks.harness import AsgiClient
+from app.core import analyzer, rules
+from app.main import app
+from app.models import ScanResult
+
+
+def _scan(**kwargs):
+    scan = generate_scan(3, files_per_app=2, file_size=64)
+    return ScanResult(**dict(scan.model_dump(), **kwargs))
+
+
+def test_bundled_rules_keep_database_and_legacy_os_assessment():
+    scan = _scan(os_info="Ubuntu 16.04.7 LTS", running_services=["nginx", "postgresql", "ssh", "mongod"],
+                 installed_packages=["bash", "nginx"], open_ports=[22, 80])
+    analysis = analyzer.analyze_scan(scan)
+    assert analysis.migration_strategy == "Replatform"
+    assert analysis.risks[:2] == [
+        "Database migration required for: postgresql, mongod",
+        "Legacy OS detected. Consider upgrading or containerizing (Refactor).",
+    ]
+    assert [f.rule_id for f in analysis.findings] == ["database-replatform", "legacy-os"]
+    assert analysis.findings[0].matches == ["postgresql", "mongod"]
+
+    plain = analyzer.analyze_scan(_scan(os_info="Debian GNU/Linux 11 (bullseye)", running_services=["nginx"],
+                                        installed_packages=["bash"], open_ports=[443]))
+    assert plain.migration_strategy == "Rehost" and plain.findings == []
+
+
+def test_indexed_evaluation_matches_linear():
+    engine = rules.RuleEngine(rules.Rule(spec) for spec in generate_rules(400, seed=3))
+    found = 0
+    for scan in generate_fleet(150, files_per_app=2, file_size=64):
+        findings = engine.evaluate(scan)
+        assert [(f.rule_id, f.matches) for f in findings] == evaluate_linear(engine.rules, scan)
+        found += len(findings)
+    assert found > 0
+
+
+def test_conditions():
+    engine = rules.RuleEngine(rules.Rule(spec) for spec in [
+        {"id": "web-no-tls", "when": [{"field": "service", "equals": "nginx"}, {"field": "port", "equals": [443], "not": True}],
+         "strategy": "Refactor"},
+        {"id": "high-ports", "when": {"field": "port", "range": [8000, 8999]}, "risk": "High ports: {matches}"},
+        {"id": "legacy-kernel", "when": {"field": "package", "prefix": "linux-image-4."}, "severity": "high"},
+        {"id": "no-ssh", "when": {"field": "service", "contains": "ssh", "not": True}},
+        {"id": "big", "when": {"field": "memory_gb", "range": [64, 1e9]}},
+        {"id": "app-conf", "when": {"field": "config", "regex": r"^/etc/app/.*\.CONF$"}},
+    ])
+    scan = _scan(running_services=["NGINX", "cron"], open_ports=[80, 8080, 8443, 9000], memory_gb=8,
+                 installed_packages=["linux-image-4.15.0-20-generic", "linux-image-5.4.0-1"],
+                 config_files={"/etc/app/main.conf": "x"})
+    findings = {f.rule_id: f for f in engine.evaluate(scan)}
+    assert sorted(findings) == ["app-conf", "high-ports", "legacy-kernel", "no-ssh", "web-no-tls"]
+    assert findings["high-ports"].message == "High ports: 8080, 8443"
+    assert findings["legacy-kernel"].matches == ["linux-image-4.15.0-20-generic"]
+    assert findings["web-no-tls"].matches == ["NGINX"]
+    assert rules.strategy_for(list(findings.values())) == "Refactor"
+
+
+def test_rule_files_override_and_disable():
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "10-org.json"), "w") as f:
+            json.dump({"rules": [
+                {"id": "database-replatform", "when": {"field": "service", "equals": "oracle"}, "strategy": "Refactor"},
+                {"id": "legacy-os", "disabled": True},
+                {"id": "telnet", "when": {"field": "package", "equals": "telnetd"}, "severity": "critical"},
+            ]}, f)
+        engine = rules.compile_rules([rules.DEFAULT_PATH, tmp])
+        ids = [rule.id for rule in engine.rules]
+        assert "legacy-os" not in ids and ids[-2:] == ["database-replatform", "telnet"]
+        analysis = analyzer.analyze_scan(
+            _scan(os_info="Ubuntu 14.04", running_services=["postgresql", "oracle"], installed_packages=["telnetd"]),
+            engine=engine,
+        )
+        assert analysis.migration_strategy == "Refactor"
+        assert [f.rule_id for f in analysis.findings] == ["database-replatform", "telnet"]
+
+        bad = os.path.join(tmp, "bad.json")
+        for spec in ({"id": "x", "when": {"field": "nope", "equals": "a"}},
+                     {"id": "x", "when": {"field": "port", "range": [10, 1]}},
+                     {"id": "x", "when": {"field": "os", "regex": "("}},
+                     {"when": {"field": "os", "equals": "a"}}):
+            with open(bad, "w") as f:
+                json.dump([spec], f)
+            with pytest.raises(rules.RuleError):
+                rules.compile_rules([bad])
+
+
+def test_rules_endpoint():
+    client = AsgiClient(app)
+    try:
+        scan = _scan(hostname="rules-host", running_services=["mysql"])
+        client.request("POST", "/api/scan/submit", scan.model_dump_json().encode(), query="project=rules")
+        response = client.request("GET", "/api/rules")
+        assert response["status"] == 200
+        summary = {r["id"]: r for r in json.loads(response["body"])["rules"]}
+        assert {"project": "rules", "hostname": "rules-host"} in summary["database-replatform"]["sample"]
+    finally:
+        client.close()
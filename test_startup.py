@@ -0,0 +1,25 @@
+import subprocess
+import sys
+
+HEAVY = ["paramiko", "jinja2", "pydantic"]
+
+
+def loaded_after_import(module):
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY!r} if m in sys.modules))"
+    out = subprocess.check_output([sys.executable, "-c", code], text=True).strip()
+    return [m for m in out.split(",") if m]
+
+
+def test_cli_import_is_lazy():
+    loaded = loaded_after_import("migrator_cli")
+    assert loaded == []
+
+
+def test_api_import_skips_ssh_stack():
+    loaded = loaded_after_import("app.main")
+    assert "paramiko" not in loaded
+
+
+if __name__ == "__main__":
+    test_cli_import_is_lazy()
+    test_api_import_skips_ssh_stack()
@@ -0,0 +1,113 @@
+import os
+import subprocess
+import tempfile
+
+from app.core import analyzer, volumes
+from app.models import DataVolume, ScanResult
+from app.static import agent
+
+
+class _LocalChannel:
+    # Enough of a paramiko channel to run the remote side locally.
+    def exec_command(self, command):
+        self.proc = subprocess.Popen(["bash", "-c", command], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def sendall(self, data):
+        self.proc.stdin.write(data)
+
+    def shutdown_write(self):
+        self.proc.stdin.close()
+
+    def makefile(self, mode, bufsize):
+        return self.proc.stdout
+
+    def recv_exit_status(self):
+        return self.proc.wait()
+
+    def close(self):
+        self.proc.stdout.close()
+
+
+class _LocalClient:
+    def get_transport(self):
+        return self
+
+    def open_session(self):
+        return _LocalChannel()
+
+
+def _tree(root, dirs=3, files=50, size=1000):
+    for d in range(dirs):
+        os.makedirs(os.path.join(root, f"d{d}"), exist_ok=True)
+        for f in range(files):
+            with open(os.path.join(root, f"d{d}", f"f{f}"), "wb") as out:
+                out.write(b"x" * size)
+
+
+def test_disk_usage_exact_sampled_and_truncated():
+    with tempfile.TemporaryDirectory() as root:
+        _tree(root)
+        exact = agent.disk_usage([(root, "app")])[0]
+        assert exact["bytes"] == 150000 and exact["files"] == 150 and not exact["estimated"]
+
+        sampled = agent.disk_usage([(root, "app")], sample_threshold=10, sample_size=5)[0]
+        assert sampled["bytes"] == 150000 and sampled["estimated"]
+
+        cut = agent.disk_usage([(root, "app")], time_budget=0)[0]
+        assert cut["truncated"] and cut["estimated"]
+
+
+def test_remote_collect_and_du_fallback():
+    with tempfile.TemporaryDirectory() as root:
+        app_dir = os.path.join(root, "app")
+        _tree(app_dir, dirs=2, files=10)
+        found = volumes.collect(_LocalClient(), [], [app_dir], time_budget=10)
+        app = next(v for v in found if v["path"] == app_dir)
+        assert app["bytes"] == 20000 and app["kind"] == "app"
+        assert any(v["kind"] == "mount" for v in found)
+
+        fallback = volumes._fallback(_LocalClient(), [(app_dir, "app"), (os.path.join(root, "missing"), "data")], 10)
+        # du counts directory entries too.
+        dirs = [v for v in fallback if v["kind"] != "mount"]
+        assert [(v["path"], v["kind"], v["truncated"]) for v in dirs] == [(app_dir, "app", False)]
+        assert 20000 <= dirs[0]["bytes"] < 40000
+
+
+def test_du_timeout_is_reported_as_an_estimate():
+    script, volumes.FALLBACK_SCRIPT = volumes.FALLBACK_SCRIPT, "printf 'dir\t%s\t\n' \"$@\"\n"
+    try:
+        found = volumes._fallback(_LocalClient(), [("/var/lib/postgresql", "data")], 10)
+    finally:
+        volumes.FALLBACK_SCRIPT = script
+    assert found == [{"path": "/var/lib/postgresql", "kind": "data", "bytes": 0, "truncated": True, "estimated": True}]
+    scan = ScanResult(hostname="db", os_info="Ubuntu 22.04", cpu_cores=2, memory_gb=4, disk_space_gb={"/": 50},
+                      running_services=[], open_ports=[], installed_packages=[],
+                      data_volumes=[DataVolume(**v) for v in found])
+    assert any("sizes are estimates" in risk for risk in analyzer.analyze_scan(scan).risks)
+
+
+def test_analyzer_estimates_transfer_and_disk():
+    gb = 1024 ** 3
+    scan = ScanResult(
+        hostname="db", os_info="Ubuntu 22.04", cpu_cores=2, memory_gb=4, disk_space_gb={"/": 500},
+        running_services=["postgresql"], open_ports=[5432], installed_packages=[],
+        data_volumes=[
+            DataVolume(path="/", kind="mount", bytes=120 * gb, total_bytes=500 * gb),
+            DataVolume(path="/var/lib/postgresql", kind="data", bytes=300 * gb),
+            DataVolume(path="/opt/app", kind="app", bytes=1 * gb),
+        ],
+    )
+    analysis = analyzer.analyze_scan(scan, bandwidth_mbps=100)
+    assert analysis.recommended_disk_gb == 180
+    assert analysis.data_volume_bytes == 301 * gb
+    assert analysis.transfer_estimates[0].path == "/var/lib/postgresql"
+    expected = 301 * gb * 8 / (100e6 * analyzer.TRANSFER_EFFICIENCY)
+    assert abs(analysis.transfer_seconds - expected) < 1
+    assert any("cutover window" in risk for risk in analysis.risks)
+
+
+if __name__ == "__main__":
+    test_disk_usage_exact_sampled_and_truncated()
+    test_remote_collect_and_du_fallback()
+    test_du_timeout_is_reported_as_an_estimate()
+    test_analyzer_estimates_transfer_and_disk()